@@ -10,20 +10,29 @@ from pyramid.settings import asbool
 from sqlalchemy import engine_from_config
 
 from randopony import (
+    broadcast,
     celery_config,
+    coalescing,
     credentials,
+    dispatch,
+    intake,
+    member_api,
+    outbox,
+    rider_list_sync,
 )
 from randopony.models import Administrator
 from randopony.models.meta import (
     DBSession,
     Base,
 )
-from randopony.views.admin import core as admin_core
 
 
 def main(global_config, **settings):  # pragma: no cover
     """ Configure RandoPony and return its Pyramid WSGI application.
     """
+    # Imported here so that importing the package in the celery worker
+    # doesn't import the view layer
+    from randopony.views.admin import core as admin_core
     authn_policy = AuthTktAuthenticationPolicy(
         credentials.auth_tkt_secret,
         hashalg='sha512',
@@ -32,10 +41,6 @@ def main(global_config, **settings):  # pragma: no cover
     authz_policy = ACLAuthorizationPolicy()
     session_factory = SignedCookieSessionFactory(
         credentials.session_cookie_secret)
-    settings.update({
-        'google_drive.username': credentials.google_drive_username,
-        'google_drive.password': credentials.google_drive_password,
-    })
     if asbool(settings.get('production_deployment', 'false')):
         settings.update({'mail.username': credentials.email_host_username})
         settings.update({'mail.password': credentials.email_host_password})
@@ -57,7 +62,17 @@ def main(global_config, **settings):  # pragma: no cover
     engine = engine_from_config(settings, 'sqlalchemy.')
     DBSession.configure(bind=engine)
     Base.metadata.bind = engine
+    member_api.configure(settings)
+    coalescing.configure(settings)
+    # Background tasks run in the app processes with the thread pool
+    # dispatcher
+    broadcast.configure(settings)
+    outbox.configure(settings)
+    intake.configure(settings)
+    rider_list_sync.configure(settings)
+    dispatch.configure(settings)
     celery.config_from_object(celery_config)
+    celery.conf.update(celery_config.broker_config(settings))
     return config.make_wsgi_app()
 
 
@@ -68,6 +83,7 @@ def map_routes(config):               # pragma: no cover
     config.add_route('home', '/')
     config.add_route('organizer-info', '/organizer-info/')
     config.add_route('about', '/about-pony/')
+    config.add_route('rider_emails', '/rider_emails/{uuid}')
     # brevet routes
     config.add_route('region.list', '/brevets/')
     config.add_route('brevet.list', '/brevets/{region}/')
@@ -75,9 +91,14 @@ def map_routes(config):               # pragma: no cover
     config.add_route(
         'brevet.entry',
         '/brevets/{region}/{distance}/{date}/entry')
+    # legacy rider email address list routes that include event details
     config.add_route(
         'brevet.rider_emails',
         '/brevets/{region}/{distance}/{date}/rider_emails/{uuid}')
+    config.add_route(
+        'brevet.roster',
+        '/brevets/{region}/{distance}/{date}/roster/'
+        '{uuid}.{format:(csv|xlsx)}')
     # legacy routes to cover when /brevets/ was /register/
     config.add_route('register', '/register/')
     config.add_route('register.region', '/register/{region}-events/')
@@ -89,6 +110,9 @@ def map_routes(config):               # pragma: no cover
     config.add_route(
         'populaire.rider_emails',
         '/populaires/{short_name}/rider_emails/{uuid}')
+    config.add_route(
+        'populaire.roster',
+        '/populaires/{short_name}/roster/{uuid}.{format:(csv|xlsx)}')
     # admin core routes
     config.add_route('admin.login', 'admin/login')
     config.add_route('admin.login.handler', 'admin/login.handler')
@@ -101,8 +125,8 @@ def map_routes(config):               # pragma: no cover
     config.add_route('admin.brevets.edit', '/admin/brevets/{item}/edit')
     config.add_route('admin.brevets.view', '/admin/brevets/{item}')
     config.add_route(
-        'admin.brevets.create_rider_list',
-        'admin/brevet/{item}/create_rider_list')
+        'admin.brevets.roster',
+        'admin/brevet/{item}/roster.{format:(csv|xlsx)}')
     config.add_route(
         'admin.brevets.email_to_organizer',
         'admin.brevet/{item}/email_to_organizer')
@@ -112,13 +136,16 @@ def map_routes(config):               # pragma: no cover
     config.add_route(
         'admin.brevets.setup_123',
         'admin.brevet/{item}/setup_123')
+    config.add_route(
+        'admin.brevets.broadcast',
+        'admin.brevet/{item}/broadcast')
     # populaire admin routes
     config.add_route('admin.populaires.create', '/admin/populaire/new')
     config.add_route('admin.populaires.edit', '/admin/populaire/{item}/edit')
     config.add_route('admin.populaires.view', '/admin/populaire/{item}')
     config.add_route(
-        'admin.populaires.create_rider_list',
-        'admin/populaire/{item}/create_rider_list')
+        'admin.populaires.roster',
+        'admin/populaire/{item}/roster.{format:(csv|xlsx)}')
     config.add_route(
         'admin.populaires.email_to_organizer',
         'admin.populaire/{item}/email_to_organizer')
@@ -128,6 +155,12 @@ def map_routes(config):               # pragma: no cover
     config.add_route(
         'admin.populaires.setup_123',
         'admin.populaire/{item}/setup_123')
+    config.add_route(
+        'admin.populaires.broadcast',
+        'admin.populaire/{item}/broadcast')
+    # broadcast email admin routes
+    config.add_route(
+        'admin.broadcasts.status', r'/admin/broadcasts/{job:\d+}')
     # administrators (aka pony wranglers) admin routes
     config.add_route('admin.wranglers.create', '/admin/wranglers/new')
     config.add_route('admin.wranglers.edit', '/admin/wranglers/{item}')
@@ -0,0 +1,215 @@
+"""RandoPony broadcast email to all of the riders registered for an event.
+
+The admin broadcast view stores the message and its recipients in a
+:py:class:`randopony.models.BroadcastJob` and returns right away.
+The job is delivered by the
+:py:func:`randopony.tasks.broadcast.send_broadcast` celery task
+in batches of recipients,
+each batch over 1 SMTP connection,
+at no more than :kbd:`broadcast.rate_limit` messages per second.
+Each recipient's delivery status is stored after each batch so that
+the job's progress can be polled.
+A failure that prevents any message from being sent,
+like the SMTP server refusing the connection setup,
+stops the job and is stored as its error.
+"""
+from datetime import datetime
+import logging
+import smtplib
+import threading
+import time
+
+from pyramid_mailer.message import Message
+import transaction
+
+from randopony.mail_queue import PersistentSMTPMailer
+from randopony.models import (
+    BroadcastJob,
+    BroadcastRecipient,
+)
+from randopony.models.meta import DBSession
+
+
+log = logging.getLogger(__name__)
+
+
+# Maximum number of recipients sent to over 1 SMTP connection
+BATCH_SIZE = 50
+# Maximum delivery rate in messages per second
+RATE_LIMIT = 5
+
+
+class RateLimiter(object):
+    """Space calls to :py:meth:`wait` at least 1/:kbd:`rate` seconds apart.
+    """
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate if rate else 0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next = None
+
+    def wait(self):
+        with self._lock:
+            now = self._clock()
+            if self._next is not None and now < self._next:
+                self._sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+class Broadcaster(object):
+    """Deliver broadcast jobs.
+    """
+    def __init__(self, mailer_factory, batch_size=BATCH_SIZE,
+                 rate_limit=RATE_LIMIT, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.mailer_factory = mailer_factory
+        self.batch_size = batch_size
+        self.rate_limiter = RateLimiter(rate_limit, clock, sleep)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Create a broadcaster configured from the app :kbd:`settings`.
+        """
+        return cls(
+            mailer_factory=lambda: PersistentSMTPMailer.from_settings(
+                settings),
+            batch_size=int(settings.get('broadcast.batch_size', BATCH_SIZE)),
+            rate_limit=float(
+                settings.get('broadcast.rate_limit', RATE_LIMIT)),
+        )
+
+    def send(self, job_id):
+        """Send the broadcast job with :kbd:`job_id` to its pending
+        recipients.
+
+        The database is only accessed in short transactions between
+        batches,
+        so no locks are held while messages are being sent.
+        The delivery statuses of the recipients that were sent to before
+        an error stopped the job are stored too,
+        so they aren't sent to again if the job is resumed.
+        """
+        try:
+            mailer = self.mailer_factory()
+        except Exception as e:
+            log.exception('broadcast job {} mailer failed'.format(job_id))
+            self._stop(job_id, e)
+            return
+        while True:
+            with transaction.manager:
+                job = DBSession.query(BroadcastJob).get(job_id)
+                if job is None:
+                    log.info('broadcast job {} not found'.format(job_id))
+                    return
+                message = Message(
+                    subject=job.subject,
+                    sender=job.sender,
+                    extra_headers={
+                        'Sender': job.sender,
+                        'Reply-To': job.reply_to,
+                    },
+                    body=job.body,
+                )
+                batch = (
+                    DBSession.query(
+                        BroadcastRecipient.id, BroadcastRecipient.email)
+                    .filter_by(job=job_id, status=BroadcastRecipient.PENDING)
+                    .order_by(BroadcastRecipient.id)
+                    .limit(self.batch_size)
+                    .all())
+                if not batch:
+                    job.finished_at = datetime.utcnow()
+                    return
+            results = []
+            job_error = None
+            try:
+                for recipient_id, email in batch:
+                    results.append(
+                        (recipient_id,)
+                        + self._send_one(mailer, message, email))
+            except Exception as e:
+                log.exception('broadcast job {} failed'.format(job_id))
+                job_error = e
+            finally:
+                mailer.close()
+                self._store_results(results)
+            if job_error is not None:
+                self._stop(job_id, job_error)
+                return
+
+    def _store_results(self, results):
+        with transaction.manager:
+            for recipient_id, status, error in results:
+                (DBSession.query(BroadcastRecipient)
+                 .filter_by(id=recipient_id)
+                 .update({
+                     'status': status,
+                     'error': error,
+                     'sent_at': (
+                         datetime.utcnow()
+                         if status == BroadcastRecipient.SENT
+                         else None),
+                 }))
+
+    def _stop(self, job_id, error):
+        # The recipients that haven't been sent to stay pending
+        with transaction.manager:
+            job = DBSession.query(BroadcastJob).get(job_id)
+            if job is not None:
+                job.error = str(error) or type(error).__name__
+                job.finished_at = datetime.utcnow()
+
+    def _send_one(self, mailer, message, email):
+        message.recipients = [email]
+        self.rate_limiter.wait()
+        try:
+            mailer.send(message.sender, [email], message.to_message())
+        except (smtplib.SMTPException, OSError) as e:
+            log.warning(
+                'broadcast email to {} failed: {}'.format(email, e))
+            return BroadcastRecipient.FAILED, str(e)
+        return BroadcastRecipient.SENT, None
+
+
+_broadcaster = Broadcaster.from_settings({})
+
+
+def configure(settings):
+    """Replace the shared broadcaster with one configured from the app
+    :kbd:`settings`.
+    """
+    global _broadcaster
+    _broadcaster = Broadcaster.from_settings(settings)
+
+
+def get_broadcaster():
+    """Return the shared broadcast job sender.
+    """
+    return _broadcaster
+
+
+def create_job(event_type, event, riders, sender, subject, body):
+    """Create a broadcast job to send a message to :kbd:`riders`,
+    1 message per distinct email address.
+
+    :arg str event_type: Admin list name of the event's type;
+                         i.e. :kbd:`brevets` or :kbd:`populaires`.
+
+    :returns: Broadcast job.
+    :rtype: :py:class:`randopony.models.BroadcastJob`
+    """
+    job = BroadcastJob(
+        event_type=event_type,
+        event_id=event.id,
+        sender=sender,
+        reply_to=event.organizer_email,
+        subject=subject,
+        body=body,
+    )
+    emails = sorted({rider.email for rider in riders})
+    job.recipients.extend(BroadcastRecipient(email) for email in emails)
+    DBSession.add(job)
+    DBSession.flush()
+    return job
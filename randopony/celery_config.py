@@ -1,12 +1,125 @@
 """RandoPony-tetra celery configuration.
+
+The broker and worker settings are read from the :kbd:`celery.*` values
+in the app config file whose path is in the :envvar:`RANDOPONY_CONFIG`
+environment variable when the worker loads this module,
+and from the app settings when the app starts.
+The defaults below are used for values that aren't set there.
 """
+import os
+
+from celery.signals import worker_process_init
+from pyramid.settings import aslist
+
+
+DEFAULT_BROKER_URL = 'sqla+sqlite:///celery.sqlite'
+DEFAULT_CONCURRENCY = 1
+DEFAULT_PREFETCH_MULTIPLIER = 1
+
+
+def broker_config(settings):
+    """Return the celery broker and worker config values from the
+    :kbd:`celery.*` values in the app :kbd:`settings`.
+
+    :kbd:`celery.broker_transport_options` is a whitespace separated list
+    of :kbd:`name=value` kombu transport options.
+    The data folders of the :kbd:`filesystem://` transport are created
+    if they don't exist.
+
+    :rtype: dict
+    """
+    broker_url = settings.get('celery.broker_url', DEFAULT_BROKER_URL)
+    transport_options = _transport_options(
+        settings.get('celery.broker_transport_options', ''))
+    if broker_url.startswith('filesystem://'):
+        folders = ('data_folder_in', 'data_folder_out', 'processed_folder')
+        for option in folders:
+            if option in transport_options:
+                os.makedirs(transport_options[option], exist_ok=True)
+    return {
+        'BROKER_URL': broker_url,
+        'BROKER_TRANSPORT_OPTIONS': transport_options,
+        'CELERYD_CONCURRENCY': int(
+            settings.get('celery.concurrency', DEFAULT_CONCURRENCY)),
+        'CELERYD_PREFETCH_MULTIPLIER': int(
+            settings.get(
+                'celery.prefetch_multiplier', DEFAULT_PREFETCH_MULTIPLIER)),
+    }
 
-# pragma: no cover
-BROKER_URL = 'sqla+sqlite:///celery.sqlite'
 
-CELERYD_CONCURRENCY = 1
+def _transport_options(value):
+    options = {}
+    for option in aslist(value):
+        name, option_value = option.split('=', 1)
+        for convert in (int, float):
+            try:
+                option_value = convert(option_value)
+                break
+            except ValueError:
+                pass
+        options[name] = option_value
+    return options
+
+
+def _app_settings():      # pragma: no cover
+    config_uri = os.environ.get('RANDOPONY_CONFIG')
+    if config_uri is None:
+        return {}
+    from pyramid.paster import get_appsettings
+    return get_appsettings(config_uri)
+
+
+_config = broker_config(_app_settings())
+BROKER_URL = _config['BROKER_URL']
+BROKER_TRANSPORT_OPTIONS = _config['BROKER_TRANSPORT_OPTIONS']
+CELERYD_CONCURRENCY = _config['CELERYD_CONCURRENCY']
+CELERYD_PREFETCH_MULTIPLIER = _config['CELERYD_PREFETCH_MULTIPLIER']
 
 CELERY_IMPORTS = (
-    'randopony.views.site.brevet',
-    'randopony.views.site.populaire',
+    'randopony.tasks.broadcast',
+    'randopony.tasks.intake',
+    'randopony.tasks.member_status',
+    'randopony.tasks.outbox',
+    'randopony.tasks.rider_list',
 )
+
+
+@worker_process_init.connect
+def bind_db_session(**kwargs):       # pragma: no cover
+    """Bind the RandoPony database session in celery worker processes
+    so that tasks can update the database,
+    and configure the club database API client, the broadcast email
+    sender, the outbox mailer, the registration intake queue, the task
+    coalescer, and the rider list sync backend.
+
+    The app config file path is taken from the :envvar:`RANDOPONY_CONFIG`
+    environment variable that is set in the supervisord program section.
+    """
+    config_uri = os.environ.get('RANDOPONY_CONFIG')
+    if config_uri is None:
+        return
+    from pyramid.paster import get_appsettings
+    from pyramid.settings import asbool
+    from sqlalchemy import engine_from_config
+    from randopony import (
+        broadcast,
+        coalescing,
+        credentials,
+        intake,
+        member_api,
+        outbox,
+        rider_list_sync,
+    )
+    from randopony.models.meta import DBSession
+    settings = get_appsettings(config_uri)
+    if asbool(settings.get('production_deployment', 'false')):
+        settings.update({'mail.username': credentials.email_host_username})
+        settings.update({'mail.password': credentials.email_host_password})
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    member_api.configure(settings)
+    broadcast.configure(settings)
+    outbox.configure(settings)
+    intake.configure(settings)
+    coalescing.configure(settings)
+    rider_list_sync.configure(settings)
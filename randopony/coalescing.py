@@ -0,0 +1,192 @@
+"""RandoPony coalesced background tasks.
+
+Bursts of requests for the same background task,
+like the rider list syncs for an event that many riders register for
+right after it is announced,
+are folded into a single pending task.
+The task runs once there have been no more requests for it for
+:kbd:`task_coalescing.quiet_window` seconds,
+or :kbd:`task_coalescing.max_delay` seconds after the first request,
+whichever is sooner.
+
+The pending tasks are stored in
+:py:class:`randopony.models.PendingTask` so that requests from the app
+and from celery workers are coalesced together.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+import json
+import logging
+
+from sqlalchemy import func
+import transaction
+from zope.sqlalchemy import mark_changed
+
+from randopony import dispatch
+from randopony.models import PendingTask
+from randopony.models.meta import DBSession
+
+
+log = logging.getLogger(__name__)
+
+
+# Seconds without a new request before a pending task runs
+QUIET_WINDOW = 30
+# Maximum seconds from a task's first request until it runs
+MAX_DELAY = 300
+
+
+class Coalescer(object):
+    """Fold requests for a celery task with the same arguments into
+    1 pending task.
+
+    :arg float quiet_window: Seconds without a new request before a pending
+                             task runs.
+
+    :arg float max_delay: Maximum seconds from a task's first request until
+                          it runs.
+    """
+    def __init__(self, quiet_window=QUIET_WINDOW, max_delay=MAX_DELAY,
+                 clock=datetime.utcnow):
+        self.quiet_window = quiet_window
+        self.max_delay = max_delay
+        self._clock = clock
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a coalescer configured from the :kbd:`task_coalescing.*`
+        values in the app :kbd:`settings`.
+        """
+        return cls(
+            quiet_window=float(
+                settings.get('task_coalescing.quiet_window', QUIET_WINDOW)),
+            max_delay=float(
+                settings.get('task_coalescing.max_delay', MAX_DELAY)),
+        )
+
+    def request(self, task, *args):
+        """Request a run of the celery :kbd:`task` with :kbd:`args`.
+
+        Must be called within a transaction.
+        If there is no pending run of the task with the same arguments
+        the task is queued when the transaction commits,
+        otherwise the request is folded into the pending one.
+
+        :returns: :py:obj:`True` if the task will be queued,
+                  or :py:obj:`False` if the request was folded into a
+                  pending one.
+        """
+        now = self._clock()
+        key = _key(args)
+        # The insert is ignored if the task is already pending,
+        # so concurrent requests never fail on the unique index
+        result = DBSession.execute(
+            PendingTask.__table__.insert()
+            .prefix_with('OR IGNORE', dialect='sqlite')
+            .values(
+                name=task.name, key=key, requests=1,
+                first_requested_at=now, last_requested_at=now))
+        mark_changed(DBSession())
+        if result.rowcount == 1:
+            transaction.get().addAfterCommitHook(
+                _enqueue, args=(task, args, self.quiet_window))
+            return True
+        pending = (
+            DBSession.query(PendingTask)
+            .filter_by(name=task.name, key=key)
+            .one())
+        pending.requests += 1
+        pending.last_requested_at = now
+        if now - pending.first_requested_at > timedelta(
+                seconds=2 * self.max_delay):
+            # The pending task should have run long ago,
+            # so it was lost; e.g. the broker was unavailable
+            pending.first_requested_at = now
+            transaction.get().addAfterCommitHook(
+                _enqueue, args=(task, args, self.quiet_window))
+            return True
+        return False
+
+    def claim(self, task, *args):
+        """Claim the pending run of the celery :kbd:`task` with
+        :kbd:`args` for the task that is running.
+
+        If requests for the task are still arriving the task is queued
+        again to run when the quiet window or the maximum delay ends.
+        Requests that arrive after the task is claimed queue a new run.
+
+        :returns: :py:obj:`True` if the task should do its work now,
+                  or :py:obj:`False` if it has been deferred.
+        """
+        now = self._clock()
+        key = _key(args)
+        with transaction.manager:
+            pending = (
+                DBSession.query(PendingTask)
+                .filter_by(name=task.name, key=key)
+                .first())
+            if pending is None:
+                # Queued directly instead of by request()
+                return True
+            run_at = min(
+                pending.last_requested_at
+                + timedelta(seconds=self.quiet_window),
+                pending.first_requested_at
+                + timedelta(seconds=self.max_delay))
+            if now >= run_at:
+                log.info(
+                    '{} {} running for {} coalesced request(s)'
+                    .format(task.name, key, pending.requests))
+                DBSession.delete(pending)
+                return True
+        dispatch.get_dispatcher().enqueue(
+            task, args, countdown=(run_at - now).total_seconds())
+        return False
+
+    def stats(self):
+        """Return the number of pending tasks,
+        the number of requests folded into them,
+        and the age in seconds of the oldest one.
+
+        :rtype: dict
+        """
+        depth, requests, oldest = (
+            DBSession.query(
+                func.count(PendingTask.id),
+                func.coalesce(func.sum(PendingTask.requests), 0),
+                func.min(PendingTask.first_requested_at))
+            .one())
+        return {
+            'depth': depth,
+            'requests': requests,
+            'oldest_age': (
+                (self._clock() - oldest).total_seconds() if oldest else 0),
+        }
+
+
+def _key(args):
+    return json.dumps(args)
+
+
+def _enqueue(success, task, args, countdown):
+    if success:
+        dispatch.get_dispatcher().enqueue(task, args, countdown=countdown)
+
+
+_coalescer = Coalescer()
+
+
+def configure(settings):
+    """Replace the shared coalescer with one configured from the app
+    :kbd:`settings`.
+    """
+    global _coalescer
+    _coalescer = Coalescer.from_settings(settings)
+
+
+def get_coalescer():
+    """Return the shared task coalescer.
+    """
+    return _coalescer
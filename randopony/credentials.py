@@ -11,9 +11,6 @@ log = logging.getLogger(__name__)
 auth_tkt_secret = None
 session_cookie_secret = None
 
-google_drive_username = None
-google_drive_password = None
-
 email_host_username = None
 email_host_password = None
 
@@ -21,8 +18,6 @@ try:
     from randopony.private_credentials import (
         auth_tkt_secret,
         session_cookie_secret,
-        google_drive_username,
-        google_drive_password,
         email_host_username,
         email_host_password,
     )
@@ -0,0 +1,351 @@
+"""RandoPony background task dispatch.
+
+Background tasks are run either by the celery worker,
+or, for small deployments without one,
+by a bounded pool of threads in each app process.
+The :kbd:`dispatch.backend` setting selects the dispatcher.
+
+Tasks are dispatched after the transaction that requests them commits,
+so they never act on changes that are rolled back.
+The thread pool dispatcher stores the tasks it is given in a local
+SQLite database file until they have run,
+so the tasks that haven't run when an app process stops are run when
+it restarts,
+and tasks that raise an exception are run again later.
+"""
+import abc
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import transaction
+
+
+log = logging.getLogger(__name__)
+
+
+# Number of times that the thread pool dispatcher runs a task that keeps
+# raising exceptions before it marks the task as failed
+MAX_ATTEMPTS = 5
+# Seconds before a task that raised an exception is run again;
+# doubled after each attempt
+RETRY_DELAY = 60
+
+
+class Dispatcher(abc.ABC):
+    """Background task dispatcher interface.
+    """
+    @abc.abstractmethod
+    def enqueue(self, task, args, countdown=None):
+        """Run the celery :kbd:`task` with :kbd:`args` in the background,
+        :kbd:`countdown` seconds from now,
+        or as soon as possible if it is :py:obj:`None`.
+        """
+
+    def start(self):
+        """Start running tasks.
+        """
+
+    def shutdown(self, timeout=None):
+        """Stop running tasks.
+        """
+
+
+class CeleryDispatcher(Dispatcher):
+    """Dispatcher that sends tasks to the celery worker.
+    """
+    def enqueue(self, task, args, countdown=None):
+        task.apply_async(args, countdown=countdown)
+
+
+class ThreadPoolDispatcher(Dispatcher):
+    """Dispatcher that runs tasks in a bounded pool of threads in the
+    app process.
+
+    Each task is stored in a local SQLite database file,
+    owned by the process that it was enqueued in,
+    until it has run.
+    When the dispatcher starts it takes over the tasks of processes that
+    are no longer running,
+    so several app processes can share the database file.
+    Tasks whose owner is stopped before they run are run when the
+    dispatcher starts again.
+    A task that raises an exception is run again after a delay that
+    doubles after each attempt,
+    and is marked as failed after :kbd:`max_attempts` attempts.
+    Failed tasks are kept in the database so that they can be recovered
+    by hand.
+
+    :arg str path: Task database file path;
+                   :kbd:`:memory:` for a transient database.
+
+    :arg int max_workers: Maximum number of tasks to run at once.
+
+    :arg int max_attempts: Number of times to run a task that raises
+                           exceptions before marking it as failed.
+
+    :arg float retry_delay: Seconds before the first retry of a task that
+                            raised an exception.
+    """
+    def __init__(
+        self, path, max_workers=2, max_attempts=MAX_ATTEMPTS,
+        retry_delay=RETRY_DELAY, clock=time.time,
+    ):
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._clock = clock
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS dispatched_tasks ('
+                'id INTEGER PRIMARY KEY, owner INTEGER NOT NULL, '
+                'name TEXT NOT NULL, args TEXT NOT NULL, '
+                'run_at REAL NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'failed INTEGER NOT NULL DEFAULT 0)')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._scheduled = []
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._running = 0
+        self._executor = None
+        self._scheduler = None
+        self._stopping = False
+        self._stop_at = None
+
+    def enqueue(self, task, args, countdown=None):
+        run_at = self._clock() + (countdown or 0)
+        with self._wakeup:
+            with self._connection:
+                cursor = self._connection.execute(
+                    'INSERT INTO dispatched_tasks (owner, name, args, run_at) '
+                    'VALUES (?, ?, ?, ?)',
+                    (os.getpid(), task.name, json.dumps(list(args)), run_at))
+            heapq.heappush(
+                self._scheduled, (run_at, cursor.lastrowid, task, args))
+            self._wakeup.notify()
+
+    def start(self):
+        """Take over the stored tasks of stopped processes,
+        and start running the stored tasks in the pool.
+        """
+        owner = os.getpid()
+        with self._wakeup:
+            with self._connection:
+                for (other,) in self._connection.execute(
+                        'SELECT DISTINCT owner FROM dispatched_tasks '
+                        'WHERE owner != ?', (owner,)).fetchall():
+                    if not _process_alive(other):
+                        self._connection.execute(
+                            'UPDATE dispatched_tasks SET owner = ? '
+                            'WHERE owner = ?', (owner, other))
+            stored = self._connection.execute(
+                'SELECT run_at, id, name, args FROM dispatched_tasks '
+                'WHERE owner = ? AND failed = 0', (owner,)).fetchall()
+            scheduled_ids = {task_id for _, task_id, _, _ in self._scheduled}
+            for run_at, task_id, name, args in stored:
+                if task_id not in scheduled_ids:
+                    heapq.heappush(
+                        self._scheduled,
+                        (run_at, task_id, name, tuple(json.loads(args))))
+            if stored:
+                log.info('{} stored task(s) to run'.format(len(stored)))
+            self._stopping = False
+            self._stop_at = None
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._scheduler = threading.Thread(
+            target=self._schedule, name='randopony-dispatch', daemon=True)
+        self._scheduler.start()
+
+    def shutdown(self, timeout=None):
+        """Drain the tasks that are due,
+        and wait for them to finish,
+        for up to :kbd:`timeout` seconds.
+        Tasks that aren't due, or that haven't finished,
+        stay stored to run when the dispatcher is started again.
+
+        :returns: :py:obj:`True` if no tasks are still running.
+        """
+        if self._scheduler is None:
+            return True
+        with self._wakeup:
+            self._stopping = True
+            if timeout is not None:
+                self._stop_at = self._clock() + timeout
+            self._wakeup.notify_all()
+        self._scheduler.join(timeout)
+        self._scheduler = None
+        with self._wakeup:
+            remaining = (
+                None if timeout is None
+                else max(0, self._stop_at - self._clock()))
+            idle = self._wakeup.wait_for(
+                lambda: self._running == 0, remaining)
+            running = self._running
+        self._executor.shutdown(wait=False)
+        if not idle:
+            log.warning(
+                '{} task(s) still running at dispatcher shutdown'
+                .format(running))
+        return idle
+
+    def stored(self):
+        """Return the number of tasks that haven't finished running.
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                'SELECT COUNT(*) FROM dispatched_tasks '
+                'WHERE failed = 0').fetchone()
+        return count
+
+    def failed(self):
+        """Return the number of tasks that were marked as failed.
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                'SELECT COUNT(*) FROM dispatched_tasks '
+                'WHERE failed = 1').fetchone()
+        return count
+
+    def _schedule(self):
+        while True:
+            self._slots.acquire()
+            with self._wakeup:
+                while not self._stopping and not self._due():
+                    self._wakeup.wait(
+                        self._scheduled[0][0] - self._clock()
+                        if self._scheduled else None)
+                if not self._due() or self._drain_ended():
+                    self._slots.release()
+                    return
+                run_at, task_id, task, args = heapq.heappop(self._scheduled)
+                self._running += 1
+            self._executor.submit(self._run, task_id, task, args)
+
+    def _due(self):
+        return self._scheduled and self._scheduled[0][0] <= self._clock()
+
+    def _drain_ended(self):
+        return (
+            self._stopping and self._stop_at is not None
+            and self._clock() >= self._stop_at)
+
+    def _run(self, task_id, task, args):
+        succeeded = False
+        try:
+            if isinstance(task, str):
+                task = _resolve(task)
+            task(*args)
+            succeeded = True
+        except Exception:
+            log.exception(
+                'task {} {} failed'.format(getattr(task, 'name', task), args))
+        finally:
+            with self._wakeup, self._connection:
+                if succeeded:
+                    self._connection.execute(
+                        'DELETE FROM dispatched_tasks WHERE id = ?',
+                        (task_id,))
+                else:
+                    self._retry_later(task_id, task, args)
+                self._running -= 1
+                self._wakeup.notify_all()
+            self._slots.release()
+
+    def _retry_later(self, task_id, task, args):
+        self._connection.execute(
+            'UPDATE dispatched_tasks SET attempts = attempts + 1 '
+            'WHERE id = ?', (task_id,))
+        (attempts,) = self._connection.execute(
+            'SELECT attempts FROM dispatched_tasks WHERE id = ?',
+            (task_id,)).fetchone()
+        if attempts >= self.max_attempts:
+            self._connection.execute(
+                'UPDATE dispatched_tasks SET failed = 1 WHERE id = ?',
+                (task_id,))
+            log.error(
+                'task {} {} failed {} times; marked as failed'
+                .format(getattr(task, 'name', task), args, attempts))
+            return
+        run_at = self._clock() + self.retry_delay * 2 ** (attempts - 1)
+        self._connection.execute(
+            'UPDATE dispatched_tasks SET run_at = ? WHERE id = ?',
+            (run_at, task_id))
+        heapq.heappush(self._scheduled, (run_at, task_id, task, args))
+
+
+def _resolve(name):
+    module, _, task = name.rpartition('.')
+    return getattr(importlib.import_module(module), task)
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_dispatcher = CeleryDispatcher()
+
+
+def configure(settings):
+    """Replace the shared dispatcher with the one that is configured in
+    the app :kbd:`settings`, and start it.
+
+    The :kbd:`dispatch.backend` setting is :kbd:`thread_pool` for a
+    :py:class:`ThreadPoolDispatcher` with :kbd:`dispatch.max_workers`
+    threads that stores its tasks at :kbd:`dispatch.sqlite_path`.
+    The thread pool waits up to :kbd:`dispatch.shutdown_timeout` seconds
+    for running tasks to finish when the process exits.
+    Tasks are sent to the celery worker if the setting is missing
+    or :kbd:`celery`.
+    """
+    if settings.get('dispatch.backend') == 'thread_pool':
+        dispatcher = ThreadPoolDispatcher(
+            settings['dispatch.sqlite_path'],
+            max_workers=int(settings.get('dispatch.max_workers', 2)))
+        set_dispatcher(dispatcher)
+        atexit.register(
+            dispatcher.shutdown,
+            float(settings.get('dispatch.shutdown_timeout', 10)))
+    else:
+        set_dispatcher(CeleryDispatcher())
+
+
+def set_dispatcher(dispatcher):
+    """Replace the shared dispatcher with :kbd:`dispatcher`, and start it.
+    """
+    global _dispatcher
+    _dispatcher.shutdown()
+    _dispatcher = dispatcher
+    _dispatcher.start()
+
+
+def get_dispatcher():
+    """Return the shared background task dispatcher.
+    """
+    return _dispatcher
+
+
+def after_commit(task, *args):
+    """Dispatch the celery :kbd:`task` with :kbd:`args` when the current
+    transaction commits.
+    """
+    transaction.get().addAfterCommitHook(_enqueue, args=(task, args))
+
+
+def _enqueue(success, task, args):
+    if success:
+        get_dispatcher().enqueue(task, args)
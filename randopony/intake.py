@@ -0,0 +1,224 @@
+"""RandoPony write-behind registration intake.
+
+When a popular event opens for registration,
+the entry form posts in all of the app processes and threads compete
+for the SQLite database write lock.
+In write-behind mode the entry views validate the form,
+append the entry to a durable local queue,
+and redirect at once,
+and a single writer applies the queued entries to the database in
+batches of 1 transaction each.
+The :kbd:`intake.mode` setting selects the mode.
+"""
+from contextlib import contextmanager
+import fcntl
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import transaction
+
+
+log = logging.getLogger(__name__)
+
+
+# Maximum number of entries applied in 1 transaction
+BATCH_SIZE = 50
+
+
+class IntakeQueue(object):
+    """Durable append-only queue of registration entries in a local
+    SQLite database file that the app processes share.
+
+    Each entry is a JSON serializable dict for an event that is
+    identified by its type (e.g. :kbd:`brevets`) and id.
+
+    :arg str path: Queue database file path.
+
+    :arg int batch_size: Maximum number of entries to apply in 1
+                         transaction.
+    """
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False)
+        # Appends don't wait for the writer's reads in write-ahead log mode
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS intake_entries ('
+                'id INTEGER PRIMARY KEY, event_type TEXT NOT NULL, '
+                'event_id INTEGER NOT NULL, entry TEXT NOT NULL, '
+                'queued_at REAL NOT NULL, '
+                'failed INTEGER NOT NULL DEFAULT 0)')
+
+    def append(self, event_type, event_id, entry):
+        """Append :kbd:`entry` for the :kbd:`event_type` event with
+        :kbd:`event_id` to the queue.
+
+        :returns: Queued entry id.
+        :rtype: int
+        """
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO intake_entries '
+                '(event_type, event_id, entry, queued_at) '
+                'VALUES (?, ?, ?, ?)',
+                (event_type, event_id, json.dumps(entry), time.time()))
+        return cursor.lastrowid
+
+    def pending(self):
+        """Return the number of entries waiting to be applied.
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                'SELECT COUNT(*) FROM intake_entries '
+                'WHERE failed = 0').fetchone()
+        return count
+
+    def failed(self):
+        """Return the number of entries that couldn't be applied.
+
+        They are kept in the queue so that they can be recovered by hand.
+        """
+        with self._lock:
+            (count,) = self._connection.execute(
+                'SELECT COUNT(*) FROM intake_entries '
+                'WHERE failed = 1').fetchone()
+        return count
+
+    def apply(self, handlers):
+        """Apply the queued entries in the order that they were appended,
+        if no other thread or process is already applying them.
+
+        Each batch of entries is applied in 1 transaction.
+        If the handler for an entry raises an exception
+        the batch is applied again 1 entry at a time,
+        and the entries that fail are marked as failed.
+        Entries whose transaction fails to commit stay queued to be
+        applied again later;
+        handlers must be idempotent because an entry is also applied
+        again if the process stops between the commit and the removal
+        of the entry from the queue.
+
+        :arg dict handlers: Functions that apply an entry,
+                            keyed by event type.
+                            Each is called with the event id and entry.
+
+        :returns: Number of entries applied.
+        :rtype: int
+        """
+        applied = 0
+        while self.pending():
+            with self._writer() as claimed:
+                if not claimed:
+                    # The writer that holds the lock checks for entries
+                    # appended while it held it after releasing it
+                    break
+                applied += self._apply_batches(handlers)
+        return applied
+
+    @contextmanager
+    def _writer(self):
+        with open(self.path + '.lock', 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply_batches(self, handlers):
+        applied = 0
+        while True:
+            with self._lock:
+                entries = [
+                    (entry_id, event_type, event_id, json.loads(entry))
+                    for entry_id, event_type, event_id, entry
+                    in self._connection.execute(
+                        'SELECT id, event_type, event_id, entry '
+                        'FROM intake_entries WHERE failed = 0 '
+                        'ORDER BY id LIMIT ?', (self.batch_size,))]
+            if not entries:
+                return applied
+            if _apply(handlers, entries):
+                self._remove(entries)
+                applied += len(entries)
+                continue
+            for entry in entries:
+                if _apply(handlers, [entry]):
+                    self._remove([entry])
+                    applied += 1
+                else:
+                    self._mark_failed(entry)
+
+    def _remove(self, entries):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                'DELETE FROM intake_entries WHERE id = ?',
+                [(entry_id,) for entry_id, _, _, _ in entries])
+
+    def _mark_failed(self, entry):
+        with self._lock, self._connection:
+            self._connection.execute(
+                'UPDATE intake_entries SET failed = 1 WHERE id = ?',
+                (entry[0],))
+
+
+def _apply(handlers, entries):
+    """Apply :kbd:`entries` in 1 transaction.
+
+    :returns: :py:obj:`False` if a handler raised an exception and the
+              transaction was aborted.
+    """
+    txn = transaction.begin()
+    try:
+        for entry_id, event_type, event_id, entry in entries:
+            handlers[event_type](event_id, entry)
+    except Exception:
+        txn.abort()
+        log.exception('intake entries {}-{} failed'.format(
+            entries[0][0], entries[-1][0]))
+        return False
+    try:
+        txn.commit()
+    except Exception:
+        txn.abort()
+        raise
+    return True
+
+
+_queue = None
+
+
+def configure(settings):
+    """Replace the shared intake queue with the one that is configured in
+    the app :kbd:`settings`.
+
+    The :kbd:`intake.mode` setting is :kbd:`write_behind` for a queue at
+    :kbd:`intake.sqlite_path` whose entries are applied in batches of up
+    to :kbd:`intake.batch_size`.
+    Entries are added to the database in the entry form request if the
+    setting is missing or :kbd:`direct`.
+    """
+    global _queue
+    if settings.get('intake.mode') == 'write_behind':
+        _queue = IntakeQueue(
+            settings['intake.sqlite_path'],
+            batch_size=int(settings.get('intake.batch_size', BATCH_SIZE)))
+    else:
+        _queue = None
+
+
+def get_queue():
+    """Return the shared intake queue,
+    or :py:obj:`None` if registrations are added to the database directly.
+    """
+    return _queue
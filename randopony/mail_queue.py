@@ -0,0 +1,296 @@
+"""RandoPony queued mail delivery.
+
+The app puts outbound mail into the :kbd:`mail.queue_path` maildir
+with :py:meth:`pyramid_mailer.mailer.Mailer.send_to_queue` when the
+request's transaction commits,
+so SMTP latency and errors don't hold up requests.
+The queue is drained by the :program:`deliver_RandoPony_mail` command,
+which sends the messages in batches over 1 SMTP connection per batch,
+and retries failed deliveries with exponential backoff.
+"""
+from email.header import (
+    decode_header,
+    make_header,
+)
+from email.parser import Parser
+import errno
+import logging
+import os
+import smtplib
+import time
+
+from pyramid.settings import asbool
+from repoze.sendmail.encoding import encode_message
+from repoze.sendmail.maildir import Maildir
+from repoze.sendmail.mailer import SMTPMailer
+
+
+log = logging.getLogger(__name__)
+
+
+# Maximum number of messages sent over 1 SMTP connection
+BATCH_SIZE = 50
+# Maximum number of delivery attempts per message in 1 queue drain
+MAX_ATTEMPTS = 4
+# Seconds to wait before the 1st retry; doubles for each later retry
+BACKOFF = 5
+# Seconds after which a delivery is assumed to have died with its process
+MAX_SEND_TIME = 3 * 60 * 60
+
+
+class PersistentSMTPMailer(SMTPMailer):
+    """SMTP mailer that sends many messages over 1 connection.
+
+    The connection is opened by the first :py:meth:`send` call and stays
+    open until :py:meth:`close` is called.
+    """
+    def __init__(self, *args, **kwargs):
+        self.timeout = kwargs.pop('timeout', 10)
+        super(PersistentSMTPMailer, self).__init__(*args, **kwargs)
+        self._connection = None
+
+    @classmethod
+    def from_settings(cls, settings, prefix='mail.'):
+        """Create a mailer configured from the :kbd:`mail.*` app settings.
+        """
+        return cls(
+            hostname=settings.get(prefix + 'host', 'localhost'),
+            port=int(settings.get(prefix + 'port', 25)),
+            username=settings.get(prefix + 'username'),
+            password=settings.get(prefix + 'password'),
+            no_tls=asbool(settings.get(prefix + 'no_tls', False)),
+            force_tls=asbool(settings.get(prefix + 'force_tls', False)),
+            ssl=asbool(settings.get(prefix + 'ssl', False)),
+            timeout=float(settings.get(prefix + 'timeout', 10)),
+        )
+
+    def smtp_factory(self):
+        if self.ssl:
+            connection = self.smtp_ssl(
+                self.hostname, str(self.port), timeout=self.timeout)
+        else:
+            connection = self.smtp(
+                self.hostname, str(self.port), timeout=self.timeout)
+        connection.set_debuglevel(self.debug_smtp)
+        return connection
+
+    def _connect(self):
+        connection = self.smtp_factory()
+        code, response = connection.ehlo()
+        if not 200 <= code < 300:
+            code, response = connection.helo()
+            if not 200 <= code < 300:
+                connection.close()
+                raise RuntimeError(
+                    'Error sending HELO to the SMTP server '
+                    '(code={}, response={})'.format(code, response))
+        have_tls = connection.has_extn('starttls')
+        if not have_tls and self.force_tls:
+            connection.close()
+            raise RuntimeError('TLS is not available but TLS is required')
+        if have_tls and not self.no_tls:
+            connection.starttls()
+            connection.ehlo()
+        if self.username is not None and self.password is not None:
+            connection.login(self.username, self.password)
+        return connection
+
+    def send(self, fromaddr, toaddrs, message):
+        if self._connection is None:
+            self._connection = self._connect()
+        try:
+            self._connection.sendmail(
+                fromaddr, toaddrs, encode_message(message))
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Don't reuse a connection that may be broken
+            self.close()
+            raise
+
+    def close(self):
+        """Close the SMTP connection, if it is open.
+        """
+        connection, self._connection = self._connection, None
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+
+class MailQueueProcessor(object):
+    """Deliver the messages in a mail queue maildir in batches,
+    retrying failed deliveries with exponential backoff.
+
+    Messages that are refused with a permanent (5xx) SMTP error are
+    moved aside and not retried.
+    Messages that still can't be delivered after :kbd:`max_attempts`
+    stay in the queue for the next drain.
+
+    Each message is claimed before it is sent,
+    so a message that another processor is sending is skipped.
+    """
+    def __init__(
+        self, mailer, queue_path, batch_size=BATCH_SIZE,
+        max_attempts=MAX_ATTEMPTS, backoff=BACKOFF, sleep=time.sleep,
+    ):
+        self.mailer = mailer
+        self.maildir = Maildir(queue_path, create=True)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._sleep = sleep
+
+    def send_messages(self):
+        """Deliver the queued messages.
+
+        :returns: Numbers of messages sent, rejected, and failed.
+        :rtype: dict
+        """
+        stats = {'sent': 0, 'rejected': 0, 'failed': 0}
+        pending = list(self.maildir)
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = self.backoff * 2 ** (attempt - 1)
+                log.warning(
+                    'retrying delivery of {} queued message(s) in {}s'
+                    .format(len(pending), delay))
+                self._sleep(delay)
+            failed = []
+            for start in range(0, len(pending), self.batch_size):
+                try:
+                    for filename in pending[start:start + self.batch_size]:
+                        outcome = self._deliver(filename)
+                        if outcome == 'failed':
+                            failed.append(filename)
+                        elif outcome is not None:
+                            stats[outcome] += 1
+                finally:
+                    self.mailer.close()
+            pending = failed
+            if not pending:
+                break
+        stats['failed'] = len(pending)
+        return stats
+
+    def _deliver(self, filename):
+        """Send the queued message in :kbd:`filename`.
+
+        :returns: :kbd:`sent`, :kbd:`rejected`, or :kbd:`failed`,
+                  or :py:obj:`None` if another processor is sending the
+                  message or has already sent it.
+        """
+        head, tail = os.path.split(filename)
+        sending = os.path.join(head, '.sending-' + tail)
+        if not _claim(filename, sending):
+            return None
+        try:
+            with open(filename) as f:
+                fromaddr, toaddrs, message = _parse_message(f)
+            try:
+                self.mailer.send(fromaddr, toaddrs, message)
+            except smtplib.SMTPResponseException as e:
+                if not 500 <= e.smtp_code <= 599:
+                    raise
+                log.error(
+                    'discarding mail from {} to {} due to a permanent '
+                    'error: {}'.format(fromaddr, ', '.join(toaddrs), e.args))
+                os.link(filename, os.path.join(head, '.rejected-' + tail))
+                outcome = 'rejected'
+            else:
+                outcome = 'sent'
+            _remove(filename)
+            return outcome
+        except Exception:
+            log.warning(
+                'delivery of queued message {} failed'.format(tail),
+                exc_info=True)
+            return 'failed'
+        finally:
+            # The claim is released so that a failed message can be
+            # retried right away
+            _remove(sending)
+
+
+def _claim(filename, sending):
+    """Claim the queued message in :kbd:`filename` for delivery by hard
+    linking it to :kbd:`sending`,
+    which fails if another processor has already claimed it.
+
+    A claim that is older than :py:data:`MAX_SEND_TIME` is assumed to
+    have been left behind by a processor that died while sending,
+    and is replaced.
+
+    :returns: :py:obj:`True` if the message was claimed.
+    """
+    try:
+        age = time.time() - os.stat(sending).st_mtime
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    else:
+        if age <= MAX_SEND_TIME:
+            return False
+        _remove(sending)
+    try:
+        # Touch the message so that its age is the time since this
+        # delivery attempt
+        os.utime(filename, None)
+        os.link(filename, sending)
+    except OSError as e:
+        # Sent by another processor, or claimed by it first
+        if e.errno in (errno.ENOENT, errno.EEXIST):
+            return False
+        raise
+    return True
+
+
+def _parse_message(fp):
+    """Return the envelope sender and recipients,
+    and the message without the headers that hold them,
+    from the queued message file :kbd:`fp`.
+    """
+    message = Parser().parse(fp)
+    fromaddr = str(make_header(decode_header(
+        message['X-Actually-From'] or '')))
+    toaddrs = tuple(
+        address.strip() for address in
+        str(make_header(decode_header(
+            message['X-Actually-To'] or ''))).split(',')
+        if address.strip())
+    del message['X-Actually-From']
+    del message['X-Actually-To']
+    return fromaddr, toaddrs, message
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def queue_stats(queue_path, clock=time.time):
+    """Return the number of messages in the mail queue,
+    and the age in seconds of the oldest one.
+
+    Delivery attempts touch messages,
+    so the age of a message that has failed to be delivered is the time
+    since its most recent attempt.
+
+    :arg queue_path: Mail queue maildir path.
+    :type queue_path: str
+    """
+    mtimes = []
+    for filename in Maildir(queue_path, create=True):
+        try:
+            mtimes.append(os.stat(filename).st_mtime)
+        except OSError as e:
+            # Delivered while we were looking
+            if e.errno != errno.ENOENT:
+                raise
+    return {
+        'depth': len(mtimes),
+        'oldest_age': clock() - min(mtimes) if mtimes else 0,
+    }
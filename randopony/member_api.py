@@ -0,0 +1,232 @@
+"""RandoPony club membership database API client.
+
+The club database is queried through a shared, pooled HTTP session with
+connect and read timeouts.
+A circuit breaker makes lookups fail fast to "unknown" after consecutive
+failures so that a slow or unavailable club database doesn't hold up
+registrations,
+and counters record request latencies and errors.
+"""
+from collections import Counter
+import logging
+import threading
+import time
+
+import requests
+
+
+log = logging.getLogger(__name__)
+
+
+class MemberAPIError(Exception):
+    """Club database request failed or was refused by the circuit breaker.
+    """
+
+
+class CircuitBreaker(object):
+    """Consecutive failures circuit breaker.
+
+    The breaker opens after :kbd:`failure_threshold` consecutive failures.
+    While it is open requests are refused until :kbd:`reset_timeout`
+    seconds have passed.
+    Then 1 trial request is allowed;
+    if it succeeds the breaker closes,
+    otherwise it opens again.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=60,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow_request(self):
+        """Return :py:obj:`True` if a request may be attempted.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if (self._state == self.OPEN
+                    and self._clock() - self._opened_at
+                    >= self.reset_timeout):
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if (self._state == self.HALF_OPEN
+                    or self._failures >= self.failure_threshold):
+                if self._state != self.OPEN:
+                    log.warning(
+                        'club database circuit breaker opened after {} '
+                        'consecutive failures'.format(self._failures))
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class MemberAPIClient(object):
+    """Club membership status API client.
+
+    :arg float connect_timeout: Seconds to wait for a connection to
+                                the club database.
+    :arg float read_timeout: Seconds to wait for the club database to
+                             respond.
+    :arg int failure_threshold: Number of consecutive failures that opens
+                                the circuit breaker.
+    :arg float reset_timeout: Seconds that the circuit breaker stays open
+                              before a trial request is allowed.
+    :arg int pool_maxsize: Maximum number of pooled connections.
+    """
+    def __init__(
+        self, connect_timeout=3.05, read_timeout=5, failure_threshold=5,
+        reset_timeout=60, pool_maxsize=10,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a client configured from the :kbd:`member_api.*` values
+        in the app :kbd:`settings`.
+        """
+        return cls(
+            connect_timeout=float(
+                settings.get('member_api.connect_timeout', 3.05)),
+            read_timeout=float(settings.get('member_api.read_timeout', 5)),
+            failure_threshold=int(
+                settings.get('member_api.failure_threshold', 5)),
+            reset_timeout=float(settings.get('member_api.reset_timeout', 60)),
+            pool_maxsize=int(settings.get('member_api.pool_maxsize', 10)),
+        )
+
+    def get_member_status(self, first_name, last_name, is_club_member_url):
+        """Return the club membership status of the rider with
+        :kbd:`first_name` and :kbd:`last_name`,
+        or :py:obj:`None` (unknown) if the lookup fails.
+
+        See :meth:`fetch_member_status` for the arguments.
+        """
+        try:
+            return self.fetch_member_status(
+                first_name, last_name, is_club_member_url)
+        except MemberAPIError:
+            return None
+
+    def fetch_member_status(self, first_name, last_name, is_club_member_url):
+        """Return the club membership status of the rider with
+        :kbd:`first_name` and :kbd:`last_name`.
+
+        :arg str is_club_member_url: Club membership status API URL
+                                     template with :kbd:`first_name` and
+                                     :kbd:`last_name` fields.
+
+        :returns: :py:obj:`True` for a current member,
+                  :py:obj:`False` for an expired membership,
+                  or :py:obj:`None` if the rider's name couldn't be found.
+
+        :raises: :exc:`MemberAPIError` if the request failed,
+                 or the circuit breaker is open.
+        """
+        if not self.breaker.allow_request():
+            self._count('short_circuits')
+            raise MemberAPIError('club database circuit breaker is open')
+        url = is_club_member_url.format(
+            last_name=last_name, first_name=first_name)
+        start = time.monotonic()
+        try:
+            response = self.session.get(
+                url, timeout=self.timeout, verify=False)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            member_status = (
+                response.json()['is_current_member'] if response.ok else None)
+        except (requests.RequestException, ValueError) as e:
+            self._record(time.monotonic() - start, 'failures')
+            self.breaker.record_failure()
+            log.warning(
+                'club database request for {} {} failed: {}'
+                .format(first_name, last_name, e))
+            raise MemberAPIError(str(e))
+        except KeyError:
+            member_status = None
+        except Exception:
+            # Unexpected, but still a failed request as far as the
+            # breaker is concerned, so it doesn't get stuck half open
+            self._record(time.monotonic() - start, 'failures')
+            self.breaker.record_failure()
+            raise
+        self._record(time.monotonic() - start, 'successes')
+        self.breaker.record_success()
+        return member_status
+
+    def stats(self):
+        """Return dict of request counters and latencies in seconds.
+        """
+        with self._lock:
+            requests_count = (
+                self._counters['successes'] + self._counters['failures'])
+            return {
+                'requests': requests_count,
+                'successes': self._counters['successes'],
+                'failures': self._counters['failures'],
+                'short_circuits': self._counters['short_circuits'],
+                'latency_mean': (
+                    self._latency_total / requests_count
+                    if requests_count else 0.0),
+                'latency_max': self._latency_max,
+            }
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _record(self, latency, counter):
+        with self._lock:
+            self._counters[counter] += 1
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+
+_client = MemberAPIClient()
+
+
+def configure(settings):
+    """Replace the shared client with one configured from the app
+    :kbd:`settings`.
+    """
+    global _client
+    _client = MemberAPIClient.from_settings(settings)
+
+
+def get_client():
+    """Return the shared club membership status API client.
+    """
+    return _client
@@ -8,6 +8,15 @@ from randopony.models.admin import (
     Administrator,
     AdministratorSchema,
 )
+from randopony.models.broadcast import (
+    BroadcastJob,
+    BroadcastRecipient,
+    BroadcastSchema,
+)
+from randopony.models.member_status import (
+    ClubMember,
+    MemberStatusCache,
+)
 from randopony.models.brevet import (
     Brevet,
     BrevetSchema,
@@ -20,3 +29,6 @@ from randopony.models.populaire import (
     PopulaireEntrySchema,
     PopulaireRider,
 )
+from randopony.models.outbox import OutboxEntry
+from randopony.models.pending_task import PendingTask
+from randopony.models.rider_list import RiderListRow
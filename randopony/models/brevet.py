@@ -1,8 +1,11 @@
 """RandoPony brevet data model.
 """
-from datetime import timedelta
+from collections import namedtuple
+from datetime import (
+    datetime,
+    timedelta,
+)
 from operator import itemgetter
-import uuid
 import colander
 from deform.widget import (
     DateTimeInputWidget,
@@ -14,15 +17,40 @@ from deform.widget import (
 from pyramid_deform import CSRFSchema
 from sqlalchemy import (
     Boolean,
+    case,
     Column,
     DateTime,
+    event,
     ForeignKey,
+    func,
+    Index,
     Integer,
     Text,
 )
 from sqlalchemy.orm import relationship
-from randopony.models.core import EventMixin
-from randopony.models.meta import Base
+from randopony.models.core import (
+    EventMixin,
+    RosterEntryMixin,
+    track_rider_count,
+    start_of_today,
+)
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+RegionSummary = namedtuple('RegionSummary', 'count next_date_time')
+
+
+class BrevetRosterEntry(
+    RosterEntryMixin,
+    namedtuple(
+        'BrevetRosterEntry', 'first_name last_name comment bike_type'),
+):
+    """Brevet rider list entry.
+    """
+    __slots__ = ()
 
 
 class Brevet(EventMixin, Base):
@@ -46,9 +74,16 @@ class Brevet(EventMixin, Base):
     }
 
     __tablename__ = 'brevets'
+    __table_args__ = (
+        Index(
+            'ix_brevets_region_distance_date_time',
+            'region', 'distance', 'date_time'),
+    )
 
     region = Column(Text, index=True)
     distance = Column(Integer)
+    # Maintained from region, distance, and date by the mapper events below
+    slug = Column(Text, unique=True, index=True)
     alt_date_time = Column(DateTime)
     route_name = Column(Text)
     start_locn = Column(Text)
@@ -82,6 +117,8 @@ class Brevet(EventMixin, Base):
             'https://maps.google.com/maps?q={}'
             .format('+'.join(self.start_locn.split())))
         self.google_doc_id = google_doc_id
+        self.rider_count = 0
+        self.organizer_notification = 'immediate'
 
     def __str__(self):
         return '{0.region}{0.distance} {0.date_time:%d%b%Y}'.format(self)
@@ -89,12 +126,63 @@ class Brevet(EventMixin, Base):
     def __repr__(self):
         return '<Brevet({})>'.format(self)
 
-    @property
-    def uuid(self):
-        return uuid.uuid5(
-            uuid.NAMESPACE_URL,
-            '/randopony/{0.region}/{0.distance}/{0.date_time:%d%b%Y}'
-            .format(self))
+    @staticmethod
+    def make_slug(region, distance, date):
+        """Return the slug that identifies the brevet in :kbd:`region` of
+        :kbd:`distance` on :kbd:`date`;
+        e.g. :kbd:`VI200-03Mar2013`.
+        """
+        return '{}{}-{:%d%b%Y}'.format(region, distance, date)
+
+    @classmethod
+    def get_by_slug(cls, slug):
+        """Return the brevet that is identified by :kbd:`slug`,
+        or :py:obj:`None`.
+        """
+        return DBSession.query(cls).filter_by(slug=slug).first()
+
+    def roster(self):
+        """Return list of :class:`BrevetRosterEntry` tuples for the
+        brevet's riders, ordered by last name.
+
+        Only the columns that are shown in the public rider list are
+        selected, so no :class:`BrevetRider` instances are built.
+        """
+        rows = (DBSession.query(*(
+                    getattr(BrevetRider, field)
+                    for field in BrevetRosterEntry._fields))
+                .filter(BrevetRider.brevet == self.id)
+                .order_by(BrevetRider.lowercase_last_name))
+        return [BrevetRosterEntry._make(row) for row in rows]
+
+    @classmethod
+    def get_current_region_summary(cls, recent_days=7):
+        """Return dict of :class:`RegionSummary` tuples keyed by region
+        for regions that have current brevets.
+
+        The summaries contain the number of current brevets in the region,
+        and the start date/time of the region's next brevet,
+        or :py:obj:`None` if all of its current brevets are in the past.
+        They are calculated with a single aggregate query.
+        """
+        today = start_of_today()
+        days_ago = today - timedelta(days=recent_days)
+        next_date_time = func.min(
+            case([(cls.date_time >= today, cls.date_time)]))
+        rows = (DBSession.query(cls.region, func.count(cls.id), next_date_time)
+                .filter(cls.date_time >= days_ago)
+                .group_by(cls.region))
+        return {
+            region: RegionSummary(count, next_date_time)
+            for region, count, next_date_time in rows
+        }
+
+
+@event.listens_for(Brevet, 'before_insert')
+@event.listens_for(Brevet, 'before_update')
+def _set_slug(mapper, connection, brevet):
+    brevet.slug = Brevet.make_slug(
+        brevet.region, brevet.distance, brevet.date_time)
 
 
 class BrevetSchema(CSRFSchema):
@@ -168,6 +256,24 @@ class BrevetSchema(CSRFSchema):
         title='Registration Closes',
         widget=DateTimeInputWidget(options=datetimeinputwidget_options),
     )
+    organizer_notification = colander.SchemaNode(
+        colander.String(),
+        title='Organizer Registration Emails',
+        widget=SelectWidget(values=Brevet.ORGANIZER_NOTIFICATIONS),
+        validator=colander.OneOf(
+            [key for key, title in Brevet.ORGANIZER_NOTIFICATIONS]),
+    )
+
+    def validator(self, node, appstruct):
+        """Reject a brevet with the same region, distance, and date as
+        another one because their pages would have the same URL.
+        """
+        other = Brevet.get_by_slug(Brevet.make_slug(
+            appstruct['region'], appstruct['distance'],
+            appstruct['date_time']))
+        if other is not None and other.id != appstruct.get('id'):
+            raise colander.Invalid(
+                node, 'There is already a {} brevet'.format(other))
 
 
 class BrevetRider(Base):
@@ -187,6 +293,11 @@ class BrevetRider(Base):
     )
 
     __tablename__ = 'brevet_riders'
+    __table_args__ = (
+        Index(
+            'ix_brevet_riders_brevet_lowercase_last_name',
+            'brevet', 'lowercase_last_name'),
+    )
 
     id = Column(Integer, primary_key=True)
     email = Column(Text)
@@ -198,6 +309,9 @@ class BrevetRider(Base):
     bike_type = Column(Text)
     info_answer = Column(Text)
     brevet = Column(Integer, ForeignKey('brevets.id'))
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    registered_at = Column(DateTime, default=datetime.utcnow)
 
     def __init__(self, first_name, last_name, email, comment,
                  bike_type='single', member_status=None, info_answer=None):
@@ -261,3 +375,6 @@ class BrevetEntrySchema(CSRFSchema):
         default='single',
         widget=SelectWidget(values=BrevetRider.BIKE_TYPES),
     )
+
+
+track_rider_count(Brevet, BrevetRider, 'brevet')
@@ -0,0 +1,126 @@
+"""RandoPony broadcast email to event riders data model.
+"""
+from datetime import datetime
+
+import colander
+from deform.widget import (
+    TextAreaWidget,
+    TextInputWidget,
+)
+from pyramid_deform import CSRFSchema
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    func,
+    Index,
+    Integer,
+    Text,
+)
+from sqlalchemy.orm import relationship
+
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+class BroadcastJob(Base):
+    """Email message to all of the riders registered for an event,
+    and the progress of its delivery.
+
+    :kbd:`event_type` is the admin list name of the event's type;
+    i.e. :kbd:`brevets` or :kbd:`populaires`.
+    """
+    __tablename__ = 'broadcast_jobs'
+    __table_args__ = (
+        Index('ix_broadcast_jobs_event', 'event_type', 'event_id'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(Text)
+    event_id = Column(Integer)
+    sender = Column(Text)
+    reply_to = Column(Text)
+    subject = Column(Text)
+    body = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    # Error that stopped the job before all of its recipients were sent to
+    error = Column(Text)
+    recipients = relationship(
+        'BroadcastRecipient',
+        order_by='BroadcastRecipient.id',
+    )
+
+    def __init__(self, event_type, event_id, sender, reply_to, subject, body):
+        self.event_type = event_type
+        self.event_id = event_id
+        self.sender = sender
+        self.reply_to = reply_to
+        self.subject = subject
+        self.body = body
+
+    def __repr__(self):
+        return '<BroadcastJob({0.id}: {0.subject})>'.format(self)
+
+    def progress(self):
+        """Return dict of numbers of the job's recipients keyed by
+        delivery status,
+        calculated with a single aggregate query.
+        """
+        progress = dict.fromkeys(BroadcastRecipient.STATUSES, 0)
+        rows = (DBSession.query(
+                    BroadcastRecipient.status, func.count())
+                .filter(BroadcastRecipient.job == self.id)
+                .group_by(BroadcastRecipient.status))
+        progress.update(rows)
+        return progress
+
+
+class BroadcastRecipient(Base):
+    """Broadcast email recipient and delivery status.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUSES = (PENDING, SENT, FAILED)
+
+    __tablename__ = 'broadcast_recipients'
+    __table_args__ = (
+        Index('ix_broadcast_recipients_job_status', 'job', 'status'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job = Column(Integer, ForeignKey('broadcast_jobs.id'))
+    email = Column(Text)
+    status = Column(Text, nullable=False, default=PENDING)
+    error = Column(Text)
+    sent_at = Column(DateTime)
+
+    def __init__(self, email):
+        self.email = email
+        self.status = self.PENDING
+
+    def __repr__(self):
+        return '<BroadcastRecipient({0.email}: {0.status})>'.format(self)
+
+
+class BroadcastSchema(CSRFSchema):
+    """Form schema for admin interface broadcast email to event riders.
+    """
+    subject = colander.SchemaNode(
+        colander.String(),
+        widget=TextInputWidget(
+            autofocus=True,
+            css_class='input-xxlarge',
+        ),
+    )
+    body = colander.SchemaNode(
+        colander.String(),
+        title='Message',
+        widget=TextAreaWidget(
+            rows=12,
+            css_class='input-xxlarge',
+        ),
+    )
@@ -4,18 +4,54 @@ from datetime import (
     datetime,
     timedelta,
 )
+import uuid
+
 from sqlalchemy import (
     Column,
     DateTime,
+    event,
+    func,
+    inspect,
     Integer,
+    select,
     Text,
 )
+from sqlalchemy.orm import (
+    object_session,
+    Session,
+)
+from sqlalchemy.orm.util import identity_key
+from zope.sqlalchemy import mark_changed
+
 from randopony.models.meta import (
     Base,
     DBSession,
 )
 
 
+def start_of_today():
+    """Return a naive datetime for midnight at the start of today.
+    """
+    today = datetime.today()
+    return today.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class RosterEntryMixin(object):
+    """Full name property for lightweight, tuple-based rider roster entries.
+
+    Mixed into :py:func:`collections.namedtuple` types that hold only
+    the rider columns that are displayed in public rider lists.
+    """
+    __slots__ = ()
+
+    @property
+    def full_name(self):
+        return (
+            u'{0.first_name} "{0.comment}" {0.last_name}'.format(self)
+            if self.comment
+            else u'{0.first_name} {0.last_name}'.format(self))
+
+
 class EmailAddress(Base):
     """Email address.
 
@@ -64,23 +100,133 @@ class Link(Base):
         return '<Link({0.key}={0.url})>'.format(self)
 
 
+def _new_uuid():
+    return str(uuid.uuid4())
+
+
 class EventMixin(object):
     """Common database columns and properties for all event data models.
     """
+    ORGANIZER_NOTIFICATIONS = (
+        ('immediate', 'Email for each registration'),
+        ('hourly', 'Hourly digest of registrations'),
+        ('daily', 'Daily digest of registrations'),
+    )
+
     id = Column(Integer, primary_key=True)
     date_time = Column(DateTime, index=True)
     organizer_email = Column(Text)
     registration_end = Column(DateTime)
     google_doc_id = Column(Text)
+    rider_count = Column(
+        Integer, nullable=False, default=0, server_default='0')
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    organizer_notification = Column(
+        Text, nullable=False, default='immediate',
+        server_default='immediate')
+    organizer_digest_at = Column(DateTime)
+    final_roster_sent_at = Column(DateTime)
+    # Secret part of the organizers' rider email address list URL;
+    # random, so it can't be derived from the event, and unchanged when
+    # the event is edited, so the URLs that organizers have keep working
+    uuid = Column(Text, unique=True, index=True, default=_new_uuid)
 
     @classmethod
     def get_current(cls, recent_days=7):
         """Return query object for current events.
         """
-        today = datetime.today()
-        today = today.replace(hour=0, minute=0, second=0, microsecond=0)
-        days_ago = today - timedelta(days=recent_days)
+        days_ago = start_of_today() - timedelta(days=recent_days)
         events = (DBSession.query(cls)
                   .filter(cls.date_time >= days_ago)
                   .order_by(cls.date_time))
         return events
+
+    @classmethod
+    def get_by_uuid(cls, uuid):
+        """Return the event that is identified by :kbd:`uuid`,
+        or :py:obj:`None`.
+        """
+        return DBSession.query(cls).filter_by(uuid=uuid).first()
+
+    @classmethod
+    def recount_riders(cls):
+        """Recalculate the rider_count of every event with a single
+        set-based UPDATE.
+
+        Repairs counts that have drifted from the rider table;
+        e.g. due to rider rows having been changed outside of the ORM.
+        """
+        events = cls.__table__
+        rider_event_id = cls._rider_cls.__table__.c[cls._rider_event_id_attr]
+        rider_count = (
+            select([func.count()])
+            .select_from(rider_event_id.table)
+            .where(rider_event_id == events.c.id)
+            .as_scalar())
+        DBSession.execute(events.update().values(rider_count=rider_count))
+        mark_changed(DBSession())
+
+
+def track_rider_count(event_cls, rider_cls, event_id_attr):
+    """Maintain :kbd:`event_cls.rider_count` as :kbd:`rider_cls` instances
+    are inserted, deleted, or moved between events,
+    and touch :kbd:`event_cls.updated_at` when any of an event's riders
+    change.
+
+    The event rows are updated by SQL emitted on the flush connection,
+    so they are changed in the same transaction as the rider rows.
+
+    :arg event_cls: Event data model class.
+    :arg rider_cls: Rider data model class.
+    :arg str event_id_attr: Name of the rider attribute that holds the
+                            foreign key of the rider's event.
+    """
+    event_cls._rider_cls = rider_cls
+    event_cls._rider_event_id_attr = event_id_attr
+
+    def adjust(connection, rider, event_id, delta):
+        if event_id is None:
+            return
+        events = event_cls.__table__
+        connection.execute(
+            events.update()
+            .where(events.c.id == event_id)
+            .values(
+                rider_count=events.c.rider_count + delta,
+                updated_at=datetime.utcnow(),
+            ))
+        session = object_session(rider)
+        if session is not None:
+            session.info.setdefault('rider_event_changes', set()).add(
+                identity_key(event_cls, event_id))
+
+    @event.listens_for(rider_cls, 'after_insert')
+    def rider_inserted(mapper, connection, rider):
+        adjust(connection, rider, getattr(rider, event_id_attr), 1)
+
+    @event.listens_for(rider_cls, 'after_delete')
+    def rider_deleted(mapper, connection, rider):
+        adjust(connection, rider, getattr(rider, event_id_attr), -1)
+
+    @event.listens_for(rider_cls, 'after_update')
+    def rider_updated(mapper, connection, rider):
+        history = inspect(rider).attrs[event_id_attr].history
+        if not history.has_changes():
+            adjust(connection, rider, getattr(rider, event_id_attr), 0)
+            return
+        for event_id in history.deleted or ():
+            adjust(connection, rider, event_id, -1)
+        for event_id in history.added or ():
+            adjust(connection, rider, event_id, 1)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_changed_rider_events(session, flush_context):
+    """Expire the in-memory rider_count and updated_at of events that were
+    changed by SQL during the flush so that they are reloaded on access.
+    """
+    for key in session.info.pop('rider_event_changes', ()):
+        event_obj = session.identity_map.get(key)
+        if event_obj is not None:
+            session.expire(event_obj, ['rider_count', 'updated_at'])
@@ -0,0 +1,119 @@
+"""RandoPony club membership roster and status cache data models.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Text,
+)
+
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+def normalize_name(name):
+    """Return :kbd:`name` lowercased, with leading and trailing whitespace
+    removed, and internal whitespace collapsed to single spaces.
+    """
+    return ' '.join(name.split()).lower()
+
+
+class ClubMember(Base):
+    """Club member from the roster exported by the club database.
+
+    The table is replaced wholesale by the
+    :command:`import_RandoPony_club_members` script.
+    Its primary key on normalized (last name, first name) is the index
+    for local membership status lookups.
+    """
+    __tablename__ = 'club_members'
+
+    last_name = Column(Text, primary_key=True)
+    first_name = Column(Text, primary_key=True)
+    member_status = Column(Boolean, nullable=False)
+
+    def __init__(self, first_name, last_name, member_status):
+        self.first_name = normalize_name(first_name)
+        self.last_name = normalize_name(last_name)
+        self.member_status = member_status
+
+    def __repr__(self):
+        return (
+            '<ClubMember({0.first_name} {0.last_name}={0.member_status})>'
+            .format(self))
+
+    @classmethod
+    def get_member_status(cls, first_name, last_name):
+        """Return the club membership status of the rider with
+        :kbd:`first_name` and :kbd:`last_name` from the imported roster,
+        or :py:obj:`None` if the name isn't in it.
+        """
+        return (
+            DBSession.query(cls.member_status)
+            .filter(cls.last_name == normalize_name(last_name))
+            .filter(cls.first_name == normalize_name(first_name))
+            .scalar())
+
+
+class MemberStatusCache(Base):
+    """Club membership status from the club database, keyed by normalized
+    rider name.
+
+    Riders register for several events in a season,
+    so caching their status saves repeated club database queries.
+    Unknown statuses (:py:obj:`None`; i.e. the name couldn't be found in
+    the club database) are cached for a shorter time than known ones
+    because new members are likely to join soon after they first
+    register.
+    """
+    __tablename__ = 'member_status_cache'
+
+    TTL = timedelta(days=1)
+    UNKNOWN_TTL = timedelta(hours=1)
+
+    first_name = Column(Text, primary_key=True)
+    last_name = Column(Text, primary_key=True)
+    member_status = Column(Boolean, nullable=True)
+    checked_at = Column(DateTime, nullable=False)
+
+    def __init__(self, first_name, last_name, member_status, checked_at):
+        self.first_name = normalize_name(first_name)
+        self.last_name = normalize_name(last_name)
+        self.member_status = member_status
+        self.checked_at = checked_at
+
+    def __repr__(self):
+        return (
+            '<MemberStatusCache({0.first_name} {0.last_name}='
+            '{0.member_status})>'.format(self))
+
+    @property
+    def is_fresh(self):
+        ttl = self.TTL if self.member_status is not None else self.UNKNOWN_TTL
+        return datetime.utcnow() - self.checked_at < ttl
+
+    @classmethod
+    def get_fresh(cls, first_name, last_name):
+        """Return the unexpired cache entry for the rider with
+        :kbd:`first_name` and :kbd:`last_name`,
+        or :py:obj:`None` if there isn't one.
+        """
+        entry = DBSession.query(cls).get(
+            (normalize_name(first_name), normalize_name(last_name)))
+        if entry is None or not entry.is_fresh:
+            return None
+        return entry
+
+    @classmethod
+    def store(cls, first_name, last_name, member_status):
+        """Add or refresh the cache entry for the rider with
+        :kbd:`first_name` and :kbd:`last_name`.
+        """
+        DBSession.merge(
+            cls(first_name, last_name, member_status, datetime.utcnow()))
@@ -0,0 +1,52 @@
+"""RandoPony transactional outbox data model.
+"""
+from datetime import datetime
+import json
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    Text,
+)
+
+from randopony.models.meta import Base
+
+
+class OutboxEntry(Base):
+    """Side effect of a change to the database,
+    like an email or a background task,
+    that is stored in the same transaction as the change,
+    and carried out after the transaction commits.
+
+    :kbd:`kind` identifies the side effect,
+    and :kbd:`payload` is a dict of the values that it needs.
+    """
+    __tablename__ = 'outbox'
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(Text, nullable=False)
+    payload_json = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Set when the side effect can't be carried out;
+    # failed entries are kept so that they can be recovered by hand
+    failed = Column(
+        Boolean, nullable=False, default=False, server_default='0')
+
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload
+
+    def __repr__(self):
+        return '<OutboxEntry({0.id}: {0.kind})>'.format(self)
+
+    @property
+    def payload(self):
+        """Dict of the values that the side effect needs.
+        """
+        return json.loads(self.payload_json)
+
+    @payload.setter
+    def payload(self, payload):
+        self.payload_json = json.dumps(payload, sort_keys=True)
@@ -0,0 +1,39 @@
+"""RandoPony coalesced background task data model.
+"""
+from datetime import datetime
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    Text,
+)
+
+from randopony.models.meta import Base
+
+
+class PendingTask(Base):
+    """Background task that has been queued and not run yet,
+    and the number of requests for it that have been folded into it.
+
+    :kbd:`name` is the celery task name,
+    and :kbd:`key` identifies the task's arguments;
+    there is at most 1 pending task for each (name, key).
+    """
+    __tablename__ = 'pending_tasks'
+    __table_args__ = (
+        Index('ix_pending_tasks_name_key', 'name', 'key', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False)
+    key = Column(Text, nullable=False)
+    requests = Column(Integer, nullable=False, default=1)
+    first_requested_at = Column(DateTime, default=datetime.utcnow)
+    last_requested_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return (
+            '<PendingTask({0.name} {0.key}: {0.requests} requests)>'
+            .format(self))
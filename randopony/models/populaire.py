@@ -1,17 +1,21 @@
 """RandoPony populaire data model.
 """
-import uuid
+from collections import namedtuple
+from datetime import datetime
 import colander
 from deform.widget import (
     DateTimeInputWidget,
     HiddenWidget,
     RadioChoiceWidget,
+    SelectWidget,
     TextInputWidget,
 )
 from pyramid_deform import CSRFSchema
 from sqlalchemy import (
     Column,
+    DateTime,
     ForeignKey,
+    Index,
     Integer,
     Text,
 )
@@ -19,6 +23,8 @@ from sqlalchemy.orm import relationship
 from randopony.models.core import (
     EventMixin,
     Link,
+    RosterEntryMixin,
+    track_rider_count,
 )
 from randopony.models.meta import (
     Base,
@@ -26,6 +32,16 @@ from randopony.models.meta import (
 )
 
 
+class PopulaireRosterEntry(
+    RosterEntryMixin,
+    namedtuple(
+        'PopulaireRosterEntry', 'first_name last_name comment distance'),
+):
+    """Populaire rider list entry.
+    """
+    __slots__ = ()
+
+
 class Populaire(EventMixin, Base):
     """Populaire event.
     """
@@ -63,6 +79,8 @@ class Populaire(EventMixin, Base):
             'https://maps.google.com/maps?q={}'
             .format('+'.join(self.start_locn.split())))
         self.google_doc_id = google_doc_id
+        self.rider_count = 0
+        self.organizer_notification = 'immediate'
 
     def __str__(self):
         return '{.short_name}'.format(self)
@@ -70,11 +88,19 @@ class Populaire(EventMixin, Base):
     def __repr__(self):
         return '<Populaire({})>'.format(self)
 
-    @property
-    def uuid(self):
-        return uuid.uuid5(
-            uuid.NAMESPACE_URL,
-            '/randopony/{0.short_name}/{0.date_time:%d%b%Y}'.format(self))
+    def roster(self):
+        """Return list of :class:`PopulaireRosterEntry` tuples for the
+        populaire's riders, ordered by last name.
+
+        Only the columns that are shown in the public rider list are
+        selected, so no :class:`PopulaireRider` instances are built.
+        """
+        rows = (DBSession.query(*(
+                    getattr(PopulaireRider, field)
+                    for field in PopulaireRosterEntry._fields))
+                .filter(PopulaireRider.populaire == self.id)
+                .order_by(PopulaireRider.lowercase_last_name))
+        return [PopulaireRosterEntry._make(row) for row in rows]
 
 
 class PopulaireSchema(CSRFSchema):
@@ -142,6 +168,13 @@ class PopulaireSchema(CSRFSchema):
         title='Registration Closes',
         widget=DateTimeInputWidget(options=datetimeinputwidget_options),
     )
+    organizer_notification = colander.SchemaNode(
+        colander.String(),
+        title='Organizer Registration Emails',
+        widget=SelectWidget(values=Populaire.ORGANIZER_NOTIFICATIONS),
+        validator=colander.OneOf(
+            [key for key, title in Populaire.ORGANIZER_NOTIFICATIONS]),
+    )
     entry_form_url = colander.SchemaNode(
         colander.String(),
         title='Entry Form URL',
@@ -157,6 +190,11 @@ class PopulaireRider(Base):
     """Populaire rider.
     """
     __tablename__ = 'populaire_riders'
+    __table_args__ = (
+        Index(
+            'ix_populaire_riders_populaire_lowercase_last_name',
+            'populaire', 'lowercase_last_name'),
+    )
 
     id = Column(Integer, primary_key=True)
     email = Column(Text)
@@ -166,6 +204,9 @@ class PopulaireRider(Base):
     comment = Column(Text)
     distance = Column(Integer)
     populaire = Column(Integer, ForeignKey('populaires.id'))
+    updated_at = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    registered_at = Column(DateTime, default=datetime.utcnow)
 
     def __init__(self, first_name, last_name, email, distance, comment):
         self.email = email
@@ -235,3 +276,6 @@ class PopulaireEntrySchema(CSRFSchema):
         title='Distance (choose one)',
         widget=deferred_distance_widget,
     )
+
+
+track_rider_count(Populaire, PopulaireRider, 'populaire')
@@ -0,0 +1,70 @@
+"""RandoPony rider list sync state data model.
+"""
+from datetime import datetime
+import json
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    Text,
+)
+
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+class RiderListRow(Base):
+    """Rider list row as it was last pushed to the rider list backend.
+
+    :kbd:`event_type` is the admin list name of the event's type;
+    i.e. :kbd:`brevets` or :kbd:`populaires`.
+    Rows are keyed by rider id within an event.
+    """
+    __tablename__ = 'rider_list_rows'
+    __table_args__ = (
+        Index(
+            'ix_rider_list_rows_event_rider',
+            'event_type', 'event_id', 'rider_id', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    event_type = Column(Text, nullable=False)
+    event_id = Column(Integer, nullable=False)
+    rider_id = Column(Integer, nullable=False)
+    row_json = Column(Text, nullable=False)
+    synced_at = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, event_type, event_id, rider_id, row):
+        self.event_type = event_type
+        self.event_id = event_id
+        self.rider_id = rider_id
+        self.row = row
+
+    def __repr__(self):
+        return (
+            '<RiderListRow({0.event_type} {0.event_id}: {0.rider_id})>'
+            .format(self))
+
+    @property
+    def row(self):
+        """Dict of rider list column values.
+        """
+        return json.loads(self.row_json)
+
+    @row.setter
+    def row(self, row):
+        self.row_json = json.dumps(row, sort_keys=True)
+
+    @classmethod
+    def get_synced(cls, event_type, event_id):
+        """Return dict of the event's last synced rows keyed by rider id.
+        """
+        return {
+            synced.rider_id: synced
+            for synced in (
+                DBSession.query(cls)
+                .filter_by(event_type=event_type, event_id=event_id))}
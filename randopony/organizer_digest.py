@@ -0,0 +1,194 @@
+"""RandoPony event organizer registration digest emails.
+
+Organizers of events that are set to hourly or daily digests get
+1 email per period that lists the riders who pre-registered since the
+previous one,
+instead of an email for each registration,
+and a final roster email when registration closes.
+"""
+from collections import namedtuple
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+from pyramid.renderers import render
+from pyramid_mailer import get_mailer
+from pyramid_mailer.message import Message
+import pytz
+
+from randopony.models import (
+    Brevet,
+    BrevetRider,
+    Populaire,
+    PopulaireRider,
+)
+from randopony.models.meta import DBSession
+from randopony.site_settings import get_email_address
+
+
+DIGEST_PERIODS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+}
+
+
+def _brevet_urls(request, brevet):
+    date = brevet.date_time.strftime('%d%b%Y')
+    event_page_url = request.route_url(
+        'brevet', region=brevet.region, distance=brevet.distance, date=date)
+    rider_emails = request.route_url('rider_emails', uuid=brevet.uuid)
+    return event_page_url, rider_emails
+
+
+def _brevet_rider_note(brevet, rider):
+    if rider.member_status is None:
+        return ' - club membership unknown'
+    if not rider.member_status:
+        return ' - club membership expired'
+    return ''
+
+
+def _populaire_urls(request, populaire):
+    event_page_url = request.route_url(
+        'populaire', short_name=populaire.short_name)
+    rider_emails = request.route_url('rider_emails', uuid=populaire.uuid)
+    return event_page_url, rider_emails
+
+
+def _populaire_rider_note(populaire, rider):
+    if ',' in populaire.distance:
+        return ' - {} km'.format(rider.distance)
+    return ''
+
+
+EventType = namedtuple('EventType', 'model rider_model event_id urls note')
+
+EVENT_TYPES = (
+    EventType(
+        Brevet, BrevetRider, BrevetRider.brevet,
+        _brevet_urls, _brevet_rider_note),
+    EventType(
+        Populaire, PopulaireRider, PopulaireRider.populaire,
+        _populaire_urls, _populaire_rider_note),
+)
+
+
+def send_organizer_digests(request, now=None):
+    """Queue the organizer digest and final roster emails that are due
+    for current events.
+
+    Only events whose digest period has passed since their previous digest
+    are queried for new registrations,
+    with 1 query per event.
+
+    :arg request: Pyramid request to use to build URLs, render templates,
+                  and get the mailer.
+
+    :arg now: UTC date/time to send digests as of;
+              defaults to now.
+    :type now: :py:class:`datetime.datetime`
+
+    :returns: Numbers of digest and final roster emails queued.
+    :rtype: dict
+    """
+    now = now or datetime.utcnow()
+    tz = pytz.timezone(request.registry.settings['timezone'])
+    mailer = get_mailer(request)
+    stats = {'digests': 0, 'final_rosters': 0}
+    for event_type in EVENT_TYPES:
+        model = event_type.model
+        events = (
+            model.get_current()
+            .filter(model.organizer_notification.in_(DIGEST_PERIODS))
+            .filter(model.final_roster_sent_at.is_(None)))
+        for event in events:
+            registration_end = (
+                tz.localize(event.registration_end)
+                .astimezone(pytz.utc).replace(tzinfo=None))
+            if registration_end <= now:
+                message = _final_roster_message(request, event_type, event)
+                event.final_roster_sent_at = now
+                stats['final_rosters'] += 1
+            elif _digest_due(event, now):
+                message = _digest_message(request, event_type, event, now)
+                if message is None:
+                    continue
+                stats['digests'] += 1
+            else:
+                continue
+            event.organizer_digest_at = now
+            mailer.send_to_queue(message)
+    return stats
+
+
+def _digest_due(event, now):
+    if event.organizer_digest_at is None:
+        return True
+    period = DIGEST_PERIODS[event.organizer_notification]
+    return now - event.organizer_digest_at >= period
+
+
+def _riders_query(event_type, event):
+    rider_model = event_type.rider_model
+    return (
+        DBSession.query(rider_model)
+        .filter(event_type.event_id == event.id)
+        .order_by(rider_model.lowercase_last_name))
+
+
+def _digest_message(request, event_type, event, now):
+    since = event.organizer_digest_at
+    riders_query = _riders_query(event_type, event).filter(
+        event_type.rider_model.registered_at <= now)
+    if since is not None:
+        riders_query = riders_query.filter(
+            event_type.rider_model.registered_at > since)
+    new_riders = riders_query.all()
+    if not new_riders:
+        return None
+    return _organizer_message(
+        request, event_type, event,
+        subject=u'{0} new pre-registration(s) for the {1}'
+                .format(len(new_riders), event),
+        template='email/organizer_digest.mako',
+        tmpl_vars={
+            'new_riders': new_riders,
+            'rider_count': event.rider_count,
+        })
+
+
+def _final_roster_message(request, event_type, event):
+    since = event.organizer_digest_at
+    riders = _riders_query(event_type, event).all()
+    return _organizer_message(
+        request, event_type, event,
+        subject=u'Final pre-registration roster for the {}'.format(event),
+        template='email/organizer_final_roster.mako',
+        tmpl_vars={
+            'riders': riders,
+            # Riders are only flagged as new if there were earlier digests
+            'new_riders': [
+                rider for rider in riders
+                if since is not None and rider.registered_at is not None
+                and rider.registered_at > since],
+        })
+
+
+def _organizer_message(request, event_type, event, subject, template,
+                       tmpl_vars):
+    event_page_url, rider_emails = event_type.urls(request, event)
+    tmpl_vars.update({
+        'event': event,
+        'event_page_url': event_page_url,
+        'rider_emails': rider_emails,
+        'rider_note': lambda rider: event_type.note(event, rider),
+        'admin_email': get_email_address('admin_email'),
+    })
+    return Message(
+        subject=subject,
+        sender=get_email_address('from_randopony'),
+        recipients=[
+            addr.strip() for addr in event.organizer_email.split(',')],
+        body=render(template, tmpl_vars, request=request),
+    )
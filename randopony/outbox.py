@@ -0,0 +1,180 @@
+"""RandoPony transactional outbox.
+
+The side effects of a registration,
+its emails, club membership status lookup, and rider list sync,
+are stored as :py:class:`randopony.models.OutboxEntry` rows in the same
+transaction as the rider,
+so they are carried out if, and only if, the registration commits.
+The request only writes to the database;
+the :py:func:`randopony.tasks.outbox.drain_outbox` background task
+carries out the side effects after the transaction commits.
+"""
+import logging
+
+from pyramid_mailer.mailer import Mailer
+from pyramid_mailer.message import Message
+import transaction
+
+from randopony.models import OutboxEntry
+from randopony.models.meta import DBSession
+
+
+log = logging.getLogger(__name__)
+
+# Outbox entry kinds
+MAIL = 'mail'
+MEMBER_STATUS = 'member_status'
+RIDER_LIST_SYNC = 'rider_list_sync'
+
+# Maximum number of entries carried out in 1 transaction
+BATCH_SIZE = 50
+
+
+def add(kind, **payload):
+    """Add a :kbd:`kind` side effect with the :kbd:`payload` values to
+    the outbox.
+
+    Must be called within a transaction.
+    """
+    DBSession.add(OutboxEntry(kind, payload))
+
+
+def add_message(message):
+    """Add an email :kbd:`message` to the outbox to be put in the mail
+    queue.
+
+    Must be called within a transaction.
+
+    :arg message: Email message.
+    :type message: :py:class:`pyramid_mailer.message.Message`
+    """
+    add(MAIL, **message_payload(message))
+
+
+def message_payload(message):
+    """Return the values of the email :kbd:`message` as a JSON
+    serializable dict.
+
+    :arg message: Email message.
+    :type message: :py:class:`pyramid_mailer.message.Message`
+    """
+    return {
+        'subject': message.subject,
+        'sender': message.sender,
+        'recipients': list(message.recipients),
+        'body': message.body,
+        'extra_headers': message.extra_headers,
+    }
+
+
+def message(payload):
+    """Return the email message that :kbd:`payload` was created from by
+    :py:func:`message_payload`.
+
+    :rtype: :py:class:`pyramid_mailer.message.Message`
+    """
+    return Message(**payload)
+
+
+def drain(handlers, batch_size=BATCH_SIZE):
+    """Carry out the side effects in the outbox in the order that they
+    were added.
+
+    Each batch of entries is carried out in 1 transaction,
+    and each entry is claimed by deleting it in that transaction,
+    so a side effect whose handler only makes changes that join the
+    transaction,
+    like queuing mail or background tasks,
+    is carried out exactly once,
+    even if the outbox is drained by more than 1 process at a time.
+    If the handler for an entry raises an exception
+    the batch is carried out again 1 entry at a time,
+    and the entries that fail are marked as failed and skipped,
+    so they don't hold up the entries after them.
+
+    :arg dict handlers: Functions that carry out a side effect,
+                        keyed by entry kind.
+                        Each is called with the entry's payload.
+
+    :returns: Number of side effects carried out.
+    :rtype: int
+    """
+    drained = 0
+    while True:
+        with transaction.manager:
+            entry_ids = [
+                entry_id for (entry_id,) in
+                DBSession.query(OutboxEntry.id)
+                .filter_by(failed=False)
+                .order_by(OutboxEntry.id)
+                .limit(batch_size)]
+        if not entry_ids:
+            return drained
+        batch_drained = _drain_entries(handlers, entry_ids)
+        if batch_drained is not None:
+            drained += batch_drained
+            continue
+        for entry_id in entry_ids:
+            entry_drained = _drain_entries(handlers, [entry_id])
+            if entry_drained is not None:
+                drained += entry_drained
+                continue
+            with transaction.manager:
+                (DBSession.query(OutboxEntry)
+                 .filter_by(id=entry_id)
+                 .update({'failed': True}, synchronize_session=False))
+
+
+def _drain_entries(handlers, entry_ids):
+    """Claim and carry out the entries with :kbd:`entry_ids` in 1
+    transaction.
+
+    :returns: Number of side effects carried out,
+              or :py:obj:`None` if a handler raised an exception and the
+              transaction was aborted.
+    """
+    txn = transaction.begin()
+    drained = 0
+    try:
+        entries = (
+            DBSession.query(OutboxEntry)
+            .filter(OutboxEntry.id.in_(entry_ids))
+            .order_by(OutboxEntry.id)
+            .all())
+        for entry in entries:
+            claimed = (
+                DBSession.query(OutboxEntry)
+                .filter_by(id=entry.id)
+                .delete(synchronize_session=False))
+            if claimed:
+                handlers[entry.kind](entry.payload)
+                drained += 1
+    except Exception:
+        txn.abort()
+        log.exception('outbox entries {}-{} failed'.format(
+            entry_ids[0], entry_ids[-1]))
+        return None
+    try:
+        txn.commit()
+    except Exception:
+        txn.abort()
+        raise
+    return drained
+
+
+_mailer = Mailer.from_settings({})
+
+
+def configure(settings):
+    """Replace the mailer that puts outbox emails in the mail queue with
+    one configured from the :kbd:`mail.*` values in the app
+    :kbd:`settings`.
+    """
+    global _mailer
+    _mailer = Mailer.from_settings(settings)
+
+
+def get_mailer():
+    """Return the mailer that puts outbox emails in the mail queue.
+    """
+    return _mailer
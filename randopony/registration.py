@@ -0,0 +1,113 @@
+"""RandoPony rider registration.
+
+Adds riders to events for the entry form views,
+and for the write-behind intake writer that applies queued entries.
+"""
+from randopony import outbox
+from randopony.models import (
+    BrevetRider,
+    PopulaireRider,
+)
+from randopony.models.meta import DBSession
+
+
+def new_brevet_rider(appstruct):
+    """Return a rider for the brevet entry form values in
+    :kbd:`appstruct` that is not yet added to a brevet.
+    """
+    return BrevetRider(
+        email=appstruct['email'],
+        first_name=appstruct['first_name'],
+        last_name=appstruct['last_name'],
+        comment=appstruct['comment'],
+        member_status=None,
+        bike_type=appstruct['bike_type'],
+    )
+
+
+def registered_brevet_rider(brevet, appstruct):
+    """Return the rider with the name and email in :kbd:`appstruct`
+    who is already registered for :kbd:`brevet`,
+    or :py:obj:`None`.
+    """
+    return (
+        DBSession.query(BrevetRider)
+        .filter_by(
+            email=appstruct['email'],
+            first_name=appstruct['first_name'],
+            last_name=appstruct['last_name'],
+            brevet=brevet.id,
+        )
+        .first())
+
+
+def add_brevet_rider(brevet, rider, is_club_member_url):
+    """Add :kbd:`rider` to :kbd:`brevet`,
+    and add the club membership status lookup and rider list sync
+    for the registration to the outbox.
+
+    Must be called within a transaction.
+    """
+    brevet.riders.append(rider)
+    DBSession.add(rider)
+    DBSession.flush()
+    # Look up the rider's club membership status after the
+    # registration is committed, instead of holding the request
+    # and the database transaction open while the club database
+    # responds
+    outbox.add(
+        outbox.MEMBER_STATUS,
+        rider_id=rider.id,
+        is_club_member_url=is_club_member_url)
+    outbox.add(
+        outbox.RIDER_LIST_SYNC,
+        event_type='brevets', event_id=brevet.id)
+
+
+def new_populaire_rider(populaire, appstruct):
+    """Return a rider for the :kbd:`populaire` entry form values in
+    :kbd:`appstruct` that is not yet added to the populaire.
+
+    Riders of single distance populaires ride that distance.
+    """
+    try:
+        distance = appstruct['distance']
+    except KeyError:
+        distance = populaire.distance.split()[0]
+    return PopulaireRider(
+        email=appstruct['email'],
+        first_name=appstruct['first_name'],
+        last_name=appstruct['last_name'],
+        distance=distance,
+        comment=appstruct['comment'],
+    )
+
+
+def registered_populaire_rider(populaire, appstruct):
+    """Return the rider with the name and email in :kbd:`appstruct`
+    who is already registered for :kbd:`populaire`,
+    or :py:obj:`None`.
+    """
+    return (
+        DBSession.query(PopulaireRider)
+        .filter_by(
+            email=appstruct['email'],
+            first_name=appstruct['first_name'],
+            last_name=appstruct['last_name'],
+            populaire=populaire.id,
+        )
+        .first())
+
+
+def add_populaire_rider(populaire, rider):
+    """Add :kbd:`rider` to :kbd:`populaire`,
+    and add the rider list sync for the registration to the outbox.
+
+    Must be called within a transaction.
+    """
+    populaire.riders.append(rider)
+    DBSession.add(rider)
+    DBSession.flush()
+    outbox.add(
+        outbox.RIDER_LIST_SYNC,
+        event_type='populaires', event_id=populaire.id)
@@ -0,0 +1,279 @@
+"""RandoPony event rider list sync.
+
+Each event's rider list is kept up to date in a rider list backend,
+like a spreadsheet service that organizers can share.
+The rows that were last pushed to the backend are stored in
+:py:class:`randopony.models.RiderListRow`,
+so each sync only pushes the rows that have been inserted, changed,
+or removed since the previous one.
+The sync is run by the
+:py:func:`randopony.tasks.rider_list.sync_rider_list` celery task.
+"""
+import abc
+from datetime import datetime
+import json
+import sqlite3
+
+import requests
+import transaction
+
+from randopony import rider_roster
+from randopony.models import RiderListRow
+from randopony.models.meta import DBSession
+
+
+class RiderListSyncError(Exception):
+    """Rider list backend request failed.
+    """
+
+
+class RiderListBackend(abc.ABC):
+    """Rider list backend interface.
+
+    Rider lists are identified by :kbd:`list_key` strings,
+    and their rows by :kbd:`row_key` strings.
+    Rows are dicts of column values keyed by
+    :py:data:`randopony.rider_roster` column keys.
+    Inserting a row that already exists replaces it,
+    so that a sync that is repeated after a failure is harmless.
+    """
+    @abc.abstractmethod
+    def insert_rows(self, list_key, rows):
+        """Add :kbd:`rows`, a dict of rows keyed by row key,
+        to the list.
+        """
+
+    @abc.abstractmethod
+    def update_rows(self, list_key, rows):
+        """Replace the values of the :kbd:`rows`,
+        a dict of rows keyed by row key.
+        """
+
+    @abc.abstractmethod
+    def delete_rows(self, list_key, row_keys):
+        """Remove the rows with :kbd:`row_keys` from the list.
+        """
+
+
+class SQLiteRiderListBackend(RiderListBackend):
+    """Rider list backend that stores the lists in a local SQLite
+    database file.
+
+    :arg str path: Database file path;
+                   :kbd:`:memory:` for a transient database.
+    """
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS rider_lists ('
+                'list_key TEXT NOT NULL, row_key TEXT NOT NULL, '
+                'row TEXT NOT NULL, PRIMARY KEY (list_key, row_key))')
+
+    def insert_rows(self, list_key, rows):
+        self._replace_rows(list_key, rows)
+
+    def update_rows(self, list_key, rows):
+        self._replace_rows(list_key, rows)
+
+    def _replace_rows(self, list_key, rows):
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO rider_lists (list_key, row_key, row) '
+                'VALUES (?, ?, ?)',
+                [(list_key, row_key, json.dumps(row, sort_keys=True))
+                 for row_key, row in rows.items()])
+
+    def delete_rows(self, list_key, row_keys):
+        with self._connection:
+            self._connection.executemany(
+                'DELETE FROM rider_lists WHERE list_key = ? AND row_key = ?',
+                [(list_key, row_key) for row_key in row_keys])
+
+    def rows(self, list_key):
+        """Return dict of the list's rows keyed by row key.
+        """
+        return {
+            row_key: json.loads(row)
+            for row_key, row in self._connection.execute(
+                'SELECT row_key, row FROM rider_lists WHERE list_key = ?',
+                (list_key,))}
+
+
+class SpreadsheetServiceBackend(RiderListBackend):
+    """Rider list backend for a spreadsheet service with a JSON API.
+
+    The service is authenticated once with a bearer token that is sent
+    on every request of a shared, pooled HTTP session.
+    Each of the backend methods is 1 request to the
+    :kbd:`{base_url}/lists/{list_key}/rows` resource;
+    :kbd:`POST` to insert,
+    :kbd:`PATCH` to update,
+    and :kbd:`DELETE` to remove rows.
+
+    :arg str base_url: Spreadsheet service API URL.
+
+    :arg str token: Spreadsheet service API token.
+
+    :arg float connect_timeout: Seconds to wait for a connection to
+                                the service.
+
+    :arg float read_timeout: Seconds to wait for the service to respond.
+    """
+    def __init__(self, base_url, token=None, connect_timeout=3.05,
+                 read_timeout=10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        if token is not None:
+            self.session.headers['Authorization'] = 'Bearer {}'.format(token)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Return a backend configured from the :kbd:`rider_list.*` values
+        in the app :kbd:`settings`.
+        """
+        return cls(
+            base_url=settings['rider_list.service_url'],
+            token=settings.get('rider_list.service_token'),
+            connect_timeout=float(
+                settings.get('rider_list.connect_timeout', 3.05)),
+            read_timeout=float(settings.get('rider_list.read_timeout', 10)),
+        )
+
+    def insert_rows(self, list_key, rows):
+        self._request('POST', list_key, {'rows': self._rows_json(rows)})
+
+    def update_rows(self, list_key, rows):
+        self._request('PATCH', list_key, {'rows': self._rows_json(rows)})
+
+    def delete_rows(self, list_key, row_keys):
+        self._request('DELETE', list_key, {'keys': list(row_keys)})
+
+    def _rows_json(self, rows):
+        return [
+            {'key': row_key, 'values': row} for row_key, row in rows.items()]
+
+    def _request(self, method, list_key, body):
+        url = '{}/lists/{}/rows'.format(self.base_url, list_key)
+        try:
+            response = self.session.request(
+                method, url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise RiderListSyncError(
+                '{} {} failed: {}'.format(method, url, e))
+
+
+class RiderListSync(object):
+    """Push the changes in events' rider lists to a rider list backend.
+
+    :arg backend: Rider list backend.
+    :type backend: :py:class:`RiderListBackend`
+    """
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def list_key(event_type, event_id):
+        return '{}-{}'.format(event_type, event_id)
+
+    def sync(self, event_type, event_id):
+        """Push the changes in the rider list of the event with
+        :kbd:`event_id` since its previous sync to the backend.
+
+        The database is read and updated in short transactions before
+        and after the backend requests,
+        so no locks are held while waiting for the backend.
+        If a backend request fails the sync state isn't updated,
+        so the changes are pushed again by the next sync.
+
+        :arg str event_type: Admin list name of the event's type;
+                             i.e. :kbd:`brevets` or :kbd:`populaires`.
+
+        :returns: Numbers of rows inserted, updated, and deleted.
+        :rtype: dict
+
+        :raises: :exc:`RiderListSyncError` if a backend request fails.
+        """
+        roster_type = rider_roster.ROSTER_TYPES[event_type]
+        inserted, updated = {}, {}
+        with transaction.manager:
+            synced = {
+                rider_id: synced_row.row
+                for rider_id, synced_row
+                in RiderListRow.get_synced(event_type, event_id).items()}
+            for rider_id, row in rider_roster.keyed_roster_rows(
+                    roster_type, event_id):
+                synced_row = synced.pop(rider_id, None)
+                if synced_row is None:
+                    inserted[rider_id] = row
+                elif synced_row != row:
+                    updated[rider_id] = row
+            deleted = sorted(synced)
+        list_key = self.list_key(event_type, event_id)
+        if inserted:
+            self.backend.insert_rows(list_key, _str_keys(inserted))
+        if updated:
+            self.backend.update_rows(list_key, _str_keys(updated))
+        if deleted:
+            self.backend.delete_rows(
+                list_key, [str(rider_id) for rider_id in deleted])
+        if inserted or updated or deleted:
+            self._store(event_type, event_id, inserted, updated, deleted)
+        return {
+            'inserted': len(inserted),
+            'updated': len(updated),
+            'deleted': len(deleted),
+        }
+
+    def _store(self, event_type, event_id, inserted, updated, deleted):
+        now = datetime.utcnow()
+        with transaction.manager:
+            synced = RiderListRow.get_synced(event_type, event_id)
+            for rider_id, row in list(inserted.items()) + list(
+                    updated.items()):
+                if rider_id in synced:
+                    synced[rider_id].row = row
+                    synced[rider_id].synced_at = now
+                else:
+                    DBSession.add(
+                        RiderListRow(event_type, event_id, rider_id, row))
+            for rider_id in deleted:
+                if rider_id in synced:
+                    DBSession.delete(synced[rider_id])
+
+
+def _str_keys(rows):
+    return {str(rider_id): row for rider_id, row in rows.items()}
+
+
+_sync = None
+
+
+def configure(settings):
+    """Replace the shared rider list sync with one for the backend that is
+    configured in the app :kbd:`settings`.
+
+    The :kbd:`rider_list.backend` setting is :kbd:`sqlite` for a
+    :py:class:`SQLiteRiderListBackend` at :kbd:`rider_list.sqlite_path`,
+    or :kbd:`spreadsheet` for a :py:class:`SpreadsheetServiceBackend`.
+    Rider list sync is disabled if the setting is missing.
+    """
+    global _sync
+    backend = settings.get('rider_list.backend')
+    if backend == 'sqlite':
+        _sync = RiderListSync(
+            SQLiteRiderListBackend(settings['rider_list.sqlite_path']))
+    elif backend == 'spreadsheet':
+        _sync = RiderListSync(
+            SpreadsheetServiceBackend.from_settings(settings))
+    else:
+        _sync = None
+
+
+def get_sync():
+    """Return the shared rider list sync,
+    or :py:obj:`None` if rider list sync is disabled.
+    """
+    return _sync
@@ -0,0 +1,288 @@
+"""RandoPony event rider roster export.
+
+Rosters are streamed to the client as CSV or XLSX files that are
+generated row by row from a server-side database cursor,
+so the whole file is never held in memory.
+"""
+from collections import namedtuple
+import csv
+import io
+import re
+from xml.sax.saxutils import escape
+import zipfile
+
+from pyramid.response import Response
+import transaction
+
+from randopony.models import (
+    BrevetRider,
+    PopulaireRider,
+)
+from randopony.models.meta import DBSession
+
+
+# Number of rows fetched from the database cursor at a time,
+# and written to each chunk of the response body
+CHUNK_ROWS = 100
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': (
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+Column = namedtuple('Column', 'key title')
+
+# Characters that aren't allowed in XML 1.0 documents,
+# like the control characters that get pasted into names
+XML_INVALID_CHARS = re.compile(
+    '[^\t\n\r\u0020-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]')
+
+BREVET_COLUMNS = (
+    Column('ridernumber', 'Rider Number'),
+    Column('lastname', 'Last Name'),
+    Column('firstname', 'First Name'),
+    Column('clubmember', 'Club Member'),
+    Column('biketype', 'Bike Type'),
+)
+
+POPULAIRE_COLUMNS = (
+    Column('ridernumber', 'Rider Number'),
+    Column('lastname', 'Last Name'),
+    Column('firstname', 'First Name'),
+    Column('distance', 'Distance'),
+)
+
+
+def brevet_row(rider_number, rider):
+    """Return dict of roster column values for a brevet rider.
+    """
+    if rider.member_status is None:
+        current_member = 'Unknown'
+    else:
+        current_member = 'Yes' if rider.member_status else 'No'
+    return {
+        'ridernumber': str(rider_number),
+        'lastname': rider.last_name,
+        'firstname': rider.first_name,
+        'clubmember': current_member,
+        'biketype': rider.bike_type,
+    }
+
+
+def populaire_row(rider_number, rider):
+    """Return dict of roster column values for a populaire rider.
+    """
+    return {
+        'ridernumber': str(rider_number),
+        'lastname': rider.last_name,
+        'firstname': rider.first_name,
+        'distance': str(rider.distance),
+    }
+
+
+RosterType = namedtuple(
+    'RosterType', 'rider_model event_id fields columns row')
+
+ROSTER_TYPES = {
+    'brevets': RosterType(
+        BrevetRider, BrevetRider.brevet,
+        ('first_name', 'last_name', 'member_status', 'bike_type'),
+        BREVET_COLUMNS, brevet_row),
+    'populaires': RosterType(
+        PopulaireRider, PopulaireRider.populaire,
+        ('first_name', 'last_name', 'distance'),
+        POPULAIRE_COLUMNS, populaire_row),
+}
+
+
+def keyed_roster_rows(roster_type, event_id):
+    """Generate (rider id, roster row dict) tuples for the event with
+    :kbd:`event_id`.
+
+    Riders are numbered in the order that they registered in,
+    so their numbers don't change as more riders register.
+    Only the roster columns are selected,
+    and they are fetched :py:data:`CHUNK_ROWS` at a time from a
+    server-side cursor.
+
+    Must be called within a transaction.
+
+    :arg roster_type: Event type roster description.
+    :type roster_type: :py:class:`RosterType`
+    """
+    rider_model = roster_type.rider_model
+    rows = (
+        DBSession.query(rider_model.id, *(
+            getattr(rider_model, field) for field in roster_type.fields))
+        .filter(roster_type.event_id == event_id)
+        .order_by(rider_model.id)
+        .yield_per(CHUNK_ROWS))
+    for rider_number, rider in enumerate(rows, start=1):
+        yield rider.id, roster_type.row(rider_number, rider)
+
+
+def roster_rows(roster_type, event_id):
+    """Generate the roster row dicts for the event with :kbd:`event_id`.
+
+    The rows are generated after the request's transaction has ended,
+    so they are read in a transaction of their own.
+
+    See :py:func:`keyed_roster_rows` for the arguments.
+    """
+    with transaction.manager:
+        for rider_id, row in keyed_roster_rows(roster_type, event_id):
+            yield row
+
+
+def csv_chunks(columns, rows):
+    """Generate a CSV file of roster :kbd:`rows` in chunks of
+    UTF-8 encoded bytes.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.title for column in columns])
+    for i, row in enumerate(rows, start=1):
+        writer.writerow([row[column.key] for column in columns])
+        if i % CHUNK_ROWS == 0:
+            yield _drain_text(buffer)
+    yield _drain_text(buffer)
+
+
+def _drain_text(buffer):
+    chunk = buffer.getvalue().encode('utf-8')
+    buffer.seek(0)
+    buffer.truncate()
+    return chunk
+
+
+class _ChunkBuffer(object):
+    """Write-only file-like object that collects the bytes written to it
+    until they are drained.
+
+    It has no :py:meth:`tell` or :py:meth:`seek`,
+    so :py:class:`zipfile.ZipFile` writes to it as an unseekable stream.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunk, self._chunks = b''.join(self._chunks), []
+        return chunk
+
+
+_XLSX_PARTS = (
+    ('[Content_Types].xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+     'content-types">'
+     '<Default Extension="rels" ContentType="application/'
+     'vnd.openxmlformats-package.relationships+xml"/>'
+     '<Default Extension="xml" ContentType="application/xml"/>'
+     '<Override PartName="/xl/workbook.xml" ContentType="application/'
+     'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+     '<Override PartName="/xl/worksheets/sheet1.xml" '
+     'ContentType="application/'
+     'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+     '</Types>'),
+    ('_rels/.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+     'relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+     'officeDocument/2006/relationships/officeDocument" '
+     'Target="xl/workbook.xml"/>'
+     '</Relationships>'),
+    ('xl/workbook.xml',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/'
+     'main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+     'relationships">'
+     '<sheets><sheet name="Riders" sheetId="1" r:id="rId1"/></sheets>'
+     '</workbook>'),
+    ('xl/_rels/workbook.xml.rels',
+     '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+     '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+     'relationships">'
+     '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+     'officeDocument/2006/relationships/worksheet" '
+     'Target="worksheets/sheet1.xml"/>'
+     '</Relationships>'),
+)
+
+
+def xlsx_chunks(columns, rows):
+    """Generate a single worksheet XLSX file of roster :kbd:`rows` in
+    chunks of bytes.
+
+    The worksheet is written as a deflated zip archive member of unknown
+    size,
+    so only the current chunk of rows is held in memory.
+    Rider numbers are written as numbers,
+    and everything else as inline strings.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_PARTS:
+            archive.writestr(name, content)
+        yield buffer.drain()
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                b'spreadsheetml/2006/main"><sheetData>')
+            sheet.write(_xlsx_row(
+                1, [(column.title, False) for column in columns]))
+            for i, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(i + 1, [
+                    (row[column.key], column.key == 'ridernumber')
+                    for column in columns]))
+                if i % CHUNK_ROWS == 0:
+                    yield buffer.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+def _xlsx_row(row_number, cells):
+    xml = ['<row r="{}">'.format(row_number)]
+    for value, is_number in cells:
+        if is_number:
+            xml.append('<c t="n"><v>{}</v></c>'.format(value))
+        else:
+            xml.append(
+                '<c t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>'
+                .format(escape(XML_INVALID_CHARS.sub('', value or ''))))
+    xml.append('</row>')
+    return ''.join(xml).encode('utf-8')
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'xlsx': xlsx_chunks,
+}
+
+
+def roster_response(request, event_type, event):
+    """Return a response that streams the roster of :kbd:`event` in the
+    format in the request's :kbd:`format` matchdict item.
+
+    :arg str event_type: Admin list name of the event's type;
+                         i.e. :kbd:`brevets` or :kbd:`populaires`.
+    """
+    fmt = request.matchdict['format']
+    roster_type = ROSTER_TYPES[event_type]
+    app_iter = WRITERS[fmt](
+        roster_type.columns, roster_rows(roster_type, event.id))
+    return Response(
+        app_iter=app_iter,
+        content_type=FORMATS[fmt],
+        content_disposition='attachment; filename="{}-riders.{}"'.format(
+            str(event).replace(' ', '_'), fmt),
+    )
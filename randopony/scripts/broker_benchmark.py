@@ -0,0 +1,118 @@
+"""RandoPony celery broker transport benchmark.
+
+Measures the enqueue-to-execute latency of a trivial task through each
+of the broker transports that the app can be configured with,
+using an in-process worker,
+so that the :kbd:`celery.broker_url` setting can be chosen on evidence.
+"""
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+
+
+log = logging.getLogger(__name__)
+
+
+# Seconds that the workers of polling transports wait between checks for
+# new messages
+POLLING_INTERVAL = 0.1
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s [messages]\n'
+          '(example: "%s 50")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) > 2 or argv[1:] and not argv[1].isdigit():
+        usage(argv)
+    messages = int(argv[1]) if argv[1:] else 20
+    logging.basicConfig(level=logging.WARNING)
+    work_dir = tempfile.mkdtemp()
+    try:
+        print('{:<10} {:>10} {:>10} {:>10}'.format(
+            'transport', 'median ms', 'p95 ms', 'max ms'))
+        for name, broker_url, transport_options in transports(work_dir):
+            latencies = measure_latency(
+                broker_url, transport_options, messages)
+            print('{:<10} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, *(
+                    1000 * latency for latency in summarize(latencies))))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def transports(work_dir):
+    """Return the names, broker URLs, and transport options of the
+    transports to measure, with their data in :kbd:`work_dir`.
+    """
+    broker_folder = os.path.join(work_dir, 'broker')
+    os.makedirs(broker_folder)
+    sqlite_path = os.path.join(work_dir, 'celery.sqlite')
+    return [
+        ('memory', 'memory://', {'polling_interval': POLLING_INTERVAL}),
+        ('filesystem', 'filesystem://', {
+            'data_folder_in': broker_folder,
+            'data_folder_out': broker_folder,
+            'polling_interval': POLLING_INTERVAL,
+        }),
+        # The sqla transport passes its options to create_engine(),
+        # so its polling interval can't be changed from 1 s
+        ('sqlite', 'sqla+sqlite:///{}'.format(sqlite_path), {}),
+    ]
+
+
+def measure_latency(broker_url, transport_options, messages):
+    """Send :kbd:`messages` tasks, 1 at a time, through the broker at
+    :kbd:`broker_url` to an in-process worker.
+
+    :returns: Seconds from when each task was sent until it started to run.
+    :rtype: list
+    """
+    app = Celery(
+        'randopony_broker_benchmark', broker=broker_url,
+        set_as_current=False)
+    app.conf.update(
+        broker_transport_options=transport_options,
+        worker_prefetch_multiplier=1,
+        task_ignore_result=True,
+        worker_hijack_root_logger=False,
+    )
+    latencies = []
+    executed = threading.Event()
+
+    @app.task(shared=False)
+    def stamp(sent_at):
+        latencies.append(time.monotonic() - sent_at)
+        executed.set()
+
+    with start_worker(app, pool='solo', perform_ping_check=False):
+        for i in range(messages):
+            executed.clear()
+            stamp.delay(time.monotonic())
+            if not executed.wait(timeout=30):
+                log.warning(
+                    '{} task not executed within 30 s'.format(broker_url))
+                break
+    return latencies
+
+
+def summarize(latencies):
+    """Return the median, 95th percentile, and maximum of
+    :kbd:`latencies`.
+    """
+    if not latencies:
+        return float('nan'), float('nan'), float('nan')
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+    return statistics.median(ordered), p95, ordered[-1]
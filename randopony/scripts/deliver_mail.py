@@ -0,0 +1,81 @@
+"""RandoPony queued mail delivery script.
+
+Delivers the messages that the app has put in the mail queue maildir,
+either once (e.g. from cron),
+or with the :kbd:`--watch` option,
+every :kbd:`mail_queue.poll_interval` seconds until it is stopped
+(e.g. by supervisor).
+"""
+import logging
+import os
+import sys
+import time
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from pyramid.settings import asbool
+
+from randopony import credentials
+from randopony.mail_queue import (
+    MailQueueProcessor,
+    PersistentSMTPMailer,
+    queue_stats,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [--watch]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2 or argv[2:] not in ([], ['--watch']):
+        usage(argv)
+    config_uri = argv[1]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    if asbool(settings.get('production_deployment', 'false')):
+        settings.update({'mail.username': credentials.email_host_username})
+        settings.update({'mail.password': credentials.email_host_password})
+    if argv[2:] != ['--watch']:
+        deliver_mail(settings)
+        return
+    poll_interval = float(settings.get('mail_queue.poll_interval', 30))
+    while True:
+        deliver_mail(settings)
+        time.sleep(poll_interval)
+
+
+def deliver_mail(settings, processor_factory=MailQueueProcessor):
+    """Deliver the messages in the mail queue,
+    logging the queue depth and age before and after delivery.
+
+    :returns: Numbers of messages sent, rejected, and failed.
+    :rtype: dict
+    """
+    queue_path = settings['mail.queue_path']
+    log.info(
+        'mail queue: {depth} message(s), oldest {oldest_age:.0f}s'
+        .format(**queue_stats(queue_path)))
+    processor = processor_factory(
+        PersistentSMTPMailer.from_settings(settings), queue_path)
+    stats = processor.send_messages()
+    log.info(
+        'mail delivery: {sent} sent, {rejected} rejected, {failed} failed'
+        .format(**stats))
+    remaining = queue_stats(queue_path)
+    log.info(
+        'mail queue: {depth} message(s), oldest {oldest_age:.0f}s'
+        .format(**remaining))
+    return dict(stats, **remaining)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""RandoPony club membership roster import script.
+
+Loads the member list exported by the club database into the
+club_members table so that rider membership statuses can be looked up
+locally instead of over HTTP.
+
+The roster file may be CSV (.csv) with a header row,
+or JSON Lines (.jsonl) with 1 object per line.
+Either way, each record must have first_name, last_name,
+and is_current_member fields.
+
+The file is streamed into a staging table in batches,
+and the staging table is swapped for the live table in a single
+transaction so that lookups never see a partially loaded roster.
+"""
+from contextlib import contextmanager
+import csv
+from itertools import islice
+import json
+import logging
+import os
+import sys
+import time
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from sqlalchemy import (
+    engine_from_config,
+    MetaData,
+    Table,
+)
+
+from randopony.models import ClubMember
+from randopony.models.member_status import normalize_name
+
+
+log = logging.getLogger(__name__)
+
+
+BATCH_SIZE = 1000
+STAGING_TABLE = 'club_members_staging'
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> <roster_file>\n'
+          '(example: "%s development.ini members.csv")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) != 3:
+        usage(argv)
+    config_uri, roster_path = argv[1:]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    start = time.time()
+    count = import_roster(engine, roster_path)
+    log.info(
+        'imported {} club members from {} in {:.2f}s'
+        .format(count, roster_path, time.time() - start))
+
+
+def import_roster(engine, roster_path, batch_size=BATCH_SIZE):
+    """Replace the club_members table contents with the roster in the
+    file at :kbd:`roster_path`.
+
+    :returns: Number of distinct members imported.
+    """
+    staging = Table(
+        STAGING_TABLE, MetaData(),
+        *(column.copy() for column in ClubMember.__table__.columns))
+    with open(roster_path, newline='') as roster_file:
+        records = read_roster(roster_file, roster_path)
+        with engine.connect() as connection:
+            staging.drop(connection, checkfirst=True)
+            staging.create(connection)
+            _load_staging_table(connection, staging, records, batch_size)
+            count = connection.execute(staging.count()).scalar()
+            _swap_tables(connection, staging)
+    return count
+
+
+def read_roster(roster_file, roster_path):
+    """Return an iterator of (first name, last name, member status)
+    tuples read from :kbd:`roster_file`,
+    in the format indicated by the :kbd:`roster_path` extension.
+    """
+    if roster_path.endswith('.csv'):
+        records = csv.DictReader(roster_file)
+    elif roster_path.endswith('.jsonl'):
+        records = (json.loads(line) for line in roster_file if line.strip())
+    else:
+        raise ValueError(
+            'unrecognized roster file type: {}'.format(roster_path))
+    for record in records:
+        yield (
+            normalize_name(record['first_name']),
+            normalize_name(record['last_name']),
+            _parse_member_status(record['is_current_member']),
+        )
+
+
+def _parse_member_status(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def _load_staging_table(connection, staging, records, batch_size):
+    """Insert :kbd:`records` into :kbd:`staging` in batches.
+
+    A name that appears more than once is a current member if any of its
+    records are current.
+    """
+    replace_current = staging.insert().prefix_with('OR REPLACE')
+    ignore_duplicate = staging.insert().prefix_with('OR IGNORE')
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            break
+        current, expired = [], []
+        for first_name, last_name, member_status in batch:
+            row = {
+                'first_name': first_name,
+                'last_name': last_name,
+                'member_status': member_status,
+            }
+            (current if member_status else expired).append(row)
+        with connection.begin():
+            if current:
+                connection.execute(replace_current, current)
+            if expired:
+                connection.execute(ignore_duplicate, expired)
+
+
+def _swap_tables(connection, staging):
+    """Replace the club_members table with :kbd:`staging` in 1 transaction.
+    """
+    live = ClubMember.__table__
+    with _transactional_ddl(connection):
+        live.drop(connection, checkfirst=True)
+        connection.execute(
+            'ALTER TABLE {} RENAME TO {}'.format(staging.name, live.name))
+        for index in live.indexes:
+            index.create(connection)
+
+
+@contextmanager
+def _transactional_ddl(connection):
+    """Run the statements in the block in 1 transaction, including DDL.
+
+    The pysqlite driver doesn't begin transactions before DDL statements,
+    so for SQLite the driver's transaction handling is turned off and the
+    transaction is begun explicitly.
+    """
+    if connection.dialect.name != 'sqlite':
+        with connection.begin():
+            yield
+        return
+    dbapi_connection = connection.connection.connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None
+    try:
+        with connection.begin():
+            connection.execute('BEGIN')
+            yield
+    finally:
+        dbapi_connection.isolation_level = isolation_level
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+"""RandoPony registration intake benchmark.
+
+Measures the latency of brevet entry form posts in each registration
+intake mode during a burst of concurrent registrations,
+like the one when a popular event opens for registration,
+so that the :kbd:`intake.mode` setting can be chosen on evidence.
+
+Each post goes through the Pyramid router with the site views,
+so its latency includes form validation,
+email rendering,
+the database work or intake queue append,
+and the dispatch of the background tasks.
+The background tasks are not sent to a celery worker;
+a writer thread stands in for the :kbd:`apply_intake` task,
+and the other tasks are dropped because their work isn't part of the
+request.
+"""
+from datetime import datetime
+import logging
+import os
+import re
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid.session import SignedCookieSessionFactory
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+import transaction
+
+from randopony import (
+    dispatch,
+    intake,
+    map_routes,
+)
+from randopony.models import (
+    Brevet,
+    EmailAddress,
+    Link,
+)
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+from randopony.site_settings import settings_cache
+from randopony.tasks import intake as intake_tasks
+
+
+log = logging.getLogger(__name__)
+
+
+ENTRY_PATH = '/brevets/VI/200/03Mar2013/entry'
+CSRF_TOKEN_RE = re.compile(r'name="csrf_token"\s+value="(\w+)"')
+
+
+class BenchmarkDispatcher(dispatch.Dispatcher):
+    """Dispatcher that stands in for the celery worker.
+
+    Dispatching the :kbd:`apply_intake` task wakes the intake writer
+    thread;
+    other tasks are dropped.
+    """
+    def __init__(self):
+        self.intake_dispatched = threading.Event()
+
+    def enqueue(self, task, args, countdown=None):
+        if task is intake_tasks.apply_intake:
+            self.intake_dispatched.set()
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s [registrations [threads]]\n'
+          '(example: "%s 500 24")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) > 3 or not all(arg.isdigit() for arg in argv[1:]):
+        usage(argv)
+    registrations = int(argv[1]) if argv[1:] else 500
+    # 2 mod_wsgi processes with 12 threads each
+    threads = int(argv[2]) if argv[2:] else 24
+    logging.basicConfig(level=logging.WARNING)
+    work_dir = tempfile.mkdtemp()
+    try:
+        print(
+            '{:<13} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8} {:>10}'.format(
+                'mode', 'mean ms', 'median ms', 'p95 ms', 'p99 ms', 'max ms',
+                'errors', 'applied s'))
+        for mode, measure in (
+            ('direct', measure_direct),
+            ('write_behind', measure_write_behind),
+        ):
+            mode_dir = os.path.join(work_dir, mode)
+            os.makedirs(mode_dir)
+            latencies, errors, elapsed = measure(
+                mode_dir, registrations, threads)
+            # The mean is printed too because the median of a burst favours
+            # the mode in which a few posts wait on the database lock while
+            # the others finish
+            print(
+                '{:<13} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} '
+                '{:>8} {:>10.2f}'.format(
+                    mode, *(
+                        [1000 * latency for latency in (
+                            (statistics.mean(latencies),)
+                            + summarize(latencies))]
+                        + [errors, elapsed])))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def summarize(latencies):
+    """Return the median, 95th percentile, 99th percentile, and maximum of
+    :kbd:`latencies`.
+    """
+    if not latencies:
+        return float('nan'), float('nan'), float('nan'), float('nan')
+    ordered = sorted(latencies)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+    return (
+        statistics.median(ordered), percentile(0.95), percentile(0.99),
+        ordered[-1])
+
+
+def measure_direct(work_dir, registrations, threads):
+    """Post :kbd:`registrations` brevet entry forms from :kbd:`threads`
+    concurrent threads in :kbd:`direct` intake mode,
+    in which each post adds its rider to the database.
+
+    :returns: Seconds that each post took,
+              number of posts that failed,
+              and seconds until all of the registrations were added.
+    :rtype: tuple
+    """
+    app = _setup(work_dir)
+    dispatch.set_dispatcher(BenchmarkDispatcher())
+    try:
+        posts = _entry_posts(app, registrations)
+        started = time.monotonic()
+        latencies, errors = _burst(
+            lambda i: _post(app, posts[i]), registrations, threads)
+        return latencies, errors, time.monotonic() - started
+    finally:
+        dispatch.configure({})
+
+
+def measure_write_behind(work_dir, registrations, threads):
+    """Post :kbd:`registrations` brevet entry forms from :kbd:`threads`
+    concurrent threads in :kbd:`write_behind` intake mode,
+    in which each post appends its entry to an intake queue that a writer
+    thread applies to the database in batches.
+
+    :returns: Seconds that each post took,
+              number of posts that failed,
+              and seconds until all of the registrations were added.
+    :rtype: tuple
+    """
+    app = _setup(work_dir)
+    dispatcher = BenchmarkDispatcher()
+    dispatch.set_dispatcher(dispatcher)
+    intake.configure({
+        'intake.mode': 'write_behind',
+        'intake.sqlite_path': os.path.join(work_dir, 'intake.sqlite'),
+    })
+    queue = intake.get_queue()
+    burst_done = threading.Event()
+
+    def apply_entries():
+        # Stands in for the apply_intake task that each post dispatches
+        try:
+            while not burst_done.is_set() or queue.pending():
+                dispatcher.intake_dispatched.wait(0.01)
+                dispatcher.intake_dispatched.clear()
+                queue.apply(intake_tasks.HANDLERS)
+        finally:
+            DBSession.remove()
+
+    try:
+        posts = _entry_posts(app, registrations)
+        writer = threading.Thread(target=apply_entries)
+        started = time.monotonic()
+        writer.start()
+        try:
+            latencies, errors = _burst(
+                lambda i: _post(app, posts[i]), registrations, threads)
+        finally:
+            burst_done.set()
+            writer.join()
+        return latencies, errors, time.monotonic() - started
+    finally:
+        intake.configure({})
+        dispatch.configure({})
+
+
+def _setup(work_dir):
+    """Create a database with a brevet that is open for registration,
+    and return a WSGI app with the site views that uses it.
+    """
+    engine = create_engine(
+        'sqlite:///{}'.format(os.path.join(work_dir, 'RandoPony.sqlite')))
+    DBSession.remove()
+    DBSession.configure(bind=engine)
+    Base.metadata.create_all(engine)
+    with transaction.manager:
+        DBSession.add_all((
+            Brevet(
+                region='VI',
+                distance=200,
+                date_time=datetime(2013, 3, 3, 7, 0),
+                route_name='Chilly 200',
+                start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+                organizer_email='mcroy@example.com',
+                registration_end=datetime(2013, 3, 2, 12, 0),
+            ),
+            Link(
+                key='is_club_member_api',
+                url='https://example.com/{last_name}/{first_name}'),
+            Link(key='membership_link', url='https://example.com/join'),
+            Link(key='entry_form', url='https://example.com/entry.pdf'),
+            Link(key='results_link', url='https://example.com/results'),
+            EmailAddress(
+                key='from_randopony', email='randopony@example.com'),
+            EmailAddress(key='admin_email', email='admin@example.com'),
+        ))
+    DBSession.remove()
+    settings_cache.clear()
+    config = Configurator(
+        settings={
+            'mako.directories': 'randopony:templates',
+            'pyramid_deform.template_search_path':
+                'randopony:templates/deform',
+            'timezone': 'Canada/Pacific',
+        },
+        session_factory=SignedCookieSessionFactory('benchmark'),
+    )
+    config.include('pyramid_deform')
+    config.include('pyramid_mako')
+    config.include('pyramid_tm')
+    config.add_static_view('static', 'randopony:static')
+    map_routes(config)
+    config.scan('randopony.views.site')
+    return config.make_wsgi_app()
+
+
+def _entry_posts(app, registrations):
+    """Load the brevet entry form once for each of :kbd:`registrations`,
+    like each rider does before posting it.
+
+    :returns: Session cookie and form values for each post.
+    :rtype: list
+    """
+    posts = []
+    for i in range(registrations):
+        response = Request.blank(ENTRY_PATH).get_response(app)
+        csrf_token = CSRF_TOKEN_RE.search(response.text).group(1)
+        cookie = response.headers['Set-Cookie'].split(';')[0]
+        posts.append((cookie, {
+            'csrf_token': csrf_token,
+            'email': 'rider{}@example.com'.format(i),
+            'first_name': 'Rider',
+            'last_name': 'Number{}'.format(i),
+            'comment': '',
+            'bike_type': 'single',
+            'register': 'register',
+        }))
+    return posts
+
+
+def _post(app, post):
+    """Post a brevet entry form to :kbd:`app`.
+
+    :returns: :py:obj:`True` if the post was redirected to the brevet page.
+    """
+    cookie, values = post
+    request = Request.blank(
+        ENTRY_PATH, POST=values, headers={'Cookie': cookie})
+    return request.get_response(app).status_code == 302
+
+
+def _burst(post, registrations, threads):
+    """Call :kbd:`post` for each of :kbd:`registrations` from
+    :kbd:`threads` threads that all start at once.
+
+    :returns: Seconds that each call took,
+              and number of calls that failed.
+    :rtype: tuple
+    """
+    latencies = []
+    errors = []
+    start = threading.Barrier(threads)
+
+    def run(thread):
+        start.wait()
+        try:
+            for i in range(thread, registrations, threads):
+                posted_at = time.monotonic()
+                try:
+                    if not post(i):
+                        errors.append(i)
+                except OperationalError:
+                    # The database was locked
+                    errors.append(i)
+                latencies.append(time.monotonic() - posted_at)
+        finally:
+            DBSession.remove()
+
+    workers = [
+        threading.Thread(target=run, args=(thread,))
+        for thread in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, len(errors)
+
+
+if __name__ == '__main__':
+    main()
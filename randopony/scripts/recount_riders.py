@@ -0,0 +1,41 @@
+"""RandoPony event rider count repair script.
+"""
+import os
+import sys
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from sqlalchemy import engine_from_config
+import transaction
+
+from randopony.models import (
+    Brevet,
+    Populaire,
+)
+from randopony.models.meta import DBSession
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri>\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) != 2:
+        usage(argv)
+    config_uri = argv[1]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    with transaction.manager:
+        for model in (Brevet, Populaire):
+            model.recount_riders()
+
+
+if __name__ == '__main__':
+    main()
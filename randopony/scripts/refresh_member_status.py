@@ -0,0 +1,222 @@
+"""RandoPony upcoming brevet riders club membership status refresh script.
+
+Re-checks the club membership status of every rider registered for an
+upcoming brevet whose status is not already known to be current,
+so that organizers get accurate membership flags on their final rosters.
+Syncs of the rider lists of the brevets whose riders' statuses change
+are requested.
+"""
+from collections import (
+    Counter,
+    defaultdict,
+)
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import sys
+import time
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from sqlalchemy import (
+    engine_from_config,
+    or_,
+)
+import transaction
+from zope.sqlalchemy import mark_changed
+
+from randopony import (
+    coalescing,
+    member_api,
+)
+from randopony.models import (
+    Brevet,
+    BrevetRider,
+    ClubMember,
+    Link,
+    MemberStatusCache,
+)
+from randopony.models.core import start_of_today
+from randopony.models.member_status import normalize_name
+from randopony.models.meta import DBSession
+from randopony.tasks import rider_list
+
+
+log = logging.getLogger(__name__)
+
+
+# Maximum number of concurrent club database requests
+MAX_WORKERS = 4
+# Maximum number of rider ids per UPDATE statement;
+# keeps the statements under SQLite's bound parameters limit
+UPDATE_CHUNK_SIZE = 500
+# Result of lookups that failed because the club database is unavailable
+UNAVAILABLE = object()
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri>\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) != 2:
+        usage(argv)
+    config_uri = argv[1]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    member_api.configure(settings)
+    coalescing.configure(settings)
+    stats = refresh_member_status()
+    log.info(
+        'refreshed {riders} riders with {names} distinct names '
+        'in {elapsed:.2f}s: {roster_hits} club roster hits, '
+        '{cache_hits} cache hits, '
+        '{cache_misses} club database lookups, {failures} failed; '
+        '{members} current members, {expired} expired, {unknown} unknown'
+        .format(**stats))
+    log.info(
+        'club database API: {requests} requests, {failures} failures, '
+        '{short_circuits} short circuits; '
+        'latency mean {latency_mean:.3f}s, max {latency_max:.3f}s'
+        .format(**member_api.get_client().stats()))
+
+
+def refresh_member_status(max_workers=MAX_WORKERS):
+    """Refresh the club membership status of riders in upcoming brevets.
+
+    Riders are deduplicated by normalized name.
+    The imported club roster and the membership status cache are
+    consulted first,
+    and the names that miss them are looked up in the club database
+    concurrently through the shared, pooled club database API client.
+    The results are written back with 1 bulk UPDATE per status value,
+    and syncs of the rider lists of the brevets whose riders' statuses
+    changed are requested.
+
+    :returns: Dict of timing and hit/miss statistics.
+    """
+    start = time.time()
+    with transaction.manager:
+        is_club_member_url = (
+            DBSession.query(Link.url)
+            .filter(Link.key == 'is_club_member_api')
+            .scalar())
+        rows = (
+            DBSession.query(
+                BrevetRider.id, BrevetRider.first_name, BrevetRider.last_name,
+                BrevetRider.brevet, BrevetRider.member_status)
+            .join(Brevet, BrevetRider.brevet == Brevet.id)
+            .filter(Brevet.date_time >= start_of_today())
+            .filter(or_(
+                BrevetRider.member_status.is_(None),
+                BrevetRider.member_status == False))  # noqa: E712
+            .all())
+        riders, names = defaultdict(list), {}
+        for rider_id, first_name, last_name, brevet_id, status in rows:
+            key = (normalize_name(first_name), normalize_name(last_name))
+            riders[key].append((rider_id, brevet_id, status))
+            names.setdefault(key, (first_name, last_name))
+        statuses, roster_hits = {}, 0
+        for key, (first_name, last_name) in names.items():
+            member_status = ClubMember.get_member_status(first_name, last_name)
+            if member_status is not None:
+                statuses[key] = member_status
+                roster_hits += 1
+                continue
+            cached = MemberStatusCache.get_fresh(first_name, last_name)
+            if cached is not None:
+                statuses[key] = cached.member_status
+    cache_hits = len(statuses) - roster_hits
+    misses = [key for key in names if key not in statuses]
+    fetched = _fetch_member_statuses(
+        [names[key] for key in misses], is_club_member_url, max_workers)
+    failures = 0
+    with transaction.manager:
+        for key, member_status in zip(misses, fetched):
+            if member_status is UNAVAILABLE:
+                failures += 1
+                statuses[key] = None
+                continue
+            statuses[key] = member_status
+            MemberStatusCache.store(*names[key], member_status=member_status)
+        for brevet_id in sorted(_update_riders(riders, statuses)):
+            rider_list.request_sync('brevets', brevet_id)
+    status_counts = Counter(statuses.values())
+    return {
+        'riders': len(rows),
+        'names': len(names),
+        'roster_hits': roster_hits,
+        'cache_hits': cache_hits,
+        'cache_misses': len(misses),
+        'failures': failures,
+        'members': status_counts[True],
+        'expired': status_counts[False],
+        'unknown': status_counts[None],
+        'elapsed': time.time() - start,
+    }
+
+
+def _fetch_member_statuses(names, is_club_member_url, max_workers):
+    """Return list of club membership statuses,
+    or :data:`UNAVAILABLE` for failed lookups,
+    for the (first name, last name) tuples in :kbd:`names`,
+    queried with up to :kbd:`max_workers` concurrent requests through
+    the shared, pooled club database API client.
+    """
+    def fetch(name):
+        first_name, last_name = name
+        try:
+            return member_api.get_client().fetch_member_status(
+                first_name, last_name, is_club_member_url)
+        except member_api.MemberAPIError:
+            return UNAVAILABLE
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch, names))
+
+
+def _update_riders(riders, statuses):
+    """Set the member_status of riders with 1 bulk UPDATE per known status.
+
+    Unknown statuses are not written so that a club database outage
+    can't erase previously found expired statuses.
+
+    :arg dict riders: Lists of (rider id, brevet id, current status)
+                      tuples keyed by normalized name.
+
+    :arg dict statuses: Membership statuses keyed by normalized name.
+
+    :returns: Ids of the brevets whose riders' statuses changed.
+    :rtype: set
+    """
+    ids_by_status = defaultdict(list)
+    brevet_ids = set()
+    for key, member_status in statuses.items():
+        if member_status is None:
+            continue
+        for rider_id, brevet_id, current_status in riders[key]:
+            if current_status is not member_status:
+                ids_by_status[member_status].append(rider_id)
+                brevet_ids.add(brevet_id)
+    riders = BrevetRider.__table__
+    for member_status, ids in ids_by_status.items():
+        for i in range(0, len(ids), UPDATE_CHUNK_SIZE):
+            chunk = ids[i:i + UPDATE_CHUNK_SIZE]
+            DBSession.execute(
+                riders.update()
+                .where(riders.c.id.in_(chunk))
+                .values(member_status=member_status))
+    if ids_by_status:
+        mark_changed(DBSession())
+    return brevet_ids
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""RandoPony event organizer digest emails script.
+
+Queues the hourly and daily registration digest emails,
+and final roster emails,
+that are due to event organizers,
+either once (e.g. from cron),
+or with the :kbd:`--watch` option,
+every :kbd:`organizer_digest.poll_interval` seconds until it is stopped
+(e.g. by supervisor).
+The emails are delivered by the :program:`deliver_RandoPony_mail` worker.
+"""
+import logging
+import os
+import sys
+import time
+
+from pyramid.config import Configurator
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from pyramid.request import Request
+from pyramid.scripting import prepare
+from sqlalchemy import engine_from_config
+import transaction
+
+from randopony import map_routes
+from randopony.models.meta import DBSession
+from randopony.organizer_digest import send_organizer_digests
+
+
+log = logging.getLogger(__name__)
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri> [--watch]\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) < 2 or argv[2:] not in ([], ['--watch']):
+        usage(argv)
+    config_uri = argv[1]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    # Links in the emails are built relative to the site URL
+    request = Request.blank(
+        '/', base_url=settings.get('site_url', 'http://localhost:6543'))
+    env = prepare(request=request, registry=make_registry(settings))
+    try:
+        if argv[2:] != ['--watch']:
+            _send_digests(env['request'])
+            return
+        poll_interval = float(
+            settings.get('organizer_digest.poll_interval', 300))
+        while True:
+            _send_digests(env['request'])
+            time.sleep(poll_interval)
+    finally:
+        env['closer']()
+
+
+def make_registry(settings):
+    """Return a registry with the mailer, templates, and routes that the
+    digest emails are built with,
+    configured from the app :kbd:`settings`,
+    without the views and background task dispatcher of the app.
+    """
+    config = Configurator(settings=settings)
+    config.include('pyramid_mailer')
+    config.include('pyramid_mako')
+    map_routes(config)
+    config.commit()
+    return config.registry
+
+
+def _send_digests(request):
+    with transaction.manager:
+        stats = send_organizer_digests(request)
+    log.info(
+        'queued {digests} organizer digest(s) and '
+        '{final_rosters} final roster(s)'.format(**stats))
+
+
+if __name__ == '__main__':
+    main()
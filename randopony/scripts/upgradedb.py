@@ -0,0 +1,217 @@
+"""RandoPony database schema upgrade script.
+
+Brings the schema of an existing database up to date with the data model
+by creating missing tables,
+adding missing columns,
+and creating missing indexes.
+Columns that have to be calculated from existing data are back-filled
+before the indexes on them are created.
+"""
+from datetime import datetime
+from functools import partial
+import logging
+import os
+import sys
+import uuid
+
+from pyramid.paster import (
+    get_appsettings,
+    setup_logging,
+)
+from sqlalchemy import (
+    engine_from_config,
+    inspect,
+    select,
+)
+from sqlalchemy.schema import CreateColumn
+import transaction
+from zope.sqlalchemy import mark_changed
+
+from randopony.models import (
+    Brevet,
+    BrevetRider,
+    Populaire,
+    PopulaireRider,
+)
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+def backfill_updated_at(model):
+    """Set the updated_at timestamps of existing :kbd:`model` rows to now.
+    """
+    table = model.__table__
+    DBSession.execute(
+        table.update()
+        .where(table.c.updated_at.is_(None))
+        .values(updated_at=datetime.utcnow()))
+    mark_changed(DBSession())
+
+
+def backfill_registered_at(model):
+    """Set the registered_at timestamps of existing :kbd:`model` rider rows
+    to their updated_at timestamps,
+    the closest record of when they registered.
+    """
+    table = model.__table__
+    DBSession.execute(
+        table.update()
+        .where(table.c.registered_at.is_(None))
+        .values(registered_at=table.c.updated_at))
+    mark_changed(DBSession())
+
+
+def backfill_brevet_slugs():
+    """Set the slugs of existing brevets from their regions, distances,
+    and dates.
+
+    Brevets with the same slug as an earlier brevet are left without one
+    so that the unique index on slugs can be created;
+    their pages couldn't be reached before either.
+    """
+    table = Brevet.__table__
+    slugs = set()
+    rows = DBSession.execute(
+        select([
+            table.c.id, table.c.region, table.c.distance, table.c.date_time])
+        .where(table.c.slug.is_(None))
+        .order_by(table.c.id)).fetchall()
+    for brevet_id, region, distance, date_time in rows:
+        if None in (region, distance, date_time):
+            continue
+        slug = Brevet.make_slug(region, distance, date_time)
+        if slug in slugs:
+            log.warning(
+                'brevet {} is a duplicate of {}; slug not set'
+                .format(brevet_id, slug))
+            continue
+        slugs.add(slug)
+        DBSession.execute(
+            table.update().where(table.c.id == brevet_id).values(slug=slug))
+    mark_changed(DBSession())
+
+
+def backfill_uuids(model, legacy_name):
+    """Set the uuids of existing :kbd:`model` events to the ones that were
+    calculated from their details by :kbd:`legacy_name` before uuids were
+    stored,
+    so that the rider email address list URLs that organizers already
+    have keep working.
+
+    Events that lack the details,
+    and events with the same details as an earlier event,
+    get random uuids so that the unique index on uuids can be created.
+    """
+    table = model.__table__
+    uuids = set()
+    rows = DBSession.execute(
+        select([table]).where(table.c.uuid.is_(None))
+        .order_by(table.c.id)).fetchall()
+    for row in rows:
+        try:
+            event_uuid = str(uuid.uuid5(
+                uuid.NAMESPACE_URL, legacy_name.format(**row)))
+        except (KeyError, TypeError, ValueError):
+            event_uuid = str(uuid.uuid4())
+        if event_uuid in uuids:
+            event_uuid = str(uuid.uuid4())
+        uuids.add(event_uuid)
+        DBSession.execute(
+            table.update().where(table.c.id == row.id)
+            .values(uuid=event_uuid))
+    mark_changed(DBSession())
+
+
+# Functions to populate newly added columns from existing data,
+# keyed by (table name, column name)
+BACKFILLS = {
+    ('brevets', 'rider_count'): Brevet.recount_riders,
+    ('brevets', 'slug'): backfill_brevet_slugs,
+    ('brevets', 'uuid'): partial(
+        backfill_uuids, Brevet,
+        '/randopony/{region}/{distance}/{date_time:%d%b%Y}'),
+    ('populaires', 'uuid'): partial(
+        backfill_uuids, Populaire,
+        '/randopony/{short_name}/{date_time:%d%b%Y}'),
+    ('populaires', 'rider_count'): Populaire.recount_riders,
+}
+for model in (Brevet, BrevetRider, Populaire, PopulaireRider):
+    BACKFILLS[(model.__tablename__, 'updated_at')] = partial(
+        backfill_updated_at, model)
+for model in (BrevetRider, PopulaireRider):
+    BACKFILLS[(model.__tablename__, 'registered_at')] = partial(
+        backfill_registered_at, model)
+
+
+def usage(argv):
+    cmd = os.path.basename(argv[0])
+    print('usage: %s <config_uri>\n'
+          '(example: "%s development.ini")' % (cmd, cmd))
+    sys.exit(1)
+
+
+def main(argv=sys.argv):
+    if len(argv) != 2:
+        usage(argv)
+    config_uri = argv[1]
+    setup_logging(config_uri)
+    settings = get_appsettings(config_uri)
+    engine = engine_from_config(settings, 'sqlalchemy.')
+    DBSession.configure(bind=engine)
+    upgrade(engine)
+
+
+def upgrade(engine):
+    """Upgrade the database schema on :kbd:`engine` to match the data model.
+    """
+    Base.metadata.create_all(engine)
+    added_columns = add_missing_columns(engine)
+    with transaction.manager:
+        for table_column in added_columns:
+            if table_column in BACKFILLS:
+                log.info('back-filling {}.{}'.format(*table_column))
+                BACKFILLS[table_column]()
+    create_missing_indexes(engine)
+
+
+def add_missing_columns(engine):
+    """Add data model columns that are missing from existing tables.
+
+    :returns: List of (table name, column name) tuples of added columns.
+    """
+    inspector = inspect(engine)
+    added_columns = []
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_ddl = CreateColumn(column).compile(dialect=engine.dialect)
+            engine.execute(
+                'ALTER TABLE {} ADD COLUMN {}'.format(table.name, column_ddl))
+            log.info('added column {}.{}'.format(table.name, column.name))
+            added_columns.append((table.name, column.name))
+    return added_columns
+
+
+def create_missing_indexes(engine):
+    """Create data model indexes that are missing from existing tables.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {
+            index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(engine)
+                log.info('created index {}'.format(index.name))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""RandoPony site settings.
+
+Off-site link URLs and email addresses that are stored in the database
+and edited in the admin interface,
+for the views, and for the scripts and background tasks that send
+email.
+"""
+import threading
+
+from sqlalchemy import (
+    event,
+    literal,
+)
+from sqlalchemy.orm import Session
+
+from randopony.models import (
+    EmailAddress,
+    Link,
+)
+from randopony.models.meta import DBSession
+
+
+class SettingsCache(object):
+    """Process-wide cache of :class:`~randopony.models.core.Link` URLs and
+    :class:`~randopony.models.core.EmailAddress` addresses.
+
+    All of the rows in both tables are loaded with a single query
+    the first time that a value is requested.
+    The cache is cleared when a transaction that inserted, updated,
+    or deleted a row in either table is committed,
+    so the next request reloads it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._links = None
+        self._email_addresses = None
+
+    def link(self, key):
+        """Return the URL of the :class:`Link` with :kbd:`key`.
+
+        :raises: :exc:`KeyError` if there is no such link.
+        """
+        links, email_addresses = self._load()
+        return links[key]
+
+    def email_address(self, key):
+        """Return the address of the :class:`EmailAddress` with :kbd:`key`.
+
+        :raises: :exc:`KeyError` if there is no such email address.
+        """
+        links, email_addresses = self._load()
+        return email_addresses[key]
+
+    def clear(self):
+        """Empty the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._links = None
+            self._email_addresses = None
+
+    def _load(self):
+        with self._lock:
+            if self._links is not None:
+                return self._links, self._email_addresses
+            generation = self._generation
+        links_query = DBSession.query(
+            literal('link'), Link.key, Link.url)
+        email_addresses_query = DBSession.query(
+            literal('email'), EmailAddress.key, EmailAddress.email)
+        links, email_addresses = {}, {}
+        for kind, key, value in links_query.union_all(email_addresses_query):
+            if kind == 'link':
+                links[key] = value
+            else:
+                email_addresses[key] = value
+        with self._lock:
+            # Don't store a result that was superseded by a commit while
+            # the query was in progress
+            if generation == self._generation:
+                self._links = links
+                self._email_addresses = email_addresses
+        return links, email_addresses
+
+
+settings_cache = SettingsCache()
+
+
+def _mark_settings_cache_stale(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['settings_cache_stale'] = True
+
+
+for model in (Link, EmailAddress):
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _mark_settings_cache_stale)
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_stale_settings_cache(session):
+    # Cleared after the commit rather than at the flush so that a load
+    # between them can't cache the values that were just replaced
+    if session.info.pop('settings_cache_stale', False):
+        settings_cache.clear()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_settings_cache_stale_mark(session, transaction):
+    # Changes in transactions that end without being committed don't
+    # make the cached settings stale
+    if transaction.parent is None:
+        session.info.pop('settings_cache_stale', None)
+
+
+def get_link(key):
+    """Return the URL of the off-site link with :kbd:`key`.
+    """
+    return settings_cache.link(key)
+
+
+def get_email_address(key):
+    """Return the email address with :kbd:`key`.
+    """
+    return settings_cache.email_address(key)
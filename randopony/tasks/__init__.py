@@ -0,0 +1,25 @@
+"""RandoPony background tasks.
+
+The celery worker imports the task modules in this package to find its
+tasks,
+so they depend only on the models and the service modules,
+and never on the Pyramid view layer.
+"""
+import functools
+
+from randopony.models.meta import DBSession
+
+
+def session_scoped(func):
+    """Decorate a task function so that it runs in its own database
+    session that is removed when the task finishes,
+    so the identity map of the long running worker doesn't grow from
+    task to task.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            DBSession.remove()
+    return wrapper
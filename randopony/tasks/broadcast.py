@@ -0,0 +1,14 @@
+"""RandoPony broadcast email delivery task.
+"""
+from celery.task import task
+
+from randopony import broadcast
+from randopony.tasks import session_scoped
+
+
+@task(ignore_result=True)
+@session_scoped
+def send_broadcast(job_id):
+    """Send the broadcast job with :kbd:`job_id`.
+    """
+    broadcast.get_broadcaster().send(job_id)
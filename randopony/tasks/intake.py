@@ -0,0 +1,75 @@
+"""RandoPony write-behind registration intake writer task.
+"""
+import logging
+
+from celery.task import task
+
+from randopony import (
+    dispatch,
+    intake,
+    outbox,
+    registration,
+)
+from randopony.models import (
+    Brevet,
+    Populaire,
+)
+from randopony.models.meta import DBSession
+from randopony.tasks import (
+    outbox as outbox_tasks,
+    session_scoped,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+def _register_brevet_rider(brevet_id, entry):
+    brevet = DBSession.query(Brevet).get(brevet_id)
+    appstruct = entry['appstruct']
+    if registration.registered_brevet_rider(brevet, appstruct) is not None:
+        log.info('{} is already registered for {}'.format(
+            appstruct['email'], brevet))
+        return
+    rider = registration.new_brevet_rider(appstruct)
+    registration.add_brevet_rider(brevet, rider, entry['is_club_member_url'])
+    for payload in entry['messages']:
+        outbox.add(outbox.MAIL, **payload)
+
+
+def _register_populaire_rider(populaire_id, entry):
+    populaire = DBSession.query(Populaire).get(populaire_id)
+    appstruct = entry['appstruct']
+    if (registration.registered_populaire_rider(populaire, appstruct)
+            is not None):
+        log.info('{} is already registered for {}'.format(
+            appstruct['email'], populaire))
+        return
+    rider = registration.new_populaire_rider(populaire, appstruct)
+    registration.add_populaire_rider(populaire, rider)
+    for payload in entry['messages']:
+        outbox.add(outbox.MAIL, **payload)
+
+
+HANDLERS = {
+    'brevets': _register_brevet_rider,
+    'populaires': _register_populaire_rider,
+}
+
+
+@task(ignore_result=True)
+@session_scoped
+def apply_intake():
+    """Add the registrations in the write-behind intake queue to the
+    database,
+    and carry out their side effects.
+
+    Registrations of riders who are already registered are dropped.
+    """
+    queue = intake.get_queue()
+    if queue is None:
+        return
+    applied = queue.apply(HANDLERS)
+    if applied:
+        log.info('{} queued registrations applied'.format(applied))
+        dispatch.get_dispatcher().enqueue(outbox_tasks.drain_outbox, ())
@@ -0,0 +1,72 @@
+"""RandoPony brevet rider club membership status update task.
+"""
+import logging
+
+from celery.task import task
+import transaction
+
+from randopony import member_api
+from randopony.models import (
+    BrevetRider,
+    ClubMember,
+    MemberStatusCache,
+)
+from randopony.models.meta import DBSession
+from randopony.tasks import (
+    rider_list,
+    session_scoped,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+@task(ignore_result=True)
+@session_scoped
+def update_member_status(rider_id, is_club_member_url):
+    """Look up the club membership status of the brevet rider with
+    :kbd:`rider_id` in the club database and store it.
+
+    The imported club roster and the membership status cache are checked
+    first.
+    If the name is in neither the rider's name is read in a short
+    transaction that is ended before the club database is queried,
+    so no database locks are held while waiting for it to respond.
+
+    A sync of the brevet's rider list is requested when the status is
+    stored.
+    """
+    with transaction.manager:
+        rider = DBSession.query(BrevetRider).get(rider_id)
+        if rider is None:
+            log.info(
+                'brevet rider {} not found for member status update'
+                .format(rider_id))
+            return
+        first_name, last_name = rider.first_name, rider.last_name
+        brevet_id = rider.brevet
+        member_status = ClubMember.get_member_status(first_name, last_name)
+        if member_status is not None:
+            rider.member_status = member_status
+            rider_list.request_sync('brevets', brevet_id)
+            return
+        cached = MemberStatusCache.get_fresh(first_name, last_name)
+        if cached is not None:
+            # Includes cached non-member statuses,
+            # so they aren't looked up in the club database again
+            rider.member_status = cached.member_status
+            rider_list.request_sync('brevets', brevet_id)
+            return
+    try:
+        member_status = member_api.get_client().fetch_member_status(
+            first_name, last_name, is_club_member_url)
+    except member_api.MemberAPIError:
+        # Leave the status unknown for refresh_RandoPony_member_status
+        # to fill in later
+        return
+    with transaction.manager:
+        (DBSession.query(BrevetRider)
+         .filter_by(id=rider_id)
+         .update({'member_status': member_status}))
+        MemberStatusCache.store(first_name, last_name, member_status)
+        rider_list.request_sync('brevets', brevet_id)
@@ -0,0 +1,51 @@
+"""RandoPony transactional outbox drain task.
+"""
+import logging
+
+from celery.task import task
+
+from randopony import (
+    dispatch,
+    outbox,
+)
+from randopony.tasks import (
+    member_status,
+    rider_list,
+    session_scoped,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+def _queue_mail(payload):
+    outbox.get_mailer().send_to_queue(outbox.message(payload))
+
+
+def _update_member_status(payload):
+    dispatch.after_commit(
+        member_status.update_member_status,
+        payload['rider_id'], payload['is_club_member_url'])
+
+
+def _sync_rider_list(payload):
+    rider_list.request_sync(payload['event_type'], payload['event_id'])
+
+
+HANDLERS = {
+    outbox.MAIL: _queue_mail,
+    outbox.MEMBER_STATUS: _update_member_status,
+    outbox.RIDER_LIST_SYNC: _sync_rider_list,
+}
+
+
+@task(ignore_result=True)
+@session_scoped
+def drain_outbox():
+    """Carry out the side effects in the outbox;
+    i.e. put emails in the mail queue,
+    and request club membership status lookups and rider list syncs.
+    """
+    drained = outbox.drain(HANDLERS)
+    if drained:
+        log.info('{} outbox entries carried out'.format(drained))
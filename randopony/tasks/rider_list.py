@@ -0,0 +1,48 @@
+"""RandoPony event rider list sync task.
+"""
+import logging
+
+from celery.task import task
+
+from randopony import (
+    coalescing,
+    rider_list_sync,
+)
+from randopony.tasks import session_scoped
+
+
+log = logging.getLogger(__name__)
+
+
+def request_sync(event_type, event_id):
+    """Request a background sync of an event's rider list.
+
+    Must be called within a transaction.
+    The sync task is queued when the transaction commits,
+    unless a sync of the event's rider list is already pending.
+    """
+    coalescing.get_coalescer().request(sync_rider_list, event_type, event_id)
+
+
+@task(ignore_result=True)
+@session_scoped
+def sync_rider_list(event_type, event_id):
+    """Push the changes in the rider list of the event with
+    :kbd:`event_id` to the rider list backend.
+    """
+    if not coalescing.get_coalescer().claim(
+            sync_rider_list, event_type, event_id):
+        return
+    sync = rider_list_sync.get_sync()
+    if sync is None:
+        return
+    try:
+        stats = sync.sync(event_type, event_id)
+    except rider_list_sync.RiderListSyncError as e:
+        log.warning(
+            '{} {} rider list sync failed: {}'
+            .format(event_type, event_id, e))
+        return
+    log.info(
+        '{} {} rider list synced: {inserted} inserted, {updated} updated, '
+        '{deleted} deleted'.format(event_type, event_id, **stats))
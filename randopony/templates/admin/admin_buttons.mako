@@ -28,15 +28,6 @@
 </%def>
 
 
-<%def name="create_rider_list(event_type, event)">
-  <a href="${request.route_url('admin.{}.create_rider_list'.format(event_type),
-                               item=str(event))}"
-     tabindex="-1">
-     Create Rider List
-   </a>
-</%def>
-
-
 <%def name="email_to_organizer(event_type, event)">
   <a href="${request.route_url('admin.{}.email_to_organizer'.format(event_type),
                                item=str(event))}"
@@ -53,3 +44,21 @@
      Email Webmaster
   </a>
 </%def>
+
+
+<%def name="broadcast(event_type, event)">
+  <a href="${request.route_url('admin.{}.broadcast'.format(event_type),
+                               item=str(event))}"
+     tabindex="-1">
+     Email All Riders
+  </a>
+</%def>
+
+
+<%def name="roster(event_type, event, format)">
+  <a href="${request.route_url('admin.{}.roster'.format(event_type),
+                               item=str(event), format=format)}"
+     tabindex="-1">
+     Download Rider List (${format.upper()})
+  </a>
+</%def>
@@ -1,5 +1,6 @@
 <%inherit file="page.mako"/>
 <%namespace name="admin_btns" file="admin_buttons.mako"/>
+<%namespace name="broadcast_jobs" file="broadcast_jobs.mako"/>
 
 <%block name="title">RandoPony::Admin::${brevet}</%block>
 
@@ -33,35 +34,40 @@
 <h4>Registration Closes</h4>
 <p>${"{:%d-%b-%Y %H:%M}".format(brevet.registration_end)}</p>
 
+<h4>Organizer Registration Emails</h4>
+<p>${dict(brevet.ORGANIZER_NOTIFICATIONS)[brevet.organizer_notification]}</p>
+
 %if brevet.info_question:
 <h4>Info Question</h4>
 <p>${brevet.info_question}</p>
 %endif
 
-<h4>Google Drive Rider List Id</h4>
-%if brevet.google_doc_id:
+<h4>Riders Email Address List UUID</h4>
 <p>
-  <a href="${'https://spreadsheets.google.com/ccc?key={0}'.format(brevet.google_doc_id.split(':')[1])}"
+  <a href="${request.route_url('rider_emails', uuid=brevet.uuid)}"
      target="_blank">
-    ${brevet.google_doc_id}
+    ${brevet.uuid}
   </a>
 </p>
-%else:
-<p class="text-warning">Not created yet!</p>
-%endif
 
-<h4>Riders Email Address List UUID</h4>
+<h4>Organizer Rider List</h4>
 <p>
-  <a href="${request.route_url('brevet.rider_emails',
+%for format in ('csv', 'xlsx'):
+  <a href="${request.route_url('brevet.roster',
                                region=brevet.region,
                                distance=brevet.distance,
                                date=brevet.date_time.strftime('%d%b%Y'),
-                               uuid=brevet.uuid)}"
-     target="_blank">
-    ${brevet.uuid}
+                               uuid=brevet.uuid,
+                               format=format)}">
+    ${format.upper()}
   </a>
+%endfor
 </p>
 
+%if broadcasts:
+${broadcast_jobs.job_list(broadcasts)}
+%endif
+
 <div class="btn-toolbar">
   ${admin_btns.edit('brevets', brevet)}
   ${admin_btns.event_list('brevets')}
@@ -71,9 +77,11 @@
     </button>
     <ul class="dropdown-menu">
       <li>${admin_btns.setup_123('brevets', brevet)}</li>
-      <li>${admin_btns.create_rider_list('brevets', brevet)}</li>
+      <li>${admin_btns.roster('brevets', brevet, 'csv')}</li>
+      <li>${admin_btns.roster('brevets', brevet, 'xlsx')}</li>
       <li>${admin_btns.email_to_organizer('brevets', brevet)}</li>
       <li>${admin_btns.email_to_webmaster('brevets', brevet)}</li>
+      <li>${admin_btns.broadcast('brevets', brevet)}</li>
     </ul>
   </div>
 </div>
@@ -0,0 +1,21 @@
+<%inherit file="page.mako"/>
+
+<%block name="title">RandoPony::Admin::Email All Riders of ${event}</%block>
+
+<h4>Email All Riders of ${event}</h4>
+<p>
+  The message will be sent to each rider individually,
+  with replies going to the organizer(s) at ${event.organizer_email}.
+</p>
+
+${form | n}
+
+<script>
+  $(document).ready(function(){
+    $("#deformcancel").click(function(event){
+      // Redirect to event page on Cancel buton click.
+      window.location = "${cancel_url}";
+      event.preventDefault();
+    });
+  });
+</script>
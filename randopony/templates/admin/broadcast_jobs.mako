@@ -0,0 +1,21 @@
+## Broadcast email jobs list
+
+<%def name="job_list(jobs)">
+  <h4>Emails to All Riders</h4>
+  <ul>
+    %for job in jobs:
+    <li>
+      ${"{:%d-%b-%Y %H:%M}".format(job.created_at)} UTC:
+      <a href="${request.route_url('admin.broadcasts.status', job=job.id)}"
+         target="_blank">
+        ${job.subject}
+      </a>
+      %if job.error:
+      (stopped: ${job.error})
+      %elif job.finished_at:
+      (finished)
+      %endif
+    </li>
+    %endfor
+  </ul>
+</%def>
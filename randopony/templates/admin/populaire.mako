@@ -1,5 +1,6 @@
 <%inherit file="page.mako"/>
 <%namespace name="admin_btns" file="admin_buttons.mako"/>
+<%namespace name="broadcast_jobs" file="broadcast_jobs.mako"/>
 
 <%block name="title">RandoPony::Admin::${populaire}</%block>
 
@@ -30,31 +31,36 @@
 <h4>Registration Closes</h4>
 <p>${"{:%a %d-%b-%Y %H:%M}".format(populaire.registration_end)}</p>
 
+<h4>Organizer Registration Emails</h4>
+<p>${dict(populaire.ORGANIZER_NOTIFICATIONS)[populaire.organizer_notification]}</p>
+
 <h4>Entry Form URL</h4>
 <p>${populaire.entry_form_url}</p>
 
-<h4>Google Drive Rider List Id</h4>
-%if populaire.google_doc_id:
+<h4>Riders Email Address List UUID</h4>
 <p>
-  <a href="${'https://spreadsheets.google.com/ccc?key={0}'.format(populaire.google_doc_id.split(':')[1])}"
+  <a href="${request.route_url('rider_emails', uuid=populaire.uuid)}"
      target="_blank">
-    ${populaire.google_doc_id}
+    ${populaire.uuid}
   </a>
 </p>
-%else:
-<p class="text-warning">Not created yet!</p>
-%endif
 
-<h4>Riders Email Address List UUID</h4>
+<h4>Organizer Rider List</h4>
 <p>
-  <a href="${request.route_url('populaire.rider_emails',
+%for format in ('csv', 'xlsx'):
+  <a href="${request.route_url('populaire.roster',
                                short_name=populaire.short_name,
-                               uuid=populaire.uuid)}"
-     target="_blank">
-    ${populaire.uuid}
+                               uuid=populaire.uuid,
+                               format=format)}">
+    ${format.upper()}
   </a>
+%endfor
 </p>
 
+%if broadcasts:
+${broadcast_jobs.job_list(broadcasts)}
+%endif
+
 <div class="btn-toolbar">
   ${admin_btns.edit('populaires', populaire)}
   ${admin_btns.event_list('populaires')}
@@ -64,9 +70,11 @@
     </button>
     <ul class="dropdown-menu">
       <li>${admin_btns.setup_123('populaires', populaire)}</li>
-      <li>${admin_btns.create_rider_list('populaires', populaire)}</li>
+      <li>${admin_btns.roster('populaires', populaire, 'csv')}</li>
+      <li>${admin_btns.roster('populaires', populaire, 'xlsx')}</li>
       <li>${admin_btns.email_to_organizer('populaires', populaire)}</li>
       <li>${admin_btns.email_to_webmaster('populaires', populaire)}</li>
+      <li>${admin_btns.broadcast('populaires', populaire)}</li>
     </ul>
   </div>
 </div>
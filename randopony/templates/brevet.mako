@@ -34,10 +34,12 @@ ${brevet}
     ${self.confirmation(request.session.pop_flash())}
     %elif request.session.peek_flash()[0] == 'duplicate':
     ${self.duplicate(request.session.pop_flash())}
+    %elif request.session.peek_flash()[0] == 'processing':
+    ${self.processing(request.session.pop_flash())}
     %endif
   %endif
 
-  %if len(brevet.riders) == 0:
+  %if brevet.rider_count == 0:
     <p>
       Nobody has pre-registered
     </p>
@@ -69,8 +71,8 @@ ${brevet}
       <thead>
         <tr>
         <th colspan="2">
-          ${len(brevet.riders)} Pre-registered
-          %if len(brevet.riders) > 1:
+          ${brevet.rider_count} Pre-registered
+          %if brevet.rider_count > 1:
           Riders
           %else:
           Rider
@@ -79,7 +81,7 @@ ${brevet}
         </tr>
       </thead>
     <tbody>
-      %for rider in brevet.riders:
+      %for rider in roster:
       <tr>
         %if rider.bike_type == 'other':
         <td>${rider.full_name} riding something indescribable</td>
@@ -92,7 +94,7 @@ ${brevet}
     </table>
   %endif
 
-  %if len(brevet.riders) < 15:
+  %if brevet.rider_count < 15:
   <div class="img-container hidden-phone">
     <img src="${request.static_url('randopony:static/img/Darcy400Peloton.jpg')}"
          alt="Brevet peloton rolling out"
@@ -128,8 +130,7 @@ ${brevet}
 <%def name="confirmation(notice_data)">
 <%
   email = notice_data[1]
-  member_status = notice_data[2]
-  membership_link = notice_data[3]
+  membership_link = notice_data[2]
 %>
 <div class="row">
   <div class="span6 alert alert-success alert-block fade in">
@@ -144,24 +145,16 @@ ${brevet}
       <kbd>${email}</kbd>
       and to the brevet organizer(s).
     </p>
-    %if member_status is None:
     <p>
-      Your name couldn't be found in the club database.
-      You need to be a member of the BC Randonneurs Club to ride this brevet.
-      Please join at
+      Your BC Randonneurs club membership status is being checked.
+      You need to be a member of the club to ride this brevet.
+      If you aren't,
+      or your membership has expired,
+      please join or renew at
       <a href="${membership_link}" title="Club Membership Page">
         ${membership_link}
       </a>
     </p>
-    %elif not member_status:
-    <p>
-      Your BC Randonneurs club membership has expired.
-      Please renew it at
-      <a href="${membership_link}" title="Club Membership Page">
-        ${membership_link}
-      </a>
-    </p>
-    %endif
     <p>
       You can print out the
       <a href="${entry_form_url}" title="Event Waiver Form">
@@ -181,6 +174,41 @@ ${brevet}
 </%def>
 
 
+<%def name="processing(notice_data)">
+<%
+  email = notice_data[1]
+  membership_link = notice_data[2]
+%>
+<div class="row">
+  <div class="span6 alert alert-info alert-block fade in">
+    <span class="close" data-dismiss="alert">&times;</span>
+    <h4 class="alert-heading">Got it!</h4>
+    <p>
+      Your pre-registration for this brevet is being processed.
+      Your name will be on the list below in a few moments;
+      reload this page to see it.
+    </p>
+    <p>
+      A confirmation email will be sent to you at
+      <kbd>${email}</kbd>
+      and to the brevet organizer(s).
+      If you were already pre-registered you won't get another one.
+    </p>
+    <p>
+      Your BC Randonneurs club membership status will be checked.
+      You need to be a member of the club to ride this brevet.
+      If you aren't,
+      or your membership has expired,
+      please join or renew at
+      <a href="${membership_link}" title="Club Membership Page">
+        ${membership_link}
+      </a>
+    </p>
+  </div>
+</div>
+</%def>
+
+
 <%def name="duplicate(notice_data)">
 <%
   name = notice_data[1]
@@ -5,9 +5,7 @@ This is an auto-generated email, but you can reply to it to contact the brevet o
 You can print out the event waiver form from the club web site <${entry_form_url}>, read it carefully, fill it out, and bring it with you to the start to save time and make the organizers like you even more.
 
 %if rider.member_status is None:
-Your name couldn't be found in the club database. You need to be a member of the BC Randonneurs Club to ride this brevet. Please join at <${membership_link}>.
-
-If you think that your are in the club database, it's possible that the pony just made a mistake, being just a bit of software and all. Please accept out humblest pony apologies.
+The pony is checking your BC Randonneurs club membership status. You need to be a member of the club to ride this brevet. If you aren't, or your membership has expired, please join or renew at <${membership_link}>.
 %elif not rider.member_status:
 Your BC Randonneurs club membership has expired. Please renew it at <${membership_link}>.
 %endif
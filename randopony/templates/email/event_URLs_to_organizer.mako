@@ -1,6 +1,6 @@
 The pre-registration page for the ${event} event has been added to the RandoPony. The URL is <${event_page_url}>.
 
-The rider list spreadsheet is a Google Drive spreadsheet that is updated as riders pre-register. You can download the data in various formats (Excel, OpenOffice, CSV, PDF, ...), or save a copy in the cloud if you have a Google account (free).  The rider list URL is <${rider_list_url}>.
+The rider list is an Excel spreadsheet of the riders who have pre-registered so far that is created each time you download it. Change the .xlsx at the end of the URL to .csv to download it as a CSV file instead.  The rider list URL is <${rider_list_url}>.
 
 If you want to send an email message to all of the pre-registered riders you can get a list of their email addresses. The list is just a comma-separated list of email addresses that you should be able to copy and paste into your email-sending program. Please use the BCC field when you do that to avoid unnecessary publication of people's email addresses. The riders email address list URL is <${rider_emails_url}>.
 
@@ -0,0 +1,15 @@
+${len(new_riders)} rider(s) pre-registered for the ${event} since the last RandoPony update:
+
+%for rider in new_riders:
+  ${rider.full_name | n} <${rider.email}>${rider_note(rider) | n}
+%endfor
+
+There are now ${rider_count} pre-registered riders. Their names should appear on the list at <${event_page_url}>, and their email addresses are in the list at <${rider_emails}>.
+
+Each of them should have received a confirmation email that appears to have come from your email address so that they can contact you directly, if necessary.
+
+You will receive a final roster email when registration closes. This is an auto-generated email. If you are having problems with the RandoPony system please send email to <${admin_email}>.
+
+Sincerely,
+
+The Rando Pony
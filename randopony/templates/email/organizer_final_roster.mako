@@ -0,0 +1,17 @@
+Pre-registration for the ${event} has closed. These are the ${len(riders)} riders who pre-registered:
+
+%for rider in riders:
+  ${rider.full_name | n} <${rider.email}>${rider_note(rider) | n}${' (new since the last RandoPony update)' if rider in new_riders else ''}
+%endfor
+
+The list of riders is also at <${event_page_url}>, and their email addresses are in the list at <${rider_emails}>.
+
+%if any(rider_note(rider) for rider in riders):
+Please check the notes about riders above before the start of the event.
+
+%endif
+This is an auto-generated email. If you are having problems with the RandoPony system please send email to <${admin_email}>.
+
+Sincerely,
+
+The Rando Pony
@@ -66,7 +66,7 @@
       Home
     </a>
   </li>
-  %if brevets.count() > 0:
+  %if brevets:
   <li id="brevets">
     <a href="${request.route_url('region.list')}" class="nav-tab">
       Brevets
@@ -79,7 +79,7 @@
     </a>
   </li>
   %endif
-  %if populaires.count() > 0:
+  %if populaires:
   <li id="populaires">
     <a href="${request.route_url('populaire.list')}" class="nav-tab">
       Populaires
@@ -34,10 +34,12 @@ ${populaire} ${"{:%d-%b-%Y}".format(populaire.date_time)}
     ${self.confirmation(request.session.pop_flash())}
     %elif request.session.peek_flash()[0] == 'duplicate':
     ${self.duplicate(request.session.pop_flash())}
+    %elif request.session.peek_flash()[0] == 'processing':
+    ${self.processing(request.session.pop_flash())}
     %endif
   %endif
 
-  %if len(populaire.riders) == 0:
+  %if populaire.rider_count == 0:
     <p>
       Nobody has pre-registered
     </p>
@@ -65,8 +67,8 @@ ${populaire} ${"{:%d-%b-%Y}".format(populaire.date_time)}
     <thead>
       <tr>
         <th colspan="2">
-          ${len(populaire.riders)} Pre-registered
-          %if len(populaire.riders) > 1:
+          ${populaire.rider_count} Pre-registered
+          %if populaire.rider_count > 1:
           Riders
           %else:
           Rider
@@ -75,7 +77,7 @@ ${populaire} ${"{:%d-%b-%Y}".format(populaire.date_time)}
       </tr>
     </thead>
     <tbody>
-      %for rider in populaire.riders:
+      %for rider in roster:
       <tr>
         <td>${rider.full_name}</td>
         %if ',' in populaire.distance:
@@ -87,7 +89,7 @@ ${populaire} ${"{:%d-%b-%Y}".format(populaire.date_time)}
   </table>
   %endif
 
-  %if len(populaire.riders) < 15:
+  %if populaire.rider_count < 15:
   <div class="img-container hidden-phone">
     <img src="${request.static_url('randopony:static/img/tandem_tuesday.jpg')}"
          alt="Bob and Alex enjoying a populaire on their tandem"
@@ -152,6 +154,30 @@ ${populaire} ${"{:%d-%b-%Y}".format(populaire.date_time)}
 </%def>
 
 
+<%def name="processing(notice_data)">
+<%
+  email = notice_data[1]
+%>
+<div class="row">
+  <div class="span6 alert alert-info alert-block fade in">
+    <span class="close" data-dismiss="alert">&times;</span>
+    <h4 class="alert-heading">Got it!</h4>
+    <p>
+      Your pre-registration for this populaire is being processed.
+      Your name will be on the list below in a few moments;
+      reload this page to see it.
+    </p>
+    <p>
+      A confirmation email will be sent to you at
+      <kbd>${email}</kbd>
+      and to the populaire organizer(s).
+      If you were already pre-registered you won't get another one.
+    </p>
+  </div>
+</div>
+</%def>
+
+
 <%def name="duplicate(notice_data)">
 <%
   name = notice_data[1]
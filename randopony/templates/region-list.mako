@@ -15,7 +15,7 @@
   </p>
   <ul class="nav nav-pills">
     %for region in sorted(regions, key=regions.get):
-    %if region_brevets[region].count() > 0:
+    %if region in region_summary:
     <li>
       <a href="${request.route_url('brevet.list', region=region)}">
         ${regions[region]}
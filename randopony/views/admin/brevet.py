@@ -1,10 +1,15 @@
 """RandoPony brevet admin views.
 """
+from datetime import datetime
+
 from deform import Button
 from pyramid_deform import FormView
-from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import (
+    HTTPFound,
+    HTTPNotFound,
+)
 from pyramid.view import view_config
-# from randopony.views.admin import google_drive
+from randopony import rider_roster
 from randopony.views.admin import core as admin_core
 from randopony.models import (
     Brevet,
@@ -25,6 +30,8 @@ def brevet_details(request):
     return {
         'version': version.number + version.release,
         'brevet': brevet,
+        'broadcasts': (
+            admin_core.get_broadcast_jobs('brevets', brevet).all()),
     }
 
 
@@ -35,7 +42,8 @@ def brevet_details(request):
 )
 class BrevetCreate(FormView):
     schema = BrevetSchema()
-    for field in 'id registration_end start_map_url'.split():
+    for field in ('id registration_end start_map_url '
+                  'organizer_notification').split():
         schema.__delitem__(field)
     buttons = (
         Button(name='add', css_class='btn btn-primary'),
@@ -104,6 +112,7 @@ class BrevetEdit(FormView):
             'start_map_url': brevet.start_map_url,
             'organizer_email': brevet.organizer_email,
             'registration_end': brevet.registration_end,
+            'organizer_notification': brevet.organizer_notification,
         }
 
     def show(self, form):
@@ -128,6 +137,11 @@ class BrevetEdit(FormView):
         brevet.start_map_url = appstruct['start_map_url']
         brevet.organizer_email = appstruct['organizer_email']
         brevet.registration_end = appstruct['registration_end']
+        if (brevet.organizer_notification == 'immediate'
+                and appstruct['organizer_notification'] != 'immediate'):
+            # Organizers have already had emails for earlier registrations
+            brevet.organizer_digest_at = datetime.utcnow()
+        brevet.organizer_notification = appstruct['organizer_notification']
         return HTTPFound(
             self.request.route_url('admin.brevets.view', item=brevet))
 
@@ -141,32 +155,15 @@ class BrevetEdit(FormView):
 
 
 @view_config(
-    route_name='admin.brevets.create_rider_list',
+    route_name='admin.brevets.roster',
     permission='authenticated',
 )
-def create_rider_list(request):
+def roster(request):
     code, date = request.matchdict['item'].split()
     brevet = admin_core.get_brevet(code, date)
-    # flash = _create_rider_list(request, brevet)
-    # admin_core.finalize_flash_msg(request, flash)
-    redirect_url = request.route_url(
-        'admin.brevets.view', item=request.matchdict['item'])
-    return HTTPFound(redirect_url)
-
-
-# def _create_rider_list(request, brevet):
-#     """Actual creation of rider list spreadsheet on Google Drive.
-#
-#     For use by :func:`create_rider_list` and :func:`setup_123` views.
-#     """
-#     username = request.registry.settings['google_drive.username']
-#     password = request.registry.settings['google_drive.password']
-#     flash = google_drive.create_rider_list(
-#         brevet, 'Brevet Rider List Template', username, password)
-#     if flash[0] == 'success':
-#         flash += google_drive.update_rider_list_info_question(
-#             brevet, username, password)
-#     return flash
+    if brevet is None:
+        raise HTTPNotFound
+    return rider_roster.roster_response(request, 'brevets', brevet)
 
 
 @view_config(
@@ -191,11 +188,12 @@ def _email_to_organizer(request, brevet, date):
     """
     event_page_url = request.route_url(
         'brevet', region=brevet.region, distance=brevet.distance, date=date)
-    rider_emails_url = request.route_url(
-        'brevet.rider_emails', region=brevet.region, distance=brevet.distance,
-        date=date, uuid=brevet.uuid)
+    rider_emails_url = request.route_url('rider_emails', uuid=brevet.uuid)
+    rider_list_url = request.route_url(
+        'brevet.roster', region=brevet.region, distance=brevet.distance,
+        date=date, uuid=brevet.uuid, format='xlsx')
     flash = admin_core.email_to_organizer(
-        request, brevet, event_page_url, rider_emails_url)
+        request, brevet, event_page_url, rider_emails_url, rider_list_url)
     return flash
 
 
@@ -232,11 +230,22 @@ def _email_to_webmaster(request, brevet, date):
 def setup_123(request):
     code, date = request.matchdict['item'].split()
     brevet = admin_core.get_brevet(code, date)
-    # flash = _create_rider_list(request, brevet)
-    # if 'error' not in flash:
-    #     flash += _email_to_organizer(request, brevet, date)
-    #     flash += _email_to_webmaster(request, brevet, date)
-    # admin_core.finalize_flash_msg(request, flash)
+    flash = _email_to_organizer(request, brevet, date)
+    flash += _email_to_webmaster(request, brevet, date)
+    admin_core.finalize_flash_msg(request, flash)
     redirect_url = request.route_url(
         'admin.brevets.view', item=request.matchdict['item'])
     return HTTPFound(redirect_url)
+
+
+@view_config(
+    route_name='admin.brevets.broadcast',
+    renderer='admin/broadcast.mako',
+    permission='authenticated',
+)
+class BrevetBroadcast(admin_core.EventBroadcast):
+    event_type = 'brevets'
+
+    def get_event(self):
+        code, date = self.request.matchdict['item'].split()
+        return admin_core.get_brevet(code, date)
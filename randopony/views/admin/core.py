@@ -1,28 +1,39 @@
 """RandoPony admin views core components.
 """
-from datetime import (
-    datetime,
-    timedelta,
-)
+import abc
+from datetime import datetime
 import logging
 
+from deform import Button
 from passlib.apps import custom_app_context
 from pyramid import security
-from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import (
+    HTTPFound,
+    HTTPNotFound,
+)
 from pyramid.renderers import render
 from pyramid.view import (
     forbidden_view_config,
     view_config,
     view_defaults,
 )
+from pyramid_deform import FormView
 from pyramid_mailer import get_mailer
 from pyramid_mailer.message import Message
 from sqlalchemy import desc
 from sqlalchemy.orm.exc import NoResultFound
 
+from randopony import (
+    broadcast,
+    dispatch,
+)
+from randopony.tasks import broadcast as broadcast_tasks
 from randopony.models import (
     Administrator,
     Brevet,
+    BroadcastJob,
+    BroadcastRecipient,
+    BroadcastSchema,
     EmailAddress,
     Populaire,
 )
@@ -203,14 +214,7 @@ def get_brevet(code, date):
     region = code[:2]
     distance = code[2:]
     date = datetime.strptime(date, '%d%b%Y')
-    return (
-        DBSession.query(Brevet)
-        .filter_by(region=region)
-        .filter_by(distance=distance)
-        .filter(Brevet.date_time >= date)
-        .filter(Brevet.date_time < date + timedelta(days=1))
-        .first()
-    )
+    return Brevet.get_by_slug(Brevet.make_slug(region, distance, date))
 
 
 def get_populaire(short_name):
@@ -221,21 +225,14 @@ def get_populaire(short_name):
     )
 
 
-def email_to_organizer(request, event, event_page_url, rider_emails_url):
-    if not event.google_doc_id:
-        return [
-            'error',
-            'Google Drive rider list must be created before email to '
-            'organizer(s) can be sent',
-        ]
+def email_to_organizer(
+    request, event, event_page_url, rider_emails_url, rider_list_url,
+):
     from_randopony = (
         DBSession.query(EmailAddress)
         .filter_by(key='from_randopony')
         .first().email
     )
-    rider_list_url = (
-        'https://spreadsheets.google.com/ccc?key={0}'
-        .format(event.google_doc_id.split(':')[1]))
     admin_email = (
         DBSession.query(EmailAddress)
         .filter_by(key='admin_email')
@@ -257,7 +254,7 @@ def email_to_organizer(request, event, event_page_url, rider_emails_url):
                 'admin_email': admin_email,
             }))
     mailer = get_mailer(request)
-    mailer.send(message)
+    mailer.send_to_queue(message)
     return [
         'success',
         'Email sent to {} organizer(s)'.format(event),
@@ -290,13 +287,116 @@ def email_to_webmaster(request, event, event_page_url):
                 'admin_email': admin_email,
             }))
     mailer = get_mailer(request)
-    mailer.send(message)
+    mailer.send_to_queue(message)
     return [
         'success',
         'Email with {} page URL sent to webmaster'.format(event),
     ]
 
 
+class EventBroadcast(FormView, abc.ABC):
+    """Base class for admin views that compose an email to all of the riders
+    registered for an event and queue it for background delivery.
+
+    Subclasses set :py:attr:`event_type` to the admin list name of their
+    event type and implement :py:meth:`get_event`.
+    """
+    schema = BroadcastSchema()
+    buttons = (
+        Button(name='send', css_class='btn btn-primary'),
+        Button(name='cancel', css_class='btn', type='reset'),
+    )
+    event_type = None
+
+    @abc.abstractmethod
+    def get_event(self):
+        """Return the event that the broadcast is for.
+        """
+
+    def view_url(self):
+        return self.request.route_url(
+            'admin.{}.view'.format(self.event_type),
+            item=self.request.matchdict['item'])
+
+    def show(self, form):
+        tmpl_vars = super(EventBroadcast, self).show(form)
+        return self._update_tmpl_vars(tmpl_vars)
+
+    def send_success(self, appstruct):
+        event = self.get_event()
+        if not event.riders:
+            finalize_flash_msg(
+                self.request,
+                ['error', 'No riders have registered for {}'.format(event)])
+            return HTTPFound(self.view_url())
+        from_randopony = (
+            DBSession.query(EmailAddress)
+            .filter_by(key='from_randopony')
+            .first().email
+        )
+        job = broadcast.create_job(
+            self.event_type, event, event.riders, from_randopony,
+            appstruct['subject'], appstruct['body'])
+        dispatch.after_commit(broadcast_tasks.send_broadcast, job.id)
+        finalize_flash_msg(self.request, [
+            'success',
+            'Email to {} rider(s) of {} queued as broadcast job {}'
+            .format(len(job.recipients), event, job.id),
+        ])
+        return HTTPFound(self.view_url())
+
+    def failure(self, e):
+        tmpl_vars = super(EventBroadcast, self).failure(e)
+        return self._update_tmpl_vars(tmpl_vars)
+
+    def _update_tmpl_vars(self, tmpl_vars):
+        tmpl_vars.update({
+            'version': version.number + version.release,
+            'event': self.get_event(),
+            'cancel_url': self.view_url(),
+        })
+        return tmpl_vars
+
+
+def get_broadcast_jobs(event_type, event):
+    """Return query object for the broadcast jobs of :kbd:`event`,
+    most recent first.
+    """
+    return (
+        DBSession.query(BroadcastJob)
+        .filter_by(event_type=event_type, event_id=event.id)
+        .order_by(desc(BroadcastJob.created_at)))
+
+
+@view_config(
+    route_name='admin.broadcasts.status',
+    renderer='json',
+    permission='authenticated',
+)
+def broadcast_status(request):
+    """Return the delivery progress of a broadcast job.
+    """
+    job = DBSession.query(BroadcastJob).get(int(request.matchdict['job']))
+    if job is None:
+        raise HTTPNotFound
+    progress = job.progress()
+    failures = (
+        DBSession.query(BroadcastRecipient.email, BroadcastRecipient.error)
+        .filter_by(job=job.id, status=BroadcastRecipient.FAILED)
+        .order_by(BroadcastRecipient.id))
+    return dict(
+        progress,
+        id=job.id,
+        subject=job.subject,
+        created_at=job.created_at.isoformat(),
+        finished_at=job.finished_at and job.finished_at.isoformat(),
+        error=job.error,
+        total=sum(progress.values()),
+        failures=[
+            {'email': email, 'error': error} for email, error in failures],
+    )
+
+
 def finalize_flash_msg(request, flash):
     """Transform a list of flash messages into a session.flash object
     with either `error` or `success` as its 1st message,
@@ -1,14 +1,18 @@
 """RandoPony populaire admin views.
 """
+from datetime import datetime
+
 from deform import Button
-# from gdata.docs.client import DocsClient
 from pyramid_deform import FormView
 from pyramid_mailer import get_mailer
 from pyramid_mailer.message import Message
-from pyramid.httpexceptions import HTTPFound
+from pyramid.httpexceptions import (
+    HTTPFound,
+    HTTPNotFound,
+)
 from pyramid.renderers import render
 from pyramid.view import view_config
-# from randopony.views.admin import google_drive
+from randopony import rider_roster
 from randopony.views.admin import core as admin_core
 from randopony.models import (
     EmailAddress,
@@ -30,6 +34,8 @@ def populaire_details(request):
     return {
         'version': version.number + version.release,
         'populaire': populaire,
+        'broadcasts': (
+            admin_core.get_broadcast_jobs('populaires', populaire).all()),
     }
 
 
@@ -40,7 +46,7 @@ def populaire_details(request):
 )
 class PopulaireCreate(FormView):
     schema = PopulaireSchema()
-    for field in 'id start_map_url'.split():
+    for field in 'id start_map_url organizer_notification'.split():
         schema.__delitem__(field)
     buttons = (
         Button(name='add', css_class='btn btn-primary'),
@@ -111,6 +117,7 @@ class PopulaireEdit(FormView):
             'organizer_email': populaire.organizer_email,
             'registration_end': populaire.registration_end,
             'entry_form_url': populaire.entry_form_url,
+            'organizer_notification': populaire.organizer_notification,
         }
 
     def show(self, form):
@@ -136,6 +143,12 @@ class PopulaireEdit(FormView):
         populaire.organizer_email = appstruct['organizer_email']
         populaire.registration_end = appstruct['registration_end']
         populaire.entry_form_url = appstruct['entry_form_url']
+        if (populaire.organizer_notification == 'immediate'
+                and appstruct['organizer_notification'] != 'immediate'):
+            # Organizers have already had emails for earlier registrations
+            populaire.organizer_digest_at = datetime.utcnow()
+        populaire.organizer_notification = (
+            appstruct['organizer_notification'])
         return HTTPFound(self._redirect_url(populaire))
 
     def failure(self, e):
@@ -148,28 +161,14 @@ class PopulaireEdit(FormView):
 
 
 @view_config(
-    route_name='admin.populaires.create_rider_list',
+    route_name='admin.populaires.roster',
     permission='authenticated',
 )
-def create_rider_list(request):
-    short_name = request.matchdict['item']
-    populaire = admin_core.get_populaire(short_name)
-    flash = _create_rider_list(request, populaire)
-    admin_core.finalize_flash_msg(request, flash)
-    redirect_url = request.route_url('admin.populaires.view', item=short_name)
-    return HTTPFound(redirect_url)
-
-
-def _create_rider_list(request, populaire):
-    """Actual creation of rider list spreadsheet on Google Drive.
-
-    For use by :func:`create_rider_list` and :func:`setup_123` views.
-    """
-    username = request.registry.settings['google_drive.username']
-    password = request.registry.settings['google_drive.password']
-    flash = google_drive.create_rider_list(
-        populaire, 'Populaire Rider List Template', username, password)
-    return flash
+def roster(request):
+    populaire = admin_core.get_populaire(request.matchdict['item'])
+    if populaire is None:
+        raise HTTPNotFound
+    return rider_roster.roster_response(request, 'populaires', populaire)
 
 
 @view_config(
@@ -192,12 +191,12 @@ def _email_to_organizer(request, populaire):
     """
     event_page_url = request.route_url(
         'populaire', short_name=populaire.short_name)
-    rider_emails_url = request.route_url(
-        'populaire.rider_emails',
-        short_name=populaire.short_name,
-        uuid=populaire.uuid)
+    rider_emails_url = request.route_url('rider_emails', uuid=populaire.uuid)
+    rider_list_url = request.route_url(
+        'populaire.roster', short_name=populaire.short_name,
+        uuid=populaire.uuid, format='xlsx')
     flash = admin_core.email_to_organizer(
-        request, populaire, event_page_url, rider_emails_url)
+        request, populaire, event_page_url, rider_emails_url, rider_list_url)
     return flash
 
 
@@ -232,10 +231,20 @@ def _email_to_webmaster(request, populaire):
 def setup_123(request):
     short_name = request.matchdict['item']
     populaire = admin_core.get_populaire(short_name)
-    flash = _create_rider_list(request, populaire)
-    if 'error' not in flash:
-        flash += _email_to_organizer(request, populaire)
-        flash += _email_to_webmaster(request, populaire)
+    flash = _email_to_organizer(request, populaire)
+    flash += _email_to_webmaster(request, populaire)
     admin_core.finalize_flash_msg(request, flash)
     redirect_url = request.route_url('admin.populaires.view', item=short_name)
     return HTTPFound(redirect_url)
+
+
+@view_config(
+    route_name='admin.populaires.broadcast',
+    renderer='admin/broadcast.mako',
+    permission='authenticated',
+)
+class PopulaireBroadcast(admin_core.EventBroadcast):
+    event_type = 'populaires'
+
+    def get_event(self):
+        return admin_core.get_populaire(self.request.matchdict['item'])
@@ -5,49 +5,53 @@ from datetime import (
     timedelta,
 )
 import logging
-from celery.task import task
 from deform import Button
-# from gdata.spreadsheet.service import SpreadsheetsService
 from pyramid_deform import FormView
 from pyramid.httpexceptions import (
     HTTPFound,
     HTTPNotFound,
 )
-from pyramid_mailer import get_mailer
 from pyramid_mailer.message import Message
 from pyramid.renderers import render
 from pyramid.response import Response
 from pyramid.view import view_config
 import pytz
-import requests
+from randopony import (
+    dispatch,
+    intake,
+    member_api,
+    outbox,
+    registration,
+    rider_roster,
+)
+from randopony.tasks import (
+    intake as intake_tasks,
+    outbox as outbox_tasks,
+)
 from randopony.views.site.core import (
+    cached_page,
+    CurrentEvents,
+    get_email_address,
     get_entry_form_url,
+    get_link,
     get_membership_link,
     get_results_link,
     SiteViews,
+    uuid_matches,
 )
-# from randopony.views.admin.google_drive import google_drive_login
 from randopony.models import (
     Brevet,
     BrevetEntrySchema,
-    BrevetRider,
-    EmailAddress,
-    Link,
-    Populaire,
+    ClubMember,
+    MemberStatusCache,
 )
-from randopony.models.meta import DBSession
 
 
 log = logging.getLogger(__name__)
 
 
 def get_brevet(region, distance, date):
-    brevet = (DBSession.query(Brevet)
-              .filter_by(region=region, distance=distance)
-              .filter(Brevet.date_time >= date)
-              .filter(Brevet.date_time < date + timedelta(days=1))
-              .first())
-    return brevet
+    return Brevet.get_by_slug(Brevet.make_slug(region, distance, date))
 
 
 class BrevetViews(SiteViews):
@@ -66,29 +70,29 @@ class BrevetViews(SiteViews):
             self.brevet = None
         self.tmpl_vars.update({'active_tab': 'brevets'})
 
-    @view_config(route_name='region.list', renderer='region-list.mako')
-    @view_config(route_name='register', renderer='region-list.mako')
+    @view_config(
+        route_name='region.list', renderer='region-list.mako',
+        decorator=cached_page)
+    @view_config(
+        route_name='register', renderer='region-list.mako',
+        decorator=cached_page)
     def region_list(self):
-        region_brevets = {}
-        for region in Brevet.REGIONS.keys():
-            region_brevets[region] = (
-                self.tmpl_vars['brevets'].filter_by(region=region))
-        admin_email = (DBSession.query(EmailAddress)
-                       .filter_by(key='admin_email')
-                       .one())
         self.tmpl_vars.update({
             'regions': Brevet.REGIONS,
-            'region_brevets': region_brevets,
-            'admin_email': admin_email.email,
+            'region_summary': Brevet.get_current_region_summary(),
+            'admin_email': get_email_address('admin_email'),
         })
         return self.tmpl_vars
 
-    @view_config(route_name='brevet.list', renderer='brevet-list.mako')
-    @view_config(route_name='register.region', renderer='brevet-list.mako')
+    @view_config(
+        route_name='brevet.list', renderer='brevet-list.mako',
+        decorator=cached_page)
+    @view_config(
+        route_name='register.region', renderer='brevet-list.mako',
+        decorator=cached_page)
     def brevet_list(self):
         region = self.request.matchdict['region']
-        region_brevets = (self.tmpl_vars['brevets']
-                          .filter_by(region=region))
+        region_brevets = self.current_events.region_brevets(region)
         images = {
             'HW': {
                 'file': 'VI400UnionBay.jpg',
@@ -134,12 +138,20 @@ class BrevetViews(SiteViews):
         if self._in_past():
             body = self._moved_on_page()
             return Response(body, status='200 OK')
+        registration_closed = self._registration_closed
+        event_started = self._event_started
+        entry_form_url = get_entry_form_url()
+        not_modified = self._not_modified(
+            self.brevet, registration_closed, event_started, entry_form_url)
+        if not_modified is not None:
+            return not_modified
         self.tmpl_vars.update({
             'brevet': self.brevet,
+            'roster': self.brevet.roster(),
             'REGIONS': Brevet.REGIONS,
-            'registration_closed': self._registration_closed,
-            'event_started': self._event_started,
-            'entry_form_url': get_entry_form_url(),
+            'registration_closed': registration_closed,
+            'event_started': event_started,
+            'entry_form_url': entry_form_url,
         })
         return self.tmpl_vars
 
@@ -151,12 +163,20 @@ class BrevetViews(SiteViews):
         brevet = get_brevet(
             region, distance, datetime.strptime(date, '%d%b%Y'))
         uuid = self.request.matchdict['uuid']
-        if uuid != str(brevet.uuid) or self._in_past():
+        if not uuid_matches(brevet, uuid) or self._in_past():
             raise HTTPNotFound
         return (
             ', '.join(rider.email for rider in brevet.riders) or
             'No riders have registered yet!')
 
+    @view_config(route_name='brevet.roster')
+    def roster(self):
+        uuid = self.request.matchdict['uuid']
+        if not uuid_matches(self.brevet, uuid) or self._in_past():
+            raise HTTPNotFound
+        return rider_roster.roster_response(
+            self.request, 'brevets', self.brevet)
+
     @property
     def _maybe_coming_soon(self):
         brevet_date = datetime.strptime(
@@ -239,10 +259,11 @@ class BrevetEntry(FormView):
         date = self.request.matchdict['date']
         brevet = get_brevet(
             region, distance, datetime.strptime(date, '%d%b%Y'))
+        current_events = CurrentEvents.load()
         tmpl_vars.update({
             'active_tab': 'brevets',
-            'brevets': Brevet.get_current(),
-            'populaires': Populaire.get_current(),
+            'brevets': current_events.brevets,
+            'populaires': current_events.populaires,
             'brevet': brevet,
             'membership_link': get_membership_link(),
             'cancel_url': self._redirect_url(region, distance, date),
@@ -255,16 +276,14 @@ class BrevetEntry(FormView):
         date = self.request.matchdict['date']
         brevet = get_brevet(
             region, distance, datetime.strptime(date, '%d%b%Y'))
+        queue = intake.get_queue()
+        if queue is not None:
+            # Write-behind intake; the duplicate check is done when the
+            # entry is applied
+            self._queue_entry(queue, brevet, appstruct)
+            return HTTPFound(self._redirect_url(region, distance, date))
         # Check for rider already registered
-        rider = (
-            DBSession.query(BrevetRider)
-            .filter_by(
-                email=appstruct['email'],
-                first_name=appstruct['first_name'],
-                last_name=appstruct['last_name'],
-                brevet=brevet.id,
-            )
-            .first())
+        rider = registration.registered_brevet_rider(brevet, appstruct)
         if rider is not None:
             # Rider with same name and email is already registered
             self.request.session.flash('duplicate')
@@ -273,40 +292,41 @@ class BrevetEntry(FormView):
             self.request.session.flash(rider.email)
         else:
             # New rider registration
-            mailer = get_mailer(self.request)
-            first_name = appstruct['first_name']
-            last_name = appstruct['last_name']
-            is_club_member_url = _get_is_club_member_url()
-            member_status = _get_member_status_by_name(
-                first_name, last_name, is_club_member_url)
-            rider = BrevetRider(
-                email=appstruct['email'],
-                first_name=first_name,
-                last_name=last_name,
-                comment=appstruct['comment'],
-                member_status=member_status,
-                bike_type=appstruct['bike_type'],
-            )
-            brevet.riders.append(rider)
-            DBSession.add(rider)
-            # update_google_spreadsheet.delay(
-            #     sorted(brevet.riders, key=attrgetter('lowercase_last_name')),
-            #     brevet.google_doc_id.split(':')[1],
-            #     self.request.registry.settings['google_drive.username'],
-            #     self.request.registry.settings['google_drive.password'],
-            #     is_club_member_url,
-            # )
-            message = self._rider_message(brevet, rider)
-            mailer.send(message)
-            message = self._organizer_message(brevet, rider)
-            mailer.send(message)
+            rider = registration.new_brevet_rider(appstruct)
+            registration.add_brevet_rider(
+                brevet, rider, _get_is_club_member_url())
+            outbox.add_message(self._rider_message(brevet, rider))
+            if brevet.organizer_notification == 'immediate':
+                # Otherwise the organizers get the registration in their
+                # next digest email
+                outbox.add_message(self._organizer_message(brevet, rider))
+            dispatch.after_commit(outbox_tasks.drain_outbox)
             membership_link = get_membership_link()
             self.request.session.flash('success')
             self.request.session.flash(rider.email)
-            self.request.session.flash(rider.member_status)
             self.request.session.flash(membership_link)
         return HTTPFound(self._redirect_url(region, distance, date))
 
+    def _queue_entry(self, queue, brevet, appstruct):
+        """Append the registration to the write-behind intake queue,
+        with its emails rendered now because their links are built from
+        the request.
+        """
+        rider = registration.new_brevet_rider(appstruct)
+        messages = [self._rider_message(brevet, rider)]
+        if brevet.organizer_notification == 'immediate':
+            messages.append(self._organizer_message(brevet, rider))
+        queue.append('brevets', brevet.id, {
+            'appstruct': appstruct,
+            'is_club_member_url': _get_is_club_member_url(),
+            'messages': [
+                outbox.message_payload(message) for message in messages],
+        })
+        dispatch.get_dispatcher().enqueue(intake_tasks.apply_intake, ())
+        self.request.session.flash('processing')
+        self.request.session.flash(rider.email)
+        self.request.session.flash(get_membership_link())
+
     def failure(self, e):
         tmpl_vars = super(BrevetEntry, self).failure(e)
         region = self.request.matchdict['region']
@@ -314,29 +334,22 @@ class BrevetEntry(FormView):
         date = self.request.matchdict['date']
         brevet = get_brevet(
             region, distance, datetime.strptime(date, '%d%b%Y'))
+        current_events = CurrentEvents.load()
         tmpl_vars.update({
             'active_tab': 'brevets',
-            'brevets': Brevet.get_current(),
-            'populaires': Populaire.get_current(),
+            'brevets': current_events.brevets,
+            'populaires': current_events.populaires,
             'brevet': brevet,
             'cancel_url': self._redirect_url(region, distance, date)
         })
         return tmpl_vars
 
     def _rider_message(self, brevet, rider):
-        from_randopony = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='from_randopony')
-            .first().email
-        )
+        from_randopony = get_email_address('from_randopony')
         brevet_page_url = self._redirect_url(
             brevet.region, brevet.distance,
             brevet.date_time.strftime('%d%b%Y'))
-        entry_form_url = (
-            DBSession.query(Link.url)
-            .filter_by(key='entry_form')
-            .one()[0]
-        )
+        entry_form_url = get_entry_form_url()
         membership_link = get_membership_link()
         message = Message(
             subject='Pre-registration Confirmation for {0}'
@@ -359,29 +372,13 @@ class BrevetEntry(FormView):
         return message
 
     def _organizer_message(self, brevet, rider):
-        from_randopony = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='from_randopony')
-            .first().email
-        )
+        from_randopony = get_email_address('from_randopony')
         date = brevet.date_time.strftime('%d%b%Y')
         brevet_page_url = self._redirect_url(
             brevet.region, brevet.distance, date)
-        # rider_list_url = (
-        #     'https://spreadsheets.google.com/ccc?key={0}'
-        #     .format(brevet.google_doc_id.split(':')[1]))
         rider_emails = self.request.route_url(
-            'brevet.rider_emails',
-            region=brevet.region,
-            distance=brevet.distance,
-            date=date,
-            uuid=brevet.uuid,
-        )
-        admin_email = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='admin_email')
-            .first().email
-        )
+            'rider_emails', uuid=brevet.uuid)
+        admin_email = get_email_address('admin_email')
         message = Message(
             subject=u'{0} has Pre-registered for the {1}'
                     .format(rider, brevet),
@@ -394,7 +391,6 @@ class BrevetEntry(FormView):
                     'rider': rider,
                     'brevet': brevet,
                     'brevet_page_url': brevet_page_url,
-                    # 'rider_list_url': rider_list_url,
                     'rider_emails': rider_emails,
                     'admin_email': admin_email,
                 })
@@ -403,58 +399,46 @@ class BrevetEntry(FormView):
 
 
 def _get_is_club_member_url():
-    return (
-        DBSession.query(Link.url)
-        .filter_by(key='is_club_member_api')
-        .one()[0]
-    )
+    return get_link('is_club_member_api')
 
 
 def _get_member_status_by_name(first_name, last_name, is_club_member_url):
-    response = requests.get(
-        is_club_member_url.format(last_name=last_name, first_name=first_name),
-        verify=False)
+    """Return the club membership status of the rider with
+    :kbd:`first_name` and :kbd:`last_name` from the imported club roster,
+    the membership status cache,
+    or from the club database if the name is in neither.
+
+    Must be called within a transaction because it updates the cache.
+    """
+    member_status = ClubMember.get_member_status(first_name, last_name)
+    if member_status is not None:
+        return member_status
+    cached = MemberStatusCache.get_fresh(first_name, last_name)
+    if cached is not None:
+        return cached.member_status
     try:
-        response.raise_for_status()
-        is_club_member = response.json()['is_current_member']
-    except (requests.HTTPError, KeyError):
-        is_club_member = None
-    return is_club_member
-
-
-# @task(ignore_result=True)
-# def update_google_spreadsheet(riders, doc_key, username, password,
-#                               is_club_member_url):
-#     # client = google_drive_login(SpreadsheetsService, username, password)
-#     spreadsheet_list = client.GetListFeed(doc_key)
-#     spreadsheet_rows = len(spreadsheet_list.entry)
-#     # Update the rows already in the spreadsheet
-#     for row, rider in enumerate(riders[:spreadsheet_rows]):
-#         rider_number = row + 1
-#         new_row_data = _make_spreadsheet_row_dict(
-#             rider_number, rider, is_club_member_url)
-#         client.UpdateRow(spreadsheet_list.entry[row], new_row_data)
-#     # Add remaining rows
-#     for row, rider in enumerate(riders[spreadsheet_rows:]):
-#         rider_number = spreadsheet_rows + row + 1
-#         row_data = _make_spreadsheet_row_dict(
-#             rider_number, rider, is_club_member_url)
-#         client.InsertRow(row_data, doc_key)
+        member_status = _request_member_status(
+            first_name, last_name, is_club_member_url)
+    except member_api.MemberAPIError:
+        # Unknown, but not cached because the club database is unavailable
+        return None
+    MemberStatusCache.store(first_name, last_name, member_status)
+    return member_status
+
+
+def _request_member_status(first_name, last_name, is_club_member_url):
+    """Return the club membership status of the rider with
+    :kbd:`first_name` and :kbd:`last_name` from the club database.
+
+    :raises: :exc:`randopony.member_api.MemberAPIError` if the club
+             database is unavailable.
+    """
+    return member_api.get_client().fetch_member_status(
+        first_name, last_name, is_club_member_url)
 
 
 def _make_spreadsheet_row_dict(rider_number, rider, is_club_member_url):
     if not rider.member_status:
         rider.member_status = _get_member_status_by_name(
             rider.first_name, rider.last_name, is_club_member_url)
-    if rider.member_status is None:
-        current_member = 'Unknown'
-    else:
-        current_member = 'Yes' if rider.member_status else 'No'
-    row_data = {
-        'ridernumber': str(rider_number),
-        'lastname': rider.last_name,
-        'firstname': rider.first_name,
-        'clubmember': current_member,
-        'biketype': rider.bike_type,
-    }
-    return row_data
+    return rider_roster.brevet_row(rider_number, rider)
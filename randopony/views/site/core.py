@@ -1,16 +1,212 @@
 """RandoPony public site core views.
 """
+from collections import (
+    defaultdict,
+    namedtuple,
+)
+from datetime import (
+    datetime,
+    timedelta,
+)
+import hashlib
+import hmac
+import threading
+
+from pyramid.httpexceptions import (
+    HTTPNotFound,
+    HTTPNotModified,
+)
+from pyramid.response import Response
 from pyramid.view import (
     notfound_view_config,
     view_config,
 )
+import pytz
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from webob.etag import ETagMatcher
 from randopony.models import (
     Brevet,
+    BrevetRider,
     EmailAddress,
     Link,
     Populaire,
+    PopulaireRider,
 )
-from randopony.models.meta import DBSession
+from randopony.models.core import start_of_today
+from randopony.site_settings import (
+    get_email_address,
+    get_link,
+)
+
+
+CachedPage = namedtuple(
+    'CachedPage', 'body content_type charset expires_at')
+
+
+class PageCache(object):
+    """Process-wide cache of rendered public site pages.
+
+    Pages are keyed by host, route name, and matchdict.
+    They expire at the end of the day,
+    when the set of current events changes,
+    or after a maximum age,
+    whichever comes first.
+    The maximum age bounds how long a page can be stale in the other
+    processes of a multi-process deployment.
+    The cache is cleared when a transaction that changed event, rider,
+    link, or email address rows is committed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pages = {}
+
+    @property
+    def generation(self):
+        """Counter that is incremented each time the cache is cleared.
+        """
+        with self._lock:
+            return self._generation
+
+    def get(self, key):
+        """Return the unexpired :class:`CachedPage` stored under :kbd:`key`,
+        or :py:obj:`None`.
+        """
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None and page.expires_at <= datetime.today():
+                del self._pages[key]
+                page = None
+        return page
+
+    def set(self, key, response, generation, max_age):
+        """Store the body of :kbd:`response` under :kbd:`key` for at most
+        :kbd:`max_age` seconds.
+
+        Nothing is stored if the cache has been cleared since
+        :kbd:`generation` was read from :attr:`generation`;
+        i.e. while the page was being rendered.
+        """
+        expires_at = min(
+            start_of_today() + timedelta(days=1),
+            datetime.today() + timedelta(seconds=max_age))
+        page = CachedPage(
+            response.body, response.content_type, response.charset,
+            expires_at)
+        with self._lock:
+            if generation == self._generation:
+                self._pages[key] = page
+
+    def clear(self):
+        """Empty the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            self._pages = {}
+
+
+page_cache = PageCache()
+
+
+def _mark_page_cache_stale(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info['page_cache_stale'] = True
+
+
+for model in (
+    Brevet, BrevetRider, Populaire, PopulaireRider, Link, EmailAddress,
+):
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _mark_page_cache_stale)
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_stale_page_cache(session):
+    if session.info.pop('page_cache_stale', False):
+        page_cache.clear()
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _discard_page_cache_stale_mark(session, transaction):
+    # Changes in transactions that end without being committed don't
+    # make cached pages stale
+    if transaction.parent is None:
+        session.info.pop('page_cache_stale', None)
+
+
+def cached_page(view):
+    """View decorator that serves rendered pages from :data:`page_cache`.
+
+    Only GET requests without pending flash messages are cached.
+    The maximum age of cached pages is set by the
+    :kbd:`page_cache.max_age` setting in seconds;
+    setting it to 0 disables the cache.
+    """
+    def cached_view(context, request):
+        max_age = int(
+            request.registry.settings.get('page_cache.max_age', 300))
+        if (max_age <= 0 or request.method != 'GET'
+                or request.session.peek_flash()):
+            return view(context, request)
+        key = (
+            request.host_url,
+            request.matched_route.name,
+            tuple(sorted(request.matchdict.items())),
+        )
+        page = page_cache.get(key)
+        if page is not None:
+            return Response(
+                body=page.body,
+                content_type=page.content_type,
+                charset=page.charset,
+            )
+        generation = page_cache.generation
+        response = view(context, request)
+        if response.status_code == 200:
+            page_cache.set(key, response, generation, max_age)
+        return response
+    return cached_view
+
+
+class CurrentEvents(object):
+    """Snapshot of the current brevets and populaires.
+
+    The events are loaded with 1 query per event type and held in lists
+    so that templates can test, count, iterate, and group them without
+    issuing SQL while they are rendered.
+    """
+    def __init__(self, brevets, populaires):
+        self.brevets = list(brevets)
+        self.populaires = list(populaires)
+        self._region_brevets = defaultdict(list)
+        for brevet in self.brevets:
+            self._region_brevets[brevet.region].append(brevet)
+
+    @classmethod
+    def load(cls, recent_days=7):
+        """Return a snapshot of the events that are current in the
+        :meth:`~randopony.models.core.EventMixin.get_current` sense.
+        """
+        return cls(
+            Brevet.get_current(recent_days),
+            Populaire.get_current(recent_days),
+        )
+
+    @property
+    def brevet_count(self):
+        return len(self.brevets)
+
+    @property
+    def populaire_count(self):
+        return len(self.populaires)
+
+    def region_brevets(self, region):
+        """Return the list of current brevets in :kbd:`region`,
+        in date order.
+        """
+        return self._region_brevets.get(region, [])
 
 
 class SiteViews(object):
@@ -18,39 +214,100 @@ class SiteViews(object):
     """
     def __init__(self, request):
         self.request = request
+        self.current_events = CurrentEvents.load()
         self.tmpl_vars = {
-            'brevets': Brevet.get_current(),
-            'populaires': Populaire.get_current(),
+            'brevets': self.current_events.brevets,
+            'populaires': self.current_events.populaires,
             'membership_link': get_membership_link(),
         }
 
-    @view_config(route_name='home', renderer='home.mako')
+    def _not_modified(self, event, *page_state):
+        """Set conditional GET headers for an event page on the response,
+        and return a 304 response if the client's copy is current.
+
+        The ETag is calculated from the event's id, updated_at timestamp,
+        and rider count,
+        the :kbd:`page_state` values that the view derives from the time
+        (e.g. registration closed),
+        and the current events and links that are shown on every page,
+        so it changes whenever the rendered page would.
+
+        :returns: :class:`pyramid.httpexceptions.HTTPNotModified` instance,
+                  or :py:obj:`None` if the page has to be rendered.
+        """
+        response = self.request.response
+        if self.request.session.peek_flash():
+            # Flash messages are rendered once for 1 client only
+            response.cache_control = 'private, no-cache'
+            return None
+        current_events = (
+            self.current_events.brevets + self.current_events.populaires)
+        etag_state = (
+            event.id, event.updated_at, event.rider_count, page_state,
+            [(e.id, e.updated_at) for e in current_events],
+            self.tmpl_vars['membership_link'],
+        )
+        response.etag = hashlib.sha1(
+            repr(etag_state).encode('utf-8')).hexdigest()
+        if event.updated_at is not None:
+            response.last_modified = event.updated_at.replace(tzinfo=pytz.utc)
+        response.cache_control.public = True
+        response.cache_control.max_age = int(
+            self.request.registry.settings.get('event_page.max_age', 60))
+        response.vary = ('Cookie',)
+        if_none_match = ETagMatcher.parse(
+            self.request.headers.get('If-None-Match', ''), strong=False)
+        if response.etag in if_none_match:
+            headers = {
+                key: response.headers[key]
+                for key in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+                if key in response.headers
+            }
+            return HTTPNotModified(headers=headers)
+        return None
+
+    @view_config(
+        route_name='home', renderer='home.mako', decorator=cached_page)
     def home(self):
         self.tmpl_vars.update({
             'active_tab': 'home',
         })
         return self.tmpl_vars
 
-    @view_config(route_name='organizer-info', renderer='organizer-info.mako')
+    @view_config(
+        route_name='organizer-info', renderer='organizer-info.mako',
+        decorator=cached_page)
     def organizer_info(self):
-        admin_email = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='admin_email')
-            .one()
-        )
         self.tmpl_vars.update({
             'active_tab': 'organizer-info',
-            'admin_email': admin_email.email,
+            'admin_email': get_email_address('admin_email'),
         })
         return self.tmpl_vars
 
-    @view_config(route_name='about', renderer='about-pony.mako')
+    @view_config(
+        route_name='about', renderer='about-pony.mako', decorator=cached_page)
     def about(self):
         self.tmpl_vars.update({
             'active_tab': 'about',
         })
         return self.tmpl_vars
 
+    @view_config(route_name='rider_emails', renderer='string')
+    def event_rider_emails(self):
+        """Return the email addresses of the riders who have registered for
+        the event that is identified by the uuid in the URL.
+
+        The URLs stay the same when events are edited.
+        """
+        uuid = self.request.matchdict['uuid']
+        event = Brevet.get_by_uuid(uuid) or Populaire.get_by_uuid(uuid)
+        days_ago = start_of_today() - timedelta(days=7)
+        if event is None or event.date_time < days_ago:
+            raise HTTPNotFound
+        return (
+            ', '.join(rider.email for rider in event.riders) or
+            'No riders have registered yet!')
+
     @notfound_view_config(renderer='404.mako')
     def notfound(self):
         self.request.response.status = '404 Not Found'
@@ -60,32 +317,30 @@ class SiteViews(object):
         return self.tmpl_vars
 
 
+def uuid_matches(event, uuid):
+    """Return :py:obj:`True` if :kbd:`uuid` from a URL is the uuid of
+    :kbd:`event`.
+
+    The comparison takes the same time wherever the uuids differ,
+    so a uuid can't be guessed from response times.
+    """
+    return event is not None and hmac.compare_digest(
+        uuid.encode('utf-8'), str(event.uuid).encode('utf-8'))
+
+
 def get_membership_link():
-    """Return club membership sign-up site URL from database.
+    """Return club membership sign-up site URL.
     """
-    membership_link = (
-        DBSession.query(Link.url)
-        .filter_by(key='membership_link')
-        .one()[0]
-    )
-    return membership_link
+    return get_link('membership_link')
 
 
 def get_entry_form_url():
-    """Return club event entry form URL from database.
+    """Return club event entry form URL.
     """
-    entry_form_url = (
-        DBSession.query(Link.url)
-        .filter_by(key='entry_form')
-        .one()[0])
-    return entry_form_url
+    return get_link('entry_form')
 
 
 def get_results_link():
-    """Return club event results page URL from database.
+    """Return club event results page URL.
     """
-    results_link = (
-        DBSession.query(Link.url)
-        .filter_by(key='results_link')
-        .one()[0])
-    return results_link
+    return get_link('results_link')
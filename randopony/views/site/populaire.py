@@ -5,34 +5,40 @@ from datetime import (
     timedelta,
 )
 import logging
-from operator import attrgetter
-from celery.task import task
 from deform import Button
-# from gdata.spreadsheet.service import SpreadsheetsService
 from pyramid_deform import FormView
 from pyramid.httpexceptions import (
     HTTPFound,
     HTTPNotFound,
 )
-from pyramid_mailer import get_mailer
 from pyramid_mailer.message import Message
 from pyramid.renderers import render
 from pyramid.response import Response
 from pyramid.view import view_config
 import pytz
+from randopony import (
+    dispatch,
+    intake,
+    outbox,
+    registration,
+    rider_roster,
+)
+from randopony.tasks import (
+    intake as intake_tasks,
+    outbox as outbox_tasks,
+)
 from randopony.views.site.core import (
+    cached_page,
+    CurrentEvents,
+    get_email_address,
     get_membership_link,
     get_results_link,
     SiteViews,
+    uuid_matches,
 )
-# from randopony.views.admin.google_drive import google_drive_login
 from randopony.models import (
-    Brevet,
-    EmailAddress,
-    Link,
     Populaire,
     PopulaireEntrySchema,
-    PopulaireRider,
 )
 from randopony.models.meta import DBSession
 
@@ -61,14 +67,13 @@ class PopulaireViews(SiteViews):
             self.populaire = None
         self.tmpl_vars.update({'active_tab': 'populaires'})
 
-    @view_config(route_name='populaire.list', renderer='populaire-list.mako')
+    @view_config(
+        route_name='populaire.list', renderer='populaire-list.mako',
+        decorator=cached_page)
     def populaire_list(self):
-        admin_email = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='admin_email')
-            .one()
-        )
-        self.tmpl_vars.update({'admin_email': admin_email.email})
+        self.tmpl_vars.update({
+            'admin_email': get_email_address('admin_email'),
+        })
         return self.tmpl_vars
 
     @view_config(route_name='populaire', renderer='populaire.mako')
@@ -76,10 +81,17 @@ class PopulaireViews(SiteViews):
         if self._in_past():
             body = self._moved_on_page()
             return Response(body, status='200 OK')
+        registration_closed = self._registration_closed
+        event_started = self._event_started
+        not_modified = self._not_modified(
+            self.populaire, registration_closed, event_started)
+        if not_modified is not None:
+            return not_modified
         self.tmpl_vars.update({
             'populaire': self.populaire,
-            'registration_closed': self._registration_closed,
-            'event_started': self._event_started,
+            'roster': self.populaire.roster(),
+            'registration_closed': registration_closed,
+            'event_started': event_started,
         })
         return self.tmpl_vars
 
@@ -87,11 +99,19 @@ class PopulaireViews(SiteViews):
     def rider_emails(self):
         populaire = get_populaire(self.request.matchdict['short_name'])
         uuid = self.request.matchdict['uuid']
-        if uuid != str(populaire.uuid) or self._in_past():
+        if not uuid_matches(populaire, uuid) or self._in_past():
             raise HTTPNotFound
         return (', '.join(rider.email for rider in populaire.riders)
                 or 'No riders have registered yet!')
 
+    @view_config(route_name='populaire.roster')
+    def roster(self):
+        uuid = self.request.matchdict['uuid']
+        if not uuid_matches(self.populaire, uuid) or self._in_past():
+            raise HTTPNotFound
+        return rider_roster.roster_response(
+            self.request, 'populaires', self.populaire)
+
     @property
     def _registration_closed(self):
         utc_registration_end = (
@@ -163,10 +183,11 @@ class PopulaireEntry(FormView):
     def show(self, form):
         tmpl_vars = super(PopulaireEntry, self).show(form)
         populaire = get_populaire(self.request.matchdict['short_name'])
+        current_events = CurrentEvents.load()
         tmpl_vars.update({
             'active_tab': 'populaires',
-            'brevets': Brevet.get_current(),
-            'populaires': Populaire.get_current(),
+            'brevets': current_events.brevets,
+            'populaires': current_events.populaires,
             'populaire': populaire,
             'membership_link': get_membership_link(),
             'cancel_url': self._redirect_url(
@@ -177,17 +198,14 @@ class PopulaireEntry(FormView):
     def register_success(self, appstruct):
         pop_short_name = self.request.matchdict['short_name']
         populaire = get_populaire(pop_short_name)
+        queue = intake.get_queue()
+        if queue is not None:
+            # Write-behind intake; the duplicate check is done when the
+            # entry is applied
+            self._queue_entry(queue, populaire, appstruct)
+            return HTTPFound(self._redirect_url(pop_short_name))
         # Check for rider already registered
-        rider = (
-            DBSession.query(PopulaireRider)
-            .filter_by(
-                email=appstruct['email'],
-                first_name=appstruct['first_name'],
-                last_name=appstruct['last_name'],
-                populaire=populaire.id,
-            )
-            .first()
-        )
+        rider = registration.registered_populaire_rider(populaire, appstruct)
         if rider is not None:
             # Rider with same name and email is already registered
             self.request.session.flash('duplicate')
@@ -196,42 +214,44 @@ class PopulaireEntry(FormView):
             self.request.session.flash(rider.email)
         else:
             # New rider registration
-            mailer = get_mailer(self.request)
-            try:
-                distance = appstruct['distance']
-            except KeyError:
-                distance = populaire.distance.split()[0]
-            rider = PopulaireRider(
-                email=appstruct['email'],
-                first_name=appstruct['first_name'],
-                last_name=appstruct['last_name'],
-                distance=distance,
-                comment=appstruct['comment'],
-            )
-            populaire.riders.append(rider)
-            DBSession.add(rider)
-            # update_google_spreadsheet.delay(
-            #     sorted(
-            #         populaire.riders, key=attrgetter('lowercase_last_name')),
-            #     populaire.google_doc_id.split(':')[1],
-            #     self.request.registry.settings['google_drive.username'],
-            #     self.request.registry.settings['google_drive.password'],
-            # )
-            message = self._rider_message(populaire, rider)
-            mailer.send(message)
-            message = self._organizer_message(populaire, rider)
-            mailer.send(message)
+            rider = registration.new_populaire_rider(populaire, appstruct)
+            registration.add_populaire_rider(populaire, rider)
+            outbox.add_message(self._rider_message(populaire, rider))
+            if populaire.organizer_notification == 'immediate':
+                # Otherwise the organizers get the registration in their
+                # next digest email
+                outbox.add_message(self._organizer_message(populaire, rider))
+            dispatch.after_commit(outbox_tasks.drain_outbox)
             self.request.session.flash('success')
             self.request.session.flash(rider.email)
         return HTTPFound(self._redirect_url(pop_short_name))
 
+    def _queue_entry(self, queue, populaire, appstruct):
+        """Append the registration to the write-behind intake queue,
+        with its emails rendered now because their links are built from
+        the request.
+        """
+        rider = registration.new_populaire_rider(populaire, appstruct)
+        messages = [self._rider_message(populaire, rider)]
+        if populaire.organizer_notification == 'immediate':
+            messages.append(self._organizer_message(populaire, rider))
+        queue.append('populaires', populaire.id, {
+            'appstruct': appstruct,
+            'messages': [
+                outbox.message_payload(message) for message in messages],
+        })
+        dispatch.get_dispatcher().enqueue(intake_tasks.apply_intake, ())
+        self.request.session.flash('processing')
+        self.request.session.flash(rider.email)
+
     def failure(self, e):
         tmpl_vars = super(PopulaireEntry, self).failure(e)
         populaire = get_populaire(self.request.matchdict['short_name'])
+        current_events = CurrentEvents.load()
         tmpl_vars.update({
             'active_tab': 'populaires',
-            'brevets': Brevet.get_current(),
-            'populaires': Populaire.get_current(),
+            'brevets': current_events.brevets,
+            'populaires': current_events.populaires,
             'populaire': populaire,
             'cancel_url': self._redirect_url(
                 self.request.matchdict['short_name']),
@@ -239,11 +259,7 @@ class PopulaireEntry(FormView):
         return tmpl_vars
 
     def _rider_message(self, populaire, rider):
-        from_randopony = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='from_randopony')
-            .first().email
-        )
+        from_randopony = get_email_address('from_randopony')
         pop_page_url = self._redirect_url(populaire.short_name)
         message = Message(
             subject='Pre-registration Confirmation for {0}'
@@ -263,24 +279,11 @@ class PopulaireEntry(FormView):
         return message
 
     def _organizer_message(self, populaire, rider):
-        from_randopony = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='from_randopony')
-            .first().email
-        )
+        from_randopony = get_email_address('from_randopony')
         pop_page_url = self._redirect_url(populaire.short_name)
-        # rider_list_url = (
-        #     'https://spreadsheets.google.com/ccc?key={0}'
-        #     .format(populaire.google_doc_id.split(':')[1]))
         rider_emails = self.request.route_url(
-            'populaire.rider_emails',
-            short_name=populaire.short_name,
-            uuid=populaire.uuid)
-        admin_email = (
-            DBSession.query(EmailAddress)
-            .filter_by(key='admin_email')
-            .first().email
-        )
+            'rider_emails', uuid=populaire.uuid)
+        admin_email = get_email_address('admin_email')
         message = Message(
             subject=u'{0} has Pre-registered for the {1}'
                     .format(rider, populaire),
@@ -293,35 +296,11 @@ class PopulaireEntry(FormView):
                     'rider': rider,
                     'populaire': populaire,
                     'pop_page_url': pop_page_url,
-                    # 'rider_list_url': rider_list_url,
                     'rider_emails': rider_emails,
                     'admin_email': admin_email,
                 }))
         return message
 
 
-# @task(ignore_result=True)
-# def update_google_spreadsheet(riders, doc_key, username, password):
-#     client = google_drive_login(SpreadsheetsService, username, password)
-#     spreadsheet_list = client.GetListFeed(doc_key)
-#     spreadsheet_rows = len(spreadsheet_list.entry)
-#     # Update the rows already in the spreadsheet
-#     for row, rider in enumerate(riders[:spreadsheet_rows]):
-#         rider_number = row + 1
-#         new_row_data = _make_spreadsheet_row_dict(rider_number, rider)
-#         client.UpdateRow(spreadsheet_list.entry[row], new_row_data)
-#     # Add remaining rows
-#     for row, rider in enumerate(riders[spreadsheet_rows:]):
-#         rider_number = spreadsheet_rows + row + 1
-#         row_data = _make_spreadsheet_row_dict(rider_number, rider)
-#         client.InsertRow(row_data, doc_key)
-
-
 def _make_spreadsheet_row_dict(rider_number, rider):
-    row_data = {
-        'ridernumber': str(rider_number),
-        'lastname': rider.last_name,
-        'firstname': rider.first_name,
-        'distance': str(rider.distance),
-    }
-    return row_data
+    return rider_roster.populaire_row(rider_number, rider)
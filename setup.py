@@ -10,7 +10,6 @@ requires = [
     'celery',
     'colander==1.2',
     'deform==0.9.9',
-    # 'gdata',
     'passlib',
     'pyramid',
     'pyramid-crow',
@@ -51,5 +50,13 @@ setup(name='RandoPony',
       main = randopony:main
       [console_scripts]
       initialize_RandoPony_db = randopony.scripts.initializedb:main
+      upgrade_RandoPony_db = randopony.scripts.upgradedb:main
+      recount_RandoPony_riders = randopony.scripts.recount_riders:main
+      refresh_RandoPony_member_status = randopony.scripts.refresh_member_status:main
+      import_RandoPony_club_members = randopony.scripts.import_club_members:main
+      deliver_RandoPony_mail = randopony.scripts.deliver_mail:main
+      send_RandoPony_organizer_digests = randopony.scripts.send_organizer_digests:main
+      benchmark_RandoPony_broker = randopony.scripts.broker_benchmark:main
+      benchmark_RandoPony_intake = randopony.scripts.intake_benchmark:main
       """,
       )
@@ -2,7 +2,11 @@
 """
 import pytest
 from pyramid import testing
-from sqlalchemy import create_engine
+from sqlalchemy import (
+    create_engine,
+    event,
+)
+import transaction
 
 from randopony.models.meta import (
     Base,
@@ -12,11 +16,34 @@ from randopony.models.meta import (
 
 @pytest.yield_fixture(scope='function')
 def db_session():
+    from randopony.site_settings import settings_cache
+    from randopony.views.site.core import page_cache
     engine = create_engine('sqlite://')
     DBSession.configure(bind=engine)
     Base.metadata.create_all(engine)
+    settings_cache.clear()
+    page_cache.clear()
+    transaction.abort()
     yield DBSession
+    transaction.abort()
     DBSession.remove()
+    settings_cache.clear()
+    page_cache.clear()
+
+
+@pytest.yield_fixture(scope='function')
+def sql_statements(db_session):
+    """List of the SQL statements executed on the database session engine.
+    """
+    statements = []
+    engine = db_session.get_bind()
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record_statement)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record_statement)
 
 
 @pytest.yield_fixture(scope='function')
@@ -71,6 +98,12 @@ def pop_rider_model():
     return PopulaireRider
 
 
+@pytest.fixture(scope='session')
+def member_status_cache_model():
+    from randopony.models import MemberStatusCache
+    return MemberStatusCache
+
+
 @pytest.fixture(scope='module')
 def views_core_module():
     from randopony.views.site import core
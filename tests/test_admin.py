@@ -171,9 +171,10 @@ class TestEmailToOrganizer(unittest.TestCase):
             'admin.populaires.view', '/admin/brevet/{item}')
         self.config.add_route(
             'brevet', '/brevets/{region}/{distance}/{date}')
+        self.config.add_route('rider_emails', '/rider_emails/{uuid}')
         self.config.add_route(
-            'brevet.rider_emails',
-            '/brevets/{region}/{distance}/{date}/rider_emails/{uuid}')
+            'brevet.roster',
+            '/brevets/{region}/{distance}/{date}/roster/{uuid}.{format}')
         engine = create_engine('sqlite://')
         DBSession.configure(bind=engine)
         Base.metadata.create_all(engine)
@@ -191,42 +192,6 @@ class TestEmailToOrganizer(unittest.TestCase):
         DBSession.remove()
         testing.tearDown()
 
-    def test_email_to_organizer_catches_missing_google_doc_id(self):
-        """email_to_organizer return error flash if google_doc_id not set
-        """
-        from randopony.models import Brevet
-        brevet = Brevet(
-            region='VI',
-            distance=200,
-            date_time=datetime(2013, 3, 3, 7, 0),
-            route_name='Chilly 200',
-            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
-            organizer_email='mcroy@example.com',
-            registration_end=datetime(2013, 3, 2, 12, 0),
-        )
-        DBSession.add(brevet)
-        request = testing.DummyRequest()
-        request.matchdict.update({
-            'region': 'VI',
-            'distance': '200',
-            'date': '03Mar2013',
-        })
-        date = '03Mar2013'
-        event_page_url = request.route_url(
-            'brevet', region=brevet.region, distance=brevet.distance,
-            date=date)
-        rider_emails_url = request.route_url(
-            'brevet.rider_emails', region=brevet.region,
-            distance=brevet.distance, date=date, uuid=brevet.uuid)
-        flash = self._call_email_to_organizer(
-            request, brevet, event_page_url, rider_emails_url)
-        self.assertEqual(
-            flash, [
-                'error',
-                'Google Drive rider list must be created before email to '
-                'organizer(s) can be sent'
-            ])
-
     def test_email_to_organizer_sends_email(self):
         """email_to_organizer sends message & sets expected flash message
         """
@@ -239,7 +204,6 @@ class TestEmailToOrganizer(unittest.TestCase):
             start_locn='Chez Croy, 3131 Millgrove St, Victoria',
             organizer_email='mcroy@example.com',
             registration_end=datetime(2013, 3, 2, 12, 0),
-            google_doc_id='spreadsheet:1234',
         )
         DBSession.add(brevet)
         request = testing.DummyRequest()
@@ -252,13 +216,16 @@ class TestEmailToOrganizer(unittest.TestCase):
         event_page_url = request.route_url(
             'brevet', region=brevet.region, distance=brevet.distance,
             date=date)
-        rider_emails_url = request.route_url(
-            'brevet.rider_emails', region=brevet.region,
-            distance=brevet.distance, date=date, uuid=brevet.uuid)
+        DBSession.flush()
+        rider_emails_url = request.route_url('rider_emails', uuid=brevet.uuid)
+        rider_list_url = request.route_url(
+            'brevet.roster', region=brevet.region, distance=brevet.distance,
+            date=date, uuid=brevet.uuid, format='xlsx')
         mailer = get_mailer(request)
         flash = self._call_email_to_organizer(
-            request, brevet, event_page_url, rider_emails_url)
-        self.assertEqual(len(mailer.outbox), 1)
+            request, brevet, event_page_url, rider_emails_url,
+            rider_list_url)
+        self.assertEqual(len(mailer.queue), 1)
         self.assertEqual(
             flash,
             ['success', 'Email sent to VI200 03Mar2013 organizer(s)'])
@@ -278,7 +245,6 @@ class TestEmailToOrganizer(unittest.TestCase):
             start_locn='Chez Croy, 3131 Millgrove St, Victoria',
             organizer_email='mcroy@example.com',
             registration_end=datetime(2013, 3, 2, 12, 0),
-            google_doc_id='spreadsheet:123'
         )
         DBSession.add(brevet)
         request = testing.DummyRequest()
@@ -291,13 +257,16 @@ class TestEmailToOrganizer(unittest.TestCase):
         event_page_url = request.route_url(
             'brevet', region=brevet.region, distance=brevet.distance,
             date=date)
-        rider_emails_url = request.route_url(
-            'brevet.rider_emails', region=brevet.region,
-            distance=brevet.distance, date=date, uuid=brevet.uuid)
+        DBSession.flush()
+        rider_emails_url = request.route_url('rider_emails', uuid=brevet.uuid)
+        rider_list_url = request.route_url(
+            'brevet.roster', region=brevet.region, distance=brevet.distance,
+            date=date, uuid=brevet.uuid, format='xlsx')
         mailer = get_mailer(request)
         self._call_email_to_organizer(
-            request, brevet, event_page_url, rider_emails_url)
-        msg = mailer.outbox[0]
+            request, brevet, event_page_url, rider_emails_url,
+            rider_list_url)
+        msg = mailer.queue[0]
         self.assertEqual(msg.subject, 'RandoPony URLs for VI200 03Mar2013')
         from_randopony = (
             DBSession.query(EmailAddress)
@@ -308,12 +277,12 @@ class TestEmailToOrganizer(unittest.TestCase):
             'The URL is <http://example.com/brevets/VI/200/03Mar2013>.',
             msg.body)
         self.assertIn(
-            'rider list URL is <https://spreadsheets.google.com/ccc?key=123>.',
+            'rider list URL is <http://example.com/brevets/VI/200/03Mar2013/'
+            'roster/{}.xlsx>.'.format(brevet.uuid),
             msg.body)
         self.assertIn(
-            'email address list URL is <http://example.com/brevets/'
-            'VI/200/03Mar2013/rider_emails/'
-            'ba8e8e00-dd42-5c6c-9b30-b65ce9c8df26>.',
+            'email address list URL is '
+            '<http://example.com/rider_emails/{}>.'.format(brevet.uuid),
             msg.body)
         self.assertIn(
             'Pre-registration on the pony closes at 12:00 on 2013-03-02',
@@ -332,7 +301,6 @@ class TestEmailToOrganizer(unittest.TestCase):
             start_locn='Chez Croy, 3131 Millgrove St, Victoria',
             organizer_email='mjansson@example.com, mcroy@example.com',
             registration_end=datetime(2013, 3, 2, 12, 0),
-            google_doc_id='spreadsheet:1234'
         )
         DBSession.add(brevet)
         request = testing.DummyRequest()
@@ -345,13 +313,16 @@ class TestEmailToOrganizer(unittest.TestCase):
         event_page_url = request.route_url(
             'brevet', region=brevet.region, distance=brevet.distance,
             date=date)
-        rider_emails_url = request.route_url(
-            'brevet.rider_emails', region=brevet.region,
-            distance=brevet.distance, date=date, uuid=brevet.uuid)
+        DBSession.flush()
+        rider_emails_url = request.route_url('rider_emails', uuid=brevet.uuid)
+        rider_list_url = request.route_url(
+            'brevet.roster', region=brevet.region, distance=brevet.distance,
+            date=date, uuid=brevet.uuid, format='xlsx')
         mailer = get_mailer(request)
         self._call_email_to_organizer(
-            request, brevet, event_page_url, rider_emails_url)
-        msg = mailer.outbox[0]
+            request, brevet, event_page_url, rider_emails_url,
+            rider_list_url)
+        msg = mailer.queue[0]
         self.assertEqual(
             msg.recipients, ['mjansson@example.com', 'mcroy@example.com'])
 
@@ -421,7 +392,7 @@ class TestEmailToWebmaster(unittest.TestCase):
         mailer = get_mailer(request)
         flash = self._call_email_to_webmaster(
             request, populaire, event_page_url)
-        self.assertEqual(len(mailer.outbox), 1)
+        self.assertEqual(len(mailer.queue), 1)
         self.assertEqual(
             flash,
             ['success', 'Email with VicPop page URL sent to webmaster'])
@@ -450,7 +421,7 @@ class TestEmailToWebmaster(unittest.TestCase):
             'populaire', short_name=populaire.short_name)
         mailer = get_mailer(request)
         self._call_email_to_webmaster(request, populaire, event_page_url)
-        msg = mailer.outbox[0]
+        msg = mailer.queue[0]
         self.assertEqual(
             msg.subject, 'RandoPony Pre-registration page for VicPop')
         self.assertEqual(msg.sender, 'randopony@randonneurs.bc.ca')
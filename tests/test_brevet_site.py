@@ -7,7 +7,16 @@ from unittest.mock import (
 )
 
 from pyramid.threadlocal import get_current_request
+from pyramid_mailer.message import Message
 import pytest
+import transaction
+
+from randopony import outbox
+from randopony.tasks import (
+    member_status as member_status_tasks,
+    outbox as outbox_tasks,
+    rider_list,
+)
 
 
 @pytest.fixture(scope='module')
@@ -62,8 +71,7 @@ class TestBrevetViews(object):
             tmpl_vars = views.region_list()
         assert tmpl_vars['active_tab'] == 'brevets'
         assert tmpl_vars['regions'] == brevet_model.REGIONS
-        expected = set(brevet_model.REGIONS.keys())
-        assert set(tmpl_vars['region_brevets'].keys()) == expected
+        assert tmpl_vars['region_summary'] == {}
         assert tmpl_vars['admin_email'] == 'tom@example.com'
 
     def test_region_list_brevet(
@@ -81,7 +89,6 @@ class TestBrevetViews(object):
                        '123 Carrie Cates Ct, North Vancouver',
             organizer_email='tracy@example.com',
         )
-        brevet_id = str(brevet)
         email = email_address_model(key='admin_email', email='tom@example.com')
         db_session.add_all((brevet, email))
         with patch.object(views_core_module, 'get_membership_link'):
@@ -90,7 +97,39 @@ class TestBrevetViews(object):
                     2012, 11, 1, 12, 55, 42)
                 views = views_class(get_current_request())
                 tmpl_vars = views.region_list()
-        assert str(tmpl_vars['region_brevets']['LM'].one()) == brevet_id
+        assert list(tmpl_vars['region_summary'].keys()) == ['LM']
+        assert tmpl_vars['region_summary']['LM'].count == 1
+
+    def test_region_list_single_aggregate_query(
+        self, views_class, email_address_model, brevet_model, core_model,
+        views_core_module, db_session, sql_statements,
+    ):
+        """region_list view gets region counts from 1 GROUP BY query
+        """
+        for region, distance in (('LM', 200), ('LM', 300), ('VI', 200)):
+            db_session.add(brevet_model(
+                region=region,
+                distance=distance,
+                date_time=datetime(2012, 11, 11, 7, 0, 0),
+                route_name='11th Hour',
+                start_locn='Lonsdale Quay, North Vancouver',
+                organizer_email='tracy@example.com',
+            ))
+        db_session.add(
+            email_address_model(key='admin_email', email='tom@example.com'))
+        db_session.flush()
+        views_core_module.get_email_address('admin_email')
+        with patch.object(views_core_module, 'get_membership_link'):
+            with patch.object(core_model, 'datetime') as m_datetime:
+                m_datetime.today.return_value = datetime(
+                    2012, 11, 1, 12, 55, 42)
+                views = views_class(get_current_request())
+                del sql_statements[:]
+                tmpl_vars = views.region_list()
+        assert len(sql_statements) == 1
+        assert 'GROUP BY' in sql_statements[0]
+        assert tmpl_vars['region_summary']['LM'].count == 2
+        assert tmpl_vars['region_summary']['VI'].count == 1
 
     def test_brevet_list(
         self, views_class, email_address_model, brevet_model, core_model,
@@ -121,7 +160,7 @@ class TestBrevetViews(object):
         assert tmpl_vars['active_tab'] == 'brevets'
         assert tmpl_vars['region'] == 'LM'
         assert tmpl_vars['regions'] == brevet_model.REGIONS
-        assert str(tmpl_vars['region_brevets'].one()) == brevet_id
+        assert [str(b) for b in tmpl_vars['region_brevets']] == [brevet_id]
         expected = {
             'file': 'LowerMainlandQuartet.jpg',
             'alt': 'Harrison Hotsprings Road',
@@ -629,9 +668,7 @@ class TestBrevetEntry(object):
     ):
         pyramid_config.add_route(
             'brevet', '/brevets/{region}/{distance}/{date}')
-        pyramid_config.add_route(
-            'brevet.rider_emails',
-            '/brevets/{region}/{distance}/{date}/rider_emails/{uuid}')
+        pyramid_config.add_route('rider_emails', '/rider_emails/{uuid}')
         from_randopony = email_address_model(
             key='from_randopony', email='randopony@example.com')
         admin_email = email_address_model(
@@ -664,6 +701,296 @@ class TestBrevetEntry(object):
         assert message.recipients == ['mcroy@example.com']
         assert message.body == m_render()
 
+    def test_register_success_new_rider(
+        self, entry, brevet_model, brevet_rider_model, brevet_views_module,
+        link_model, db_session, pyramid_config,
+    ):
+        """new rider is saved w/o waiting for club membership lookup
+        """
+        pyramid_config.add_route(
+            'brevet', '/brevets/{region}/{distance}/{date}')
+        brevet = brevet_model(
+            region='VI',
+            distance=200,
+            date_time=datetime(2013, 3, 3, 7, 0),
+            route_name='Chilly 200',
+            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+            organizer_email='mcroy@example.com',
+            registration_end=datetime(2013, 3, 2, 12, 0),
+        )
+        db_session.add_all((
+            brevet,
+            link_model(
+                key='is_club_member_api',
+                url='https://example.com/{last_name}/{first_name}'),
+            link_model(
+                key='membership_link',
+                url='https://example.com/membership_link'),
+        ))
+        request = get_current_request()
+        request.matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': '03Mar2013',
+        })
+        am_patch = patch.object(brevet_views_module.outbox, 'add_message')
+        gmsbn_patch = patch.object(
+            brevet_views_module, '_get_member_status_by_name')
+        r_msg_patch = patch.object(entry, '_rider_message')
+        o_msg_patch = patch.object(entry, '_organizer_message')
+        with am_patch as m_add_message, r_msg_patch, o_msg_patch:
+            with gmsbn_patch as m_get_member_status_by_name:
+                url = entry.register_success({
+                    'email': 'tom@example.com',
+                    'first_name': 'Tom',
+                    'last_name': 'Dickson',
+                    'comment': '',
+                    'bike_type': 'single',
+                })
+        rider = db_session.query(brevet_rider_model).one()
+        assert rider.member_status is None
+        assert not m_get_member_status_by_name.called
+        assert m_add_message.call_count == 2
+        assert url.location == 'http://example.com/brevets/VI/200/03Mar2013'
+        assert request.session.pop_flash() == [
+            'success', 'tom@example.com',
+            'https://example.com/membership_link']
+
+    def test_register_success_digest_mode_no_organizer_email(
+        self, entry, brevet_model, brevet_views_module, link_model,
+        db_session, pyramid_config,
+    ):
+        """organizers of digest mode brevets get no email per registration
+        """
+        pyramid_config.add_route(
+            'brevet', '/brevets/{region}/{distance}/{date}')
+        brevet = brevet_model(
+            region='VI',
+            distance=200,
+            date_time=datetime(2013, 3, 3, 7, 0),
+            route_name='Chilly 200',
+            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+            organizer_email='mcroy@example.com',
+            registration_end=datetime(2013, 3, 2, 12, 0),
+        )
+        brevet.organizer_notification = 'daily'
+        db_session.add_all((
+            brevet,
+            link_model(
+                key='is_club_member_api',
+                url='https://example.com/{last_name}/{first_name}'),
+            link_model(
+                key='membership_link',
+                url='https://example.com/membership_link'),
+        ))
+        get_current_request().matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': '03Mar2013',
+        })
+        am_patch = patch.object(brevet_views_module.outbox, 'add_message')
+        r_msg_patch = patch.object(entry, '_rider_message')
+        o_msg_patch = patch.object(entry, '_organizer_message')
+        with am_patch as m_add_message, r_msg_patch:
+            with o_msg_patch as m_organizer_message:
+                entry.register_success({
+                    'email': 'tom@example.com',
+                    'first_name': 'Tom',
+                    'last_name': 'Dickson',
+                    'comment': '',
+                    'bike_type': 'single',
+                })
+        assert m_add_message.call_count == 1
+        assert not m_organizer_message.called
+
+    def test_register_success_side_effects_in_outbox(
+        self, entry, brevet_model, brevet_rider_model, brevet_views_module,
+        link_model, db_session, pyramid_config,
+    ):
+        """registration side effects are carried out by the outbox drain
+        task that is queued when the registration commits
+        """
+        pyramid_config.add_route(
+            'brevet', '/brevets/{region}/{distance}/{date}')
+        brevet = brevet_model(
+            region='VI',
+            distance=200,
+            date_time=datetime(2013, 3, 3, 7, 0),
+            route_name='Chilly 200',
+            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+            organizer_email='mcroy@example.com',
+            registration_end=datetime(2013, 3, 2, 12, 0),
+        )
+        db_session.add_all((
+            brevet,
+            link_model(
+                key='is_club_member_api',
+                url='https://example.com/{last_name}/{first_name}'),
+            link_model(
+                key='membership_link',
+                url='https://example.com/membership_link'),
+        ))
+        get_current_request().matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': '03Mar2013',
+        })
+        do_patch = patch.object(outbox_tasks.drain_outbox, 'apply_async')
+        r_msg_patch = patch.object(
+            entry, '_rider_message',
+            return_value=Message(
+                subject='rider', sender='randopony@example.com',
+                recipients=['tom@example.com'], body='Thanks'))
+        o_msg_patch = patch.object(
+            entry, '_organizer_message',
+            return_value=Message(
+                subject='organizer', sender='randopony@example.com',
+                recipients=['mcroy@example.com'], body='New rider'))
+        with r_msg_patch, o_msg_patch, do_patch as m_drain:
+            entry.register_success({
+                'email': 'tom@example.com',
+                'first_name': 'Tom',
+                'last_name': 'Dickson',
+                'comment': '',
+                'bike_type': 'single',
+            })
+            rider = db_session.query(brevet_rider_model).one()
+            rider_id, brevet_id = rider.id, rider.brevet
+            assert not m_drain.called
+            transaction.commit()
+        m_drain.assert_called_once_with((), countdown=None)
+        m_mailer = Mock(name='mailer')
+        gm_patch = patch.object(outbox, 'get_mailer', return_value=m_mailer)
+        ums_patch = patch.object(
+            member_status_tasks.update_member_status, 'apply_async')
+        srl_patch = patch.object(rider_list.sync_rider_list, 'apply_async')
+        with gm_patch, ums_patch as m_update_member_status, \
+                srl_patch as m_sync_rider_list:
+            outbox_tasks.drain_outbox()
+        m_update_member_status.assert_called_once_with(
+            (rider_id, 'https://example.com/{last_name}/{first_name}'),
+            countdown=None)
+        m_sync_rider_list.assert_called_once_with(
+            ('brevets', brevet_id), countdown=30)
+        assert [
+            call[0][0].subject for call in m_mailer.send_to_queue.call_args_list
+        ] == ['rider', 'organizer']
+
+    def test_register_success_write_behind(
+        self, entry, brevet_model, brevet_rider_model, brevet_views_module,
+        link_model, db_session, pyramid_config, tmpdir,
+    ):
+        """write-behind intake queues entry instead of adding rider to db
+        """
+        from randopony import intake
+        from randopony.tasks import intake as intake_tasks
+        pyramid_config.add_route(
+            'brevet', '/brevets/{region}/{distance}/{date}')
+        brevet = brevet_model(
+            region='VI',
+            distance=200,
+            date_time=datetime(2013, 3, 3, 7, 0),
+            route_name='Chilly 200',
+            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+            organizer_email='mcroy@example.com',
+            registration_end=datetime(2013, 3, 2, 12, 0),
+        )
+        db_session.add_all((
+            brevet,
+            link_model(
+                key='is_club_member_api',
+                url='https://example.com/{last_name}/{first_name}'),
+            link_model(
+                key='membership_link',
+                url='https://example.com/membership_link'),
+        ))
+        request = get_current_request()
+        request.matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': '03Mar2013',
+        })
+        intake.configure({
+            'intake.mode': 'write_behind',
+            'intake.sqlite_path': str(tmpdir.join('intake.sqlite')),
+        })
+        ai_patch = patch.object(intake_tasks.apply_intake, 'apply_async')
+        r_msg_patch = patch.object(
+            entry, '_rider_message',
+            return_value=Message(
+                subject='rider', sender='randopony@example.com',
+                recipients=['tom@example.com'], body='Thanks'))
+        o_msg_patch = patch.object(
+            entry, '_organizer_message',
+            return_value=Message(
+                subject='organizer', sender='randopony@example.com',
+                recipients=['mcroy@example.com'], body='New rider'))
+        try:
+            with ai_patch as m_apply_intake, r_msg_patch, o_msg_patch:
+                url = entry.register_success({
+                    'email': 'tom@example.com',
+                    'first_name': 'Tom',
+                    'last_name': 'Dickson',
+                    'comment': '',
+                    'bike_type': 'single',
+                })
+            assert intake.get_queue().pending() == 1
+        finally:
+            intake.configure({})
+        assert db_session.query(brevet_rider_model).count() == 0
+        m_apply_intake.assert_called_once_with((), countdown=None)
+        assert url.location == 'http://example.com/brevets/VI/200/03Mar2013'
+        assert request.session.pop_flash() == [
+            'processing', 'tom@example.com',
+            'https://example.com/membership_link']
+
+
+@pytest.mark.usefixtures(
+    'brevet_views_module', 'member_status_cache_model', 'db_session',
+)
+class TestGetMemberStatusByName(object):
+    """Unit tests for cache-first _get_member_status_by_name function.
+    """
+    def test_cache_miss_queries_club_database(
+        self, brevet_views_module, member_status_cache_model, db_session,
+    ):
+        rms_patch = patch.object(
+            brevet_views_module, '_request_member_status', return_value=True)
+        with rms_patch as m_request_member_status:
+            member_status = brevet_views_module._get_member_status_by_name(
+                'Tom', 'Dickson', 'is_club_member_url')
+        assert member_status is True
+        m_request_member_status.assert_called_once_with(
+            'Tom', 'Dickson', 'is_club_member_url')
+        entry = member_status_cache_model.get_fresh('Tom', 'Dickson')
+        assert entry.member_status is True
+
+    @pytest.mark.parametrize('cached_status', [True, False, None])
+    def test_cache_hit_skips_club_database(
+        self, cached_status, brevet_views_module, member_status_cache_model,
+        db_session,
+    ):
+        member_status_cache_model.store('Tom', 'Dickson', cached_status)
+        rms_patch = patch.object(brevet_views_module, '_request_member_status')
+        with rms_patch as m_request_member_status:
+            member_status = brevet_views_module._get_member_status_by_name(
+                ' tom', 'dickson ', 'is_club_member_url')
+        assert member_status is cached_status
+        assert not m_request_member_status.called
+
+    def test_club_database_unavailable(
+        self, brevet_views_module, member_status_cache_model, db_session,
+    ):
+        from randopony.member_api import MemberAPIError
+        rms_patch = patch.object(
+            brevet_views_module, '_request_member_status',
+            side_effect=MemberAPIError)
+        with rms_patch:
+            member_status = brevet_views_module._get_member_status_by_name(
+                'Tom', 'Dickson', 'is_club_member_url')
+        assert member_status is None
+        assert member_status_cache_model.get_fresh('Tom', 'Dickson') is None
+
 
 @pytest.mark.usefixtures('brevet_views_module')
 class TestMakeSpreadsheetRowDict(object):
@@ -0,0 +1,292 @@
+"""Tests for RandoPony broadcast email to event riders.
+"""
+from datetime import datetime
+import smtplib
+from unittest.mock import (
+    MagicMock,
+    patch,
+)
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.threadlocal import get_current_request
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def broadcast_module():
+    from randopony import broadcast
+    return broadcast
+
+
+@pytest.fixture(scope='session')
+def broadcast_job_model():
+    from randopony.models import BroadcastJob
+    return BroadcastJob
+
+
+@pytest.fixture(scope='session')
+def broadcast_recipient_model():
+    from randopony.models import BroadcastRecipient
+    return BroadcastRecipient
+
+
+@pytest.fixture(scope='function')
+def brevet(brevet_model, brevet_rider_model, db_session):
+    brevet = brevet_model(
+        region='VI',
+        distance=200,
+        date_time=datetime(2013, 3, 3, 7, 0),
+        route_name='Chilly 200',
+        start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+        organizer_email='mcroy@example.com',
+    )
+    for first_name, email in (
+        ('Tom', 'tom@example.com'),
+        ('Fred', 'fred@example.com'),
+        ('Freda', 'fred@example.com'),
+    ):
+        brevet.riders.append(brevet_rider_model(
+            email=email, first_name=first_name, last_name='Dickson',
+            comment=''))
+    db_session.add(brevet)
+    db_session.flush()
+    return brevet
+
+
+class FakeMailer(object):
+    """Mailer that records the recipients of sent messages by batch,
+    fails for addresses in its :kbd:`refused` set,
+    and raises RuntimeError for addresses in its :kbd:`broken` set.
+    """
+    def __init__(self, refused=(), broken=()):
+        self.refused = set(refused)
+        self.broken = set(broken)
+        self.batches = [[]]
+
+    def send(self, fromaddr, toaddrs, message):
+        if toaddrs[0] in self.broken:
+            raise RuntimeError('TLS is not available but TLS is required')
+        if toaddrs[0] in self.refused:
+            raise smtplib.SMTPRecipientsRefused(
+                {toaddrs[0]: (550, 'no such user')})
+        self.batches[-1].append((toaddrs, message['Reply-To']))
+
+    def close(self):
+        self.batches.append([])
+
+
+@pytest.mark.usefixtures('broadcast_module', 'db_session')
+class TestCreateJob(object):
+    """Unit tests for create_job function.
+    """
+    def test_recipients_deduplicated(self, broadcast_module, brevet):
+        job = broadcast_module.create_job(
+            'brevets', brevet, brevet.riders, 'randopony@example.com',
+            'Route change', 'The route has changed.')
+        assert job.id is not None
+        assert [r.email for r in job.recipients] == [
+            'fred@example.com', 'tom@example.com']
+        assert job.reply_to == 'mcroy@example.com'
+        assert job.progress() == {'pending': 2, 'sent': 0, 'failed': 0}
+
+
+@pytest.mark.usefixtures('broadcast_module', 'db_session')
+class TestBroadcaster(object):
+    """Unit tests for Broadcaster class.
+    """
+    def _create_job(self, broadcast_module, brevet, db_session):
+        with transaction.manager:
+            job = broadcast_module.create_job(
+                'brevets', brevet, brevet.riders, 'randopony@example.com',
+                'Route change', 'The route has changed.')
+            return job.id
+
+    def test_send(
+        self, broadcast_module, broadcast_job_model, brevet, db_session,
+    ):
+        job_id = self._create_job(broadcast_module, brevet, db_session)
+        mailer = FakeMailer()
+        broadcaster = broadcast_module.Broadcaster(
+            lambda: mailer, batch_size=1, rate_limit=0)
+        broadcaster.send(job_id)
+        assert mailer.batches == [
+            [(['fred@example.com'], 'mcroy@example.com')],
+            [(['tom@example.com'], 'mcroy@example.com')],
+            [],
+        ]
+        job = db_session.query(broadcast_job_model).get(job_id)
+        assert job.progress() == {'pending': 0, 'sent': 2, 'failed': 0}
+        assert job.finished_at is not None
+        assert all(r.sent_at is not None for r in job.recipients)
+
+    def test_failed_recipient(
+        self, broadcast_module, broadcast_job_model, brevet, db_session,
+    ):
+        job_id = self._create_job(broadcast_module, brevet, db_session)
+        mailer = FakeMailer(refused={'tom@example.com'})
+        broadcaster = broadcast_module.Broadcaster(
+            lambda: mailer, rate_limit=0)
+        broadcaster.send(job_id)
+        job = db_session.query(broadcast_job_model).get(job_id)
+        assert job.progress() == {'pending': 0, 'sent': 1, 'failed': 1}
+        failed, = [r for r in job.recipients if r.status == 'failed']
+        assert failed.email == 'tom@example.com'
+        assert 'no such user' in failed.error
+        assert failed.sent_at is None
+
+    def test_mailer_error_stops_job(
+        self, broadcast_module, broadcast_job_model, brevet, db_session,
+    ):
+        job_id = self._create_job(broadcast_module, brevet, db_session)
+        mailer = FakeMailer(broken={'tom@example.com'})
+        broadcaster = broadcast_module.Broadcaster(
+            lambda: mailer, rate_limit=0)
+        with patch.object(broadcast_module, 'log'):
+            broadcaster.send(job_id)
+        job = db_session.query(broadcast_job_model).get(job_id)
+        assert job.progress() == {'pending': 1, 'sent': 1, 'failed': 0}
+        sent, = [r for r in job.recipients if r.status == 'sent']
+        assert sent.email == 'fred@example.com'
+        assert sent.sent_at is not None
+        assert job.error == 'TLS is not available but TLS is required'
+        assert job.finished_at is not None
+
+    def test_mailer_factory_error_stops_job(
+        self, broadcast_module, broadcast_job_model, brevet, db_session,
+    ):
+        job_id = self._create_job(broadcast_module, brevet, db_session)
+        broadcaster = broadcast_module.Broadcaster(
+            MagicMock(side_effect=OSError('connection refused')))
+        with patch.object(broadcast_module, 'log'):
+            broadcaster.send(job_id)
+        job = db_session.query(broadcast_job_model).get(job_id)
+        assert job.progress() == {'pending': 2, 'sent': 0, 'failed': 0}
+        assert job.error == 'connection refused'
+
+    def test_missing_job(self, broadcast_module, db_session):
+        mailer = FakeMailer()
+        broadcaster = broadcast_module.Broadcaster(lambda: mailer)
+        broadcaster.send(42)
+        assert mailer.batches == [[]]
+
+
+class TestRateLimiter(object):
+    """Unit tests for RateLimiter class.
+    """
+    def test_spaces_calls(self):
+        from randopony.broadcast import RateLimiter
+        clock = MagicMock(name='clock', side_effect=[0, 0.25, 1])
+        sleep = MagicMock(name='sleep')
+        rate_limiter = RateLimiter(2, clock, sleep)
+        for i in range(3):
+            rate_limiter.wait()
+        assert sleep.call_args_list == [((0.25,),)]
+
+    def test_no_limit(self):
+        from randopony.broadcast import RateLimiter
+        sleep = MagicMock(name='sleep')
+        rate_limiter = RateLimiter(0, sleep=sleep)
+        for i in range(3):
+            rate_limiter.wait()
+        assert not sleep.called
+
+
+@pytest.mark.usefixtures('db_session', 'pyramid_config')
+class TestBrevetBroadcast(object):
+    """Unit tests for admin brevet broadcast email view.
+    """
+    def _make_one(self, pyramid_config):
+        from randopony.views.admin.brevet import BrevetBroadcast
+        pyramid_config.add_route(
+            'admin.brevets.view', '/admin/brevets/{item}')
+        request = get_current_request()
+        request.matchdict['item'] = 'VI200 03Mar2013'
+        return BrevetBroadcast(request)
+
+    def test_send_success(
+        self, broadcast_module, brevet, email_address_model, db_session,
+        pyramid_config,
+    ):
+        db_session.add(email_address_model(
+            key='from_randopony', email='randopony@example.com'))
+        broadcast_view = self._make_one(pyramid_config)
+        from randopony.tasks import broadcast as broadcast_tasks
+        sb_patch = patch.object(broadcast_tasks, 'send_broadcast')
+        with sb_patch as m_send_broadcast:
+            url = broadcast_view.send_success({
+                'subject': 'Route change',
+                'body': 'The route has changed.',
+            })
+            assert not m_send_broadcast.apply_async.called
+            transaction.commit()
+        m_send_broadcast.apply_async.assert_called_once_with(
+            (1,), countdown=None)
+        assert url.location == (
+            'http://example.com/admin/brevets/VI200%2003Mar2013')
+        assert broadcast_view.request.session.pop_flash() == [
+            'success',
+            'Email to 2 rider(s) of VI200 03Mar2013 queued as broadcast job 1',
+        ]
+
+    def test_send_no_riders(
+        self, broadcast_module, brevet_model, db_session, pyramid_config,
+    ):
+        db_session.add(brevet_model(
+            region='VI',
+            distance=200,
+            date_time=datetime(2013, 3, 3, 7, 0),
+            route_name='Chilly 200',
+            start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+            organizer_email='mcroy@example.com',
+        ))
+        broadcast_view = self._make_one(pyramid_config)
+        with patch.object(broadcast_module, 'create_job') as m_create_job:
+            broadcast_view.send_success({
+                'subject': 'Route change',
+                'body': 'The route has changed.',
+            })
+        assert not m_create_job.called
+        assert broadcast_view.request.session.pop_flash() == [
+            'error', 'No riders have registered for VI200 03Mar2013']
+
+
+@pytest.mark.usefixtures('db_session', 'pyramid_config')
+class TestBroadcastStatus(object):
+    """Unit tests for admin broadcast job status view.
+    """
+    def test_status(
+        self, broadcast_module, brevet, broadcast_recipient_model,
+        db_session,
+    ):
+        from randopony.views.admin.core import broadcast_status
+        job = broadcast_module.create_job(
+            'brevets', brevet, brevet.riders, 'randopony@example.com',
+            'Route change', 'The route has changed.')
+        fred, tom = job.recipients
+        fred.status = broadcast_recipient_model.SENT
+        tom.status = broadcast_recipient_model.FAILED
+        tom.error = 'no such user'
+        request = get_current_request()
+        request.matchdict['job'] = str(job.id)
+        status = broadcast_status(request)
+        assert status == {
+            'id': job.id,
+            'subject': 'Route change',
+            'created_at': job.created_at.isoformat(),
+            'finished_at': None,
+            'error': None,
+            'total': 2,
+            'pending': 0,
+            'sent': 1,
+            'failed': 1,
+            'failures': [
+                {'email': 'tom@example.com', 'error': 'no such user'}],
+        }
+
+    def test_unknown_job(self, db_session):
+        from randopony.views.admin.core import broadcast_status
+        request = get_current_request()
+        request.matchdict['job'] = '42'
+        with pytest.raises(HTTPNotFound):
+            broadcast_status(request)
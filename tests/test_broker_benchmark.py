@@ -0,0 +1,45 @@
+"""Tests for RandoPony celery broker transport benchmark.
+"""
+import math
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def benchmark_module():
+    from randopony.scripts import broker_benchmark
+    return broker_benchmark
+
+
+@pytest.mark.usefixtures('benchmark_module')
+class TestMeasureLatency(object):
+    """Unit tests for measure_latency function.
+    """
+    def test_memory_transport(self, benchmark_module):
+        from celery import current_app
+        app = current_app._get_current_object()
+        try:
+            latencies = benchmark_module.measure_latency(
+                'memory://', {'polling_interval': 0.01}, 3)
+        finally:
+            # The in-process worker makes the benchmark app the current one
+            app.set_current()
+            app.set_default()
+        assert len(latencies) == 3
+        assert all(0 <= latency < 5 for latency in latencies)
+
+
+@pytest.mark.usefixtures('benchmark_module')
+class TestSummarize(object):
+    """Unit tests for summarize function.
+    """
+    def test_summarize(self, benchmark_module):
+        latencies = [0.1 * i for i in range(1, 21)]
+        median, p95, maximum = benchmark_module.summarize(latencies)
+        assert median == pytest.approx(1.05)
+        assert p95 == pytest.approx(2.0)
+        assert maximum == pytest.approx(2.0)
+
+    def test_no_latencies(self, benchmark_module):
+        assert all(
+            math.isnan(value) for value in benchmark_module.summarize([]))
@@ -0,0 +1,56 @@
+"""Tests for RandoPony celery configuration.
+"""
+import os
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def celery_config():
+    from randopony import celery_config
+    return celery_config
+
+
+@pytest.mark.usefixtures('celery_config')
+class TestBrokerConfig(object):
+    """Unit tests for broker_config function.
+    """
+    def test_defaults(self, celery_config):
+        config = celery_config.broker_config({})
+        assert config == {
+            'BROKER_URL': 'sqla+sqlite:///celery.sqlite',
+            'BROKER_TRANSPORT_OPTIONS': {},
+            'CELERYD_CONCURRENCY': 1,
+            'CELERYD_PREFETCH_MULTIPLIER': 1,
+        }
+
+    def test_settings(self, celery_config):
+        config = celery_config.broker_config({
+            'celery.broker_url': 'redis://localhost:6379/0',
+            'celery.broker_transport_options':
+                '\nvisibility_timeout=3600\npolling_interval=0.5\nkey=a=b',
+            'celery.concurrency': '2',
+            'celery.prefetch_multiplier': '4',
+        })
+        assert config == {
+            'BROKER_URL': 'redis://localhost:6379/0',
+            'BROKER_TRANSPORT_OPTIONS': {
+                'visibility_timeout': 3600,
+                'polling_interval': 0.5,
+                'key': 'a=b',
+            },
+            'CELERYD_CONCURRENCY': 2,
+            'CELERYD_PREFETCH_MULTIPLIER': 4,
+        }
+
+    def test_filesystem_folders_created(self, celery_config, tmpdir):
+        broker_folder = os.path.join(str(tmpdir), 'broker')
+        config = celery_config.broker_config({
+            'celery.broker_url': 'filesystem://',
+            'celery.broker_transport_options':
+                'data_folder_in={0} data_folder_out={0}'
+                .format(broker_folder),
+        })
+        assert os.path.isdir(broker_folder)
+        assert config['BROKER_TRANSPORT_OPTIONS']['data_folder_in'] == (
+            broker_folder)
@@ -0,0 +1,157 @@
+"""Tests for RandoPony coalesced background tasks.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+from unittest.mock import Mock
+
+import pytest
+import transaction
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = datetime(2013, 3, 3, 7, 0)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture(scope='function')
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture(scope='function')
+def coalescer(clock):
+    from randopony.coalescing import Coalescer
+    return Coalescer(quiet_window=30, max_delay=300, clock=clock)
+
+
+@pytest.fixture(scope='function')
+def task():
+    task = Mock(name='task', spec=['name', 'apply_async'])
+    task.name = 'randopony.tasks.rider_list.sync_rider_list'
+    return task
+
+
+def _request(coalescer, task, *args):
+    with transaction.manager:
+        return coalescer.request(task, *args)
+
+
+@pytest.mark.usefixtures('db_session')
+class TestCoalescer(object):
+    """Unit tests for Coalescer.
+    """
+    def test_first_request_queued_after_commit(self, coalescer, task):
+        with transaction.manager:
+            assert coalescer.request(task, 'brevets', 1)
+            assert not task.apply_async.called
+        task.apply_async.assert_called_once_with(
+            ('brevets', 1), countdown=30)
+
+    def test_request_not_queued_on_abort(self, coalescer, task):
+        coalescer.request(task, 'brevets', 1)
+        transaction.abort()
+        assert not task.apply_async.called
+        assert coalescer.stats()['depth'] == 0
+
+    def test_later_requests_folded(self, coalescer, task, clock):
+        assert _request(coalescer, task, 'brevets', 1)
+        clock.advance(5)
+        assert not _request(coalescer, task, 'brevets', 1)
+        assert _request(coalescer, task, 'brevets', 2)
+        assert task.apply_async.call_count == 2
+        stats = coalescer.stats()
+        assert stats == {'depth': 2, 'requests': 3, 'oldest_age': 5}
+
+    def test_claim_deferred_during_quiet_window(self, coalescer, task, clock):
+        _request(coalescer, task, 'brevets', 1)
+        clock.advance(20)
+        _request(coalescer, task, 'brevets', 1)
+        clock.advance(20)
+        task.apply_async.reset_mock()
+        assert not coalescer.claim(task, 'brevets', 1)
+        task.apply_async.assert_called_once_with(
+            ('brevets', 1), countdown=10)
+        clock.advance(10)
+        assert coalescer.claim(task, 'brevets', 1)
+        assert coalescer.stats()['depth'] == 0
+
+    def test_claim_after_max_delay(self, coalescer, task, clock):
+        _request(coalescer, task, 'brevets', 1)
+        for i in range(15):
+            clock.advance(20)
+            _request(coalescer, task, 'brevets', 1)
+        assert coalescer.claim(task, 'brevets', 1)
+
+    def test_request_after_claim_queues_new_run(
+        self, coalescer, task, clock,
+    ):
+        _request(coalescer, task, 'brevets', 1)
+        clock.advance(30)
+        assert coalescer.claim(task, 'brevets', 1)
+        assert _request(coalescer, task, 'brevets', 1)
+        assert task.apply_async.call_count == 2
+
+    def test_claim_unrequested_task(self, coalescer, task):
+        assert coalescer.claim(task, 'brevets', 1)
+
+    def test_lost_task_requeued(self, coalescer, task, clock):
+        _request(coalescer, task, 'brevets', 1)
+        clock.advance(601)
+        assert _request(coalescer, task, 'brevets', 1)
+        assert task.apply_async.call_count == 2
+
+    def test_burst(self, coalescer, task, clock):
+        """burst of registrations for 1 event runs 1 sync
+        """
+        # Simulated broker queue of the due times of task messages
+        queue = []
+        task.apply_async.side_effect = (
+            lambda args, countdown: queue.append(
+                clock() + timedelta(seconds=countdown)))
+
+        def run_due_tasks():
+            due = [due_at for due_at in queue if due_at <= clock()]
+            for due_at in due:
+                queue.remove(due_at)
+            return sum(coalescer.claim(task, 'brevets', 1) for _ in due)
+
+        # 20 registrations in a minute after an event is announced
+        runs, max_depth = 0, 0
+        for i in range(20):
+            _request(coalescer, task, 'brevets', 1)
+            max_depth = max(max_depth, len(queue))
+            clock.advance(3)
+            runs += run_due_tasks()
+        while queue:
+            clock.now = max(clock(), min(queue))
+            runs += run_due_tasks()
+        assert runs == 1
+        assert max_depth == 1
+        # Queued by the 1st request, then deferred by each claim until
+        # the quiet window after the last request ended
+        assert task.apply_async.call_count == 4
+        assert coalescer.stats()['depth'] == 0
+
+
+@pytest.mark.usefixtures('db_session')
+class TestConfigure(object):
+    """Unit tests for task coalescer configuration from app settings.
+    """
+    def test_configure(self):
+        from randopony import coalescing
+        coalescing.configure({
+            'task_coalescing.quiet_window': '10',
+            'task_coalescing.max_delay': '60',
+        })
+        coalescer = coalescing.get_coalescer()
+        assert (coalescer.quiet_window, coalescer.max_delay) == (10, 60)
+        coalescing.configure({})
+        assert coalescing.get_coalescer().quiet_window == 30
@@ -0,0 +1,247 @@
+"""Tests for RandoPony background task dispatch.
+"""
+import threading
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+import pytest
+import transaction
+
+
+recorded = []
+
+
+def record(value):
+    """Task function for dispatchers to resolve by name.
+    """
+    recorded.append(value)
+
+
+record.name = 'tests.test_dispatch.record'
+
+
+def wait_for(condition, timeout=5):
+    """Wait for :kbd:`condition` to return a true value.
+    """
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return True
+        threading.Event().wait(0.01)
+    return condition()
+
+
+@pytest.fixture(scope='module')
+def dispatch_module():
+    from randopony import dispatch
+    return dispatch
+
+
+@pytest.yield_fixture(scope='function')
+def dispatcher(dispatch_module, tmpdir):
+    dispatcher = dispatch_module.ThreadPoolDispatcher(
+        str(tmpdir.join('dispatch.sqlite')), max_workers=1)
+    yield dispatcher
+    dispatcher.shutdown(timeout=5)
+
+
+class Task(object):
+    """Task that records its calls, and waits for its release if it is
+    blocking.
+    """
+    def __init__(self, name='task', blocking=False):
+        self.name = name
+        self.calls = []
+        self.started = threading.Event()
+        self.called = threading.Event()
+        self.release = threading.Event()
+        if not blocking:
+            self.release.set()
+
+    def __call__(self, *args):
+        self.started.set()
+        self.release.wait(5)
+        self.calls.append(args)
+        self.called.set()
+
+
+@pytest.mark.usefixtures('dispatch_module')
+class TestCeleryDispatcher(object):
+    """Unit tests for CeleryDispatcher.
+    """
+    def test_enqueue(self, dispatch_module):
+        task = Mock(name='task')
+        dispatch_module.CeleryDispatcher().enqueue(task, (42,), countdown=30)
+        task.apply_async.assert_called_once_with((42,), countdown=30)
+
+
+@pytest.mark.usefixtures('dispatch_module')
+class TestAfterCommit(object):
+    """Unit tests for after_commit function.
+    """
+    def test_dispatched_on_commit(self, dispatch_module):
+        task = Mock(name='task')
+        with transaction.manager:
+            dispatch_module.after_commit(task, 42, 'foo')
+            assert not task.apply_async.called
+        task.apply_async.assert_called_once_with((42, 'foo'), countdown=None)
+
+    def test_not_dispatched_on_abort(self, dispatch_module):
+        task = Mock(name='task')
+        dispatch_module.after_commit(task, 42)
+        transaction.abort()
+        assert not task.apply_async.called
+
+
+@pytest.mark.usefixtures('dispatch_module')
+class TestThreadPoolDispatcher(object):
+    """Unit tests for ThreadPoolDispatcher.
+    """
+    def test_runs_task(self, dispatcher):
+        task = Task()
+        dispatcher.start()
+        dispatcher.enqueue(task, (42, 'foo'))
+        assert task.called.wait(5)
+        assert task.calls == [(42, 'foo')]
+        assert dispatcher.shutdown(timeout=5)
+        assert dispatcher.stored() == 0
+
+    def test_countdown(self, dispatcher):
+        task = Task()
+        dispatcher.start()
+        dispatcher.enqueue(task, (1,), countdown=60)
+        dispatcher.enqueue(task, (2,), countdown=0.05)
+        assert task.called.wait(5)
+        assert task.calls == [(2,)]
+        assert dispatcher.stored() == 1
+
+    def test_bounded_pool(self, dispatcher):
+        blocking_task, task = Task(blocking=True), Task()
+        dispatcher.start()
+        dispatcher.enqueue(blocking_task, ())
+        dispatcher.enqueue(task, ())
+        assert blocking_task.started.wait(5)
+        assert not task.called.wait(0.1)
+        blocking_task.release.set()
+        assert task.called.wait(5)
+
+    def test_failed_task_stored(self, dispatch_module, dispatcher):
+        task = Mock(name='task', side_effect=ValueError)
+        task.name = 'task'
+        with patch.object(dispatch_module, 'log') as m_log:
+            dispatcher.start()
+            dispatcher.enqueue(task, (42,))
+            assert dispatcher.shutdown(timeout=5)
+        assert m_log.exception.called
+        assert dispatcher.stored() == 1
+        assert dispatcher.failed() == 0
+
+    def test_failed_task_retried(self, dispatch_module, tmpdir):
+        dispatcher = dispatch_module.ThreadPoolDispatcher(
+            str(tmpdir.join('dispatch.sqlite')), retry_delay=0.01)
+        task = Mock(name='task', side_effect=[ValueError, None])
+        task.name = 'task'
+        with patch.object(dispatch_module, 'log'):
+            dispatcher.start()
+            dispatcher.enqueue(task, (42,))
+            try:
+                assert wait_for(lambda: dispatcher.stored() == 0)
+            finally:
+                assert dispatcher.shutdown(timeout=5)
+        assert task.call_count == 2
+
+    def test_task_marked_failed_after_max_attempts(
+        self, dispatch_module, tmpdir,
+    ):
+        dispatcher = dispatch_module.ThreadPoolDispatcher(
+            str(tmpdir.join('dispatch.sqlite')),
+            max_attempts=2, retry_delay=0)
+        task = Mock(name='task', side_effect=ValueError)
+        task.name = 'task'
+        with patch.object(dispatch_module, 'log') as m_log:
+            dispatcher.start()
+            dispatcher.enqueue(task, (42,))
+            try:
+                assert wait_for(lambda: dispatcher.failed() == 1)
+            finally:
+                assert dispatcher.shutdown(timeout=5)
+            assert task.call_count == 2
+            assert m_log.error.called
+            assert dispatcher.stored() == 0
+            assert dispatcher.failed() == 1
+            dispatcher.start()
+            assert dispatcher.shutdown(timeout=5)
+        assert task.call_count == 2
+
+    def test_shutdown_waits_for_running_task(self, dispatcher):
+        blocking_task = Task(blocking=True)
+        dispatcher.start()
+        dispatcher.enqueue(blocking_task, ())
+        assert blocking_task.started.wait(5)
+        assert not dispatcher.shutdown(timeout=0.1)
+        blocking_task.release.set()
+        assert blocking_task.called.wait(5)
+
+    def test_unfinished_tasks_run_on_restart(
+        self, dispatch_module, dispatcher, tmpdir,
+    ):
+        recorded[:] = []
+        dispatcher.enqueue(record, ('foo',))
+        restarted = dispatch_module.ThreadPoolDispatcher(
+            str(tmpdir.join('dispatch.sqlite')))
+        restarted.start()
+        assert restarted.shutdown(timeout=5)
+        assert recorded == ['foo']
+        assert restarted.stored() == 0
+
+    def test_stopped_process_tasks_taken_over(
+        self, dispatch_module, dispatcher, tmpdir,
+    ):
+        recorded[:] = []
+        dispatcher.enqueue(record, ('foo',))
+        with dispatcher._connection:
+            dispatcher._connection.execute(
+                'UPDATE dispatched_tasks SET owner = 4242')
+        other = dispatch_module.ThreadPoolDispatcher(
+            str(tmpdir.join('dispatch.sqlite')))
+        pa_patch = patch.object(
+            dispatch_module, '_process_alive', return_value=True)
+        with pa_patch:
+            other.start()
+            assert other.shutdown(timeout=5)
+        assert recorded == []
+        pa_patch = patch.object(
+            dispatch_module, '_process_alive', return_value=False)
+        with pa_patch:
+            other.start()
+            assert other.shutdown(timeout=5)
+        assert recorded == ['foo']
+
+
+@pytest.mark.usefixtures('dispatch_module')
+class TestConfigure(object):
+    """Unit tests for dispatcher configuration from app settings.
+    """
+    def test_thread_pool(self, dispatch_module, tmpdir):
+        with patch.object(dispatch_module.atexit, 'register') as m_register:
+            dispatch_module.configure({
+                'dispatch.backend': 'thread_pool',
+                'dispatch.sqlite_path': str(tmpdir.join('dispatch.sqlite')),
+                'dispatch.max_workers': '3',
+            })
+        dispatcher = dispatch_module.get_dispatcher()
+        try:
+            assert isinstance(
+                dispatcher, dispatch_module.ThreadPoolDispatcher)
+            assert dispatcher.max_workers == 3
+            m_register.assert_called_once_with(dispatcher.shutdown, 10)
+        finally:
+            dispatch_module.configure({})
+        assert dispatcher._scheduler is None
+
+    def test_celery(self, dispatch_module):
+        dispatch_module.configure({})
+        assert isinstance(
+            dispatch_module.get_dispatcher(),
+            dispatch_module.CeleryDispatcher)
@@ -0,0 +1,151 @@
+"""Tests for RandoPony club membership roster import script.
+"""
+import json
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def import_module():
+    from randopony.scripts import import_club_members
+    return import_club_members
+
+
+@pytest.fixture(scope='module')
+def club_member_model():
+    from randopony.models import ClubMember
+    return ClubMember
+
+
+@pytest.fixture
+def engine(db_session):
+    return db_session.get_bind()
+
+
+def _write_csv(tmpdir, rows):
+    roster = tmpdir.join('members.csv')
+    roster.write(
+        'first_name,last_name,is_current_member,email\n'
+        + ''.join(
+            '{},{},{},x@example.com\n'.format(*row) for row in rows))
+    return str(roster)
+
+
+def _roster(engine):
+    return sorted(engine.execute(
+        'SELECT first_name, last_name, member_status FROM club_members'))
+
+
+@pytest.mark.usefixtures('import_module', 'club_member_model', 'engine')
+class TestImportRoster(object):
+    """Unit tests for import_roster function.
+    """
+    def test_csv(self, import_module, engine, tmpdir):
+        roster_path = _write_csv(tmpdir, [
+            ('Tom', 'Dickson', 'Yes'),
+            (' Mary ', 'JONES', 'no'),
+        ])
+        count = import_module.import_roster(engine, roster_path)
+        assert count == 2
+        assert _roster(engine) == [
+            ('mary', 'jones', False), ('tom', 'dickson', True)]
+
+    def test_json_lines(self, import_module, engine, tmpdir):
+        roster = tmpdir.join('members.jsonl')
+        roster.write('\n'.join(json.dumps(record) for record in (
+            {'first_name': 'Tom', 'last_name': 'Dickson',
+             'is_current_member': True},
+            {'first_name': 'Mary', 'last_name': 'Jones',
+             'is_current_member': False},
+        )) + '\n')
+        import_module.import_roster(engine, str(roster))
+        assert _roster(engine) == [
+            ('mary', 'jones', False), ('tom', 'dickson', True)]
+
+    def test_unrecognized_file_type(self, import_module, engine, tmpdir):
+        roster = tmpdir.join('members.xls')
+        roster.write('')
+        with pytest.raises(ValueError):
+            import_module.import_roster(engine, str(roster))
+
+    def test_duplicate_name_current_wins(
+        self, import_module, engine, tmpdir,
+    ):
+        roster_path = _write_csv(tmpdir, [
+            ('Tom', 'Dickson', 'true'),
+            ('Mary', 'Jones', 'true'),
+            ('Mary', 'Jones', 'false'),
+            ('tom', 'dickson', 'false'),
+        ])
+        count = import_module.import_roster(
+            engine, roster_path, batch_size=3)
+        assert count == 2
+        assert _roster(engine) == [
+            ('mary', 'jones', True), ('tom', 'dickson', True)]
+
+    def test_replaces_previous_roster(self, import_module, engine, tmpdir):
+        import_module.import_roster(
+            engine, _write_csv(tmpdir, [('Tom', 'Dickson', 'yes')]))
+        import_module.import_roster(
+            engine, _write_csv(tmpdir, [('Mary', 'Jones', 'yes')]))
+        assert _roster(engine) == [('mary', 'jones', True)]
+        tables = {
+            row[0] for row in engine.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert 'club_members_staging' not in tables
+
+    def test_failed_swap_keeps_previous_roster(
+        self, import_module, engine, tmpdir,
+    ):
+        import_module.import_roster(
+            engine, _write_csv(tmpdir, [('Tom', 'Dickson', 'yes')]))
+        from sqlalchemy.engine import Connection
+        execute = Connection.execute
+
+        def fail_on_rename(connection, statement, *args, **kwargs):
+            if str(statement).startswith('ALTER TABLE'):
+                raise RuntimeError('rename failed')
+            return execute(connection, statement, *args, **kwargs)
+        with patch.object(Connection, 'execute', fail_on_rename):
+            with pytest.raises(RuntimeError):
+                import_module.import_roster(
+                    engine, _write_csv(tmpdir, [('Mary', 'Jones', 'yes')]))
+        assert _roster(engine) == [('tom', 'dickson', True)]
+
+
+@pytest.mark.usefixtures(
+    'club_member_model', 'member_status_cache_model', 'db_session',
+)
+class TestClubMemberLookup(object):
+    """Unit tests for local club roster membership status lookups.
+    """
+    def test_get_member_status(self, club_member_model, db_session):
+        db_session.add(club_member_model('Tom', 'Dickson', True))
+        status = club_member_model.get_member_status(' tom', 'DICKSON ')
+        assert status is True
+
+    def test_get_member_status_not_found(self, club_member_model, db_session):
+        assert club_member_model.get_member_status('Tom', 'Dickson') is None
+
+    def test_roster_answers_before_club_database(
+        self, club_member_model, db_session,
+    ):
+        from randopony.views.site import brevet as brevet_views_module
+        db_session.add(club_member_model('Tom', 'Dickson', False))
+        rms_patch = patch.object(brevet_views_module, '_request_member_status')
+        with rms_patch as m_request_member_status:
+            status = brevet_views_module._get_member_status_by_name(
+                'Tom', 'Dickson', 'is_club_member_url')
+        assert status is False
+        assert not m_request_member_status.called
+
+    def test_club_database_fallback(self, club_member_model, db_session):
+        from randopony.views.site import brevet as brevet_views_module
+        rms_patch = patch.object(
+            brevet_views_module, '_request_member_status', return_value=True)
+        with rms_patch as m_request_member_status:
+            status = brevet_views_module._get_member_status_by_name(
+                'Tom', 'Dickson', 'is_club_member_url')
+        assert status is True
+        assert m_request_member_status.called
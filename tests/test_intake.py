@@ -0,0 +1,207 @@
+"""Tests for RandoPony write-behind registration intake.
+"""
+from datetime import datetime
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def intake_module():
+    from randopony import intake
+    return intake
+
+
+@pytest.fixture(scope='function')
+def queue(intake_module, tmpdir):
+    return intake_module.IntakeQueue(
+        str(tmpdir.join('intake.sqlite')), batch_size=2)
+
+
+@pytest.yield_fixture(scope='function')
+def shared_queue(intake_module, tmpdir):
+    intake_module.configure({
+        'intake.mode': 'write_behind',
+        'intake.sqlite_path': str(tmpdir.join('intake.sqlite')),
+    })
+    yield intake_module.get_queue()
+    intake_module.configure({})
+
+
+def _appstruct(**kwargs):
+    appstruct = {
+        'email': 'tom@example.com',
+        'first_name': 'Tom',
+        'last_name': 'Dickson',
+        'comment': '',
+    }
+    appstruct.update(kwargs)
+    return appstruct
+
+
+@pytest.mark.usefixtures('intake_module')
+class TestIntakeQueue(object):
+    """Unit tests for IntakeQueue.
+    """
+    def test_append(self, queue):
+        queue.append('brevets', 42, {'foo': 'bar'})
+        queue.append('brevets', 42, {'foo': 'baz'})
+        assert queue.pending() == 2
+
+    def test_apply_in_order_in_batches(self, queue):
+        for i in range(5):
+            queue.append('brevets', 42, {'i': i})
+        handler = Mock(name='handler')
+        begin_patch = patch.object(
+            transaction, 'begin', wraps=transaction.begin)
+        with begin_patch as m_begin:
+            applied = queue.apply({'brevets': handler})
+        assert applied == 5
+        assert [call[0] for call in handler.call_args_list] == [
+            (42, {'i': i}) for i in range(5)]
+        assert m_begin.call_count == 3
+        assert queue.pending() == 0
+
+    def test_failed_entry_kept(self, queue, intake_module):
+        for i in range(2):
+            queue.append('brevets', 42, {'i': i})
+
+        def handler(event_id, entry):
+            if entry['i'] == 0:
+                raise ValueError
+        with patch.object(intake_module, 'log') as m_log:
+            applied = queue.apply({'brevets': handler})
+        assert applied == 1
+        assert m_log.exception.called
+        assert queue.pending() == 0
+        assert queue.failed() == 1
+
+    def test_commit_failure_leaves_entries_queued(self, queue):
+        queue.append('brevets', 42, {'i': 0})
+        data_manager = Mock(
+            name='data_manager', sortKey=Mock(return_value='dm'))
+        data_manager.tpc_vote.side_effect = ValueError
+
+        def handler(event_id, entry):
+            transaction.get().join(data_manager)
+        with pytest.raises(ValueError):
+            queue.apply({'brevets': handler})
+        assert queue.pending() == 1
+
+    def test_single_writer(self, queue, tmpdir, intake_module):
+        queue.append('brevets', 42, {'i': 0})
+        other = intake_module.IntakeQueue(str(tmpdir.join('intake.sqlite')))
+        handler = Mock(name='handler')
+        with other._writer() as claimed:
+            assert claimed
+            assert queue.apply({'brevets': handler}) == 0
+        assert not handler.called
+        assert queue.apply({'brevets': handler}) == 1
+
+
+@pytest.mark.usefixtures('intake_module')
+class TestConfigure(object):
+    """Unit tests for intake queue configuration from app settings.
+    """
+    def test_write_behind(self, shared_queue, intake_module):
+        assert isinstance(shared_queue, intake_module.IntakeQueue)
+        assert shared_queue.batch_size == 50
+
+    def test_direct(self, intake_module):
+        intake_module.configure({'intake.mode': 'direct'})
+        assert intake_module.get_queue() is None
+
+
+@pytest.mark.usefixtures('db_session')
+class TestApplyIntake(object):
+    """Unit tests for intake writer task.
+    """
+    def test_brevet_registration(
+        self, shared_queue, brevet_model, brevet_rider_model, db_session,
+    ):
+        from randopony.models import OutboxEntry
+        from randopony.tasks import (
+            intake as intake_tasks,
+            outbox as outbox_tasks,
+        )
+        with transaction.manager:
+            brevet = brevet_model(
+                region='VI',
+                distance=200,
+                date_time=datetime(2013, 3, 3, 7, 0),
+                route_name='Chilly 200',
+                start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+                organizer_email='mcroy@example.com',
+                registration_end=datetime(2013, 3, 2, 12, 0),
+            )
+            db_session.add(brevet)
+            db_session.flush()
+            brevet_id = brevet.id
+        entry = {
+            'appstruct': _appstruct(bike_type='single'),
+            'is_club_member_url': 'https://example.com/{last_name}',
+            'messages': [{
+                'subject': 'Confirmation',
+                'sender': 'randopony@example.com',
+                'recipients': ['tom@example.com'],
+                'body': 'Thanks',
+                'extra_headers': {},
+            }],
+        }
+        shared_queue.append('brevets', brevet_id, entry)
+        shared_queue.append('brevets', brevet_id, entry)
+        do_patch = patch.object(outbox_tasks.drain_outbox, 'apply_async')
+        with do_patch as m_drain:
+            intake_tasks.apply_intake()
+        rider = db_session.query(brevet_rider_model).one()
+        assert rider.email == 'tom@example.com'
+        assert rider.bike_type == 'single'
+        assert sorted(
+            entry.kind for entry in db_session.query(OutboxEntry)
+        ) == ['mail', 'member_status', 'rider_list_sync']
+        m_drain.assert_called_once_with((), countdown=None)
+        assert shared_queue.pending() == 0
+
+    def test_populaire_registration(
+        self, shared_queue, pop_model, pop_rider_model, db_session,
+    ):
+        from randopony.tasks import (
+            intake as intake_tasks,
+            outbox as outbox_tasks,
+        )
+        with transaction.manager:
+            populaire = pop_model(
+                event_name="New Year's Populaire",
+                short_name='NewYearsPop',
+                distance='60 km',
+                date_time=datetime(2013, 1, 1, 10, 0),
+                start_locn='Kelseys Family Restaurant, 325 Burnside Rd W',
+                organizer_email='mcroy@example.com',
+                registration_end=datetime(2012, 12, 31, 17, 0),
+                entry_form_url='http://www.randonneurs.bc.ca/eventform.pdf',
+            )
+            db_session.add(populaire)
+            db_session.flush()
+            populaire_id = populaire.id
+        shared_queue.append(
+            'populaires', populaire_id,
+            {'appstruct': _appstruct(), 'messages': []})
+        with patch.object(outbox_tasks.drain_outbox, 'apply_async'):
+            intake_tasks.apply_intake()
+        rider = db_session.query(pop_rider_model).one()
+        assert rider.email == 'tom@example.com'
+        assert rider.distance == 60
+
+    def test_direct_mode(self, intake_module):
+        from randopony.tasks import (
+            intake as intake_tasks,
+            outbox as outbox_tasks,
+        )
+        intake_module.configure({})
+        with patch.object(outbox_tasks.drain_outbox, 'apply_async') as m:
+            intake_tasks.apply_intake()
+        assert not m.called
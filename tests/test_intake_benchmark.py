@@ -0,0 +1,50 @@
+"""Tests for RandoPony registration intake benchmark.
+"""
+import math
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def benchmark_module():
+    from randopony.scripts import intake_benchmark
+    return intake_benchmark
+
+
+@pytest.mark.usefixtures('benchmark_module')
+class TestMeasure(object):
+    """Unit tests for intake mode measurement functions.
+    """
+    @pytest.mark.parametrize('measure', [
+        'measure_direct',
+        'measure_write_behind',
+    ])
+    def test_measure(self, measure, benchmark_module, tmpdir):
+        from randopony.models import BrevetRider
+        from randopony.models.meta import DBSession
+        latencies, errors, elapsed = getattr(benchmark_module, measure)(
+            str(tmpdir), 6, 3)
+        assert len(latencies) == 6
+        assert errors == 0
+        assert elapsed >= max(latencies)
+        try:
+            assert DBSession.query(BrevetRider).count() == 6
+        finally:
+            DBSession.remove()
+
+
+@pytest.mark.usefixtures('benchmark_module')
+class TestSummarize(object):
+    """Unit tests for summarize function.
+    """
+    def test_summarize(self, benchmark_module):
+        latencies = [0.01 * i for i in range(1, 101)]
+        median, p95, p99, maximum = benchmark_module.summarize(latencies)
+        assert median == pytest.approx(0.505)
+        assert p95 == pytest.approx(0.96)
+        assert p99 == pytest.approx(1.0)
+        assert maximum == pytest.approx(1.0)
+
+    def test_no_latencies(self, benchmark_module):
+        assert all(
+            math.isnan(value) for value in benchmark_module.summarize([]))
@@ -0,0 +1,185 @@
+"""Tests for RandoPony queued mail delivery.
+"""
+from email.message import Message
+import os
+import smtplib
+from unittest.mock import MagicMock
+
+import pytest
+from repoze.sendmail.maildir import Maildir
+
+
+@pytest.fixture(scope='module')
+def mail_queue_module():
+    from randopony import mail_queue
+    return mail_queue
+
+
+@pytest.fixture
+def queue_path(tmpdir):
+    return str(tmpdir.join('mail'))
+
+
+def _queue_messages(queue_path, count):
+    maildir = Maildir(queue_path, create=True)
+    for i in range(count):
+        message = Message()
+        message['X-Actually-From'] = 'from@example.com'
+        message['X-Actually-To'] = 'rider{}@example.com'.format(i)
+        message['Subject'] = 'Message {}'.format(i)
+        message.set_payload('Body')
+        maildir.add(message).commit()
+
+
+class FakeMailer(object):
+    """Mailer that records sent messages and the batches they were sent in,
+    and fails with the exceptions in its :kbd:`errors` list.
+    """
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.batches = [[]]
+
+    def send(self, fromaddr, toaddrs, message):
+        if self.errors:
+            error = self.errors.pop(0)
+            if error is not None:
+                raise error
+        self.batches[-1].append(toaddrs)
+
+    def close(self):
+        if self.batches[-1]:
+            self.batches.append([])
+
+
+class TestMailQueueProcessor(object):
+    """Unit tests for MailQueueProcessor.
+    """
+    def _make_one(self, mailer, queue_path, **kwargs):
+        from randopony.mail_queue import MailQueueProcessor
+        kwargs.setdefault('sleep', MagicMock(name='sleep'))
+        return MailQueueProcessor(mailer, queue_path, **kwargs)
+
+    def test_sends_in_batches(self, queue_path):
+        _queue_messages(queue_path, 5)
+        mailer = FakeMailer()
+        processor = self._make_one(mailer, queue_path, batch_size=2)
+        stats = processor.send_messages()
+        assert stats == {'sent': 5, 'rejected': 0, 'failed': 0}
+        assert [len(batch) for batch in mailer.batches] == [2, 2, 1, 0]
+        assert list(Maildir(queue_path)) == []
+
+    def test_retries_transient_failure_with_backoff(self, queue_path):
+        _queue_messages(queue_path, 2)
+        mailer = FakeMailer(errors=[
+            smtplib.SMTPServerDisconnected('lost connection'),
+            None,
+            smtplib.SMTPResponseException(421, 'try again later'),
+        ])
+        processor = self._make_one(mailer, queue_path, backoff=5)
+        stats = processor.send_messages()
+        assert stats == {'sent': 2, 'rejected': 0, 'failed': 0}
+        assert processor._sleep.call_args_list == [((5,),), ((10,),)]
+
+    def test_gives_up_after_max_attempts(self, queue_path):
+        _queue_messages(queue_path, 1)
+        mailer = FakeMailer(
+            errors=[smtplib.SMTPServerDisconnected('down')] * 3)
+        processor = self._make_one(mailer, queue_path, max_attempts=3)
+        stats = processor.send_messages()
+        assert stats == {'sent': 0, 'rejected': 0, 'failed': 1}
+        assert len(list(Maildir(queue_path))) == 1
+
+    def test_permanent_failure_not_retried(self, queue_path):
+        _queue_messages(queue_path, 1)
+        mailer = FakeMailer(
+            errors=[smtplib.SMTPResponseException(550, 'no such user')])
+        processor = self._make_one(mailer, queue_path)
+        stats = processor.send_messages()
+        assert stats == {'sent': 0, 'rejected': 1, 'failed': 0}
+        assert not processor._sleep.called
+        assert list(Maildir(queue_path)) == []
+
+    def test_message_claimed_elsewhere_skipped(self, queue_path):
+        _queue_messages(queue_path, 1)
+        (filename,) = Maildir(queue_path)
+        head, tail = os.path.split(filename)
+        sending = os.path.join(head, '.sending-' + tail)
+        os.link(filename, sending)
+        mailer = FakeMailer()
+        processor = self._make_one(mailer, queue_path)
+        stats = processor.send_messages()
+        assert stats == {'sent': 0, 'rejected': 0, 'failed': 0}
+        assert mailer.batches == [[]]
+        assert os.path.exists(sending)
+        assert list(Maildir(queue_path)) == [filename]
+
+    def test_stale_claim_replaced(self, mail_queue_module, queue_path):
+        _queue_messages(queue_path, 1)
+        (filename,) = Maildir(queue_path)
+        head, tail = os.path.split(filename)
+        sending = os.path.join(head, '.sending-' + tail)
+        os.link(filename, sending)
+        stale = os.stat(sending).st_mtime - mail_queue_module.MAX_SEND_TIME - 1
+        os.utime(sending, (stale, stale))
+        processor = self._make_one(FakeMailer(), queue_path)
+        stats = processor.send_messages()
+        assert stats == {'sent': 1, 'rejected': 0, 'failed': 0}
+        assert not os.path.exists(sending)
+
+    def test_failed_delivery_releases_claim(self, queue_path):
+        _queue_messages(queue_path, 1)
+        (filename,) = Maildir(queue_path)
+        head, tail = os.path.split(filename)
+        mailer = FakeMailer(errors=[smtplib.SMTPServerDisconnected('down')])
+        processor = self._make_one(mailer, queue_path, max_attempts=1)
+        stats = processor.send_messages()
+        assert stats == {'sent': 0, 'rejected': 0, 'failed': 1}
+        assert not os.path.exists(os.path.join(head, '.sending-' + tail))
+
+
+class TestPersistentSMTPMailer(object):
+    """Unit tests for PersistentSMTPMailer.
+    """
+    def _make_one(self):
+        from randopony.mail_queue import PersistentSMTPMailer
+        mailer = PersistentSMTPMailer(
+            hostname='smtp.example.com', username='user', password='secret')
+        mailer.smtp = MagicMock(name='SMTP')
+        connection = mailer.smtp.return_value
+        connection.ehlo.return_value = (250, 'ok')
+        connection.has_extn.return_value = False
+        return mailer, connection
+
+    def test_reuses_connection(self):
+        mailer, connection = self._make_one()
+        for i in range(3):
+            mailer.send('from@example.com', ['to@example.com'], Message())
+        mailer.close()
+        assert mailer.smtp.call_count == 1
+        connection.login.assert_called_once_with('user', 'secret')
+        assert connection.sendmail.call_count == 3
+        assert connection.quit.call_count == 1
+
+    def test_reconnects_after_disconnect(self):
+        mailer, connection = self._make_one()
+        connection.sendmail.side_effect = [
+            smtplib.SMTPServerDisconnected('lost connection'), {}]
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            mailer.send('from@example.com', ['to@example.com'], Message())
+        mailer.send('from@example.com', ['to@example.com'], Message())
+        assert mailer.smtp.call_count == 2
+
+
+class TestQueueStats(object):
+    """Unit tests for queue_stats function.
+    """
+    def test_empty_queue(self, mail_queue_module, queue_path):
+        stats = mail_queue_module.queue_stats(queue_path)
+        assert stats == {'depth': 0, 'oldest_age': 0}
+
+    def test_depth_and_oldest_age(self, mail_queue_module, queue_path):
+        _queue_messages(queue_path, 3)
+        for filename, mtime in zip(Maildir(queue_path), (100, 40, 70)):
+            os.utime(filename, (mtime, mtime))
+        stats = mail_queue_module.queue_stats(queue_path, clock=lambda: 160)
+        assert stats == {'depth': 3, 'oldest_age': 120}
@@ -0,0 +1,195 @@
+"""Tests for RandoPony club membership database API client.
+"""
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+import json
+import threading
+import time
+
+import pytest
+
+
+class StubClubDatabaseHandler(BaseHTTPRequestHandler):
+    """Club membership status API stub.
+
+    Paths are /{last_name}/{first_name}/;
+    the last name selects the response.
+    """
+    def do_GET(self):
+        last_name = self.path.split('/')[1]
+        if last_name == 'Slow':
+            time.sleep(0.5)
+        if last_name == 'Error':
+            self.send_response(500)
+            self.end_headers()
+            return
+        if last_name == 'Missing':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if last_name == 'Garbled':
+            body = b'not json'
+        elif last_name == 'Listed':
+            body = b'[]'
+        else:
+            body = json.dumps(
+                {'is_current_member': last_name == 'Member'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def member_api_module():
+    from randopony import member_api
+    return member_api
+
+
+@pytest.yield_fixture(scope='module')
+def stub_url():
+    server = HTTPServer(('127.0.0.1', 0), StubClubDatabaseHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/{{last_name}}/{{first_name}}/'.format(
+        server.server_port)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(member_api_module):
+    return member_api_module.MemberAPIClient(
+        connect_timeout=1, read_timeout=0.2, failure_threshold=2,
+        reset_timeout=60)
+
+
+@pytest.mark.usefixtures('stub_url', 'client')
+class TestMemberAPIClient(object):
+    """Unit tests for MemberAPIClient against a stub club database.
+    """
+    @pytest.mark.parametrize('last_name, expected', [
+        ('Member', True),
+        ('Expired', False),
+        ('Missing', None),
+    ])
+    def test_get_member_status(self, last_name, expected, client, stub_url):
+        member_status = client.get_member_status('Tom', last_name, stub_url)
+        assert member_status is expected
+        assert client.stats()['successes'] == 1
+
+    @pytest.mark.parametrize('last_name', ['Error', 'Slow', 'Garbled'])
+    def test_failure_is_unknown(self, last_name, client, stub_url):
+        member_status = client.get_member_status('Tom', last_name, stub_url)
+        assert member_status is None
+        assert client.stats()['failures'] == 1
+
+    def test_fetch_failure_raises(
+        self, member_api_module, client, stub_url,
+    ):
+        with pytest.raises(member_api_module.MemberAPIError):
+            client.fetch_member_status('Tom', 'Error', stub_url)
+
+    def test_fetch_short_circuit_raises(
+        self, member_api_module, client, stub_url,
+    ):
+        for i in range(2):
+            client.get_member_status('Tom', 'Error', stub_url)
+        with pytest.raises(member_api_module.MemberAPIError):
+            client.fetch_member_status('Tom', 'Member', stub_url)
+
+    def test_unexpected_error_recorded_as_failure(self, client, stub_url):
+        for i in range(2):
+            with pytest.raises(TypeError):
+                client.fetch_member_status('Tom', 'Listed', stub_url)
+        assert client.stats()['failures'] == 2
+        assert client.breaker.state == client.breaker.OPEN
+
+    def test_connection_error_is_unknown(self, client):
+        member_status = client.get_member_status(
+            'Tom', 'Member', 'http://127.0.0.1:1/{last_name}/{first_name}/')
+        assert member_status is None
+        assert client.stats()['failures'] == 1
+
+    def test_breaker_opens_after_consecutive_failures(
+        self, client, stub_url,
+    ):
+        for i in range(2):
+            client.get_member_status('Tom', 'Error', stub_url)
+        assert client.breaker.state == client.breaker.OPEN
+        member_status = client.get_member_status('Tom', 'Member', stub_url)
+        assert member_status is None
+        stats = client.stats()
+        assert stats['requests'] == 2
+        assert stats['short_circuits'] == 1
+
+    def test_success_resets_failure_count(self, client, stub_url):
+        client.get_member_status('Tom', 'Error', stub_url)
+        client.get_member_status('Tom', 'Member', stub_url)
+        client.get_member_status('Tom', 'Error', stub_url)
+        assert client.breaker.state == client.breaker.CLOSED
+
+    def test_latency_recorded(self, client, stub_url):
+        client.get_member_status('Tom', 'Member', stub_url)
+        stats = client.stats()
+        assert 0 < stats['latency_mean'] == stats['latency_max']
+
+    def test_from_settings(self, member_api_module):
+        client = member_api_module.MemberAPIClient.from_settings({
+            'member_api.connect_timeout': '1.5',
+            'member_api.read_timeout': '2',
+            'member_api.failure_threshold': '3',
+            'member_api.reset_timeout': '30',
+        })
+        assert client.timeout == (1.5, 2.0)
+        assert client.breaker.failure_threshold == 3
+        assert client.breaker.reset_timeout == 30.0
+
+
+class TestCircuitBreaker(object):
+    """Unit tests for CircuitBreaker.
+    """
+    @pytest.fixture
+    def clock(self):
+        clock = [0.0]
+        return clock
+
+    @pytest.fixture
+    def breaker(self, member_api_module, clock):
+        return member_api_module.CircuitBreaker(
+            failure_threshold=2, reset_timeout=60, clock=lambda: clock[0])
+
+    def test_closed_allows_requests(self, breaker):
+        assert breaker.allow_request()
+
+    def test_half_open_after_reset_timeout(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        assert not breaker.allow_request()
+        clock[0] = 60
+        assert breaker.allow_request()
+        assert breaker.state == breaker.HALF_OPEN
+        assert not breaker.allow_request()
+
+    def test_trial_success_closes(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock[0] = 60
+        breaker.allow_request()
+        breaker.record_success()
+        assert breaker.state == breaker.CLOSED
+
+    def test_trial_failure_reopens(self, breaker, clock):
+        breaker.record_failure()
+        breaker.record_failure()
+        clock[0] = 60
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == breaker.OPEN
+        assert not breaker.allow_request()
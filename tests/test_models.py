@@ -1,6 +1,9 @@
 """Unit tests for RandoPony data model.
 """
-from datetime import datetime
+from datetime import (
+    datetime,
+    timedelta,
+)
 import unittest
 from unittest.mock import patch
 
@@ -220,6 +223,376 @@ class TestBrevet(unittest.TestCase):
         self.assertEqual(brevets.all(), [])
 
 
+@pytest.mark.usefixtures('brevet_model', 'core_model', 'db_session')
+class TestBrevetRegionSummary(object):
+    """Unit tests for Brevet.get_current_region_summary class method.
+    """
+    def _add_brevet(self, brevet_model, db_session, region, date_time):
+        db_session.add(brevet_model(
+            region=region,
+            distance=200,
+            date_time=date_time,
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        ))
+
+    def test_region_counts(self, brevet_model, core_model, db_session):
+        """summary has count of current brevets in each region
+        """
+        for region, day in (('LM', 11), ('LM', 18), ('VI', 25)):
+            self._add_brevet(
+                brevet_model, db_session, region, datetime(2012, 11, day, 7))
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            summary = brevet_model.get_current_region_summary()
+        assert summary['LM'].count == 2
+        assert summary['VI'].count == 1
+        assert 'SI' not in summary
+
+    def test_excludes_old_brevets(self, brevet_model, core_model, db_session):
+        """summary excludes brevets longer ago than recent days
+        """
+        self._add_brevet(
+            brevet_model, db_session, 'LM', datetime(2012, 10, 1, 7))
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            summary = brevet_model.get_current_region_summary()
+        assert summary == {}
+
+    def test_next_date_time(self, brevet_model, core_model, db_session):
+        """summary has date/time of next brevet, excluding recent past ones
+        """
+        for day in (28, 4, 11):
+            month = 10 if day == 28 else 11
+            self._add_brevet(
+                brevet_model, db_session, 'LM', datetime(2012, month, day, 7))
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            summary = brevet_model.get_current_region_summary()
+        assert summary['LM'].count == 3
+        assert summary['LM'].next_date_time == datetime(2012, 11, 4, 7)
+
+    def test_next_date_time_none(self, brevet_model, core_model, db_session):
+        """next brevet date/time is None when all brevets are in recent past
+        """
+        self._add_brevet(
+            brevet_model, db_session, 'LM', datetime(2012, 10, 28, 7))
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            summary = brevet_model.get_current_region_summary()
+        assert summary['LM'].next_date_time is None
+
+
+@pytest.mark.usefixtures('brevet_model', 'db_session')
+class TestBrevetSlug(object):
+    """Unit tests for brevet slug maintenance and lookup.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    def test_make_slug(self, brevet_model):
+        slug = brevet_model.make_slug('LM', 200, datetime(2012, 11, 11, 7))
+        assert slug == 'LM200-11Nov2012'
+
+    def test_slug_set_on_insert(self, brevet):
+        assert brevet.slug == 'LM200-11Nov2012'
+
+    def test_slug_updated_on_change(self, brevet, db_session):
+        brevet.date_time = datetime(2012, 11, 18, 7)
+        db_session.flush()
+        assert brevet.slug == 'LM200-18Nov2012'
+
+    def test_get_by_slug(self, brevet, brevet_model):
+        assert brevet_model.get_by_slug('LM200-11Nov2012') is brevet
+        assert brevet_model.get_by_slug('LM300-11Nov2012') is None
+
+    def test_get_by_slug_uses_index(self, brevet, brevet_model, db_session):
+        plan = db_session.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM brevets WHERE slug = :slug',
+            {'slug': 'LM200-11Nov2012'}).fetchall()
+        assert 'ix_brevets_slug' in ' '.join(str(row) for row in plan)
+
+    def test_schema_rejects_duplicate_brevet(self, brevet):
+        import colander
+        from randopony.models import BrevetSchema
+        schema = BrevetSchema()
+        appstruct = {
+            'region': 'LM',
+            'distance': 200,
+            'date_time': datetime(2012, 11, 11, 8, 0, 0),
+        }
+        with pytest.raises(colander.Invalid):
+            schema.validator(schema, appstruct)
+        appstruct['id'] = brevet.id
+        schema.validator(schema, appstruct)
+
+
+@pytest.mark.usefixtures('brevet_model', 'db_session')
+class TestEventUUID(object):
+    """Unit tests for event uuid column and lookup.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    def test_uuid_set_on_insert(self, brevet):
+        import uuid
+        assert uuid.UUID(brevet.uuid).version == 4
+
+    def test_uuid_unchanged_on_edit(self, brevet, db_session):
+        event_uuid = brevet.uuid
+        brevet.date_time = datetime(2012, 11, 18, 7)
+        db_session.flush()
+        assert brevet.uuid == event_uuid
+
+    def test_get_by_uuid(self, brevet, brevet_model):
+        assert brevet_model.get_by_uuid(brevet.uuid) is brevet
+        assert brevet_model.get_by_uuid('foo') is None
+
+    def test_get_by_uuid_uses_index(self, brevet, db_session):
+        plan = db_session.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM brevets WHERE uuid = :uuid',
+            {'uuid': brevet.uuid}).fetchall()
+        assert 'ix_brevets_uuid' in ' '.join(str(row) for row in plan)
+
+
+@pytest.mark.usefixtures(
+    'brevet_model', 'brevet_rider_model', 'pop_model', 'pop_rider_model',
+    'db_session',
+)
+class TestRiderCount(object):
+    """Unit tests for maintenance of denormalized event rider counts.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    def _make_rider(self, brevet_rider_model, first_name):
+        return brevet_rider_model(
+            email='{}@example.com'.format(first_name.lower()),
+            first_name=first_name,
+            last_name='Dickson',
+            comment='',
+        )
+
+    def test_new_event_has_no_riders(self, brevet):
+        assert brevet.rider_count == 0
+
+    def test_rider_insert_increments_count(
+        self, brevet, brevet_rider_model, db_session,
+    ):
+        for first_name in ('Tom', 'Dick'):
+            brevet.riders.append(
+                self._make_rider(brevet_rider_model, first_name))
+        db_session.flush()
+        assert brevet.rider_count == 2
+
+    def test_rider_delete_decrements_count(
+        self, brevet, brevet_rider_model, db_session,
+    ):
+        rider = self._make_rider(brevet_rider_model, 'Tom')
+        brevet.riders.append(rider)
+        db_session.flush()
+        db_session.delete(rider)
+        db_session.flush()
+        assert brevet.rider_count == 0
+
+    def test_rider_moved_to_other_event(
+        self, brevet, brevet_model, brevet_rider_model, db_session,
+    ):
+        other = brevet_model(
+            region='LM',
+            distance=300,
+            date_time=datetime(2012, 11, 18, 6, 0, 0),
+            route_name='Late 300',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(other)
+        rider = self._make_rider(brevet_rider_model, 'Tom')
+        brevet.riders.append(rider)
+        db_session.flush()
+        rider.brevet = other.id
+        db_session.flush()
+        assert brevet.rider_count == 0
+        assert other.rider_count == 1
+
+    def test_rider_update_touches_event(
+        self, brevet, brevet_rider_model, db_session,
+    ):
+        rider = self._make_rider(brevet_rider_model, 'Tom')
+        brevet.riders.append(rider)
+        db_session.flush()
+        brevet.updated_at = updated_at = datetime(2012, 11, 1)
+        db_session.flush()
+        rider.comment = 'fueled by coffee'
+        db_session.flush()
+        assert brevet.updated_at > updated_at
+
+    def test_populaire_rider_insert_increments_count(
+        self, pop_model, pop_rider_model, db_session,
+    ):
+        populaire = pop_model(
+            event_name='Victoria Populaire',
+            short_name='VicPop',
+            distance='50 km, 100 km',
+            date_time=datetime(2011, 3, 27, 10, 0),
+            start_locn='University of Victoria, Parking Lot #2',
+            organizer_email='mjansson@example.com',
+            registration_end=datetime(2011, 3, 24, 12, 0),
+            entry_form_url='http://www.randonneurs.bc.ca/VicPop/',
+        )
+        populaire.riders.append(pop_rider_model(
+            email='tom@example.com',
+            first_name='Tom',
+            last_name='Dickson',
+            distance=100,
+            comment='',
+        ))
+        db_session.add(populaire)
+        db_session.flush()
+        assert populaire.rider_count == 1
+
+    def test_recount_riders(
+        self, brevet, brevet_model, brevet_rider_model, db_session,
+    ):
+        for first_name in ('Tom', 'Dick', 'Harry'):
+            brevet.riders.append(
+                self._make_rider(brevet_rider_model, first_name))
+        db_session.flush()
+        db_session.execute(
+            brevet_model.__table__.update().values(rider_count=42))
+        brevet_model.recount_riders()
+        db_session.expire_all()
+        assert brevet.rider_count == 3
+
+
+@pytest.mark.usefixtures(
+    'brevet_model', 'brevet_rider_model', 'pop_model', 'pop_rider_model',
+    'db_session',
+)
+class TestRoster(object):
+    """Unit tests for lightweight event rider list projections.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, brevet_rider_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        for first_name, last_name, comment in (
+            ('Tom', 'Dickson', 'fueled by coffee'),
+            ('Harry', 'allen', ''),
+        ):
+            brevet.riders.append(brevet_rider_model(
+                email='{}@example.com'.format(first_name.lower()),
+                first_name=first_name,
+                last_name=last_name,
+                comment=comment,
+                bike_type='tandem',
+            ))
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    @pytest.fixture
+    def populaire(self, pop_model, pop_rider_model, db_session):
+        populaire = pop_model(
+            event_name='Victoria Populaire',
+            short_name='VicPop',
+            distance='50 km, 100 km',
+            date_time=datetime(2011, 3, 27, 10, 0),
+            start_locn='University of Victoria, Parking Lot #2',
+            organizer_email='mjansson@example.com',
+            registration_end=datetime(2011, 3, 24, 12, 0),
+            entry_form_url='http://www.randonneurs.bc.ca/VicPop/',
+        )
+        for first_name, last_name, distance in (
+            ('Tom', 'Dickson', 100),
+            ('Harry', 'allen', 50),
+        ):
+            populaire.riders.append(pop_rider_model(
+                email='{}@example.com'.format(first_name.lower()),
+                first_name=first_name,
+                last_name=last_name,
+                distance=distance,
+                comment='',
+            ))
+        db_session.add(populaire)
+        db_session.flush()
+        return populaire
+
+    def test_brevet_roster(self, brevet):
+        roster = brevet.roster()
+        assert roster == [
+            ('Harry', 'allen', '', 'tandem'),
+            ('Tom', 'Dickson', 'fueled by coffee', 'tandem'),
+        ]
+
+    def test_brevet_roster_full_names(self, brevet):
+        full_names = [rider.full_name for rider in brevet.roster()]
+        assert full_names == ['Harry allen', 'Tom "fueled by coffee" Dickson']
+
+    def test_populaire_roster(self, populaire):
+        roster = populaire.roster()
+        assert [(rider.full_name, rider.distance) for rider in roster] == [
+            ('Harry allen', 50),
+            ('Tom Dickson', 100),
+        ]
+
+    @pytest.mark.parametrize('rider_table, event_column', [
+        ('brevet_riders', 'brevet'),
+        ('populaire_riders', 'populaire'),
+    ])
+    def test_roster_query_uses_index_order(
+        self, rider_table, event_column, db_session,
+    ):
+        plan = db_session.execute(
+            'EXPLAIN QUERY PLAN '
+            'SELECT first_name, last_name FROM {0} WHERE {1} = 1 '
+            'ORDER BY lowercase_last_name'.format(rider_table, event_column))
+        details = ' '.join(row[-1] for row in plan)
+        assert 'ix_{}_{}_lowercase_last_name'.format(
+            rider_table, event_column) in details
+        assert 'TEMP B-TREE' not in details
+
+
 class TestBrevetRider(object):
     """Unit tests for BrevetRider data model.
     """
@@ -472,3 +845,45 @@ class TestPopulaireRider(object):
         )
         expected = u'{} "hoping for sun" {}'.format(first_name, last_name)
         assert rider.full_name == expected
+
+
+@pytest.mark.usefixtures('member_status_cache_model', 'db_session')
+class TestMemberStatusCache(object):
+    """Unit tests for club membership status cache data model.
+    """
+    def test_normalize_name(self):
+        from randopony.models.member_status import normalize_name
+        assert normalize_name('  Mary  Jo\t') == 'mary jo'
+
+    def test_store_and_get_fresh(self, member_status_cache_model, db_session):
+        member_status_cache_model.store('Tom', 'Dickson', True)
+        entry = member_status_cache_model.get_fresh(' tom ', 'DICKSON')
+        assert entry.member_status is True
+
+    def test_get_fresh_miss(self, member_status_cache_model, db_session):
+        assert member_status_cache_model.get_fresh('Tom', 'Dickson') is None
+
+    def test_store_refreshes_entry(
+        self, member_status_cache_model, db_session,
+    ):
+        member_status_cache_model.store('Tom', 'Dickson', False)
+        member_status_cache_model.store('Tom', 'Dickson', True)
+        entries = db_session.query(member_status_cache_model).all()
+        assert len(entries) == 1
+        assert entries[0].member_status is True
+
+    @pytest.mark.parametrize('member_status, age, expected', [
+        (True, timedelta(hours=23), True),
+        (True, timedelta(hours=25), False),
+        (False, timedelta(hours=23), True),
+        (None, timedelta(minutes=59), True),
+        (None, timedelta(minutes=61), False),
+    ])
+    def test_ttl(
+        self, member_status, age, expected, member_status_cache_model,
+        db_session,
+    ):
+        db_session.add(member_status_cache_model(
+            'Tom', 'Dickson', member_status, datetime.utcnow() - age))
+        entry = member_status_cache_model.get_fresh('Tom', 'Dickson')
+        assert (entry is not None) == expected
@@ -0,0 +1,230 @@
+"""Tests for RandoPony event organizer registration digest emails.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+from pyramid.threadlocal import get_current_request
+from pyramid_mailer import get_mailer
+import pytest
+
+
+@pytest.fixture(scope='module')
+def digest_module():
+    from randopony import organizer_digest
+    return organizer_digest
+
+
+@pytest.fixture(scope='function')
+def digest_config(pyramid_config, email_address_model, db_session):
+    pyramid_config.include('pyramid_mailer.testing')
+    pyramid_config.add_route(
+        'brevet', '/brevets/{region}/{distance}/{date}')
+    pyramid_config.add_route('populaire', '/populaires/{short_name}')
+    pyramid_config.add_route('rider_emails', '/rider_emails/{uuid}')
+    db_session.add_all((
+        email_address_model(
+            key='from_randopony', email='randopony@example.com'),
+        email_address_model(key='admin_email', email='tom@example.com'),
+    ))
+    return pyramid_config
+
+
+@pytest.fixture(scope='function')
+def now():
+    return datetime.utcnow().replace(microsecond=0)
+
+
+@pytest.fixture(scope='function')
+def brevet(brevet_model, db_session, now):
+    brevet = brevet_model(
+        region='VI',
+        distance=200,
+        date_time=(now + timedelta(days=10)).replace(hour=7, minute=0),
+        route_name='Chilly 200',
+        start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+        organizer_email='mcroy@example.com, dug@example.com',
+    )
+    brevet.organizer_notification = 'hourly'
+    db_session.add(brevet)
+    return brevet
+
+
+def _register(db_session, event, rider_model, registered_at, **kwargs):
+    rider = rider_model(**kwargs)
+    rider.registered_at = registered_at
+    event.riders.append(rider)
+    db_session.add(rider)
+    db_session.flush()
+    return rider
+
+
+def _queue(request):
+    return get_mailer(request).queue
+
+
+@pytest.mark.usefixtures('digest_module', 'digest_config', 'db_session')
+class TestSendOrganizerDigests(object):
+    """Unit tests for send_organizer_digests function.
+    """
+    def _brevet_rider(self, db_session, brevet, brevet_rider_model,
+                      first_name, registered_at, member_status=True):
+        return _register(
+            db_session, brevet, brevet_rider_model, registered_at,
+            first_name=first_name, last_name='Dickson',
+            email='{}@example.com'.format(first_name.lower()),
+            comment='', member_status=member_status)
+
+    def test_first_digest(
+        self, digest_module, brevet, brevet_rider_model, db_session, now,
+    ):
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Tom',
+            now - timedelta(hours=2))
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Fred',
+            now - timedelta(minutes=5), member_status=None)
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 1, 'final_rosters': 0}
+        msg, = _queue(request)
+        assert msg.subject == (
+            '2 new pre-registration(s) for the {}'.format(brevet))
+        assert msg.sender == 'randopony@example.com'
+        assert msg.recipients == ['mcroy@example.com', 'dug@example.com']
+        assert 'Tom Dickson <tom@example.com>\n' in msg.body
+        assert (
+            'Fred Dickson <fred@example.com> - club membership unknown'
+            in msg.body)
+        assert 'There are now 2 pre-registered riders' in msg.body
+        assert brevet.organizer_digest_at == now
+
+    def test_digest_not_due(
+        self, digest_module, brevet, brevet_rider_model, db_session, now,
+        sql_statements,
+    ):
+        brevet.organizer_digest_at = now - timedelta(minutes=30)
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Tom',
+            now - timedelta(minutes=5))
+        del sql_statements[:]
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 0, 'final_rosters': 0}
+        assert _queue(request) == []
+        assert not any(
+            'FROM brevet_riders' in statement
+            for statement in sql_statements)
+
+    def test_digest_lists_riders_since_previous_digest(
+        self, digest_module, brevet, brevet_rider_model, db_session, now,
+    ):
+        brevet.organizer_notification = 'daily'
+        brevet.organizer_digest_at = now - timedelta(days=1)
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Tom',
+            now - timedelta(days=2))
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Fred',
+            now - timedelta(hours=3))
+        request = get_current_request()
+        digest_module.send_organizer_digests(request, now)
+        msg, = _queue(request)
+        assert msg.subject.startswith('1 new pre-registration(s)')
+        assert 'Fred Dickson <fred@example.com>' in msg.body
+        assert 'Tom Dickson' not in msg.body
+
+    def test_no_new_riders(self, digest_module, brevet, db_session, now):
+        previous_digest_at = now - timedelta(hours=2)
+        brevet.organizer_digest_at = previous_digest_at
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 0, 'final_rosters': 0}
+        assert _queue(request) == []
+        assert brevet.organizer_digest_at == previous_digest_at
+
+    def test_immediate_events_ignored(
+        self, digest_module, brevet, brevet_rider_model, db_session, now,
+    ):
+        brevet.organizer_notification = 'immediate'
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Tom',
+            now - timedelta(hours=2))
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 0, 'final_rosters': 0}
+
+    def test_final_roster(
+        self, digest_module, brevet, brevet_rider_model, db_session, now,
+    ):
+        # Registration closed 1 day ago in Pacific time
+        brevet.registration_end = now - timedelta(days=2)
+        brevet.organizer_digest_at = now - timedelta(days=3)
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Tom',
+            now - timedelta(days=4))
+        self._brevet_rider(
+            db_session, brevet, brevet_rider_model, 'Fred',
+            now - timedelta(days=2, hours=1), member_status=False)
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 0, 'final_rosters': 1}
+        msg, = _queue(request)
+        assert msg.subject == (
+            'Final pre-registration roster for the {}'.format(brevet))
+        assert 'These are the 2 riders' in msg.body
+        assert (
+            'Fred Dickson <fred@example.com> - club membership expired '
+            '(new since the last RandoPony update)' in msg.body)
+        assert 'Tom Dickson <tom@example.com>\n' in msg.body
+        assert brevet.final_roster_sent_at == now
+        stats = digest_module.send_organizer_digests(
+            request, now + timedelta(days=1))
+        assert stats == {'digests': 0, 'final_rosters': 0}
+
+    def test_populaire_digest_distances(
+        self, digest_module, pop_model, pop_rider_model, db_session, now,
+    ):
+        populaire = pop_model(
+            event_name='Victoria Populaire',
+            short_name='VicPop',
+            distance='50 km, 100 km',
+            date_time=now + timedelta(days=10),
+            start_locn='University of Victoria, Parking Lot #2',
+            organizer_email='mjansson@example.com',
+            registration_end=now + timedelta(days=9),
+            entry_form_url='http://www.randonneurs.bc.ca/VicPop/',
+        )
+        populaire.organizer_notification = 'daily'
+        db_session.add(populaire)
+        _register(
+            db_session, populaire, pop_rider_model, now - timedelta(hours=1),
+            first_name='Tom', last_name='Dickson', email='tom@example.com',
+            distance=100, comment='')
+        request = get_current_request()
+        stats = digest_module.send_organizer_digests(request, now)
+        assert stats == {'digests': 1, 'final_rosters': 0}
+        msg, = _queue(request)
+        assert msg.recipients == ['mjansson@example.com']
+        assert 'Tom Dickson <tom@example.com> - 100 km' in msg.body
+        assert 'http://example.com/populaires/VicPop' in msg.body
+
+
+class TestMakeRegistry(object):
+    """Unit tests for organizer digests script registry.
+    """
+    def test_routes_and_mailer(self):
+        from pyramid.request import Request
+        from pyramid.scripting import prepare
+        from randopony.scripts.send_organizer_digests import make_registry
+        registry = make_registry({'mako.directories': 'randopony:templates'})
+        env = prepare(
+            request=Request.blank('/', base_url='https://example.com'),
+            registry=registry)
+        try:
+            url = env['request'].route_url('rider_emails', uuid='foo')
+            assert url == 'https://example.com/rider_emails/foo'
+            assert get_mailer(env['request']) is not None
+        finally:
+            env['closer']()
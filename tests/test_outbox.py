@@ -0,0 +1,178 @@
+"""Tests for RandoPony transactional outbox.
+"""
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+from pyramid_mailer.message import Message
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def outbox_module():
+    from randopony import outbox
+    return outbox
+
+
+@pytest.fixture(scope='function')
+def outbox_entries(db_session):
+    from randopony.models import OutboxEntry
+
+    def outbox_entries():
+        return [
+            (entry.kind, entry.payload)
+            for entry in db_session.query(OutboxEntry).order_by(OutboxEntry.id)
+        ]
+    return outbox_entries
+
+
+@pytest.mark.usefixtures('outbox_module', 'db_session')
+class TestOutbox(object):
+    """Unit tests for outbox entries.
+    """
+    def test_add(self, outbox_module, outbox_entries):
+        outbox_module.add(
+            outbox_module.RIDER_LIST_SYNC, event_type='brevets', event_id=42)
+        assert outbox_entries() == [
+            ('rider_list_sync', {'event_type': 'brevets', 'event_id': 42})]
+
+    def test_entries_rolled_back_with_transaction(
+        self, outbox_module, outbox_entries,
+    ):
+        outbox_module.add(
+            outbox_module.RIDER_LIST_SYNC, event_type='brevets', event_id=42)
+        transaction.abort()
+        assert outbox_entries() == []
+
+    def test_message_round_trip(self, outbox_module, outbox_entries):
+        outbox_module.add_message(Message(
+            subject='Registration Confirmation',
+            sender='randopony@example.com',
+            recipients=['tom@example.com'],
+            body='Thanks',
+            extra_headers={'Sender': 'randopony@example.com'},
+        ))
+        [(kind, payload)] = outbox_entries()
+        assert kind == 'mail'
+        message = outbox_module.message(payload)
+        assert message.subject == 'Registration Confirmation'
+        assert message.sender == 'randopony@example.com'
+        assert message.recipients == ['tom@example.com']
+        assert message.body == 'Thanks'
+        assert message.extra_headers == {'Sender': 'randopony@example.com'}
+
+
+@pytest.mark.usefixtures('outbox_module', 'db_session')
+class TestDrain(object):
+    """Unit tests for outbox drain function.
+    """
+    def test_entries_carried_out_in_order(
+        self, outbox_module, outbox_entries,
+    ):
+        with transaction.manager:
+            for event_id in range(5):
+                outbox_module.add('foo', event_id=event_id)
+        handler = Mock(name='handler')
+        drained = outbox_module.drain({'foo': handler}, batch_size=2)
+        assert drained == 5
+        assert [call[0][0] for call in handler.call_args_list] == [
+            {'event_id': event_id} for event_id in range(5)]
+        assert outbox_entries() == []
+
+    def test_entry_claimed_elsewhere_skipped(self, outbox_module):
+        from randopony.models import OutboxEntry
+        from randopony.models.meta import DBSession
+        with transaction.manager:
+            outbox_module.add('foo', event_id=1)
+            outbox_module.add('foo', event_id=2)
+        calls = []
+
+        def handler(payload):
+            # Another drain claims the 2nd entry while this one is
+            # carrying out the 1st
+            DBSession.query(OutboxEntry).filter(
+                OutboxEntry.kind == 'foo', OutboxEntry.id != 1,
+            ).delete(synchronize_session=False)
+            calls.append(payload)
+        assert outbox_module.drain({'foo': handler}) == 1
+        assert calls == [{'event_id': 1}]
+
+    def test_failed_entry_skipped(self, outbox_module, outbox_entries):
+        from randopony.models import OutboxEntry
+        from randopony.models.meta import DBSession
+        with transaction.manager:
+            for event_id in range(3):
+                outbox_module.add('foo', event_id=event_id)
+            outbox_module.add('bar', event_id=3)
+        calls = []
+
+        def handler(payload):
+            if payload['event_id'] == 1:
+                raise ValueError
+            calls.append(payload)
+        with patch.object(outbox_module, 'log') as m_log:
+            drained = outbox_module.drain({'foo': handler})
+        assert drained == 2
+        # The 1st entry is carried out again when the failed batch is
+        # retried 1 entry at a time
+        assert calls == [{'event_id': 0}, {'event_id': 0}, {'event_id': 2}]
+        assert m_log.exception.called
+        assert outbox_entries() == [
+            ('foo', {'event_id': 1}), ('bar', {'event_id': 3})]
+        assert all(entry.failed for entry in DBSession.query(OutboxEntry))
+        assert outbox_module.drain({'foo': handler}) == 0
+
+    def test_commit_failure_leaves_entries_in_outbox(
+        self, outbox_module, outbox_entries,
+    ):
+        with transaction.manager:
+            outbox_module.add('foo', event_id=1)
+        data_manager = Mock(
+            name='data_manager', sortKey=Mock(return_value='dm'))
+        data_manager.tpc_vote.side_effect = ValueError
+
+        def handler(payload):
+            transaction.get().join(data_manager)
+        with pytest.raises(ValueError):
+            outbox_module.drain({'foo': handler})
+        assert outbox_entries() == [('foo', {'event_id': 1})]
+
+
+@pytest.mark.usefixtures('db_session')
+class TestDrainOutbox(object):
+    """Unit tests for outbox drain task.
+    """
+    def test_mail_queued(self):
+        from randopony import outbox
+        from randopony.tasks import outbox as outbox_tasks
+        with transaction.manager:
+            outbox.add_message(Message(
+                subject='Registration Confirmation',
+                sender='randopony@example.com',
+                recipients=['tom@example.com'],
+                body='Thanks',
+            ))
+        m_mailer = Mock(name='mailer')
+        with patch.object(outbox, 'get_mailer', return_value=m_mailer):
+            outbox_tasks.drain_outbox()
+        message = m_mailer.send_to_queue.call_args[0][0]
+        assert message.recipients == ['tom@example.com']
+
+    def test_member_status_update_queued_after_drain_commits(self):
+        from randopony import outbox
+        from randopony.tasks import (
+            member_status,
+            outbox as outbox_tasks,
+        )
+        with transaction.manager:
+            outbox.add(
+                outbox.MEMBER_STATUS, rider_id=42,
+                is_club_member_url='https://example.com/{last_name}')
+        ums_patch = patch.object(
+            member_status.update_member_status, 'apply_async')
+        with ums_patch as m_apply_async:
+            outbox_tasks.drain_outbox()
+        m_apply_async.assert_called_once_with(
+            (42, 'https://example.com/{last_name}'), countdown=None)
@@ -8,7 +8,6 @@ from unittest.mock import (
 )
 
 from pyramid import testing
-import pytest
 from sqlalchemy import create_engine
 
 from randopony.models.meta import (
@@ -57,6 +56,7 @@ class TestPopulaireDetails(unittest.TestCase):
             {
                 'version': version.number + version.release,
                 'populaire': populaire,
+                'broadcasts': [],
             })
 
 
@@ -220,6 +220,7 @@ class TestPopulaireEdit(unittest.TestCase):
                 'registration_end': datetime(2011, 3, 24, 12, 0),
                 'entry_form_url': 'http://www.randonneurs.bc.ca/VicPop/'
                                   'VicPop11_registration.pdf',
+                'organizer_notification': 'immediate',
             })
 
     def test_show(self):
@@ -292,9 +293,11 @@ class TestPopulaireEdit(unittest.TestCase):
             'registration_end': datetime(2011, 3, 24, 12, 0),
             'entry_form_url': 'http://www.randonneurs.bc.ca/VicPop/'
                               'VicPop11_registration.pdf',
+            'organizer_notification': 'hourly',
         })
         populaire = DBSession.query(Populaire).first()
         self.assertEqual(populaire.organizer_email, 'tom@example.com')
+        self.assertEqual(populaire.organizer_notification, 'hourly')
         self.assertEqual(
             url.location, 'http://example.com/admin/populaires/VicPop')
 
@@ -319,7 +322,7 @@ class TestPopulaireEdit(unittest.TestCase):
 
 
 class TestSetup123(unittest.TestCase):
-    """Unit tests for combined 3-step setup admin function view.
+    """Unit tests for combined setup admin function view.
     """
     def _call_setup_123(self, *args, **kwargs):
         from randopony.views.admin.populaire import setup_123
@@ -328,8 +331,6 @@ class TestSetup123(unittest.TestCase):
     def setUp(self):
         self.config = testing.setUp(
             settings={
-                'google_drive.username': 'randopony',
-                'google_drive.password': 'sEcReT',
                 'mako.directories': 'randopony:templates',
             })
         self.config.include('pyramid_mailer.testing')
@@ -338,9 +339,10 @@ class TestSetup123(unittest.TestCase):
             'admin.populaires.view', '/admin/populaire/{item}')
         self.config.add_route(
             'populaire', '/populaires/{short_name}')
+        self.config.add_route('rider_emails', '/rider_emails/{uuid}')
         self.config.add_route(
-            'populaire.rider_emails',
-            '/populaires/{short_name}/rider_emails/{uuid}')
+            'populaire.roster',
+            '/populaires/{short_name}/roster/{uuid}.{format}')
         engine = create_engine('sqlite://')
         DBSession.configure(bind=engine)
         Base.metadata.create_all(engine)
@@ -350,7 +352,7 @@ class TestSetup123(unittest.TestCase):
         testing.tearDown()
 
     def test_setup_123(self):
-        """setup_123 calls expected 3 setup steps
+        """setup_123 calls expected setup steps
         """
         from randopony.models import Populaire
         from randopony.views.admin import populaire as pop_module
@@ -369,51 +371,17 @@ class TestSetup123(unittest.TestCase):
         DBSession.add(populaire)
         request = testing.DummyRequest()
         request.matchdict['item'] = 'VicPop'
-        patch_crl = patch.object(pop_module, '_create_rider_list')
-        patch_eto = patch.object(pop_module, '_email_to_organizer')
-        patch_etw = patch.object(pop_module, '_email_to_webmaster')
-        with patch_crl as mock_crl, patch_eto as mock_eto, patch_etw as mock_etw:
-            mock_crl.return_value = 'success'
+        patch_eto = patch.object(
+            pop_module, '_email_to_organizer', return_value=[])
+        patch_etw = patch.object(
+            pop_module, '_email_to_webmaster', return_value=[])
+        with patch_eto as mock_eto, patch_etw as mock_etw:
             resp = self._call_setup_123(request)
-        mock_crl.assert_called_once_with(request, populaire)
         mock_eto.assert_called_once_with(request, populaire)
         mock_etw.assert_called_once_with(request, populaire)
         self.assertEqual(
             resp.location, 'http://example.com/admin/populaire/VicPop')
 
-    @pytest.mark.xfail(reason='google spreadsheet disabled')
-    def test_setup_123_error_create_rider_list_already_done(self):
-        """setup_123 stops w/ exp flash msg if rider list doc id is setup
-        """
-        from randopony.models import Populaire
-        from randopony.views.admin import populaire as pop_module
-        populaire = Populaire(
-            event_name='Victoria Populaire',
-            short_name='VicPop',
-            distance='50 km, 100 km',
-            date_time=datetime(2011, 3, 27, 10, 0),
-            start_locn='University of Victoria, Parking Lot #2 '
-                       '(Gabriola Road, near McKinnon Gym)',
-            organizer_email='mjansson@example.com',
-            registration_end=datetime(2011, 3, 24, 12, 0),
-            entry_form_url='http://www.randonneurs.bc.ca/VicPop/'
-                           'VicPop11_registration.pdf',
-            google_doc_id='spreadsheet:1234',
-        )
-        DBSession.add(populaire)
-        request = testing.DummyRequest()
-        request.matchdict['item'] = 'VicPop'
-        patch_eto = patch.object(pop_module, '_email_to_organizer')
-        patch_etw = patch.object(pop_module, '_email_to_webmaster')
-        with patch_eto as mock_eto, patch_etw as mock_etw:
-            self._call_setup_123(request)
-        self.assertFalse(mock_eto.called)
-        self.assertFalse(mock_etw.called)
-        flash = request.session.pop_flash()
-        self.assertEqual(
-            flash,
-            ['error', 'Rider list spreadsheet already created'])
-
     def test_setup_123_success_flash(self):
         """setup_123 sets expected flash message on success
         """
@@ -421,7 +389,6 @@ class TestSetup123(unittest.TestCase):
             EmailAddress,
             Populaire,
         )
-        from randopony.views.admin import populaire as pop_module
         populaire = Populaire(
             event_name='Victoria Populaire',
             short_name='VicPop',
@@ -433,7 +400,6 @@ class TestSetup123(unittest.TestCase):
             registration_end=datetime(2011, 3, 24, 12, 0),
             entry_form_url='http://www.randonneurs.bc.ca/VicPop/'
                            'VicPop11_registration.pdf',
-            google_doc_id='spreadsheet:1234',
         )
         from_randopony = EmailAddress(
             key='from_randopony',
@@ -451,17 +417,12 @@ class TestSetup123(unittest.TestCase):
             (populaire, from_randopony, admin_email, club_webmaster))
         request = testing.DummyRequest()
         request.matchdict['item'] = 'VicPop'
-        crl_patch = patch.object(pop_module, '_create_rider_list')
-        with crl_patch as mock_crl:
-            mock_crl.return_value = [
-                'success', 'Rider list spreadsheet created']
-            self._call_setup_123(request)
+        self._call_setup_123(request)
         flash = request.session.pop_flash()
         self.assertEqual(
             flash,
             [
                 'success',
-                'Rider list spreadsheet created',
                 'Email sent to VicPop organizer(s)',
                 'Email with VicPop page URL sent to webmaster',
             ])
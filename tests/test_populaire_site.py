@@ -3,15 +3,14 @@
 from datetime import datetime
 from unittest.mock import (
     MagicMock,
+    Mock,
     patch,
 )
 
-from pyramid import testing
 from pyramid.threadlocal import get_current_request
-from pyramid_mailer import get_mailer
+from pyramid_mailer.message import Message
 import pytest
-
-from randopony.models.meta import DBSession
+import transaction
 
 
 @pytest.fixture(scope='module')
@@ -405,7 +404,6 @@ class TestPopulaireEntry(object):
             'duplicate', ' '.join((first_name, last_name)), 'tom@example.com']
         assert request.session.pop_flash() == expected
 
-    @pytest.mark.xfail(reason='google spreadsheet disabled')
     @pytest.mark.parametrize("first_name, last_name", [
         ('Tom', 'Disckson'),  # ASCII
         (u'Étienne', u'«küßî»'),  # 1-byte Unicode
@@ -413,13 +411,13 @@ class TestPopulaireEntry(object):
     ])
     def test_register_success_new_rider(
         self, first_name, last_name, entry, pop_model, pop_rider_model,
-        email_address_model, views_module, db_session, pyramid_config,
+        views_module, db_session, pyramid_config,
     ):
-        """valid entry for new rider adds rider to db & sets exp flash msgs
+        """valid entry for new rider adds rider to db, queues rider list
+        sync in outbox & sets exp flash msgs
         """
+        from randopony.models import OutboxEntry
         pyramid_config.add_route('populaire', '/populaires/{short_name}')
-        from_randopony = email_address_model(
-            key='from_randopony', email='randopony@example.com')
         populaire = pop_model(
             event_name='Victoria Populaire',
             short_name='VicPop',
@@ -431,17 +429,14 @@ class TestPopulaireEntry(object):
             registration_end=datetime(2011, 3, 24, 12, 0),
             entry_form_url='http://www.randonneurs.bc.ca/VicPop/'
                            'VicPop11_registration.pdf',
-            google_doc_id='spreadsheet:'
-                '0AtBTJntkFrPQdFJDN3lvRmVOQW5RXzRZbzRTRFJLYnc',
         )
-        db_session.add_all((from_randopony, populaire))
+        db_session.add(populaire)
         request = get_current_request()
         request.matchdict['short_name'] = 'VicPop'
-        gm_patch = patch.object(views_module, 'get_mailer')
-        ugs_patch = patch.object(views_module, 'update_google_spreadsheet')
+        am_patch = patch.object(views_module.outbox, 'add_message')
         r_msg_patch = patch.object(entry, '_rider_message')
         o_msg_patch = patch.object(entry, '_organizer_message')
-        with gm_patch, ugs_patch, r_msg_patch, o_msg_patch:
+        with am_patch, r_msg_patch, o_msg_patch:
             url = entry.register_success({
                 'email': 'fred@example.com',
                 'first_name': first_name,
@@ -456,19 +451,22 @@ class TestPopulaireEntry(object):
         assert rider.full_name == expected
         assert rider.lowercase_last_name == last_name.lower()
         assert rider.distance == 100
+        entries = [
+            (outbox_entry.kind, outbox_entry.payload)
+            for outbox_entry in db_session.query(OutboxEntry)]
+        assert entries == [(
+            'rider_list_sync',
+            {'event_type': 'populaires', 'event_id': populaire.id})]
         assert url.location == 'http://example.com/populaires/VicPop'
         assert request.session.pop_flash() == ['success', 'fred@example.com']
 
-    @pytest.mark.xfail(reason='google spreadsheet disabled')
     def test_register_success_single_distance(
-        self, entry, pop_model, pop_rider_model, email_address_model,
-        views_module, db_session, pyramid_config,
+        self, entry, pop_model, pop_rider_model, views_module, db_session,
+        pyramid_config,
     ):
         """valid entry for single dstance populaire sets distance correctly
         """
         pyramid_config.add_route('populaire', '/populaires/{short_name}')
-        from_randopony = email_address_model(
-            key='from_randopony', email='randopony@example.com')
         populaire = pop_model(
             event_name="New Year's Populaire",
             short_name='NewYearsPop',
@@ -478,17 +476,14 @@ class TestPopulaireEntry(object):
             organizer_email='mcroy@example.com',
             registration_end=datetime(2012, 12, 31, 17, 0),
             entry_form_url='http://www.randonneurs.bc.ca/organize/eventform.pdf',
-            google_doc_id='spreadsheet:'
-                '0AtBTJntkFrPQdFJDN3lvRmVOQW5RXzRZbzRTRFJLYnc',
         )
-        db_session.add_all((from_randopony, populaire))
+        db_session.add(populaire)
         request = get_current_request()
         request.matchdict['short_name'] = 'NewYearsPop'
-        gm_patch = patch.object(views_module, 'get_mailer')
-        ugs_patch = patch.object(views_module, 'update_google_spreadsheet')
+        am_patch = patch.object(views_module.outbox, 'add_message')
         r_msg_patch = patch.object(entry, '_rider_message')
         o_msg_patch = patch.object(entry, '_organizer_message')
-        with gm_patch, ugs_patch, r_msg_patch, o_msg_patch:
+        with am_patch, r_msg_patch, o_msg_patch:
             entry.register_success({
                 'email': 'fred@example.com',
                 'first_name': 'Fred',
@@ -499,16 +494,12 @@ class TestPopulaireEntry(object):
         rider = db_session.query(pop_rider_model).first()
         assert rider.distance == '60'
 
-    @pytest.mark.xfail(reason='google spreadsheet disabled')
     def test_register_success_sends_2_emails(
-        self, entry, pop_model, pop_rider_model, email_address_model,
-        views_module, db_session, pyramid_config,
+        self, entry, pop_model, views_module, db_session, pyramid_config,
     ):
-        """successful entry sends emails to rider and organizer
+        """successful entry adds emails to rider and organizer to outbox
         """
         pyramid_config.add_route('populaire', '/populaires/{short_name}')
-        from_randopony = email_address_model(
-            key='from_randopony', email='randopony@example.com')
         populaire = pop_model(
             event_name="New Year's Populaire",
             short_name='NewYearsPop',
@@ -518,27 +509,21 @@ class TestPopulaireEntry(object):
             organizer_email='mcroy@example.com',
             registration_end=datetime(2012, 12, 31, 17, 0),
             entry_form_url='http://www.randonneurs.bc.ca/organize/eventform.pdf',
-            google_doc_id='spreadsheet:'
-                '0AtBTJntkFrPQdFJDN3lvRmVOQW5RXzRZbzRTRFJLYnc',
         )
-        db_session.add_all((from_randopony, populaire))
+        db_session.add(populaire)
         request = get_current_request()
         request.matchdict['short_name'] = 'NewYearsPop'
-        ugs_patch = patch.object(views_module, 'update_google_spreadsheet')
         r_msg_patch = patch.object(entry, '_rider_message')
         o_msg_patch = patch.object(entry, '_organizer_message')
-        with ugs_patch, r_msg_patch, o_msg_patch:
-            m_mailer = MagicMock(name='mailer')
-            gm_patch = patch.object(
-                views_module, 'get_mailer', return_value=m_mailer)
-            with gm_patch:
-                entry.register_success({
-                    'email': 'fred@example.com',
-                    'first_name': 'Fred',
-                    'last_name': 'Dickson',
-                    'comment': 'Sunshine Man',
-                })
-        assert m_mailer.send.call_count == 2
+        am_patch = patch.object(views_module.outbox, 'add_message')
+        with r_msg_patch, o_msg_patch, am_patch as m_add_message:
+            entry.register_success({
+                'email': 'fred@example.com',
+                'first_name': 'Fred',
+                'last_name': 'Dickson',
+                'comment': 'Sunshine Man',
+            })
+        assert m_add_message.call_count == 2
 
     def test_rider_email_message(
         self, entry, pop_model, pop_rider_model, email_address_model,
@@ -593,9 +578,7 @@ class TestPopulaireEntry(object):
         """reg notify email to org for single dist event has expected content
         """
         pyramid_config.add_route('populaire', '/populaires/{short_name}')
-        pyramid_config.add_route(
-            'populaire.rider_emails',
-            '/populaires/{short_name}/rider_emails/{uuid}')
+        pyramid_config.add_route('rider_emails', '/rider_emails/{uuid}')
         from_randopony = email_address_model(
             key='from_randopony', email='randopony@example.com')
         admin_email = email_address_model(
@@ -639,9 +622,7 @@ class TestPopulaireEntry(object):
         """reg notify email to orgs for multi-org event has expected content
         """
         pyramid_config.add_route('populaire', '/populaires/{short_name}')
-        pyramid_config.add_route(
-            'populaire.rider_emails',
-            '/populaires/{short_name}/rider_emails/{uuid}')
+        pyramid_config.add_route('rider_emails', '/rider_emails/{uuid}')
         from_randopony = email_address_model(
             key='from_randopony', email='randopony@example.com')
         admin_email = email_address_model(
@@ -674,13 +655,20 @@ class TestPopulaireEntry(object):
             msg = entry._organizer_message(populaire, rider)
         assert msg.recipients == ['mjansson@example.com', 'mcroy@example.com']
 
-    @pytest.mark.xfail(reason='google spreadsheet disabled')
-    def test_register_success_queues_update_google_spreadsheet_task(self):
-        """successful registration queues task to update rider list spreadsheet
+    def test_register_success_side_effects_in_outbox(
+        self, entry, pop_model, pop_rider_model, views_module, db_session,
+        pyramid_config,
+    ):
+        """registration side effects are carried out by the outbox drain
+        task that is queued when the registration commits
         """
-        from randopony.models import Populaire
-        from randopony.views.site import populaire as pop_module
-        populaire = Populaire(
+        from randopony import outbox
+        from randopony.tasks import (
+            outbox as outbox_tasks,
+            rider_list,
+        )
+        pyramid_config.add_route('populaire', '/populaires/{short_name}')
+        populaire = pop_model(
             event_name="New Year's Populaire",
             short_name='NewYearsPop',
             distance='60 km',
@@ -689,22 +677,94 @@ class TestPopulaireEntry(object):
             organizer_email='mcroy@example.com',
             registration_end=datetime(2012, 12, 31, 17, 0),
             entry_form_url='http://www.randonneurs.bc.ca/organize/eventform.pdf',
-            google_doc_id='spreadsheet:'
-                '0AtBTJntkFrPQdFJDN3lvRmVOQW5RXzRZbzRTRFJLYnc',
         )
-        DBSession.add(populaire)
-        request = testing.DummyRequest()
-        request.matchdict['short_name'] = 'NewYearsPop'
-        get_mailer(request)
-        entry = self._make_one(request)
-        with patch.object(pop_module, 'update_google_spreadsheet') as mock_task:
+        db_session.add(populaire)
+        get_current_request().matchdict['short_name'] = 'NewYearsPop'
+        do_patch = patch.object(outbox_tasks.drain_outbox, 'apply_async')
+        r_msg_patch = patch.object(
+            entry, '_rider_message',
+            return_value=Message(
+                subject='rider', sender='randopony@example.com',
+                recipients=['fred@example.com'], body='Thanks'))
+        o_msg_patch = patch.object(
+            entry, '_organizer_message',
+            return_value=Message(
+                subject='organizer', sender='randopony@example.com',
+                recipients=['mcroy@example.com'], body='New rider'))
+        with r_msg_patch, o_msg_patch, do_patch as m_drain:
             entry.register_success({
                 'email': 'fred@example.com',
                 'first_name': 'Fred',
                 'last_name': 'Dickson',
                 'comment': 'Sunshine Man',
             })
-        assert mock_task.delay.called
+            rider = db_session.query(pop_rider_model).one()
+            populaire_id = rider.populaire
+            assert not m_drain.called
+            transaction.commit()
+        m_drain.assert_called_once_with((), countdown=None)
+        m_mailer = Mock(name='mailer')
+        gm_patch = patch.object(outbox, 'get_mailer', return_value=m_mailer)
+        srl_patch = patch.object(rider_list.sync_rider_list, 'apply_async')
+        with gm_patch, srl_patch as m_sync_rider_list:
+            outbox_tasks.drain_outbox()
+        m_sync_rider_list.assert_called_once_with(
+            ('populaires', populaire_id), countdown=30)
+        assert m_mailer.send_to_queue.call_count == 2
+
+    def test_register_success_write_behind(
+        self, entry, pop_model, pop_rider_model, views_module, db_session,
+        pyramid_config, tmpdir,
+    ):
+        """write-behind intake queues entry instead of adding rider to db
+        """
+        from randopony import intake
+        from randopony.tasks import intake as intake_tasks
+        pyramid_config.add_route('populaire', '/populaires/{short_name}')
+        populaire = pop_model(
+            event_name="New Year's Populaire",
+            short_name='NewYearsPop',
+            distance='60 km',
+            date_time=datetime(2013, 1, 1, 10, 0),
+            start_locn='Kelseys Family Restaurant, 325 Burnside Rd W, Victoria',
+            organizer_email='mcroy@example.com',
+            registration_end=datetime(2012, 12, 31, 17, 0),
+            entry_form_url='http://www.randonneurs.bc.ca/organize/eventform.pdf',
+        )
+        db_session.add(populaire)
+        request = get_current_request()
+        request.matchdict['short_name'] = 'NewYearsPop'
+        intake.configure({
+            'intake.mode': 'write_behind',
+            'intake.sqlite_path': str(tmpdir.join('intake.sqlite')),
+        })
+        ai_patch = patch.object(intake_tasks.apply_intake, 'apply_async')
+        r_msg_patch = patch.object(
+            entry, '_rider_message',
+            return_value=Message(
+                subject='rider', sender='randopony@example.com',
+                recipients=['fred@example.com'], body='Thanks'))
+        o_msg_patch = patch.object(
+            entry, '_organizer_message',
+            return_value=Message(
+                subject='organizer', sender='randopony@example.com',
+                recipients=['mcroy@example.com'], body='New rider'))
+        try:
+            with ai_patch as m_apply_intake, r_msg_patch, o_msg_patch:
+                url = entry.register_success({
+                    'email': 'fred@example.com',
+                    'first_name': 'Fred',
+                    'last_name': 'Dickson',
+                    'comment': 'Sunshine Man',
+                })
+            assert intake.get_queue().pending() == 1
+        finally:
+            intake.configure({})
+        assert db_session.query(pop_rider_model).count() == 0
+        m_apply_intake.assert_called_once_with((), countdown=None)
+        assert url.location == 'http://example.com/populaires/NewYearsPop'
+        assert request.session.pop_flash() == [
+            'processing', 'fred@example.com']
 
     def test_failure(
         self, entry, pop_model, email_address_model,
@@ -0,0 +1,178 @@
+"""Tests for RandoPony club membership status refresh script.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+from unittest.mock import patch
+
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def refresh_module():
+    from randopony.scripts import refresh_member_status
+    return refresh_member_status
+
+
+@pytest.fixture
+def brevets(brevet_model, brevet_rider_model, link_model, db_session):
+    """Ids of upcoming brevets with 2 registrations by the same rider,
+    and a past brevet.
+    """
+    brevets = []
+    for days in (10, 20, -20):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime.today() + timedelta(days=days),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        brevets.append(brevet)
+    for brevet, first_name, last_name, member_status in (
+        (brevets[0], 'Tom', 'Dickson', None),
+        (brevets[1], ' tom', 'DICKSON', False),
+        (brevets[1], 'Harry', 'Allen', True),
+        (brevets[1], 'Mary', 'Jones', None),
+        (brevets[2], 'Ann', 'Past', None),
+    ):
+        brevet.riders.append(brevet_rider_model(
+            email='{}@example.com'.format(first_name.strip().lower()),
+            first_name=first_name,
+            last_name=last_name,
+            comment='',
+            member_status=member_status,
+        ))
+    with transaction.manager:
+        db_session.add_all(brevets)
+        db_session.add(link_model(
+            key='is_club_member_api',
+            url='https://example.com/{last_name}/{first_name}'))
+        db_session.flush()
+        return [brevet.id for brevet in brevets]
+
+
+def _member_statuses(db_session, brevet_rider_model):
+    return {
+        (rider.first_name.strip(), rider.brevet): rider.member_status
+        for rider in db_session.query(brevet_rider_model)
+    }
+
+
+@pytest.mark.usefixtures(
+    'refresh_module', 'brevets', 'brevet_rider_model',
+    'member_status_cache_model', 'db_session',
+)
+class TestRefreshMemberStatus(object):
+    """Unit tests for refresh_member_status function.
+    """
+    @pytest.yield_fixture(autouse=True)
+    def m_sync(self):
+        from randopony.tasks import rider_list
+        with patch.object(rider_list.sync_rider_list, 'apply_async') as m:
+            yield m
+
+    def test_dedupes_names_and_skips_current_members(
+        self, refresh_module, brevets,
+    ):
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_fetch = m_get_client().fetch_member_status
+            m_fetch.return_value = True
+            refresh_module.refresh_member_status()
+        requested = sorted(
+            call[0][:2] for call in m_fetch.call_args_list)
+        assert requested == [('Mary', 'Jones'), ('Tom', 'Dickson')]
+
+    def test_updates_riders(
+        self, refresh_module, brevets, brevet_rider_model, db_session,
+    ):
+        def request_member_status(first_name, last_name, *args):
+            return {'Tom': True, 'Mary': False}[first_name]
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.side_effect = (
+                request_member_status)
+            refresh_module.refresh_member_status()
+        statuses = _member_statuses(db_session, brevet_rider_model)
+        assert statuses == {
+            ('Tom', brevets[0]): True,
+            ('tom', brevets[1]): True,
+            ('Harry', brevets[1]): True,
+            ('Mary', brevets[1]): False,
+            ('Ann', brevets[2]): None,
+        }
+
+    def test_requests_syncs_of_changed_brevets(
+        self, refresh_module, brevets, m_sync,
+    ):
+        def request_member_status(first_name, last_name, *args):
+            return {'Tom': False, 'Mary': None}[first_name]
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.side_effect = (
+                request_member_status)
+            refresh_module.refresh_member_status()
+        # Tom's status in the 2nd brevet was already expired
+        m_sync.assert_called_once_with(('brevets', brevets[0]), countdown=30)
+
+    def test_unchanged_statuses_not_synced(
+        self, refresh_module, brevets, m_sync,
+    ):
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.return_value = None
+            refresh_module.refresh_member_status()
+        assert not m_sync.called
+
+    def test_unknown_status_not_written(
+        self, refresh_module, brevets, brevet_rider_model, db_session,
+    ):
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.return_value = None
+            refresh_module.refresh_member_status()
+        statuses = _member_statuses(db_session, brevet_rider_model)
+        assert statuses[('tom', brevets[1])] is False
+
+    def test_cache_hits(
+        self, refresh_module, brevets, member_status_cache_model,
+    ):
+        with transaction.manager:
+            member_status_cache_model.store('Mary', 'Jones', True)
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_fetch = m_get_client().fetch_member_status
+            m_fetch.return_value = True
+            stats = refresh_module.refresh_member_status()
+        m_fetch.assert_called_once()
+        assert stats['riders'] == 3
+        assert stats['names'] == 2
+        assert stats['cache_hits'] == 1
+        assert stats['cache_misses'] == 1
+        assert stats['members'] == 2
+
+    def test_stores_results_in_cache(
+        self, refresh_module, brevets, member_status_cache_model,
+    ):
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.return_value = False
+            refresh_module.refresh_member_status()
+        entry = member_status_cache_model.get_fresh('Tom', 'Dickson')
+        assert entry.member_status is False
+
+    def test_failed_lookups_are_unknown_and_not_cached(
+        self, refresh_module, brevets, member_status_cache_model,
+    ):
+        from randopony.member_api import MemberAPIError
+        gc_patch = patch.object(refresh_module.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            m_get_client().fetch_member_status.side_effect = MemberAPIError
+            stats = refresh_module.refresh_member_status()
+        assert stats['failures'] == 2
+        assert stats['unknown'] == 2
+        assert member_status_cache_model.get_fresh('Tom', 'Dickson') is None
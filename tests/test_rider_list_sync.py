@@ -0,0 +1,241 @@
+"""Tests for RandoPony event rider list sync.
+"""
+from datetime import datetime
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+import json
+import threading
+from unittest.mock import Mock
+
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def sync_module():
+    from randopony import rider_list_sync
+    return rider_list_sync
+
+
+@pytest.fixture(scope='function')
+def brevet_id(brevet_model, brevet_rider_model, db_session):
+    brevet = brevet_model(
+        region='VI',
+        distance=200,
+        date_time=datetime(2013, 3, 3, 7, 0),
+        route_name='Chilly 200',
+        start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+        organizer_email='mcroy@example.com',
+    )
+    brevet.riders.extend((
+        brevet_rider_model(
+            'Fibber', 'McGee', 'fibber@example.com', '', member_status=True),
+        brevet_rider_model('Tom', 'Dickson', 'tom@example.com', ''),
+    ))
+    db_session.add(brevet)
+    db_session.flush()
+    brevet_id = brevet.id
+    transaction.commit()
+    return brevet_id
+
+
+def _register(db_session, brevet_model, brevet_rider_model, brevet_id,
+              first_name):
+    with transaction.manager:
+        brevet = db_session.query(brevet_model).get(brevet_id)
+        brevet.riders.append(brevet_rider_model(
+            first_name, 'Jones', 'jones@example.com', ''))
+
+
+class SpreadsheetStandIn(BaseHTTPRequestHandler):
+    """Local stand-in for the spreadsheet service JSON API.
+    """
+    lists = {}
+    requests = []
+    fail = False
+
+    def _handle(self):
+        body = json.loads(
+            self.rfile.read(int(self.headers['Content-Length'])).decode())
+        self.requests.append(
+            (self.command, self.path, self.headers['Authorization']))
+        if self.fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+        list_key = self.path.split('/')[-2]
+        rows = self.lists.setdefault(list_key, {})
+        if self.command == 'DELETE':
+            for key in body['keys']:
+                rows.pop(key)
+        else:
+            for row in body['rows']:
+                rows[row['key']] = row['values']
+        self.send_response(204)
+        self.end_headers()
+
+    do_POST = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.yield_fixture(scope='function')
+def stand_in():
+    SpreadsheetStandIn.lists = {}
+    SpreadsheetStandIn.requests = []
+    SpreadsheetStandIn.fail = False
+    server = HTTPServer(('127.0.0.1', 0), SpreadsheetStandIn)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://127.0.0.1:{}/api'.format(server.server_port)
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+@pytest.mark.usefixtures('sync_module', 'db_session')
+class TestRiderListSync(object):
+    """Unit tests for RiderListSync with the SQLite backend.
+    """
+    def _sync(self, sync_module):
+        backend = sync_module.SQLiteRiderListBackend(':memory:')
+        return sync_module.RiderListSync(backend)
+
+    def test_initial_sync_inserts_rows(self, sync_module, brevet_id):
+        rider_list_sync = self._sync(sync_module)
+        stats = rider_list_sync.sync('brevets', brevet_id)
+        assert stats == {'inserted': 2, 'updated': 0, 'deleted': 0}
+        rows = rider_list_sync.backend.rows(
+            'brevets-{}'.format(brevet_id))
+        assert sorted(row['lastname'] for row in rows.values()) == [
+            'Dickson', 'McGee']
+
+    def test_unchanged_rows_not_pushed(self, sync_module, brevet_id):
+        rider_list_sync = self._sync(sync_module)
+        rider_list_sync.sync('brevets', brevet_id)
+        rider_list_sync.backend = Mock(name='backend')
+        stats = rider_list_sync.sync('brevets', brevet_id)
+        assert stats == {'inserted': 0, 'updated': 0, 'deleted': 0}
+        assert rider_list_sync.backend.mock_calls == []
+
+    def test_only_changes_pushed(
+        self, sync_module, brevet_id, brevet_model, brevet_rider_model,
+        db_session,
+    ):
+        rider_list_sync = self._sync(sync_module)
+        rider_list_sync.sync('brevets', brevet_id)
+        _register(
+            db_session, brevet_model, brevet_rider_model, brevet_id, 'Ana')
+        with transaction.manager:
+            rider = db_session.query(brevet_rider_model).filter_by(
+                first_name='Tom').one()
+            rider.member_status = False
+        backend = rider_list_sync.backend
+        rider_list_sync.backend = Mock(name='backend', wraps=backend)
+        stats = rider_list_sync.sync('brevets', brevet_id)
+        assert stats == {'inserted': 1, 'updated': 1, 'deleted': 0}
+        (list_key, inserted), _ = (
+            rider_list_sync.backend.insert_rows.call_args)
+        assert [row['firstname'] for row in inserted.values()] == ['Ana']
+        (list_key, updated), _ = rider_list_sync.backend.update_rows.call_args
+        assert [row['clubmember'] for row in updated.values()] == ['No']
+        assert not rider_list_sync.backend.delete_rows.called
+        rows = backend.rows(list_key)
+        assert len(rows) == 3
+
+    def test_removed_rider_deleted(
+        self, sync_module, brevet_id, brevet_rider_model, db_session,
+    ):
+        rider_list_sync = self._sync(sync_module)
+        rider_list_sync.sync('brevets', brevet_id)
+        with transaction.manager:
+            rider = db_session.query(brevet_rider_model).filter_by(
+                first_name='Fibber').one()
+            rider_id = rider.id
+            db_session.delete(rider)
+        stats = rider_list_sync.sync('brevets', brevet_id)
+        # The remaining rider is renumbered
+        assert stats == {'inserted': 0, 'updated': 1, 'deleted': 1}
+        rows = rider_list_sync.backend.rows('brevets-{}'.format(brevet_id))
+        assert str(rider_id) not in rows
+        assert [row['ridernumber'] for row in rows.values()] == ['1']
+
+    def test_backend_failure_leaves_state_unchanged(
+        self, sync_module, brevet_id, db_session,
+    ):
+        from randopony.models import RiderListRow
+        rider_list_sync = self._sync(sync_module)
+        backend = rider_list_sync.backend
+        rider_list_sync.backend = Mock(name='backend')
+        rider_list_sync.backend.insert_rows.side_effect = (
+            sync_module.RiderListSyncError)
+        with pytest.raises(sync_module.RiderListSyncError):
+            rider_list_sync.sync('brevets', brevet_id)
+        assert db_session.query(RiderListRow).count() == 0
+        rider_list_sync.backend = backend
+        stats = rider_list_sync.sync('brevets', brevet_id)
+        assert stats['inserted'] == 2
+
+
+@pytest.mark.usefixtures('sync_module', 'db_session', 'stand_in')
+class TestSpreadsheetServiceBackend(object):
+    """Unit tests for spreadsheet service backend against a local stand-in
+    for the service.
+    """
+    def test_sync(
+        self, sync_module, stand_in, brevet_id, brevet_rider_model,
+        db_session,
+    ):
+        backend = sync_module.SpreadsheetServiceBackend(stand_in, 'secret')
+        rider_list_sync = sync_module.RiderListSync(backend)
+        rider_list_sync.sync('brevets', brevet_id)
+        with transaction.manager:
+            db_session.query(brevet_rider_model).filter_by(
+                first_name='Tom').update({'bike_type': 'tandem'})
+        rider_list_sync.sync('brevets', brevet_id)
+        list_key = 'brevets-{}'.format(brevet_id)
+        url = '/api/lists/{}/rows'.format(list_key)
+        assert SpreadsheetStandIn.requests == [
+            ('POST', url, 'Bearer secret'),
+            ('PATCH', url, 'Bearer secret'),
+        ]
+        rows = SpreadsheetStandIn.lists[list_key]
+        assert sorted(row['biketype'] for row in rows.values()) == [
+            'single', 'tandem']
+
+    def test_service_error(self, sync_module, stand_in, brevet_id):
+        SpreadsheetStandIn.fail = True
+        backend = sync_module.SpreadsheetServiceBackend(stand_in)
+        with pytest.raises(sync_module.RiderListSyncError):
+            backend.delete_rows('brevets-42', ['1'])
+
+
+@pytest.mark.usefixtures('sync_module')
+class TestConfigure(object):
+    """Unit tests for rider list sync configuration from app settings.
+    """
+    def test_sqlite(self, sync_module):
+        sync_module.configure({
+            'rider_list.backend': 'sqlite',
+            'rider_list.sqlite_path': ':memory:',
+        })
+        assert isinstance(
+            sync_module.get_sync().backend,
+            sync_module.SQLiteRiderListBackend)
+
+    def test_spreadsheet(self, sync_module):
+        sync_module.configure({
+            'rider_list.backend': 'spreadsheet',
+            'rider_list.service_url': 'https://example.com/api/',
+            'rider_list.read_timeout': '20',
+        })
+        backend = sync_module.get_sync().backend
+        assert backend.base_url == 'https://example.com/api'
+        assert backend.timeout == (3.05, 20)
+
+    def test_disabled(self, sync_module):
+        sync_module.configure({})
+        assert sync_module.get_sync() is None
@@ -0,0 +1,235 @@
+"""Tests for RandoPony event rider roster export.
+"""
+import csv
+from datetime import (
+    datetime,
+    timedelta,
+)
+import io
+from unittest.mock import patch
+from xml.etree import ElementTree
+import zipfile
+
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.threadlocal import get_current_request
+import pytest
+import transaction
+
+
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+@pytest.fixture(scope='module')
+def roster_module():
+    from randopony import rider_roster
+    return rider_roster
+
+
+@pytest.fixture(scope='function')
+def brevet_id(brevet_model, brevet_rider_model, db_session):
+    brevet = brevet_model(
+        region='VI',
+        distance=200,
+        date_time=datetime.today() + timedelta(days=10),
+        route_name='Chilly 200',
+        start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+        organizer_email='mcroy@example.com',
+    )
+    brevet.riders.extend((
+        brevet_rider_model(
+            'Fibber', 'McGee', 'fibber@example.com', '',
+            member_status=True),
+        brevet_rider_model(
+            'Ana', 'Zamora, "Jr"', 'ana@example.com', '',
+            bike_type='tandem', member_status=False),
+        brevet_rider_model('Tom', 'Dickson', 'tom@example.com', ''),
+    ))
+    db_session.add(brevet)
+    db_session.flush()
+    brevet_id = brevet.id
+    transaction.commit()
+    return brevet_id
+
+
+def _xlsx_rows(body):
+    with zipfile.ZipFile(io.BytesIO(body)) as archive:
+        assert archive.testzip() is None
+        assert 'xl/workbook.xml' in archive.namelist()
+        sheet = ElementTree.fromstring(
+            archive.read('xl/worksheets/sheet1.xml'))
+    return [
+        [cell.findtext('.//{}t'.format(SHEET_NS))
+         or cell.findtext('{}v'.format(SHEET_NS))
+         for cell in row]
+        for row in sheet.iter('{}row'.format(SHEET_NS))]
+
+
+@pytest.mark.usefixtures('roster_module', 'db_session')
+class TestRosterExport(object):
+    """Unit tests for rider roster export.
+    """
+    def test_brevet_rows(self, roster_module, brevet_id):
+        """brevet roster rows are numbered in registration order
+        """
+        rows = list(roster_module.roster_rows(
+            roster_module.ROSTER_TYPES['brevets'], brevet_id))
+        assert rows == [
+            {'ridernumber': '1', 'lastname': 'McGee', 'firstname': 'Fibber',
+             'clubmember': 'Yes', 'biketype': 'single'},
+            {'ridernumber': '2', 'lastname': 'Zamora, "Jr"',
+             'firstname': 'Ana', 'clubmember': 'No', 'biketype': 'tandem'},
+            {'ridernumber': '3', 'lastname': 'Dickson', 'firstname': 'Tom',
+             'clubmember': 'Unknown', 'biketype': 'single'},
+        ]
+
+    def test_populaire_rows(
+        self, roster_module, pop_model, pop_rider_model, db_session,
+    ):
+        """populaire roster rows include rider's distance
+        """
+        populaire = pop_model(
+            'Victoria Populaire', 'VicPop', '50 km, 100 km',
+            datetime(2011, 3, 27, 10, 0), 'University of Victoria',
+            'mjansson@example.com', datetime(2011, 3, 24, 12, 0),
+            entry_form_url='http://www.randonneurs.bc.ca/VicPop.pdf')
+        populaire.riders.append(pop_rider_model(
+            'Fibber', 'McGee', 'fibber@example.com', 100, ''))
+        db_session.add(populaire)
+        db_session.flush()
+        populaire_id = populaire.id
+        transaction.commit()
+        rows = list(roster_module.roster_rows(
+            roster_module.ROSTER_TYPES['populaires'], populaire_id))
+        assert rows == [{
+            'ridernumber': '1', 'lastname': 'McGee', 'firstname': 'Fibber',
+            'distance': '100',
+        }]
+
+    def test_csv(self, roster_module, brevet_id):
+        """CSV roster has header row and quoted values
+        """
+        roster_type = roster_module.ROSTER_TYPES['brevets']
+        body = b''.join(roster_module.csv_chunks(
+            roster_type.columns, roster_module.roster_rows(
+                roster_type, brevet_id)))
+        rows = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+        assert rows[0] == [
+            'Rider Number', 'Last Name', 'First Name', 'Club Member',
+            'Bike Type']
+        assert rows[2] == ['2', 'Zamora, "Jr"', 'Ana', 'No', 'tandem']
+        assert len(rows) == 4
+
+    def test_xlsx(self, roster_module, brevet_id):
+        """XLSX roster is a valid archive with a worksheet of riders
+        """
+        roster_type = roster_module.ROSTER_TYPES['brevets']
+        body = b''.join(roster_module.xlsx_chunks(
+            roster_type.columns, roster_module.roster_rows(
+                roster_type, brevet_id)))
+        rows = _xlsx_rows(body)
+        assert rows[0] == [
+            'Rider Number', 'Last Name', 'First Name', 'Club Member',
+            'Bike Type']
+        assert rows[2] == ['2', 'Zamora, "Jr"', 'Ana', 'No', 'tandem']
+        assert len(rows) == 4
+
+    def test_xlsx_strips_xml_invalid_chars(self, roster_module):
+        """control characters that XML forbids are left out of XLSX cells
+        """
+        rows = [{
+            'ridernumber': '1', 'lastname': 'Mc\x0bGee\x00',
+            'firstname': 'Fib\x1fber\tJr', 'distance': '100',
+        }]
+        body = b''.join(roster_module.xlsx_chunks(
+            roster_module.POPULAIRE_COLUMNS, rows))
+        assert _xlsx_rows(body)[1] == ['1', 'McGee', 'Fibber\tJr', '100']
+
+    @pytest.mark.parametrize('fmt', ['csv', 'xlsx'])
+    def test_chunked(self, roster_module, fmt):
+        """large rosters are generated in chunks of rows
+        """
+        columns = roster_module.POPULAIRE_COLUMNS
+        n_rows = roster_module.CHUNK_ROWS * 3
+        rows = (
+            {'ridernumber': str(i), 'lastname': 'Rider{}'.format(i),
+             'firstname': 'Fast', 'distance': '100'}
+            for i in range(1, n_rows + 1))
+        chunks = list(roster_module.WRITERS[fmt](columns, rows))
+        assert len(chunks) >= 3
+        body = b''.join(chunks)
+        if fmt == 'csv':
+            rows = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+        else:
+            rows = _xlsx_rows(body)
+        assert len(rows) == n_rows + 1
+        assert rows[-1][1] == 'Rider{}'.format(n_rows)
+
+
+@pytest.mark.usefixtures('db_session', 'pyramid_config')
+class TestRosterViews(object):
+    """Unit tests for rider roster export views.
+    """
+    def test_organizer_brevet_roster(
+        self, brevet_model, brevet_id, views_core_module,
+    ):
+        """organizer brevet roster view streams CSV attachment
+        """
+        from randopony.views.site.brevet import BrevetViews
+        brevet = brevet_model.get_current().filter_by(id=brevet_id).one()
+        request = get_current_request()
+        request.matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': brevet.date_time.strftime('%d%b%Y'),
+            'uuid': str(brevet.uuid),
+            'format': 'csv',
+        })
+        with patch.object(views_core_module, 'get_membership_link'):
+            resp = BrevetViews(request).roster()
+        assert resp.content_type == 'text/csv'
+        assert resp.content_disposition == (
+            'attachment; filename="{}-riders.csv"'
+            .format(str(brevet).replace(' ', '_')))
+        assert resp.content_length is None
+        assert b'Fibber' in b''.join(resp.app_iter)
+
+    def test_organizer_roster_invalid_uuid(
+        self, brevet_model, brevet_id, views_core_module,
+    ):
+        """organizer brevet roster view raises 404 for wrong uuid
+        """
+        from randopony.views.site.brevet import BrevetViews
+        brevet = brevet_model.get_current().filter_by(id=brevet_id).one()
+        request = get_current_request()
+        request.matchdict.update({
+            'region': 'VI',
+            'distance': '200',
+            'date': brevet.date_time.strftime('%d%b%Y'),
+            'uuid': 'foo',
+            'format': 'csv',
+        })
+        with patch.object(views_core_module, 'get_membership_link'):
+            views = BrevetViews(request)
+        with pytest.raises(HTTPNotFound):
+            views.roster()
+
+    def test_admin_brevet_roster(self, brevet_model, brevet_id):
+        """admin brevet roster view streams XLSX attachment
+        """
+        from randopony.views.admin.brevet import roster
+        brevet = brevet_model.get_current().filter_by(id=brevet_id).one()
+        request = get_current_request()
+        request.matchdict.update({'item': str(brevet), 'format': 'xlsx'})
+        resp = roster(request)
+        assert resp.content_type == (
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        assert len(_xlsx_rows(b''.join(resp.app_iter))) == 4
+
+    def test_admin_populaire_roster_not_found(self):
+        """admin populaire roster view raises 404 for unknown populaire
+        """
+        from randopony.views.admin.populaire import roster
+        request = get_current_request()
+        request.matchdict.update({'item': 'foo', 'format': 'csv'})
+        with pytest.raises(HTTPNotFound):
+            roster(request)
@@ -1,9 +1,18 @@
 """Tests for RandoPony public site core views and functionality.
 """
-from unittest.mock import patch
+from datetime import (
+    datetime,
+    timedelta,
+)
+from unittest.mock import (
+    Mock,
+    patch,
+)
 
+from pyramid import testing
 from pyramid.threadlocal import get_current_request
 import pytest
+import transaction
 
 
 @pytest.fixture(scope='module')
@@ -19,6 +28,293 @@ def views(core_module, pyramid_config):
         return SiteViews(get_current_request())
 
 
+@pytest.mark.usefixtures(
+    'core_module', 'link_model', 'email_address_model', 'db_session',
+    'sql_statements',
+)
+class TestSettingsCache(object):
+    """Unit tests for process-wide Link and EmailAddress cache.
+    """
+    def test_single_query_loads_all_settings(
+        self, core_module, link_model, email_address_model, db_session,
+        sql_statements,
+    ):
+        """links and email addresses are loaded by 1 query
+        """
+        db_session.add_all((
+            link_model(key='membership_link', url='https://membership/'),
+            link_model(key='entry_form', url='http://entry_form.pdf/'),
+            email_address_model(key='admin_email', email='tom@example.com'),
+        ))
+        db_session.flush()
+        del sql_statements[:]
+        assert core_module.get_membership_link() == 'https://membership/'
+        assert core_module.get_entry_form_url() == 'http://entry_form.pdf/'
+        admin_email = core_module.get_email_address('admin_email')
+        assert admin_email == 'tom@example.com'
+        assert len(sql_statements) == 1
+
+    def test_cache_hit_runs_no_queries(
+        self, core_module, link_model, db_session, sql_statements,
+    ):
+        """cached values are returned without database queries
+        """
+        db_session.add(
+            link_model(key='membership_link', url='https://membership/'))
+        db_session.flush()
+        core_module.get_membership_link()
+        del sql_statements[:]
+        for i in range(3):
+            core_module.get_membership_link()
+        assert sql_statements == []
+
+    def test_update_invalidates_cache(
+        self, core_module, link_model, db_session,
+    ):
+        """committing a link update clears the cache
+        """
+        link = link_model(key='membership_link', url='https://membership/')
+        db_session.add(link)
+        transaction.commit()
+        core_module.get_membership_link()
+        link = db_session.query(link_model).one()
+        link.url = 'https://new_membership/'
+        transaction.commit()
+        assert core_module.get_membership_link() == 'https://new_membership/'
+
+    def test_delete_invalidates_cache(
+        self, core_module, email_address_model, db_session,
+    ):
+        """committing an email address deletion clears the cache
+        """
+        email = email_address_model(key='admin_email', email='tom@example.com')
+        db_session.add(email)
+        transaction.commit()
+        core_module.get_email_address('admin_email')
+        db_session.delete(db_session.query(email_address_model).one())
+        transaction.commit()
+        with pytest.raises(KeyError):
+            core_module.get_email_address('admin_email')
+
+    def test_load_between_flush_and_commit_not_stored(
+        self, core_module, link_model, db_session, sql_statements,
+    ):
+        """values loaded before a settings change commits aren't kept
+        """
+        db_session.add(
+            link_model(key='membership_link', url='https://membership/'))
+        db_session.flush()
+        core_module.get_membership_link()
+        transaction.commit()
+        del sql_statements[:]
+        core_module.get_membership_link()
+        assert len(sql_statements) == 1
+
+    def test_rollback_does_not_clear_cache(
+        self, core_module, link_model, db_session, sql_statements,
+    ):
+        """rolled back settings changes leave the cache alone
+        """
+        db_session.add(
+            link_model(key='membership_link', url='https://membership/'))
+        transaction.commit()
+        core_module.get_membership_link()
+        db_session.add(link_model(key='entry_form', url='http://entry/'))
+        db_session.flush()
+        transaction.abort()
+        assert 'settings_cache_stale' not in db_session().info
+        del sql_statements[:]
+        core_module.get_membership_link()
+        assert sql_statements == []
+
+
+@pytest.mark.usefixtures('core_module', 'pyramid_config', 'db_session')
+class TestCachedPage(object):
+    """Unit tests for rendered page cache view decorator.
+    """
+    @pytest.fixture
+    def view(self, core_module):
+        calls = []
+
+        def view(context, request):
+            calls.append(request)
+            response = request.response
+            response.text = 'page {}'.format(len(calls))
+            return response
+        return core_module.cached_page(view)
+
+    @pytest.fixture
+    def request_(self, pyramid_config):
+        request = testing.DummyRequest()
+        request.matched_route = Mock()
+        request.matched_route.name = 'brevet.list'
+        request.matchdict = {'region': 'LM'}
+        return request
+
+    def test_cache_miss_renders_page(self, view, request_):
+        response = view(None, request_)
+        assert response.text == 'page 1'
+
+    def test_cache_hit_skips_view(self, view, request_):
+        view(None, request_)
+        response = view(None, request_)
+        assert response.text == 'page 1'
+        assert response.content_type == 'text/html'
+
+    def test_key_includes_matchdict(self, view, request_):
+        view(None, request_)
+        request_.matchdict = {'region': 'VI'}
+        response = view(None, request_)
+        assert response.text == 'page 2'
+
+    def test_post_bypasses_cache(self, view, request_):
+        view(None, request_)
+        request_.method = 'POST'
+        response = view(None, request_)
+        assert response.text == 'page 2'
+
+    def test_flash_message_bypasses_cache(self, view, request_):
+        view(None, request_)
+        request_.session.flash('success')
+        response = view(None, request_)
+        assert response.text == 'page 2'
+
+    def test_zero_max_age_disables_cache(
+        self, view, request_, pyramid_config,
+    ):
+        pyramid_config.registry.settings['page_cache.max_age'] = '0'
+        view(None, request_)
+        response = view(None, request_)
+        assert response.text == 'page 2'
+
+    def test_page_expires(self, core_module, view, request_):
+        view(None, request_)
+        with patch.object(core_module, 'datetime') as m_dt:
+            m_dt.today.return_value = datetime(2100, 1, 1)
+            response = view(None, request_)
+        assert response.text == 'page 2'
+
+    def test_commit_of_event_change_clears_cache(
+        self, view, request_, brevet_model, db_session,
+    ):
+        view(None, request_)
+        db_session.add(brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        ))
+        db_session.flush()
+        assert view(None, request_).text == 'page 1'
+        transaction.commit()
+        assert view(None, request_).text == 'page 2'
+
+    def test_rollback_does_not_clear_cache(
+        self, view, request_, link_model, db_session,
+    ):
+        view(None, request_)
+        db_session.add(link_model(key='membership_link', url='https://m/'))
+        db_session.flush()
+        transaction.abort()
+        assert 'page_cache_stale' not in db_session().info
+        assert view(None, request_).text == 'page 1'
+
+    def test_page_rendered_during_clear_not_stored(
+        self, core_module, request_,
+    ):
+        def view(context, request):
+            core_module.page_cache.clear()
+            response = request.response
+            response.text = 'stale'
+            return response
+        core_module.cached_page(view)(None, request_)
+        key = (request_.host_url, 'brevet.list', (('region', 'LM'),))
+        assert core_module.page_cache.get(key) is None
+
+
+@pytest.mark.usefixtures(
+    'core_module', 'core_model', 'brevet_model', 'pop_model', 'link_model',
+    'db_session', 'sql_statements',
+)
+class TestCurrentEvents(object):
+    """Unit tests for current events snapshot.
+    """
+    @pytest.fixture
+    def events(
+        self, brevet_model, pop_model, link_model, db_session, sql_statements,
+    ):
+        db_session.add(link_model(
+            key='entry_form', url='http://entry_form.pdf/'))
+        db_session.add_all((
+            brevet_model(
+                region='LM',
+                distance=200,
+                date_time=datetime(2012, 11, 11, 7, 0, 0),
+                route_name='11th Hour',
+                start_locn='Lonsdale Quay, North Vancouver',
+                organizer_email='tracy@example.com',
+            ),
+            brevet_model(
+                region='VI',
+                distance=300,
+                date_time=datetime(2012, 11, 18, 6, 0, 0),
+                route_name='Chilly 300',
+                start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+                organizer_email='mcroy@example.com',
+            ),
+            brevet_model(
+                region='LM',
+                distance=300,
+                date_time=datetime(2012, 11, 25, 6, 0, 0),
+                route_name='Late 300',
+                start_locn='Lonsdale Quay, North Vancouver',
+                organizer_email='tracy@example.com',
+            ),
+            pop_model(
+                event_name='Victoria Populaire',
+                short_name='VicPop',
+                distance='50 km, 100 km',
+                date_time=datetime(2012, 11, 4, 10, 0),
+                start_locn='University of Victoria, Parking Lot #2',
+                organizer_email='mjansson@example.com',
+                registration_end=datetime(2012, 11, 3, 12, 0),
+            ),
+        ))
+        db_session.flush()
+        del sql_statements[:]
+
+    def test_load_1_query_per_event_type(
+        self, core_module, core_model, events, sql_statements,
+    ):
+        """snapshot is loaded with 1 query for brevets & 1 for populaires
+        """
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            current_events = core_module.CurrentEvents.load()
+        assert len(sql_statements) == 2
+        assert current_events.brevet_count == 3
+        assert current_events.populaire_count == 1
+
+    def test_materialized_no_queries_after_load(
+        self, core_module, core_model, events, sql_statements,
+    ):
+        """counts, lists & region groupings don't issue SQL after load
+        """
+        with patch.object(core_model, 'datetime') as m_datetime:
+            m_datetime.today.return_value = datetime(2012, 11, 1, 12, 55, 42)
+            current_events = core_module.CurrentEvents.load()
+        del sql_statements[:]
+        assert bool(current_events.brevets)
+        assert [str(p) for p in current_events.populaires] == ['VicPop']
+        lm_brevets = current_events.region_brevets('LM')
+        assert [str(b) for b in lm_brevets] == [
+            'LM200 11Nov2012', 'LM300 25Nov2012']
+        assert current_events.region_brevets('PR') == []
+        assert sql_statements == []
+
+
 @pytest.mark.usefixtures('core_module', 'link_model', 'db_session')
 class TestGetMembershipLink(object):
     """Unit test for get_membership_link() function.
@@ -105,3 +401,168 @@ class TestSiteViews(object):
         tmpl_vars = views.notfound()
         assert tmpl_vars['active_tab'] is None
         assert get_current_request().response.status == '404 Not Found'
+
+
+@pytest.mark.usefixtures(
+    'views', 'brevet_model', 'brevet_rider_model', 'pop_model', 'db_session',
+)
+class TestEventRiderEmails(object):
+    """Unit tests for rider email address list view by event uuid.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime.today() + timedelta(days=2),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    def test_brevet_rider_emails(
+        self, views, brevet, brevet_rider_model, db_session,
+    ):
+        """rider emails of brevet w/ uuid from URL
+        """
+        brevet.riders.append(brevet_rider_model(
+            email='tom@example.com',
+            first_name='Tom',
+            last_name='Dickson',
+            comment='',
+        ))
+        db_session.flush()
+        get_current_request().matchdict['uuid'] = brevet.uuid
+        assert views.event_rider_emails() == 'tom@example.com'
+
+    def test_populaire_no_riders(self, views, pop_model, db_session):
+        """message for populaire w/ uuid from URL & no riders
+        """
+        populaire = pop_model(
+            event_name='Victoria Populaire',
+            short_name='VicPop',
+            distance='50 km, 100 km',
+            date_time=datetime.today() + timedelta(days=2),
+            start_locn='University of Victoria, Parking Lot #2',
+            organizer_email='mjansson@example.com',
+            registration_end=datetime.today() + timedelta(days=1),
+            entry_form_url='http://www.randonneurs.bc.ca/eventform.pdf',
+        )
+        db_session.add(populaire)
+        db_session.flush()
+        get_current_request().matchdict['uuid'] = populaire.uuid
+        assert views.event_rider_emails() == 'No riders have registered yet!'
+
+    def test_unknown_uuid(self, views, brevet):
+        """404 for uuid of no event
+        """
+        from pyramid.httpexceptions import HTTPNotFound
+        get_current_request().matchdict['uuid'] = 'foo'
+        with pytest.raises(HTTPNotFound):
+            views.event_rider_emails()
+
+    def test_past_event(self, views, brevet, db_session):
+        """404 for event beyond in_past horizon
+        """
+        from pyramid.httpexceptions import HTTPNotFound
+        brevet.date_time = datetime.today() - timedelta(days=8)
+        db_session.flush()
+        get_current_request().matchdict['uuid'] = brevet.uuid
+        with pytest.raises(HTTPNotFound):
+            views.event_rider_emails()
+
+
+@pytest.mark.usefixtures('core_module')
+class TestUUIDMatches(object):
+    """Unit tests for uuid_matches function.
+    """
+    def test_match(self, core_module):
+        assert core_module.uuid_matches(Mock(uuid='foo'), 'foo')
+
+    def test_mismatch(self, core_module):
+        assert not core_module.uuid_matches(Mock(uuid='foo'), 'bar')
+
+    def test_no_event(self, core_module):
+        assert not core_module.uuid_matches(None, 'foo')
+
+
+@pytest.mark.usefixtures(
+    'views', 'brevet_model', 'brevet_rider_model', 'db_session',
+)
+class TestNotModified(object):
+    """Unit tests for event page conditional GET support.
+    """
+    @pytest.fixture
+    def brevet(self, brevet_model, db_session):
+        brevet = brevet_model(
+            region='LM',
+            distance=200,
+            date_time=datetime(2012, 11, 11, 7, 0, 0),
+            route_name='11th Hour',
+            start_locn='Lonsdale Quay, North Vancouver',
+            organizer_email='tracy@example.com',
+        )
+        db_session.add(brevet)
+        db_session.flush()
+        return brevet
+
+    def test_sets_conditional_get_headers(self, views, brevet):
+        """response has ETag, Last-Modified & Cache-Control headers
+        """
+        not_modified = views._not_modified(brevet, False, False)
+        response = get_current_request().response
+        assert not_modified is None
+        assert response.etag is not None
+        assert response.last_modified is not None
+        assert response.cache_control.public
+        assert response.cache_control.max_age == 60
+        assert response.vary == ('Cookie',)
+
+    def test_matching_etag_returns_304(self, views, brevet):
+        """request w/ current ETag gets 304 Not Modified response
+        """
+        views._not_modified(brevet, False, False)
+        etag = get_current_request().response.etag
+        get_current_request().headers['If-None-Match'] = '"{}"'.format(etag)
+        not_modified = views._not_modified(brevet, False, False)
+        assert not_modified.status_code == 304
+        assert not_modified.headers['ETag'] == '"{}"'.format(etag)
+
+    def test_page_state_changes_etag(self, views, brevet):
+        """ETag changes when registration closes
+        """
+        views._not_modified(brevet, False, False)
+        etag = get_current_request().response.etag
+        get_current_request().headers['If-None-Match'] = '"{}"'.format(etag)
+        assert views._not_modified(brevet, True, False) is None
+
+    def test_new_rider_changes_etag(
+        self, views, brevet, brevet_rider_model, db_session,
+    ):
+        """ETag changes when a rider registers
+        """
+        views._not_modified(brevet, False, False)
+        etag = get_current_request().response.etag
+        brevet.riders.append(brevet_rider_model(
+            email='tom@example.com',
+            first_name='Tom',
+            last_name='Dickson',
+            comment='',
+        ))
+        db_session.flush()
+        views._not_modified(brevet, False, False)
+        assert get_current_request().response.etag != etag
+
+    def test_flash_message_disables_caching(self, views, brevet):
+        """response w/ flash message is not cacheable
+        """
+        get_current_request().session.flash('success')
+        not_modified = views._not_modified(brevet, False, False)
+        response = get_current_request().response
+        assert not_modified is None
+        assert response.etag is None
+        assert response.cache_control.private is not None
+        assert response.cache_control.no_cache is not None
@@ -0,0 +1,218 @@
+"""Tests for RandoPony background tasks.
+"""
+from datetime import datetime
+import subprocess
+import sys
+from unittest.mock import (
+    Mock,
+    patch,
+)
+
+import pytest
+import transaction
+
+
+@pytest.fixture(scope='module')
+def member_status_tasks():
+    from randopony.tasks import member_status
+    return member_status
+
+
+@pytest.fixture(scope='module')
+def rider_list_tasks():
+    from randopony.tasks import rider_list
+    return rider_list
+
+
+@pytest.fixture(scope='function')
+def rider_id(brevet_model, brevet_rider_model, db_session):
+    brevet = brevet_model(
+        region='VI',
+        distance=200,
+        date_time=datetime(2013, 3, 3, 7, 0),
+        route_name='Chilly 200',
+        start_locn='Chez Croy, 3131 Millgrove St, Victoria',
+        organizer_email='mcroy@example.com',
+    )
+    brevet.riders.append(brevet_rider_model(
+        email='tom@example.com',
+        first_name='Tom',
+        last_name='Dickson',
+        comment='',
+    ))
+    with transaction.manager:
+        db_session.add(brevet)
+    return db_session.query(brevet_rider_model).one().id
+
+
+class TestTaskModules(object):
+    """Unit tests for task modules dependencies.
+    """
+    def test_view_layer_not_imported(self):
+        """task modules don't import views for celery worker
+        """
+        from randopony import celery_config
+        script = (
+            'import sys\n'
+            'for name in {!r}:\n'
+            '    __import__(name)\n'
+            'print([name for name in sys.modules\n'
+            '       if name.startswith("randopony.views")])'
+            .format(celery_config.CELERY_IMPORTS))
+        output = subprocess.check_output(
+            [sys.executable, '-c', script], universal_newlines=True)
+        assert output.splitlines()[-1] == '[]'
+
+
+@pytest.mark.usefixtures('db_session')
+class TestSessionScoped(object):
+    """Unit tests for session_scoped task function decorator.
+    """
+    def test_session_removed(self, db_session):
+        from randopony.tasks import session_scoped
+
+        @session_scoped
+        def task_func():
+            return db_session()
+
+        session = task_func()
+        assert db_session() is not session
+
+    def test_session_removed_on_exception(self, db_session):
+        from randopony.tasks import session_scoped
+
+        @session_scoped
+        def task_func():
+            sessions.append(db_session())
+            raise ValueError
+
+        sessions = []
+        with pytest.raises(ValueError):
+            task_func()
+        assert db_session() is not sessions[0]
+
+
+@pytest.mark.usefixtures(
+    'member_status_tasks', 'brevet_model', 'brevet_rider_model', 'db_session',
+)
+class TestUpdateMemberStatus(object):
+    """Unit tests for update_member_status background task.
+    """
+    @pytest.mark.parametrize('member_status', [True, False, None])
+    def test_stores_member_status(
+        self, member_status, member_status_tasks, rider_id,
+        brevet_rider_model, rider_list_tasks, db_session,
+    ):
+        gc_patch = patch.object(member_status_tasks.member_api, 'get_client')
+        srl_patch = patch.object(
+            rider_list_tasks.sync_rider_list, 'apply_async')
+        with gc_patch as m_get_client, srl_patch as m_apply_async:
+            m_fetch = m_get_client().fetch_member_status
+            m_fetch.return_value = member_status
+            member_status_tasks.update_member_status(
+                rider_id, 'is_club_member_url')
+        m_fetch.assert_called_once_with(
+            'Tom', 'Dickson', 'is_club_member_url')
+        rider = db_session.query(brevet_rider_model).one()
+        assert rider.member_status is member_status
+        m_apply_async.assert_called_once_with(
+            ('brevets', rider.brevet), countdown=30)
+
+    def test_missing_rider(self, member_status_tasks, db_session):
+        gc_patch = patch.object(member_status_tasks.member_api, 'get_client')
+        with gc_patch as m_get_client:
+            member_status_tasks.update_member_status(42, 'is_club_member_url')
+        assert not m_get_client.called
+
+    @pytest.mark.parametrize('member_status', [True, False, None])
+    def test_uses_cache(
+        self, member_status, member_status_tasks, rider_id,
+        brevet_rider_model, member_status_cache_model, rider_list_tasks,
+        db_session,
+    ):
+        with transaction.manager:
+            member_status_cache_model.store('Tom', 'Dickson', member_status)
+        gc_patch = patch.object(member_status_tasks.member_api, 'get_client')
+        srl_patch = patch.object(
+            rider_list_tasks.sync_rider_list, 'apply_async')
+        with gc_patch as m_get_client, srl_patch as m_apply_async:
+            member_status_tasks.update_member_status(
+                rider_id, 'is_club_member_url')
+        assert not m_get_client.called
+        rider = db_session.query(brevet_rider_model).one()
+        assert rider.member_status is member_status
+        m_apply_async.assert_called_once_with(
+            ('brevets', rider.brevet), countdown=30)
+
+    def test_club_database_unavailable(
+        self, member_status_tasks, rider_id, brevet_rider_model,
+        rider_list_tasks, db_session,
+    ):
+        from randopony.member_api import MemberAPIError
+        gc_patch = patch.object(member_status_tasks.member_api, 'get_client')
+        srl_patch = patch.object(
+            rider_list_tasks.sync_rider_list, 'apply_async')
+        with gc_patch as m_get_client, srl_patch as m_apply_async:
+            m_get_client().fetch_member_status.side_effect = MemberAPIError
+            member_status_tasks.update_member_status(
+                rider_id, 'is_club_member_url')
+        assert db_session.query(brevet_rider_model).one().member_status is None
+        assert not m_apply_async.called
+
+
+@pytest.mark.usefixtures('db_session')
+class TestSendBroadcast(object):
+    """Unit tests for send_broadcast background task.
+    """
+    def test_send_broadcast(self, db_session):
+        from randopony.tasks import broadcast as broadcast_tasks
+        gb_patch = patch.object(broadcast_tasks.broadcast, 'get_broadcaster')
+        with gb_patch as m_get_broadcaster:
+            broadcast_tasks.send_broadcast(42)
+        m_get_broadcaster().send.assert_called_once_with(42)
+
+
+@pytest.mark.usefixtures('rider_list_tasks', 'db_session')
+class TestSyncRiderList(object):
+    """Unit tests for sync_rider_list background task.
+    """
+    def test_disabled(self, rider_list_tasks, db_session):
+        gs_patch = patch.object(
+            rider_list_tasks.rider_list_sync, 'get_sync', return_value=None)
+        with gs_patch as m_get_sync:
+            rider_list_tasks.sync_rider_list('brevets', 42)
+        assert m_get_sync.called
+
+    def test_sync(self, rider_list_tasks, db_session):
+        m_sync = Mock(name='sync')
+        m_sync.sync.return_value = {'inserted': 1, 'updated': 0, 'deleted': 0}
+        gs_patch = patch.object(
+            rider_list_tasks.rider_list_sync, 'get_sync', return_value=m_sync)
+        with gs_patch:
+            rider_list_tasks.sync_rider_list('brevets', 42)
+        m_sync.sync.assert_called_once_with('brevets', 42)
+
+    def test_deferred_while_requests_arriving(
+        self, rider_list_tasks, db_session,
+    ):
+        srl_patch = patch.object(
+            rider_list_tasks.sync_rider_list, 'apply_async')
+        gs_patch = patch.object(rider_list_tasks.rider_list_sync, 'get_sync')
+        with srl_patch as m_apply_async, gs_patch as m_get_sync:
+            with transaction.manager:
+                rider_list_tasks.request_sync('brevets', 42)
+            rider_list_tasks.sync_rider_list('brevets', 42)
+        assert m_apply_async.call_count == 2
+        assert not m_get_sync.called
+
+    def test_backend_failure_logged(self, rider_list_tasks, db_session):
+        from randopony.rider_list_sync import RiderListSyncError
+        m_sync = Mock(name='sync')
+        m_sync.sync.side_effect = RiderListSyncError('503')
+        gs_patch = patch.object(
+            rider_list_tasks.rider_list_sync, 'get_sync', return_value=m_sync)
+        log_patch = patch.object(rider_list_tasks, 'log')
+        with gs_patch, log_patch as m_log:
+            rider_list_tasks.sync_rider_list('brevets', 42)
+        assert m_log.warning.called
+        assert not m_log.info.called
@@ -0,0 +1,155 @@
+"""Tests for RandoPony database schema upgrade script.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import (
+    create_engine,
+    inspect,
+)
+
+from randopony.models.meta import (
+    Base,
+    DBSession,
+)
+
+
+@pytest.fixture(scope='module')
+def upgradedb_module():
+    from randopony.scripts import upgradedb
+    return upgradedb
+
+
+@pytest.yield_fixture(scope='function')
+def engine():
+    engine = create_engine('sqlite://')
+    DBSession.remove()
+    DBSession.configure(bind=engine)
+    yield engine
+    DBSession.remove()
+
+
+@pytest.mark.usefixtures('upgradedb_module', 'engine')
+class TestUpgrade(object):
+    """Unit tests for upgrade function.
+    """
+    def test_creates_missing_tables(self, upgradedb_module, engine):
+        upgradedb_module.upgrade(engine)
+        tables = set(inspect(engine).get_table_names())
+        assert set(Base.metadata.tables) <= tables
+
+    def test_adds_missing_column(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('CREATE TABLE tmp AS SELECT * FROM brevets')
+        engine.execute('DROP TABLE brevets')
+        engine.execute(
+            'CREATE TABLE brevets AS SELECT id, region, distance, date_time '
+            'FROM tmp')
+        upgradedb_module.upgrade(engine)
+        columns = {
+            column['name'] for column in inspect(engine).get_columns('brevets')}
+        assert 'rider_count' in columns
+
+    def test_backfills_rider_count(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP TABLE brevets')
+        engine.execute(
+            'CREATE TABLE brevets '
+            '(id INTEGER PRIMARY KEY, region TEXT, distance INTEGER, '
+            'date_time DATETIME)')
+        engine.execute(
+            "INSERT INTO brevets VALUES (1, 'LM', 200, ?)",
+            datetime(2012, 11, 11, 7))
+        for rider_id in (1, 2):
+            engine.execute(
+                "INSERT INTO brevet_riders (id, first_name, last_name, brevet) "
+                "VALUES (?, 'Tom', 'Dickson', 1)", rider_id)
+        upgradedb_module.upgrade(engine)
+        rider_count, updated_at = engine.execute(
+            'SELECT rider_count, updated_at FROM brevets WHERE id = 1').first()
+        assert rider_count == 2
+        assert updated_at is not None
+
+    def test_backfills_brevet_slugs(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP TABLE brevets')
+        engine.execute(
+            'CREATE TABLE brevets '
+            '(id INTEGER PRIMARY KEY, region TEXT, distance INTEGER, '
+            'date_time DATETIME)')
+        for brevet_id, region in ((1, 'LM'), (2, 'VI'), (3, 'LM')):
+            engine.execute(
+                'INSERT INTO brevets VALUES (?, ?, 200, ?)',
+                brevet_id, region, datetime(2012, 11, 11, 7))
+        upgradedb_module.upgrade(engine)
+        slugs = engine.execute(
+            'SELECT id, slug FROM brevets ORDER BY id').fetchall()
+        assert slugs == [
+            (1, 'LM200-11Nov2012'), (2, 'VI200-11Nov2012'), (3, None)]
+        indexes = {
+            index['name']: index
+            for index in inspect(engine).get_indexes('brevets')}
+        assert indexes['ix_brevets_slug']['unique']
+        assert 'ix_brevets_region_distance_date_time' in indexes
+
+    def test_backfills_legacy_uuids(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP TABLE brevets')
+        engine.execute(
+            'CREATE TABLE brevets '
+            '(id INTEGER PRIMARY KEY, region TEXT, distance INTEGER, '
+            'date_time DATETIME)')
+        for brevet_id in (1, 2):
+            engine.execute(
+                "INSERT INTO brevets VALUES (?, 'VI', 200, ?)",
+                brevet_id, datetime(2013, 3, 3, 7))
+        engine.execute('DROP TABLE populaires')
+        engine.execute(
+            'CREATE TABLE populaires (id INTEGER PRIMARY KEY, short_name TEXT)')
+        engine.execute("INSERT INTO populaires VALUES (1, 'VicPop')")
+        upgradedb_module.upgrade(engine)
+        uuids = engine.execute(
+            'SELECT uuid FROM brevets ORDER BY id').fetchall()
+        assert uuids[0] == ('ba8e8e00-dd42-5c6c-9b30-b65ce9c8df26',)
+        assert uuids[1][0] not in (None, uuids[0][0])
+        assert engine.execute('SELECT uuid FROM populaires').scalar()
+        indexes = {
+            index['name']: index
+            for index in inspect(engine).get_indexes('brevets')}
+        assert indexes['ix_brevets_uuid']['unique']
+
+    def test_backfills_registered_at(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP TABLE brevet_riders')
+        engine.execute(
+            'CREATE TABLE brevet_riders '
+            '(id INTEGER PRIMARY KEY, first_name TEXT, last_name TEXT, '
+            'brevet INTEGER, updated_at DATETIME)')
+        engine.execute(
+            "INSERT INTO brevet_riders VALUES (1, 'Tom', 'Dickson', 1, ?)",
+            datetime(2012, 11, 1, 10))
+        upgradedb_module.upgrade(engine)
+        registered_at = engine.execute(
+            'SELECT registered_at FROM brevet_riders WHERE id = 1').scalar()
+        assert registered_at == '2012-11-01 10:00:00'
+
+    def test_existing_events_notify_organizers_immediately(
+        self, upgradedb_module, engine,
+    ):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP TABLE populaires')
+        engine.execute(
+            'CREATE TABLE populaires (id INTEGER PRIMARY KEY, short_name TEXT)')
+        engine.execute("INSERT INTO populaires VALUES (1, 'VicPop')")
+        upgradedb_module.upgrade(engine)
+        organizer_notification = engine.execute(
+            'SELECT organizer_notification FROM populaires').scalar()
+        assert organizer_notification == 'immediate'
+
+    def test_creates_missing_index(self, upgradedb_module, engine):
+        Base.metadata.create_all(engine)
+        engine.execute('DROP INDEX ix_brevets_region')
+        upgradedb_module.upgrade(engine)
+        indexes = {
+            index['name'] for index in inspect(engine).get_indexes('brevets')}
+        assert 'ix_brevets_region' in indexes